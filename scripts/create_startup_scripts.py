@@ -3,53 +3,108 @@
 from pathlib import Path
 
 STARTUP_SCRIPT_TEMPLATE = '''#!/usr/bin/env python3
-"""Startup script for {service_name} with TLS support."""
+"""Startup script for {service_name} with TLS support.
+
+{workers_doc}
+"""
 import os
 import ssl
 import uvicorn
 from pathlib import Path
+from uvicorn.supervisors import Multiprocess
+
+# {app_comment}
+APP = "{app}"
+
+# Internal port should always be {port} to match healthcheck
+PORT = {port}
+
+CERT_DIR = Path("/app/certs")
+
+
+def create_tls13_context(cert_file: str, key_file: str) -> ssl.SSLContext:
+    """Create a TLS 1.3-only server context."""
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.minimum_version = ssl.TLSVersion.TLSv1_3
+    ssl_context.maximum_version = ssl.TLSVersion.TLSv1_3
+    ssl_context.load_cert_chain(certfile=cert_file, keyfile=key_file)
+    ssl_context.options |= ssl.OP_NO_COMPRESSION
+    return ssl_context
+
+
+class TLS13Config(uvicorn.Config):
+    """uvicorn config that swaps in our TLS 1.3-only context on load.
+
+    load() runs inside each worker process, so every worker builds its own
+    SSL context instead of inheriting one from the supervisor.
+    """
+
+    def load(self) -> None:
+        super().load()
+        if self.is_ssl:
+            self.ssl = create_tls13_context(self.ssl_certfile, self.ssl_keyfile)
 
-# Import the FastAPI app
-from src.main import app
 
 if __name__ == "__main__":
-    port = int(os.getenv("{port_env}", "{default_port}"))
     tls_enabled = os.getenv("TLS_ENABLED", "false").lower() in ("true", "1", "yes")
-
+    workers = max(1, int(os.getenv("WORKERS", "1")))
+{worker_cap}
+    ssl_files = {{}}
     if tls_enabled:
-        # Configure TLS 1.3
-        cert_dir = Path("/app/certs")
-        cert_file = str(cert_dir / "server-cert.pem")
-        key_file = str(cert_dir / "server-key.pem")
-
-        # Create SSL context for TLS 1.3
-        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        ssl_context.minimum_version = ssl.TLSVersion.TLSv1_3
-        ssl_context.maximum_version = ssl.TLSVersion.TLSv1_3
-        ssl_context.load_cert_chain(certfile=cert_file, keyfile=key_file)
-
-        # Security options (TLS 1.3 ciphers are enabled by default)
-        ssl_context.options |= ssl.OP_NO_TLSv1
-        ssl_context.options |= ssl.OP_NO_TLSv1_1
-        ssl_context.options |= ssl.OP_NO_TLSv1_2
-        ssl_context.options |= ssl.OP_NO_COMPRESSION
-
-        print(f"Starting {service_name} with TLS 1.3 on port {{port}}")
-        uvicorn.run(app, host="0.0.0.0", port=port, ssl=ssl_context)
+        ssl_files = {{
+            "ssl_certfile": str(CERT_DIR / "server-cert.pem"),
+            "ssl_keyfile": str(CERT_DIR / "server-key.pem"),
+        }}
+        print(f"Starting {service_name} with TLS 1.3 ONLY on port {{PORT}} ({{workers}} worker(s))")
+    else:
+        print(f"Starting {service_name} without TLS on port {{PORT}} ({{workers}} worker(s))")
+
+    config = TLS13Config(
+        APP,
+        host="0.0.0.0",
+        port=PORT,
+        workers=workers,
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30")),
+        **ssl_files,
+    )
+    server = uvicorn.Server(config)
+
+    if workers > 1:
+        # Bind once in the supervisor; every worker accepts on the same socket
+        sock = config.bind_socket()
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
     else:
-        print(f"Starting {service_name} without TLS on port {{port}}")
-        uvicorn.run(app, host="0.0.0.0", port=port)
+        server.run()
+'''
+
+WORKERS_DOC = '''Set WORKERS to run several worker processes that share one listening
+socket. The supervisor restarts workers one at a time on SIGHUP (graceful
+reload); SIGTTIN / SIGTTOU add or remove a worker.'''
+
+SINGLE_WORKER_DOC = '''WORKERS is ignored for this service: it always runs a single worker,
+because Socket.IO sessions, rooms and timers are kept per process. Scale
+it with more instances behind the sticky load balancer instead.'''
+
+SINGLE_WORKER_CAP = '''    if workers > 1:
+        print("Socket.IO sessions are process-local; ignoring WORKERS and running 1 worker")
+        workers = 1
 '''
 
 services = [
-    {"name": "api-gateway", "port_env": "API_GATEWAY_PORT", "default_port": "8080"},
-    {"name": "auth-service", "port_env": "AUTH_SERVICE_PORT", "default_port": "8085"},
-    {"name": "diagram-service", "port_env": "DIAGRAM_SERVICE_PORT", "default_port": "8082"},
-    {"name": "ai-service", "port_env": "AI_SERVICE_PORT", "default_port": "8084"},
-    {"name": "collaboration-service", "port_env": "COLLABORATION_SERVICE_PORT", "default_port": "8083"},
-    {"name": "git-service", "port_env": "GIT_SERVICE_PORT", "default_port": "8087"},
-    {"name": "export-service", "port_env": "EXPORT_SERVICE_PORT", "default_port": "8097"},
-    {"name": "integration-hub", "port_env": "INTEGRATION_HUB_PORT", "default_port": "8099"},
+    {"name": "api-gateway", "port": 8080},
+    {"name": "auth-service", "port": 8085},
+    {"name": "diagram-service", "port": 8082},
+    {"name": "ai-service", "port": 8084},
+    {
+        "name": "collaboration-service",
+        "port": 8083,
+        "app": "src.main:socket_app",
+        "app_comment": "Socket.IO ASGI app (wraps FastAPI + Socket.IO)",
+        "single_worker": True,
+    },
+    {"name": "git-service", "port": 8087},
+    {"name": "export-service", "port": 8097},
+    {"name": "integration-hub", "port": 8099},
 ]
 
 for service in services:
@@ -58,11 +113,15 @@ for service in services:
         print(f"❌ {service['name']}: directory not found")
         continue
 
+    single_worker = service.get("single_worker", False)
     startup_file = service_dir / "startup.py"
     content = STARTUP_SCRIPT_TEMPLATE.format(
         service_name=service["name"],
-        port_env=service["port_env"],
-        default_port=service["default_port"]
+        port=service["port"],
+        app=service.get("app", "src.main:app"),
+        app_comment=service.get("app_comment", "FastAPI app (imported by each worker)"),
+        workers_doc=SINGLE_WORKER_DOC if single_worker else WORKERS_DOC,
+        worker_cap=SINGLE_WORKER_CAP if single_worker else "",
     )
 
     startup_file.write_text(content)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Test exactly-once cross-instance fan-out in collaboration-service (Feature #422).
+
+Starts two collaboration-service instances on this host, both attached to the
+same Redis, and connects two Socket.IO clients to each. The senders on both
+instances publish diagram updates into one room concurrently; every other
+client must receive every update exactly once, and no sender may receive its
+own updates. A message posted to /broadcast on one instance must likewise
+reach every client exactly once. Finally one instance is restarted under the
+same INSTANCE_ID (its sequence numbers start over); its updates must still
+reach the other instance's clients exactly once.
+
+Redis must be reachable at REDIS_HOST / REDIS_PORT (default localhost:6379).
+
+Usage:
+    python scripts/tests/test_collab_exactly_once.py --updates 200
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+import socketio
+
+# ANSI color codes
+GREEN = '\033[92m'
+RED = '\033[91m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+BOLD = '\033[1m'
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SERVICE_DIR = REPO_ROOT / "services" / "collaboration-service"
+
+
+def print_header(message: str):
+    """Print a formatted header."""
+    print(f"\n{BOLD}{BLUE}{'=' * 80}{RESET}")
+    print(f"{BOLD}{BLUE}{message.center(80)}{RESET}")
+    print(f"{BOLD}{BLUE}{'=' * 80}{RESET}\n")
+
+
+def print_success(message: str):
+    """Print success message."""
+    print(f"{GREEN}✓ {message}{RESET}")
+
+
+def print_error(message: str):
+    """Print error message."""
+    print(f"{RED}✗ {message}{RESET}")
+
+
+def print_info(message: str):
+    """Print info message."""
+    print(f"{YELLOW}ℹ {message}{RESET}")
+
+
+def start_instance(port: int, instance_id: str) -> subprocess.Popen:
+    """Start one collaboration-service instance."""
+    env = {
+        **os.environ,
+        "INSTANCE_ID": instance_id,
+        "LOG_LEVEL": "WARNING",
+        "PYTHONPATH": f"{REPO_ROOT}{os.pathsep}{os.environ.get('PYTHONPATH', '')}",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:socket_app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def stop_instance(process: subprocess.Popen):
+    """Stop an instance."""
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def wait_until_ready(url: str, timeout: float = 30.0) -> bool:
+    """Poll /health until it answers 200."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(f"{url}/health", timeout=2)
+                if response.status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+
+class Client:
+    """Socket.IO client that counts the updates it receives by id."""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.received: Counter = Counter()
+        self.sio = socketio.AsyncClient()
+        self.sio.on('update', self._on_update)
+
+    async def _on_update(self, data):
+        if isinstance(data, dict) and 'id' in data:
+            self.received[data['id']] += 1
+
+    async def join(self, room: str):
+        await self.sio.connect(self.url, transports=['websocket'])
+        result = await self.sio.call('join_room', {
+            'room': room,
+            'user_id': f"exactly-once-{self.name}",
+            'username': self.name,
+            'role': 'editor'
+        })
+        if not result or not result.get('success'):
+            raise RuntimeError(f"{self.name} failed to join {room}: {result}")
+
+    async def send_updates(self, room: str, count: int) -> List[str]:
+        ids = [f"{self.name}-{i}" for i in range(count)]
+        for update_id in ids:
+            result = await self.sio.call('diagram_update', {'room': room, 'update': {'id': update_id}})
+            if not result or not result.get('success'):
+                raise RuntimeError(f"{self.name} update rejected: {result}")
+        return ids
+
+
+async def wait_for_deliveries(clients: List[Client], expected: int, timeout: float = 15.0):
+    """Wait until every client has received at least `expected` updates, or time out."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(sum(c.received.values()) >= expected for c in clients):
+            break
+        await asyncio.sleep(0.2)
+    # Allow late duplicates to show up
+    await asyncio.sleep(1.0)
+
+
+def check_exactly_once(client: Client, expected_ids: List[str], own_ids: List[str]) -> bool:
+    """Every expected id delivered once, own ids never."""
+    missing = [i for i in expected_ids if client.received[i] == 0]
+    duplicated = [i for i in expected_ids if client.received[i] > 1]
+    echoed = [i for i in own_ids if client.received[i] > 0]
+
+    if not missing and not duplicated and not echoed:
+        print_success(f"{client.name}: {len(expected_ids)} updates, each delivered exactly once")
+        return True
+    print_error(f"{client.name}: {len(missing)} missing, {len(duplicated)} duplicated, "
+                f"{len(echoed)} own updates echoed back")
+    return False
+
+
+async def run_test(args) -> bool:
+    url_a = f"http://localhost:{args.port_a}"
+    url_b = f"http://localhost:{args.port_b}"
+    room = f"file:exactly-once-{uuid.uuid4().hex[:8]}"
+
+    sender_a, listener_a = Client("a1", url_a), Client("a2", url_a)
+    sender_b, listener_b = Client("b1", url_b), Client("b2", url_b)
+    clients = [sender_a, listener_a, sender_b, listener_b]
+
+    try:
+        for client in clients:
+            await client.join(room)
+        # Let both instances' room subscriptions settle
+        await asyncio.sleep(0.5)
+        print_info(f"4 clients joined {room} across 2 instances")
+
+        ids_a, ids_b = await asyncio.gather(
+            sender_a.send_updates(room, args.updates),
+            sender_b.send_updates(room, args.updates),
+        )
+        await wait_for_deliveries(clients, args.updates)
+
+        print_header("Socket.IO diagram_update fan-out")
+        results = [
+            check_exactly_once(sender_a, ids_b, ids_a),
+            check_exactly_once(listener_a, ids_a + ids_b, []),
+            check_exactly_once(sender_b, ids_a, ids_b),
+            check_exactly_once(listener_b, ids_a + ids_b, []),
+        ]
+
+        print_header("HTTP /broadcast fan-out")
+        broadcast_ids = [f"http-{i}" for i in range(args.updates // 10 or 1)]
+        async with httpx.AsyncClient() as http:
+            for broadcast_id in broadcast_ids:
+                response = await http.post(f"{url_a}/broadcast/{room}", json={'id': broadcast_id})
+                response.raise_for_status()
+        await wait_for_deliveries(clients, args.updates + len(broadcast_ids))
+        for client in clients:
+            results.append(check_exactly_once(client, broadcast_ids, []))
+
+        async with httpx.AsyncClient() as http:
+            for name, url in (("A", url_a), ("B", url_b)):
+                stats = (await http.get(f"{url}/health")).json().get("broadcast", {})
+                print_info(f"Instance {name}: {stats}")
+
+        return all(results)
+    finally:
+        for client in clients:
+            if client.sio.connected:
+                await client.sio.disconnect()
+
+
+async def run_restart_test(args, processes: Dict[str, subprocess.Popen]) -> bool:
+    """Restart instance A under the same INSTANCE_ID; B must not drop its new sequence numbers."""
+    url_a = f"http://localhost:{args.port_a}"
+    url_b = f"http://localhost:{args.port_b}"
+    room = f"file:exactly-once-{uuid.uuid4().hex[:8]}"
+
+    stop_instance(processes["collab-a"])
+    processes["collab-a"] = start_instance(args.port_a, "collab-a")
+    if not await wait_until_ready(url_a):
+        print_error("Restarted instance did not become ready")
+        return False
+
+    sender, listener = Client("a3", url_a), Client("b3", url_b)
+    try:
+        for client in (sender, listener):
+            await client.join(room)
+        await asyncio.sleep(0.5)
+        ids = await sender.send_updates(room, args.updates)
+        await wait_for_deliveries([listener], args.updates)
+
+        print_header("Fan-out after restarting an instance")
+        return check_exactly_once(listener, ids, [])
+    finally:
+        for client in (sender, listener):
+            if client.sio.connected:
+                await client.sio.disconnect()
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port-a", type=int, default=8183)
+    parser.add_argument("--port-b", type=int, default=8184)
+    parser.add_argument("--updates", type=int, default=200, help="Updates sent by each sender")
+    args = parser.parse_args()
+
+    print_header("Collaboration Exactly-Once Fan-out Test")
+
+    processes: Dict[str, subprocess.Popen] = {
+        "collab-a": start_instance(args.port_a, "collab-a"),
+        "collab-b": start_instance(args.port_b, "collab-b"),
+    }
+    try:
+        for port in (args.port_a, args.port_b):
+            if not await wait_until_ready(f"http://localhost:{port}"):
+                print_error(f"Instance on port {port} did not become ready")
+                return 1
+
+        passed = await run_test(args)
+        passed = await run_restart_test(args, processes) and passed
+    finally:
+        for process in processes.values():
+            stop_instance(process)
+
+    if passed:
+        print_success("Exactly-once fan-out verified across two instances")
+        return 0
+    print_error("Fan-out was not exactly-once")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON vs MessagePack framing for collaboration traffic.
+
+Encodes representative cursor_update, delta_update and operation_applied
+frames the way collaboration-service sends them (a Socket.IO event packet for
+JSON clients; a binary attachment plus placeholder packet for msgpack
+clients, see src/framing.py) and reports:
+
+- bytes per delivered message on the wire
+- CPU per message (encode once per emit, decode once per recipient)
+- bytes/second for a room where every user moves their cursor at 10 Hz
+
+Runs offline; no services are needed.
+
+Usage:
+    python scripts/tests/test_collab_framing_benchmark.py --iterations 20000
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT / "services" / "collaboration-service"))
+
+from src.framing import decode_frame, encode_frame  # noqa: E402
+
+# ANSI color codes
+GREEN = '\033[92m'
+RED = '\033[91m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+BOLD = '\033[1m'
+
+CURSOR_HZ = 10
+ROOM_SIZES = [10, 50, 200]
+
+
+def print_header(message: str):
+    """Print a formatted header."""
+    print(f"\n{BOLD}{BLUE}{'=' * 80}{RESET}")
+    print(f"{BOLD}{BLUE}{message.center(80)}{RESET}")
+    print(f"{BOLD}{BLUE}{'=' * 80}{RESET}\n")
+
+
+def print_success(message: str):
+    """Print success message."""
+    print(f"{GREEN}✓ {message}{RESET}")
+
+
+def print_error(message: str):
+    """Print error message."""
+    print(f"{RED}✗ {message}{RESET}")
+
+
+def print_info(message: str):
+    """Print info message."""
+    print(f"{YELLOW}ℹ {message}{RESET}")
+
+
+def sample_frames() -> Dict[str, dict]:
+    """Frames shaped like the ones main.py emits."""
+    user_id = str(uuid.uuid4())
+    timestamp = datetime.utcnow().isoformat()
+    return {
+        "cursor_update": {
+            "user_id": user_id,
+            "username": "alice",
+            "color": "#FF6B6B",
+            "x": 512.5,
+            "y": 384.25,
+            "timestamp": timestamp,
+        },
+        "delta_update": {
+            "user_id": user_id,
+            "delta": {
+                f"shape:{uuid.uuid4().hex[:12]}": {"x": 100 + i * 10, "y": 200 + i * 5, "rotation": 0.0}
+                for i in range(5)
+            },
+        },
+        "operation_applied": {
+            "type": "operation_applied",
+            "data": {
+                "element_id": f"shape:{uuid.uuid4().hex[:12]}",
+                "operation_type": "move",
+                "new_value": {"x": 140, "y": 220},
+                "old_value": {"x": 100, "y": 200},
+                "user_id": user_id,
+                "resolved_by_ot": False,
+                "timestamp": timestamp,
+            },
+        },
+    }
+
+
+def json_packet(event: str, payload: dict) -> bytes:
+    """Socket.IO EVENT packet as python-socketio encodes it for JSON clients."""
+    return ("42" + json.dumps([event, payload], separators=(",", ":"))).encode("utf-8")
+
+
+def binary_packets(event: str, payload: dict) -> bytes:
+    """BINARY_EVENT placeholder packet plus the MessagePack attachment."""
+    attachment = encode_frame(payload)
+    header = "451-" + json.dumps([event, {"_placeholder": True, "num": 0}], separators=(",", ":"))
+    return header.encode("utf-8") + attachment
+
+
+def cpu_per_call(fn: Callable[[], object], iterations: int) -> float:
+    """Average CPU time per call in microseconds."""
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def benchmark_frame(event: str, payload: dict, iterations: int) -> Dict[str, float]:
+    json_wire = json_packet(event, payload)
+    binary_wire = binary_packets(event, payload)
+    attachment = encode_frame(payload)
+
+    return {
+        "json_bytes": len(json_wire),
+        "msgpack_bytes": len(binary_wire),
+        "json_encode_us": cpu_per_call(lambda: json_packet(event, payload), iterations),
+        "msgpack_encode_us": cpu_per_call(lambda: binary_packets(event, payload), iterations),
+        "json_decode_us": cpu_per_call(lambda: json.loads(json_wire[2:]), iterations),
+        "msgpack_decode_us": cpu_per_call(lambda: decode_frame(attachment), iterations),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    print_header("Collaboration Framing Benchmark: JSON vs MessagePack")
+    print_info(f"{args.iterations} iterations per measurement")
+
+    results = {event: benchmark_frame(event, payload, args.iterations)
+               for event, payload in sample_frames().items()}
+
+    print(f"\n{BOLD}{'Frame':<18} {'JSON B':>7} {'MP B':>7} {'saved':>7} "
+          f"{'JSON enc µs':>12} {'MP enc µs':>10} {'JSON dec µs':>12} {'MP dec µs':>10}{RESET}")
+    for event, r in results.items():
+        saved = 1 - r["msgpack_bytes"] / r["json_bytes"]
+        print(f"{event:<18} {r['json_bytes']:>7} {r['msgpack_bytes']:>7} {saved:>6.0%} "
+              f"{r['json_encode_us']:>12.2f} {r['msgpack_encode_us']:>10.2f} "
+              f"{r['json_decode_us']:>12.2f} {r['msgpack_decode_us']:>10.2f}")
+
+    # Every user moves at CURSOR_HZ; each move is encoded once and delivered to the other users
+    cursor = results["cursor_update"]
+    print_header(f"Cursor traffic at {CURSOR_HZ} Hz per user")
+    print(f"{BOLD}{'Users':>6} {'msgs/s out':>11} {'JSON KB/s':>10} {'MP KB/s':>9} "
+          f"{'JSON CPU ms/s':>14} {'MP CPU ms/s':>12}{RESET}")
+    for users in ROOM_SIZES:
+        emits = users * CURSOR_HZ
+        delivered = emits * (users - 1)
+        print(f"{users:>6} {delivered:>11} "
+              f"{delivered * cursor['json_bytes'] / 1024:>10.0f} "
+              f"{delivered * cursor['msgpack_bytes'] / 1024:>9.0f} "
+              f"{emits * cursor['json_encode_us'] / 1000:>14.2f} "
+              f"{emits * cursor['msgpack_encode_us'] / 1000:>12.2f}")
+
+    smaller = all(r["msgpack_bytes"] < r["json_bytes"] for r in results.values())
+    if smaller:
+        print_success("MessagePack frames are smaller than JSON for every frame type")
+        return 0
+    print_error("MessagePack frames are not smaller for every frame type")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+Load test for collaboration-service with fan-out latency SLOs.
+
+Simulates ROOMS x USERS Socket.IO clients (python-socketio) against one or
+more collaboration-service instances sharing one Redis. Every user sends a
+mix of traffic for --duration seconds after a --warmup:
+
+- cursor_move at --cursor-hz (delivered as coalesced cursor_update ticks)
+- delta_update at --delta-hz
+- lock_element / unlock_element every --lock-every seconds
+- action_performed + undo_action every --undo-every seconds
+
+Each message carries the time it was sent (cursor x, delta "sent_at",
+lock element ids, undo action ids), so every delivery to another user of
+the room yields one end-to-end fan-out latency. The report has p50/p99
+latency per message type, messages per second sent and delivered, and
+server memory (RSS) per connected socket. The run fails if an SLO is
+missed, or, with --baseline, if p99 latency, delivered messages per second
+or memory per socket regress by more than --tolerance against an earlier
+--output file.
+
+By default the test starts --instances local instances on ports from
+--port, with COLLAB_SHARDS set so that they agree on room owners, and
+connects the users of each room to its owner, as nginx does (see
+src/sharding.py). With --url it targets running instances instead (rooms
+are spread round-robin, and memory is not measured). Redis must be
+reachable at REDIS_HOST / REDIS_PORT (default localhost:6379).
+
+Usage:
+    python scripts/tests/test_collab_load.py --rooms 20 --users 10 --duration 30
+    python scripts/tests/test_collab_load.py --instances 2 --output load.json
+    python scripts/tests/test_collab_load.py --baseline load.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import socketio
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SERVICE_DIR = REPO_ROOT / "services" / "collaboration-service"
+sys.path.insert(0, str(SERVICE_DIR))
+
+from src.sharding import HashRing, shard_key  # noqa: E402
+
+# ANSI color codes
+GREEN = '\033[92m'
+RED = '\033[91m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+BOLD = '\033[1m'
+
+MESSAGE_TYPES = ["cursor", "delta", "lock", "undo"]
+
+
+def print_header(message: str):
+    """Print a formatted header."""
+    print(f"\n{BOLD}{BLUE}{'=' * 80}{RESET}")
+    print(f"{BOLD}{BLUE}{message.center(80)}{RESET}")
+    print(f"{BOLD}{BLUE}{'=' * 80}{RESET}\n")
+
+
+def print_success(message: str):
+    """Print success message."""
+    print(f"{GREEN}✓ {message}{RESET}")
+
+
+def print_error(message: str):
+    """Print error message."""
+    print(f"{RED}✗ {message}{RESET}")
+
+
+def print_info(message: str):
+    """Print info message."""
+    print(f"{YELLOW}ℹ {message}{RESET}")
+
+
+def start_instance(port: int, instance_id: str, shards: str) -> subprocess.Popen:
+    """Start one collaboration-service instance."""
+    env = {
+        **os.environ,
+        "INSTANCE_ID": instance_id,
+        "COLLAB_SHARDS": shards,
+        "LOG_LEVEL": "WARNING",
+        "PYTHONPATH": f"{REPO_ROOT}{os.pathsep}{os.environ.get('PYTHONPATH', '')}",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:socket_app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def stop_instance(process: subprocess.Popen):
+    """Stop an instance."""
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def wait_until_ready(url: str, timeout: float = 30.0) -> bool:
+    """Poll /health until it answers 200."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(f"{url}/health", timeout=2)
+                if response.status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of a process (Linux /proc), or None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def total_rss(pids: List[int]) -> Optional[int]:
+    """Combined RSS of the local instances, or None if not measurable."""
+    sizes = [rss_bytes(pid) for pid in pids]
+    if not sizes or None in sizes:
+        return None
+    return sum(sizes)
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of unsorted values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LoadStats:
+    """Sent and delivered messages, and delivery latencies, of the whole run."""
+
+    def __init__(self):
+        self.epoch = time.perf_counter()
+        self.recording = False
+        self.sent: Counter = Counter()
+        self.delivered: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.latencies: Dict[str, List[float]] = {kind: [] for kind in MESSAGE_TYPES}
+        self.sent_at: Dict[str, float] = {}  # lock element / undo action id -> send time
+
+    def now_ms(self) -> float:
+        return (time.perf_counter() - self.epoch) * 1000
+
+    def record_sent(self, kind: str, key: Optional[str] = None) -> float:
+        sent = self.now_ms()
+        if key is not None:
+            self.sent_at[key] = sent
+        if self.recording:
+            self.sent[kind] += 1
+        return sent
+
+    def record_delivery(self, kind: str, sent: Optional[float]):
+        if not self.recording or not isinstance(sent, (int, float)):
+            return
+        self.delivered[kind] += 1
+        self.latencies[kind].append(self.now_ms() - sent)
+
+
+class LoadClient:
+    """One simulated user: sends the traffic mix and timestamps what it receives."""
+
+    def __init__(self, stats: LoadStats, url: str, room: str, user_id: str):
+        self.stats = stats
+        self.url = url
+        self.room = room
+        self.user_id = user_id
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on('cursor_update', self._on_cursor)
+        self.sio.on('delta_update', self._on_delta)
+        self.sio.on('element_locked', self._on_locked)
+        self.sio.on('action_undone', self._on_undone)
+
+    # Receiving
+
+    async def _on_cursor(self, data):
+        if isinstance(data, dict) and data.get('user_id') != self.user_id:
+            self.stats.record_delivery("cursor", data.get('x'))
+
+    async def _on_delta(self, data):
+        if isinstance(data, dict):
+            for changes in data.values():
+                if isinstance(changes, dict):
+                    self.stats.record_delivery("delta", changes.get('sent_at'))
+
+    async def _on_locked(self, data):
+        if isinstance(data, dict) and data.get('user_id') != self.user_id:
+            self.stats.record_delivery("lock", self.stats.sent_at.get(data.get('element_id')))
+
+    async def _on_undone(self, data):
+        if isinstance(data, dict) and data.get('user_id') != self.user_id:
+            action = data.get('action') or {}
+            self.stats.record_delivery("undo", self.stats.sent_at.get(action.get('action_id')))
+
+    # Sending
+
+    async def join(self):
+        await self.sio.connect(self.url, transports=['websocket'])
+        result = await self.sio.call('join_room', {
+            'room': self.room,
+            'user_id': self.user_id,
+            'username': self.user_id,
+            'role': 'editor'
+        }, timeout=30)
+        if not result or not result.get('success'):
+            raise RuntimeError(f"{self.user_id} failed to join {self.room}: {result}")
+
+    async def _every(self, interval: float, send, until: float):
+        """Call send every `interval` seconds (first call at a random offset) until the deadline."""
+        await asyncio.sleep(random.uniform(0, interval))
+        while time.monotonic() < until:
+            started = time.monotonic()
+            try:
+                await send()
+            except Exception:
+                self.stats.errors[send.__name__] += 1
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    async def send_cursor(self):
+        sent = self.stats.record_sent("cursor")
+        await self.sio.emit('cursor_move', {
+            'room': self.room, 'user_id': self.user_id, 'x': sent, 'y': random.uniform(0, 1000)
+        })
+
+    async def send_delta(self):
+        sent = self.stats.record_sent("delta")
+        element_id = f"shape:{self.user_id}-{random.randrange(20)}"
+        await self.sio.emit('delta_update', {
+            'room': self.room,
+            'user_id': self.user_id,
+            'delta': {element_id: {
+                'x': random.uniform(0, 2000), 'y': random.uniform(0, 2000), 'sent_at': sent
+            }}
+        })
+
+    async def send_lock(self):
+        element_id = f"shape:lock-{uuid.uuid4().hex[:12]}"
+        self.stats.record_sent("lock", element_id)
+        await self.sio.call('lock_element', {
+            'room': self.room, 'element_id': element_id, 'user_id': self.user_id, 'username': self.user_id
+        }, timeout=10)
+        await self.sio.call('unlock_element', {
+            'room': self.room, 'element_id': element_id, 'user_id': self.user_id
+        }, timeout=10)
+
+    async def send_undo(self):
+        action_id = uuid.uuid4().hex
+        await self.sio.call('action_performed', {
+            'room': self.room,
+            'user_id': self.user_id,
+            'action': {
+                'action_id': action_id,
+                'action_type': 'update',
+                'element_id': f"shape:{self.user_id}-0",
+                'element_type': 'shape',
+                'before_state': {'x': 0},
+                'after_state': {'x': 10}
+            }
+        }, timeout=10)
+        self.stats.record_sent("undo", action_id)
+        await self.sio.call('undo_action', {'room': self.room, 'user_id': self.user_id}, timeout=10)
+
+    async def run(self, args, until: float):
+        await asyncio.gather(
+            self._every(1.0 / args.cursor_hz, self.send_cursor, until),
+            self._every(1.0 / args.delta_hz, self.send_delta, until),
+            self._every(args.lock_every, self.send_lock, until),
+            self._every(args.undo_every, self.send_undo, until),
+        )
+
+
+def assign_rooms(rooms: List[str], urls: List[str], ring: Optional[HashRing]) -> Dict[str, str]:
+    """Instance URL each room's users connect to: the room's owner, or round-robin."""
+    if ring is None:
+        return {room: urls[i % len(urls)] for i, room in enumerate(rooms)}
+    return {room: urls[int(ring.owner(shard_key(room)))] for room in rooms}
+
+
+async def run_load(args, urls: List[str], ring: Optional[HashRing], pids: List[int]) -> dict:
+    stats = LoadStats()
+    run_id = uuid.uuid4().hex[:8]
+    rooms = [f"file:load-{run_id}-{r}" for r in range(args.rooms)]
+    targets = assign_rooms(rooms, urls, ring)
+    clients = [
+        LoadClient(stats, targets[room], room, f"load-{run_id}-{r}-{u}")
+        for r, room in enumerate(rooms) for u in range(args.users)
+    ]
+
+    rss_before = total_rss(pids)
+    try:
+        for start in range(0, len(clients), args.connect_batch):
+            await asyncio.gather(*(client.join() for client in clients[start:start + args.connect_batch]))
+        print_info(f"{len(clients)} users joined {len(rooms)} rooms on {len(urls)} instance(s)")
+        rss_joined = total_rss(pids)
+
+        until = time.monotonic() + args.warmup + args.duration
+        senders = asyncio.gather(*(client.run(args, until) for client in clients))
+        await asyncio.sleep(args.warmup)
+        stats.recording = True
+        started = time.monotonic()
+        await senders
+        # Let the last fan-out arrive
+        await asyncio.sleep(1.0)
+        stats.recording = False
+        elapsed = time.monotonic() - started
+        rss_end = total_rss(pids)
+
+        async with httpx.AsyncClient() as http:
+            health = [(await http.get(f"{url}/health", timeout=5)).json() for url in urls]
+    finally:
+        await asyncio.gather(*(client.sio.disconnect() for client in clients if client.sio.connected))
+
+    sockets = len(clients)
+    measured = None not in (rss_before, rss_joined, rss_end)
+    results = {
+        "rooms": args.rooms,
+        "users": args.users,
+        "instances": len(urls),
+        "duration_s": round(elapsed, 2),
+        "sent_per_s": round(sum(stats.sent.values()) / elapsed, 1),
+        "delivered_per_s": round(sum(stats.delivered.values()) / elapsed, 1),
+        "errors": dict(stats.errors),
+        "latency_ms": {},
+        "memory_per_socket_kb": round((rss_joined - rss_before) / sockets / 1024, 1) if measured else None,
+        "memory_end_per_socket_kb": round((rss_end - rss_before) / sockets / 1024, 1) if measured else None,
+        "send_queue_resyncs": sum(h.get("send_queues", {}).get("resyncs", 0) for h in health),
+    }
+    for kind in MESSAGE_TYPES:
+        latencies = stats.latencies[kind]
+        results["latency_ms"][kind] = {
+            "sent": stats.sent[kind],
+            "delivered": stats.delivered[kind],
+            "p50": round(percentile(latencies, 0.50), 2) if latencies else None,
+            "p99": round(percentile(latencies, 0.99), 2) if latencies else None,
+        }
+    every = [latency for values in stats.latencies.values() for latency in values]
+    results["latency_ms"]["all"] = {
+        "sent": sum(stats.sent.values()),
+        "delivered": len(every),
+        "p50": round(percentile(every, 0.50), 2) if every else None,
+        "p99": round(percentile(every, 0.99), 2) if every else None,
+    }
+    return results
+
+
+def print_report(results: dict):
+    print_header("Results")
+    print(f"{BOLD}{'Type':<8} {'sent':>8} {'delivered':>10} {'p50 ms':>9} {'p99 ms':>9}{RESET}")
+    for kind, row in results["latency_ms"].items():
+        p50 = f"{row['p50']:.2f}" if row["p50"] is not None else "-"
+        p99 = f"{row['p99']:.2f}" if row["p99"] is not None else "-"
+        print(f"{kind:<8} {row['sent']:>8} {row['delivered']:>10} {p50:>9} {p99:>9}")
+    print()
+    print_info(f"Sent {results['sent_per_s']} msg/s, delivered {results['delivered_per_s']} msg/s "
+               f"over {results['duration_s']}s")
+    if results["memory_per_socket_kb"] is not None:
+        print_info(f"Server memory: {results['memory_per_socket_kb']} KB/socket after join, "
+                   f"{results['memory_end_per_socket_kb']} KB/socket at the end")
+    print_info(f"Send queue resyncs: {results['send_queue_resyncs']}, client errors: {results['errors'] or 0}")
+
+
+def check_slos(results: dict, args, baseline: Optional[dict]) -> bool:
+    """Print every SLO check. Returns True if all passed."""
+    print_header("SLOs")
+    checks = []
+    overall = results["latency_ms"]["all"]
+    if overall["p50"] is not None:
+        checks.append((f"p50 fan-out latency {overall['p50']:.2f} ms <= {args.slo_p50_ms} ms",
+                       overall["p50"] <= args.slo_p50_ms))
+        checks.append((f"p99 fan-out latency {overall['p99']:.2f} ms <= {args.slo_p99_ms} ms",
+                       overall["p99"] <= args.slo_p99_ms))
+    else:
+        checks.append(("messages were delivered", False))
+    checks.append((f"{results['delivered_per_s']} delivered msg/s >= {args.slo_min_rate}",
+                   results["delivered_per_s"] >= args.slo_min_rate))
+    if results["memory_per_socket_kb"] is not None:
+        checks.append((f"{results['memory_per_socket_kb']} KB/socket <= {args.slo_socket_kb} KB",
+                       results["memory_per_socket_kb"] <= args.slo_socket_kb))
+    checks.append((f"{results['send_queue_resyncs']} send queue resyncs <= {args.slo_resyncs}",
+                   results["send_queue_resyncs"] <= args.slo_resyncs))
+
+    if baseline is not None:
+        allowed = 1 + args.tolerance
+        before = baseline["latency_ms"]["all"]["p99"]
+        if before is not None and overall["p99"] is not None:
+            checks.append((f"p99 {overall['p99']:.2f} ms within {args.tolerance:.0%} of baseline {before:.2f} ms",
+                           overall["p99"] <= before * allowed))
+        checks.append((f"{results['delivered_per_s']} delivered msg/s within {args.tolerance:.0%} "
+                       f"of baseline {baseline['delivered_per_s']}",
+                       results["delivered_per_s"] * allowed >= baseline["delivered_per_s"]))
+        before = baseline.get("memory_per_socket_kb")
+        if before and results["memory_per_socket_kb"] is not None:
+            checks.append((f"{results['memory_per_socket_kb']} KB/socket within {args.tolerance:.0%} "
+                           f"of baseline {before} KB",
+                           results["memory_per_socket_kb"] <= before * allowed))
+
+    for description, passed in checks:
+        (print_success if passed else print_error)(description)
+    return all(passed for _, passed in checks)
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--users", type=int, default=10, help="Users per room")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of traffic before measuring")
+    parser.add_argument("--instances", type=int, default=1, help="Local instances to start")
+    parser.add_argument("--port", type=int, default=8283, help="Port of the first local instance")
+    parser.add_argument("--url", action="append", default=[], help="Use running instance(s) instead")
+    parser.add_argument("--connect-batch", type=int, default=50, help="Users connecting at once")
+    parser.add_argument("--seed", type=int, default=1)
+    # Traffic mix, per user
+    parser.add_argument("--cursor-hz", type=float, default=10.0)
+    parser.add_argument("--delta-hz", type=float, default=2.0)
+    parser.add_argument("--lock-every", type=float, default=5.0, help="Seconds between lock/unlock pairs")
+    parser.add_argument("--undo-every", type=float, default=5.0, help="Seconds between action/undo pairs")
+    # SLOs
+    parser.add_argument("--slo-p50-ms", type=float, default=50.0)
+    parser.add_argument("--slo-p99-ms", type=float, default=250.0)
+    parser.add_argument("--slo-min-rate", type=float, default=0.0, help="Minimum delivered msg/s")
+    parser.add_argument("--slo-socket-kb", type=float, default=256.0, help="Maximum server KB per socket")
+    parser.add_argument("--slo-resyncs", type=int, default=0, help="Maximum slow-consumer resyncs")
+    parser.add_argument("--baseline", type=Path, help="Results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against --baseline")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print_header("Collaboration Load Test")
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+
+    processes: List[subprocess.Popen] = []
+    ring = None
+    if args.url:
+        urls = args.url
+    else:
+        ports = [args.port + i for i in range(args.instances)]
+        # Instance ids are their index, so the ring maps rooms straight to urls
+        shards = {str(i): f"localhost:{port}" for i, port in enumerate(ports)}
+        ring = HashRing(shards)
+        shards_env = ",".join(f"{instance_id}={address}" for instance_id, address in shards.items())
+        processes = [start_instance(port, str(i), shards_env) for i, port in enumerate(ports)]
+        urls = [f"http://localhost:{port}" for port in ports]
+
+    try:
+        for url in urls:
+            if not await wait_until_ready(url):
+                print_error(f"Instance {url} did not become ready")
+                return 1
+        print_info(f"{args.rooms} rooms x {args.users} users, {args.duration:.0f}s after {args.warmup:.0f}s warmup")
+        results = await run_load(args, urls, ring, [process.pid for process in processes])
+    finally:
+        for process in processes:
+            stop_instance(process)
+
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print_info(f"Results written to {args.output}")
+
+    if check_slos(results, args, baseline):
+        print_success("All SLOs met")
+        return 0
+    print_error("SLO regression")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark the OT operation log lookup in collaboration-service.
+
+Replays a room receiving --rate operations per second (timestamps advance
+by 1/rate) spread over --elements elements by --users users, and measures
+the per-operation CPU cost of finding concurrent operations and recording
+the new one:
+
+- list: the previous implementation, a list of up to 1000 dicts scanned
+  linearly, parsing each timestamp, then trimmed by slicing
+- indexed: OperationLog (src/operation_log.py), typed records in a ring
+  buffer with a per-element index of recent operations
+
+Both must find the same concurrent operations. The indexed log must fit
+--rate operations into one second of CPU with room to spare.
+
+Runs offline; no services are needed.
+
+Usage:
+    python scripts/tests/test_collab_ot_log_benchmark.py --rate 10000 --seconds 3
+"""
+
+import argparse
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT / "services" / "collaboration-service"))
+
+from src.operation_log import Operation, OperationLog  # noqa: E402
+
+# ANSI color codes
+GREEN = '\033[92m'
+RED = '\033[91m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+BOLD = '\033[1m'
+
+# Share of one core the indexed log may use at the target rate
+CPU_BUDGET = 0.25
+
+
+def print_header(message: str):
+    """Print a formatted header."""
+    print(f"\n{BOLD}{BLUE}{'=' * 80}{RESET}")
+    print(f"{BOLD}{BLUE}{message.center(80)}{RESET}")
+    print(f"{BOLD}{BLUE}{'=' * 80}{RESET}\n")
+
+
+def print_success(message: str):
+    """Print success message."""
+    print(f"{GREEN}✓ {message}{RESET}")
+
+
+def print_error(message: str):
+    """Print error message."""
+    print(f"{RED}✗ {message}{RESET}")
+
+
+def print_info(message: str):
+    """Print info message."""
+    print(f"{YELLOW}ℹ {message}{RESET}")
+
+
+def generate_operations(count: int, rate: int, elements: int, users: int) -> List[Operation]:
+    """Operations as element_update_ot creates them, `rate` per second."""
+    start = datetime.utcnow()
+    step = timedelta(seconds=1 / rate)
+    element_ids = [f"shape:{uuid.uuid4().hex[:12]}" for _ in range(elements)]
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    return [
+        Operation(
+            operation_id=str(uuid.uuid4()),
+            user_id=random.choice(user_ids),
+            element_id=random.choice(element_ids),
+            operation_type=random.choice(["move", "resize", "color"]),
+            old_value={"x": i, "y": i},
+            new_value={"x": i + 1, "y": i + 1},
+            timestamp=start + step * i
+        )
+        for i in range(count)
+    ]
+
+
+def run_list(operations: List[Operation]) -> List[int]:
+    """Previous implementation; returns the number of concurrent operations per operation."""
+    history: List[dict] = []
+    found = []
+    for operation in operations:
+        concurrent = [
+            op for op in history
+            if op['element_id'] == operation.element_id
+            and abs((datetime.fromisoformat(op['timestamp']) - operation.timestamp).total_seconds()) < 1.0
+            and op['user_id'] != operation.user_id
+            and not op.get('transformed', False)
+        ]
+        found.append(len([Operation.from_dict(op) for op in concurrent]))
+        history.append(operation.to_dict())
+        if len(history) > 1000:
+            history = history[-1000:]
+    return found
+
+
+def run_indexed(operations: List[Operation]) -> List[int]:
+    history = OperationLog()
+    found = []
+    for operation in operations:
+        found.append(len(history.concurrent(operation)))
+        history.append(operation)
+    return found
+
+
+def cpu_per_op(fn, operations: List[Operation]):
+    start = time.process_time()
+    result = fn(operations)
+    return (time.process_time() - start) / len(operations) * 1e6, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=int, default=10000, help="Operations per second per room")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Simulated seconds of traffic")
+    parser.add_argument("--elements", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    print_header("OT Operation Log Benchmark")
+    operations = generate_operations(int(args.rate * args.seconds), args.rate, args.elements, args.users)
+    print_info(f"{len(operations)} operations at {args.rate}/s over {args.elements} elements by {args.users} users")
+
+    list_us, list_found = cpu_per_op(run_list, operations)
+    indexed_us, indexed_found = cpu_per_op(run_indexed, operations)
+
+    print(f"\n{BOLD}{'Log':<10} {'µs/op':>10} {'CPU at rate':>12}{RESET}")
+    for name, us in (("list", list_us), ("indexed", indexed_us)):
+        print(f"{name:<10} {us:>10.2f} {us * args.rate / 1e6:>11.1%}")
+    print_info(f"Indexed lookup is {list_us / indexed_us:.0f}x faster")
+
+    passed = True
+    if list_found == indexed_found:
+        print_success("Both logs find the same concurrent operations")
+    else:
+        mismatches = sum(1 for a, b in zip(list_found, indexed_found) if a != b)
+        print_error(f"{mismatches} operations found different concurrent operations")
+        passed = False
+
+    if indexed_us * args.rate / 1e6 <= CPU_BUDGET:
+        print_success(f"Indexed log handles {args.rate} ops/s within {CPU_BUDGET:.0%} of a core")
+    else:
+        print_error(f"Indexed log needs more than {CPU_BUDGET:.0%} of a core at {args.rate} ops/s")
+        passed = False
+
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
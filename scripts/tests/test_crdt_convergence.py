@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Test convergence of the collaboration CRDT document (src/crdt.py).
+
+Generates random edit histories (several clients writing and deleting the
+same elements with interleaved Lamport clocks) and checks that:
+
+- merge order does not matter: every delivery order that keeps each
+  client's own updates in order, with duplicates, yields the same elements
+- compaction preserves state: a compacted document materializes the same
+  elements, and its updates (sent whole or as a diff) rebuild it
+- replicas converge across compaction: replicas that applied different
+  prefixes of the history, or compacted at different times, catch up
+  through diff(state_vector) to the same elements
+- updates and state vectors survive the MessagePack encoding
+
+Runs offline; no services are needed.
+
+Usage:
+    python scripts/tests/test_crdt_convergence.py --rounds 200 --seed 7
+"""
+
+import argparse
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT / "services" / "collaboration-service"))
+
+from src.crdt import (  # noqa: E402
+    CRDTDocument,
+    Update,
+    decode_state_vector,
+    decode_updates,
+    encode_state_vector,
+    encode_updates,
+)
+
+# ANSI color codes
+GREEN = '\033[92m'
+RED = '\033[91m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+BOLD = '\033[1m'
+
+CLIENTS = ["alice", "bob", "carol"]
+ELEMENTS = ["e1", "e2", "e3", "e4"]
+PROPERTIES = ["x", "y", "fill", "text"]
+
+
+def print_header(message: str):
+    """Print a formatted header."""
+    print(f"\n{BOLD}{BLUE}{'=' * 80}{RESET}")
+    print(f"{BOLD}{BLUE}{message.center(80)}{RESET}")
+    print(f"{BOLD}{BLUE}{'=' * 80}{RESET}\n")
+
+
+def print_success(message: str):
+    """Print success message."""
+    print(f"{GREEN}✓ {message}{RESET}")
+
+
+def print_error(message: str):
+    """Print error message."""
+    print(f"{RED}✗ {message}{RESET}")
+
+
+def print_info(message: str):
+    """Print info message."""
+    print(f"{YELLOW}ℹ {message}{RESET}")
+
+
+def random_history(rng: random.Random, length: int) -> Dict[str, List[Update]]:
+    """Updates of each client, in the order that client made them."""
+    clocks = {client: 0 for client in CLIENTS}
+    lamports = {client: 0 for client in CLIENTS}
+    history: Dict[str, List[Update]] = {client: [] for client in CLIENTS}
+    for _ in range(length):
+        client = rng.choice(CLIENTS)
+        # Sometimes the client has seen another client's writes, sometimes not (concurrency)
+        if rng.random() < 0.5:
+            lamports[client] = max(lamports[client], lamports[rng.choice(CLIENTS)])
+        clocks[client] += 1
+        lamports[client] += 1
+        element_id = rng.choice(ELEMENTS)
+        if rng.random() < 0.15:
+            update = Update(client, clocks[client], lamports[client], element_id, deleted=True)
+        else:
+            props = rng.sample(PROPERTIES, rng.randint(1, len(PROPERTIES)))
+            fields = {prop: f"{client}-{clocks[client]}-{prop}" for prop in props}
+            update = Update(client, clocks[client], lamports[client], element_id, fields)
+        history[client].append(update)
+    return history
+
+
+def delivery_order(rng: random.Random, history: Dict[str, List[Update]], duplicates: bool = False) -> List[Update]:
+    """A random interleaving that keeps each client's updates in order."""
+    positions = {client: 0 for client in history}
+    order: List[Update] = []
+    while any(positions[client] < len(updates) for client, updates in history.items()):
+        client = rng.choice([c for c, updates in history.items() if positions[c] < len(updates)])
+        order.append(history[client][positions[client]])
+        positions[client] += 1
+        if duplicates and order and rng.random() < 0.2:
+            order.append(rng.choice(order))
+    return order
+
+
+def prefix(rng: random.Random, history: Dict[str, List[Update]]) -> List[Update]:
+    """The updates of a replica that has seen only part of each client's history."""
+    return [update for updates in history.values() for update in updates[:rng.randint(0, len(updates))]]
+
+
+def check_order_independence(rng: random.Random, rounds: int) -> bool:
+    for round_number in range(rounds):
+        history = random_history(rng, rng.randint(5, 60))
+        expected = CRDTDocument.from_updates(delivery_order(rng, history)).elements()
+        for _ in range(5):
+            elements = CRDTDocument.from_updates(delivery_order(rng, history, duplicates=True)).elements()
+            if elements != expected:
+                print_error(f"Round {round_number}: delivery order changed the result")
+                return False
+    print_success(f"{rounds} histories: every delivery order yields the same elements")
+    return True
+
+
+def check_compaction_preserves_state(rng: random.Random, rounds: int) -> bool:
+    for round_number in range(rounds):
+        history = random_history(rng, rng.randint(5, 60))
+        document = CRDTDocument.from_updates(delivery_order(rng, history))
+        expected = document.elements()
+        log_size = len(document.log)
+        removed = document.compact()
+
+        rebuilt = CRDTDocument.from_updates(document.diff())
+        if document.elements() != expected or rebuilt.elements() != expected:
+            print_error(f"Round {round_number}: compaction changed the document")
+            return False
+        if len(document.log) != log_size - removed:
+            print_error(f"Round {round_number}: compact() miscounted removed updates")
+            return False
+    print_success(f"{rounds} histories: compacted documents keep and rebuild the same elements")
+    return True
+
+
+def check_replicas_converge_across_compaction(rng: random.Random, rounds: int) -> bool:
+    for round_number in range(rounds):
+        history = random_history(rng, rng.randint(5, 60))
+        server = CRDTDocument.from_updates(delivery_order(rng, history))
+        expected = server.elements()
+
+        # A replica that saw part of the history before the server compacted
+        replica = CRDTDocument.from_updates(prefix(rng, history))
+        server.compact()
+        replica.apply_many(server.diff(replica.state_vector))
+        # (State vectors may still differ: compaction can drop a client's latest update)
+        if replica.elements() != expected:
+            print_error(f"Round {round_number}: replica did not catch up after compaction")
+            return False
+
+        # Two peers that each saw part of the history and compacted independently
+        a = CRDTDocument.from_updates(prefix(rng, history))
+        b = CRDTDocument.from_updates(prefix(rng, history))
+        a.compact()
+        b.compact()
+        a_missing, b_missing = b.diff(a.state_vector), a.diff(b.state_vector)
+        a.apply_many(a_missing)
+        b.apply_many(b_missing)
+        if a.elements() != b.elements():
+            print_error(f"Round {round_number}: independently compacted peers diverged")
+            return False
+        a.apply_many(server.diff(a.state_vector))
+        b.apply_many(server.diff(b.state_vector))
+        if a.elements() != expected or b.elements() != expected:
+            print_error(f"Round {round_number}: peers did not converge with the server")
+            return False
+    print_success(f"{rounds} histories: replicas converge through diffs across compaction")
+    return True
+
+
+def check_encoding_round_trip(rng: random.Random) -> bool:
+    history = random_history(rng, 40)
+    updates = delivery_order(rng, history)
+    document = CRDTDocument.from_updates(updates)
+    decoded = decode_updates(encode_updates(updates))
+    state_vector = decode_state_vector(encode_state_vector(document.state_vector))
+    ok = decoded == updates and state_vector == document.state_vector
+    if ok:
+        print_success("Updates and state vectors survive MessagePack encoding")
+    else:
+        print_error("MessagePack round trip changed updates or the state vector")
+    return ok
+
+
+def run_checks(seed: int, rounds: int) -> bool:
+    rng = random.Random(seed)
+    results = [
+        check_order_independence(rng, rounds),
+        check_compaction_preserves_state(rng, rounds),
+        check_replicas_converge_across_compaction(rng, rounds),
+        check_encoding_round_trip(rng),
+    ]
+    print_info(f"{sum(results)}/{len(results)} checks passed")
+    return all(results)
+
+
+def test_crdt_convergence():
+    """Entry point for pytest, with the default seed."""
+    assert run_checks(seed=7, rounds=100)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200, help="Random histories per check")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print_header("CRDT Convergence Test")
+    print_info(f"seed={args.seed} rounds={args.rounds}")
+    return 0 if run_checks(args.seed, args.rounds) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test merging per-hit fields into cached share snapshots (diagram-service).
+
+Public share links serve a snapshot serialized once (serialize_payload) and
+splice per-hit fields into its bytes (merge_payload) instead of decoding and
+re-encoding it. Checks that the spliced bytes are valid JSON with every
+field, for regular, nested, unicode and empty snapshots.
+
+Runs offline; no services are needed.
+
+Usage:
+    python scripts/tests/test_share_payload_merge.py
+"""
+
+import json
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT / "services" / "diagram-service"))
+
+from src.share_cache import merge_payload, serialize_payload  # noqa: E402
+
+# ANSI color codes
+GREEN = '\033[92m'
+RED = '\033[91m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+BOLD = '\033[1m'
+
+
+def print_header(message: str):
+    """Print a formatted header."""
+    print(f"\n{BOLD}{BLUE}{'=' * 80}{RESET}")
+    print(f"{BOLD}{BLUE}{message.center(80)}{RESET}")
+    print(f"{BOLD}{BLUE}{'=' * 80}{RESET}\n")
+
+
+def print_success(message: str):
+    """Print success message."""
+    print(f"{GREEN}✓ {message}{RESET}")
+
+
+def print_error(message: str):
+    """Print error message."""
+    print(f"{RED}✗ {message}{RESET}")
+
+
+def print_info(message: str):
+    """Print info message."""
+    print(f"{YELLOW}ℹ {message}{RESET}")
+
+
+HIT_FIELDS = {"view_count": 42, "share_token": "abc123"}
+
+SNAPSHOTS = {
+    "regular": {"id": "file-1", "title": "Diagram", "canvas_data": {"shapes": [{"id": "a", "x": 1}]}},
+    "nested": {"canvas_data": {"shapes": [], "meta": {"tags": ["x", {"y": None}]}}},
+    "unicode": {"title": "Überblick – ダイアグラム", "note": "emoji 🎉"},
+    "empty": {},
+}
+
+
+def check_merge(name: str, payload: dict) -> bool:
+    merged = merge_payload(serialize_payload(payload), HIT_FIELDS)
+    try:
+        decoded = json.loads(merged)
+    except ValueError as e:
+        print_error(f"{name}: merged payload is not valid JSON ({e}): {merged[:80]!r}")
+        return False
+    if decoded != {**HIT_FIELDS, **payload}:
+        print_error(f"{name}: merged payload lost fields: {decoded}")
+        return False
+    print_success(f"{name} snapshot: valid JSON with every field")
+    return True
+
+
+def test_merge_payload() -> bool:
+    return all([check_merge(name, payload) for name, payload in SNAPSHOTS.items()])
+
+
+def test_empty_snapshot_with_whitespace() -> bool:
+    merged = merge_payload(b"{ }", HIT_FIELDS)
+    ok = json.loads(merged) == HIT_FIELDS
+    if ok:
+        print_success("Empty snapshot with whitespace merges to the hit fields only")
+    else:
+        print_error(f"Unexpected merge of empty snapshot: {merged!r}")
+    return ok
+
+
+def test_no_fields_returns_snapshot() -> bool:
+    snapshot = serialize_payload(SNAPSHOTS["regular"])
+    ok = merge_payload(snapshot, {}) is snapshot
+    if ok:
+        print_success("No per-hit fields returns the cached bytes untouched")
+    else:
+        print_error("Snapshot was copied or changed without fields to add")
+    return ok
+
+
+def main() -> int:
+    print_header("Share Payload Merge Test")
+    results = [test_merge_payload(), test_empty_snapshot_with_whitespace(), test_no_fields_returns_snapshot()]
+    print_info(f"{sum(results)}/{len(results)} checks passed")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
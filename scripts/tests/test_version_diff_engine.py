@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Test the element-hash version diff engine of diagram-service.
+
+Checks, against src/version_diff.py directly:
+
+- only changed elements are returned (additions, deletions, modifications)
+- modifications carry property-level changes and only the changed properties
+- the NDJSON record stream matches the diff, with one trailing summary
+- diffs and element indexes are cached by version ID, so a repeated
+  comparison does not load either canvas again
+- prime_adjacent fills the cache for (previous version, new version)
+
+Runs offline; no services are needed.
+
+Usage:
+    python scripts/tests/test_version_diff_engine.py
+"""
+
+import sys
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT / "services" / "diagram-service"))
+
+from src.version_diff import (  # noqa: E402
+    VersionDiffCache,
+    build_element_index,
+    diff_indexes,
+    iter_diff_records,
+)
+
+# ANSI color codes
+GREEN = '\033[92m'
+RED = '\033[91m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+BOLD = '\033[1m'
+
+
+def print_header(message: str):
+    """Print a formatted header."""
+    print(f"\n{BOLD}{BLUE}{'=' * 80}{RESET}")
+    print(f"{BOLD}{BLUE}{message.center(80)}{RESET}")
+    print(f"{BOLD}{BLUE}{'=' * 80}{RESET}\n")
+
+
+def print_success(message: str):
+    """Print success message."""
+    print(f"{GREEN}✓ {message}{RESET}")
+
+
+def print_error(message: str):
+    """Print error message."""
+    print(f"{RED}✗ {message}{RESET}")
+
+
+def print_info(message: str):
+    """Print info message."""
+    print(f"{YELLOW}ℹ {message}{RESET}")
+
+
+BEFORE = {
+    "shapes": [
+        {"id": "a", "type": "rect", "x": 10, "y": 10, "width": 100, "fill": "#fff"},
+        {"id": "b", "type": "text", "x": 50, "y": 50, "text": "hello"},
+        {"id": "c", "type": "ellipse", "x": 0, "y": 0},
+    ]
+}
+AFTER = {
+    "shapes": [
+        {"id": "a", "type": "rect", "x": 20, "y": 10, "width": 100, "fill": "#fff"},
+        {"id": "b", "type": "text", "x": 50, "y": 50, "text": "hello"},
+        {"id": "d", "type": "arrow", "x": 5, "y": 5},
+    ]
+}
+
+
+def counting_loader(canvas: dict, calls: List[str], name: str) -> Callable[[], dict]:
+    def load():
+        calls.append(name)
+        return canvas
+    return load
+
+
+def test_only_changed_elements() -> bool:
+    diff = diff_indexes(build_element_index(BEFORE), build_element_index(AFTER))
+    ok = (
+        [e["id"] for e in diff["additions"]] == ["d"]
+        and [e["id"] for e in diff["deletions"]] == ["c"]
+        and [m["id"] for m in diff["modifications"]] == ["a"]
+        and diff["summary"] == {"total_changes": 3, "added_count": 1, "deleted_count": 1, "modified_count": 1}
+    )
+    if ok:
+        print_success("Unchanged element b is skipped; a modified, c deleted, d added")
+    else:
+        print_error(f"Unexpected diff: {diff}")
+    return ok
+
+
+def test_property_level_changes() -> bool:
+    before = {"elements": [{"id": 1, "x": 1, "label": "old", "stroke": "red"}]}
+    after = {"elements": [{"id": 1, "x": 1, "label": "new", "rotation": 90}]}
+    modification = diff_indexes(build_element_index(before), build_element_index(after))["modifications"][0]
+    changes = {p["property"]: p["change"] for p in modification["properties"]}
+    ok = (
+        modification["id"] == "1"
+        and changes == {"label": "changed", "rotation": "added", "stroke": "removed"}
+        and modification["before"] == {"label": "old", "stroke": "red"}
+        and modification["after"] == {"label": "new", "rotation": 90}
+        and "x" not in modification["before"]
+    )
+    if ok:
+        print_success("Modifications carry only the changed properties")
+    else:
+        print_error(f"Unexpected modification: {modification}")
+    return ok
+
+
+def test_record_stream() -> bool:
+    diff = diff_indexes(build_element_index(BEFORE), build_element_index(AFTER))
+    records = list(iter_diff_records(diff))
+    types = [record["type"] for record in records]
+    ok = types == ["added", "deleted", "modified", "summary"] and records[-1]["total_changes"] == 3
+    if ok:
+        print_success("NDJSON records: additions, deletions, modifications, then summary")
+    else:
+        print_error(f"Unexpected records: {types}")
+    return ok
+
+
+def test_cache_skips_loading() -> bool:
+    cache = VersionDiffCache()
+    calls: List[str] = []
+    load_before = counting_loader(BEFORE, calls, "v1")
+    load_after = counting_loader(AFTER, calls, "v2")
+
+    first = cache.get_diff("v1", "v2", load_before, load_after)
+    second = cache.get_diff("v1", "v2", load_before, load_after)
+    # A new pair sharing v2 reuses its cached element index
+    cache.get_diff("v2", "v3", load_after, counting_loader(BEFORE, calls, "v3"))
+
+    stats = cache.stats()
+    ok = first is second and calls == ["v1", "v2", "v3"] and stats["hits"] == 1 and stats["misses"] == 2
+    if ok:
+        print_success("Repeated diffs and shared versions do not reload canvases")
+    else:
+        print_error(f"Loader calls {calls}, stats {stats}")
+    return ok
+
+
+def test_prime_adjacent() -> bool:
+    cache = VersionDiffCache()
+    calls: List[str] = []
+    cache.prime_adjacent("v1", counting_loader(BEFORE, calls, "v1"), "v2", AFTER)
+    cached = cache.get_cached_diff("v1", "v2")
+    ok = cached is not None and cached["summary"]["total_changes"] == 3 and calls == ["v1"]
+    if ok:
+        print_success("Creating a version primes the diff to its predecessor")
+    else:
+        print_error(f"Primed diff missing or wrong: {cached}")
+    return ok
+
+
+def test_lru_eviction() -> bool:
+    cache = VersionDiffCache(max_indexes=2, max_diffs=1)
+    pairs: List[Tuple[str, str]] = [("v1", "v2"), ("v2", "v3")]
+    for old, new in pairs:
+        cache.get_diff(old, new, lambda: BEFORE, lambda: AFTER)
+    stats = cache.stats()
+    ok = stats["diffs"] == 1 and stats["indexes"] == 2 and cache.get_cached_diff("v1", "v2") is None
+    if ok:
+        print_success("Caches stay within their size limits (LRU eviction)")
+    else:
+        print_error(f"Cache sizes exceeded: {stats}")
+    return ok
+
+
+def main() -> int:
+    print_header("Version Diff Engine Test")
+    tests = [
+        test_only_changed_elements,
+        test_property_level_changes,
+        test_record_stream,
+        test_cache_skips_loading,
+        test_prime_adjacent,
+        test_lru_eviction,
+    ]
+    results = [test() for test in tests]
+    print_info(f"{sum(results)}/{len(results)} checks passed")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
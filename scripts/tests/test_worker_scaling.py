@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Benchmark multi-worker throughput for a service startup script.
+
+Starts `services/<service>/startup.py` with WORKERS=1, 2, 4 and 8, drives
+concurrent load against a lightweight endpoint and reports requests/second
+and latency percentiles for each worker count. Also checks that a graceful
+reload (SIGHUP to the supervisor) under load drops no requests.
+
+The service's dependencies (database, Redis, ...) must be reachable from
+this host, exactly as when running the service outside Docker.
+
+Usage:
+    python scripts/tests/test_worker_scaling.py --service api-gateway --port 8080 --path /health
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+# ANSI color codes
+GREEN = '\033[92m'
+RED = '\033[91m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+BOLD = '\033[1m'
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+WORKER_COUNTS = [1, 2, 4, 8]
+
+
+def print_header(message: str):
+    """Print a formatted header."""
+    print(f"\n{BOLD}{BLUE}{'=' * 80}{RESET}")
+    print(f"{BOLD}{BLUE}{message.center(80)}{RESET}")
+    print(f"{BOLD}{BLUE}{'=' * 80}{RESET}\n")
+
+
+def print_success(message: str):
+    """Print success message."""
+    print(f"{GREEN}✓ {message}{RESET}")
+
+
+def print_error(message: str):
+    """Print error message."""
+    print(f"{RED}✗ {message}{RESET}")
+
+
+def print_info(message: str):
+    """Print info message."""
+    print(f"{YELLOW}ℹ {message}{RESET}")
+
+
+def start_service(service: str, workers: int, tls: bool = False) -> subprocess.Popen:
+    """Start a service's startup.py with the given worker count."""
+    service_dir = REPO_ROOT / "services" / service
+    env = {
+        **os.environ,
+        "WORKERS": str(workers),
+        "TLS_ENABLED": "true" if tls else "false",
+        "PYTHONPATH": f"{REPO_ROOT}{os.pathsep}{os.environ.get('PYTHONPATH', '')}",
+    }
+    return subprocess.Popen(
+        [sys.executable, "startup.py"],
+        cwd=service_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def stop_service(process: subprocess.Popen):
+    """Stop the supervisor and its workers."""
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def wait_until_ready(url: str, timeout: float = 60.0) -> bool:
+    """Poll the endpoint until it answers 200."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(verify=False) as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(url, timeout=2)
+                if response.status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+
+async def run_load(url: str, concurrency: int, duration: float, retry_closed: bool = False) -> Dict:
+    """Drive closed-loop load and collect latency samples and errors.
+
+    With retry_closed, a request that fails because the server closed an idle
+    keep-alive connection (as a draining worker does) is retried once, the way
+    the load balancer retries idempotent requests.
+    """
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(verify=False, limits=limits, timeout=10) as client:
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    try:
+                        response = await client.get(url)
+                    except (httpx.RemoteProtocolError, httpx.ReadError):
+                        if not retry_closed:
+                            raise
+                        response = await client.get(url)
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] if latencies else 0.0,
+    }
+
+
+async def benchmark_workers(args, workers: int) -> Dict:
+    """Benchmark one worker count."""
+    url = f"{args.scheme}://localhost:{args.port}{args.path}"
+    process = start_service(args.service, workers, tls=args.scheme == "https")
+    try:
+        if not await wait_until_ready(url):
+            print_error(f"{args.service} did not become ready with {workers} worker(s)")
+            return {}
+        # Warm up connection pools and per-worker caches
+        await run_load(url, args.concurrency, 2)
+        result = await run_load(url, args.concurrency, args.duration)
+        result["workers"] = workers
+        return result
+    finally:
+        stop_service(process)
+
+
+async def test_graceful_reload(args) -> bool:
+    """SIGHUP the supervisor under load; no request may fail."""
+    url = f"{args.scheme}://localhost:{args.port}{args.path}"
+    process = start_service(args.service, 2, tls=args.scheme == "https")
+    try:
+        if not await wait_until_ready(url):
+            print_error("Service did not become ready for reload test")
+            return False
+
+        load = asyncio.create_task(run_load(url, args.concurrency, args.duration, retry_closed=True))
+        await asyncio.sleep(args.duration / 3)
+        process.send_signal(signal.SIGHUP)
+        result = await load
+
+        if result["errors"] == 0:
+            print_success(f"Graceful reload: {result['requests']} requests, 0 errors")
+            return True
+        print_error(f"Graceful reload: {result['errors']} failed requests out of "
+                    f"{result['requests'] + result['errors']}")
+        return False
+    finally:
+        stop_service(process)
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service", default="api-gateway")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--scheme", default="http", choices=["http", "https"])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0)
+    args = parser.parse_args()
+
+    print_header(f"Worker Scaling Benchmark: {args.service}")
+    print_info(f"{args.concurrency} concurrent clients, {args.duration}s per run, GET {args.path}")
+
+    results = []
+    for workers in WORKER_COUNTS:
+        result = await benchmark_workers(args, workers)
+        if not result:
+            return 1
+        results.append(result)
+        print_info(f"{workers} worker(s): {result['rps']:.0f} req/s, "
+                   f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+                   f"{result['errors']} errors")
+
+    baseline = results[0]["rps"] or 1.0
+    print(f"\n{BOLD}{'Workers':>8} {'req/s':>10} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}{RESET}")
+    for result in results:
+        print(f"{result['workers']:>8} {result['rps']:>10.0f} {result['rps'] / baseline:>7.2f}x "
+              f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>7}")
+
+    print_header("Graceful Reload")
+    reload_ok = await test_graceful_reload(args)
+
+    scaled = len(results) > 1 and results[1]["rps"] > results[0]["rps"]
+    if scaled:
+        print_success("Throughput increases with additional workers")
+    else:
+        print_error("No throughput gain from additional workers")
+
+    return 0 if scaled and reload_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
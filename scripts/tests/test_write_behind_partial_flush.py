@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test write-behind flushes of partially known elements.
+
+A room's CRDT document only holds the fields clients wrote through it, so
+moving an existing shape flushes {"x": ..., "y": ...} for that record.
+Builds the patch with collaboration-service's WriteBehind from a real
+CRDTDocument and merges it with diagram-service's apply_canvas_patch,
+checking that:
+
+- a moved shape keeps id, type, typeName and props
+- a partial props write changes only those props
+- a deleted element is removed, and untouched records are kept
+- only diagram-service's own 404 drops a flush; a 404 from a proxy or an
+  unknown route is retried
+
+Runs offline; no services are needed.
+
+Usage:
+    python scripts/tests/test_write_behind_partial_flush.py
+"""
+
+import asyncio
+import importlib.util
+import sys
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT / "services" / "collaboration-service"))
+
+from src.crdt import CRDTDocument, Update  # noqa: E402
+from src.timers import TimerScheduler  # noqa: E402
+from src.write_behind import WriteBehind, is_final_rejection  # noqa: E402
+
+# diagram-service also names its package "src"; load its standalone module by path
+_spec = importlib.util.spec_from_file_location(
+    "diagram_canvas_patch", REPO_ROOT / "services" / "diagram-service" / "src" / "canvas_patch.py"
+)
+canvas_patch = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(canvas_patch)
+
+# ANSI color codes
+GREEN = '\033[92m'
+RED = '\033[91m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+RESET = '\033[0m'
+BOLD = '\033[1m'
+
+ROOM = "file:diagram-1"
+
+
+def print_header(message: str):
+    """Print a formatted header."""
+    print(f"\n{BOLD}{BLUE}{'=' * 80}{RESET}")
+    print(f"{BOLD}{BLUE}{message.center(80)}{RESET}")
+    print(f"{BOLD}{BLUE}{'=' * 80}{RESET}\n")
+
+
+def print_success(message: str):
+    """Print success message."""
+    print(f"{GREEN}✓ {message}{RESET}")
+
+
+def print_error(message: str):
+    """Print error message."""
+    print(f"{RED}✗ {message}{RESET}")
+
+
+def print_info(message: str):
+    """Print info message."""
+    print(f"{YELLOW}ℹ {message}{RESET}")
+
+
+def stored_canvas() -> dict:
+    return {
+        "schema": {"schemaVersion": 2},
+        "store": {
+            "shape:abc": {
+                "id": "shape:abc", "typeName": "shape", "type": "geo", "x": 10, "y": 10,
+                "props": {"w": 100, "h": 50, "color": "black"},
+            },
+            "shape:def": {"id": "shape:def", "typeName": "shape", "type": "text", "x": 0, "y": 0,
+                          "props": {"text": "hi"}},
+            "shape:ghi": {"id": "shape:ghi", "typeName": "shape", "type": "arrow", "x": 5, "y": 5,
+                          "props": {}},
+        },
+    }
+
+
+async def flushed_patch(updates) -> dict:
+    """The patch WriteBehind sends for a room after these local updates."""
+    document = CRDTDocument()
+    applied = document.apply_many(updates)
+    write_behind = WriteBehind(TimerScheduler(), {ROOM: document}.get)
+    write_behind.mark_dirty(ROOM, {update.element_id for update in applied}, "user-1")
+    return write_behind._take_patch(ROOM)
+
+
+def test_moved_shape_keeps_record() -> bool:
+    patch = asyncio.run(flushed_patch([Update("alice", 1, 1, "shape:abc", {"x": 120, "y": 40})]))
+    merged = canvas_patch.apply_canvas_patch(stored_canvas(), patch)["store"]["shape:abc"]
+    expected = {**stored_canvas()["store"]["shape:abc"], "x": 120, "y": 40}
+    ok = patch == {"store": {"shape:abc": {"x": 120, "y": 40}}} and merged == expected
+    if ok:
+        print_success("Moving a shape flushes {x, y} and keeps id, type, typeName and props")
+    else:
+        print_error(f"Patch {patch} merged into {merged}")
+    return ok
+
+
+def test_partial_props() -> bool:
+    patch = asyncio.run(flushed_patch([Update("alice", 1, 1, "shape:abc", {"props": {"color": "red"}})]))
+    merged = canvas_patch.apply_canvas_patch(stored_canvas(), patch)["store"]["shape:abc"]
+    ok = merged["props"] == {"w": 100, "h": 50, "color": "red"} and merged["type"] == "geo"
+    if ok:
+        print_success("A partial props write changes only those props")
+    else:
+        print_error(f"Unexpected record: {merged}")
+    return ok
+
+
+def test_delete_and_untouched() -> bool:
+    patch = asyncio.run(flushed_patch([
+        Update("alice", 1, 1, "shape:def", {"x": 1}),
+        Update("bob", 1, 2, "shape:def", deleted=True),
+    ]))
+    canvas = stored_canvas()
+    merged = canvas_patch.apply_canvas_patch(canvas, patch)
+    ok = (
+        patch == {"store": {"shape:def": None}}
+        and "shape:def" not in merged["store"]
+        and merged["store"]["shape:ghi"] == canvas["store"]["shape:ghi"]
+        and merged["schema"] == canvas["schema"]
+        and "shape:def" in canvas["store"]
+    )
+    if ok:
+        print_success("Deleted elements are removed; other records and the input are untouched")
+    else:
+        print_error(f"Patch {patch} merged into {merged}")
+    return ok
+
+
+def test_only_diagram_404_is_final() -> bool:
+    missing = httpx.Response(404, json={"detail": "Diagram not found"})
+    unknown_route = httpx.Response(404, json={"detail": "Not Found"})
+    proxy = httpx.Response(404, text="<html><body>404 Not Found</body></html>")
+    ok = (
+        is_final_rejection(missing)
+        and not is_final_rejection(unknown_route)
+        and not is_final_rejection(proxy)
+        and is_final_rejection(httpx.Response(403))
+        and not is_final_rejection(httpx.Response(429))
+        and not is_final_rejection(httpx.Response(503))
+    )
+    if ok:
+        print_success("Only a missing diagram drops the flush; misrouted 404s are retried")
+    else:
+        print_error("Unexpected final-rejection classification")
+    return ok
+
+
+def main() -> int:
+    print_header("Write-Behind Partial Flush Test")
+    tests = [
+        test_moved_shape_keeps_record,
+        test_partial_props,
+        test_delete_and_untouched,
+        test_only_diagram_404_is_final,
+    ]
+    results = [test() for test in tests]
+    print_info(f"{sum(results)}/{len(results)} checks passed")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
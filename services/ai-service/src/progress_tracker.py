@@ -1,10 +1,25 @@
-"""Progress tracking for AI generation with detailed status updates."""
-from dataclasses import dataclass
+"""Progress tracking for AI generation with detailed status updates.
+
+Progress is kept in Redis when available so that any worker process can
+serve the progress endpoints for a generation started by another worker;
+without Redis it falls back to per-process memory.
+"""
+from dataclasses import dataclass, asdict
 from datetime import datetime
 from typing import Optional, Dict, List
 from enum import Enum
+import json
+import logging
+import os
 import uuid
 
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Progress entries expire after this many seconds
+PROGRESS_TTL_SECONDS = 3600
+
 
 class GenerationStatus(str, Enum):
     """Generation status stages."""
@@ -29,16 +44,25 @@ class ProgressUpdate:
 class ProgressTracker:
     """Track generation progress with detailed status updates."""
 
-    def __init__(self):
-        # In-memory storage: generation_id -> List[ProgressUpdate]
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        # Shared storage: list of JSON-encoded updates per generation
+        self._redis = redis_client
+        # In-memory fallback: generation_id -> List[ProgressUpdate]
         self._progress: Dict[str, List[ProgressUpdate]] = {}
         self._active_generations: Dict[str, str] = {}  # generation_id -> current_status
 
+    @staticmethod
+    def _key(generation_id: str) -> str:
+        return f"ai:progress:{generation_id}"
+
     def create_generation(self, generation_id: Optional[str] = None) -> str:
         """Create a new generation tracking entry."""
         gen_id = generation_id or str(uuid.uuid4())
-        self._progress[gen_id] = []
-        self._active_generations[gen_id] = GenerationStatus.ANALYZING
+        if self._redis is not None:
+            self._redis.delete(self._key(gen_id))
+        else:
+            self._progress[gen_id] = []
+            self._active_generations[gen_id] = GenerationStatus.ANALYZING
 
         # Add initial update
         self.update(
@@ -59,9 +83,6 @@ class ProgressTracker:
         details: Optional[Dict] = None
     ):
         """Add a progress update."""
-        if generation_id not in self._progress:
-            self._progress[generation_id] = []
-
         update = ProgressUpdate(
             generation_id=generation_id,
             status=status,
@@ -71,6 +92,16 @@ class ProgressTracker:
             details=details
         )
 
+        if self._redis is not None:
+            key = self._key(generation_id)
+            pipe = self._redis.pipeline()
+            pipe.rpush(key, json.dumps(asdict(update), default=str))
+            pipe.expire(key, PROGRESS_TTL_SECONDS)
+            pipe.execute()
+            return
+
+        if generation_id not in self._progress:
+            self._progress[generation_id] = []
         self._progress[generation_id].append(update)
         self._active_generations[generation_id] = status
 
@@ -123,23 +154,41 @@ class ProgressTracker:
 
     def get_latest(self, generation_id: str) -> Optional[ProgressUpdate]:
         """Get latest progress update for a generation."""
+        if self._redis is not None:
+            raw = self._redis.lindex(self._key(generation_id), -1)
+            return self._decode(raw) if raw else None
+
         if generation_id not in self._progress or not self._progress[generation_id]:
             return None
         return self._progress[generation_id][-1]
 
     def get_all(self, generation_id: str) -> List[ProgressUpdate]:
         """Get all progress updates for a generation."""
+        if self._redis is not None:
+            return [self._decode(raw) for raw in self._redis.lrange(self._key(generation_id), 0, -1)]
         return self._progress.get(generation_id, [])
 
     def get_current_status(self, generation_id: str) -> Optional[GenerationStatus]:
         """Get current status of a generation."""
+        if self._redis is not None:
+            latest = self.get_latest(generation_id)
+            return latest.status if latest else None
         return self._active_generations.get(generation_id)
 
     def cleanup(self, generation_id: str):
         """Remove a completed generation from tracking."""
+        if self._redis is not None:
+            self._redis.delete(self._key(generation_id))
+            return
         self._progress.pop(generation_id, None)
         self._active_generations.pop(generation_id, None)
 
+    @staticmethod
+    def _decode(raw: str) -> ProgressUpdate:
+        data = json.loads(raw)
+        data["status"] = GenerationStatus(data["status"])
+        return ProgressUpdate(**data)
+
 
 # Global singleton instance
 _progress_tracker = None
@@ -149,5 +198,22 @@ def get_progress_tracker() -> ProgressTracker:
     """Get global progress tracker instance."""
     global _progress_tracker
     if _progress_tracker is None:
-        _progress_tracker = ProgressTracker()
+        _progress_tracker = ProgressTracker(_connect_redis())
     return _progress_tracker
+
+
+def _connect_redis() -> Optional[redis.Redis]:
+    """Connect to Redis for shared progress, or None to use process memory."""
+    try:
+        client = redis.Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", "6379")),
+            db=int(os.getenv("REDIS_DB", "0")),
+            decode_responses=True,
+            socket_connect_timeout=2
+        )
+        client.ping()
+        return client
+    except redis.RedisError as e:
+        logger.warning(f"Redis unavailable, tracking generation progress in memory: {e}")
+        return None
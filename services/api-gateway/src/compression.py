@@ -0,0 +1,266 @@
+"""Streaming response compression with negotiated codecs.
+
+CompressionMiddleware compresses response bodies chunk by chunk as they are
+sent, with the codec the client prefers in Accept-Encoding (q-values
+honoured; on ties zstd, then br, then gzip). brotli and zstd need the
+brotli and zstandard packages; without them only gzip is offered.
+
+A response is sent as it is when it is:
+
+- already encoded (Content-Encoding), e.g. passed through from a service
+- partial (206 or Content-Range), or has no body (HEAD, 204, 304)
+- of an incompressible type (images other than SVG, audio, video,
+  archives, fonts, PDFs) or an event stream
+- smaller than the minimum size (by Content-Length, or a single body chunk)
+
+Chunks of COMPRESSION_THREAD_THRESHOLD bytes or more are compressed in a
+worker thread, so large bodies do not stall the event loop.
+
+    COMPRESSION_GZIP_LEVEL        gzip level (default 6)
+    COMPRESSION_BROTLI_QUALITY    brotli quality (default 4)
+    COMPRESSION_ZSTD_LEVEL        zstd level (default 3)
+    COMPRESSION_THREAD_THRESHOLD  chunk size in bytes compressed off the loop (default 64 KB)
+"""
+import asyncio
+import os
+import zlib
+from typing import Any, Awaitable, Callable, Dict, MutableMapping, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+COMPRESSION_THREAD_THRESHOLD = int(os.getenv("COMPRESSION_THREAD_THRESHOLD", str(64 * 1024)))
+
+INCOMPRESSIBLE_TYPES = (
+    "image/", "audio/", "video/", "font/woff", "font/woff2",
+    "application/zip", "application/gzip", "application/x-gzip", "application/zstd",
+    "application/x-7z-compressed", "application/x-rar-compressed", "application/x-bzip2",
+    "application/x-xz", "application/pdf", "application/octet-stream",
+    "text/event-stream",
+)
+COMPRESSIBLE_EXCEPTIONS = ("image/svg+xml",)
+
+# Called once a compressed response is sent: (scope, encoding, original bytes, compressed bytes)
+CompressionCallback = Callable[[MutableMapping[str, Any], str, int, int], None]
+
+
+class GzipCodec:
+    def __init__(self):
+        self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCodec:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCodec:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Available codecs, most preferred first
+CODECS: Dict[str, type] = {}
+if zstandard is not None:
+    CODECS["zstd"] = ZstdCodec
+if brotli is not None:
+    CODECS["br"] = BrotliCodec
+CODECS["gzip"] = GzipCodec
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """The available codec the client prefers, or None if it accepts none."""
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.partition(";")
+        name = name.strip()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                continue
+        weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in CODECS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in COMPRESSIBLE_EXCEPTIONS:
+        return True
+    return not media_type.startswith(INCOMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing response bodies as they stream out.
+
+    Args:
+        app: The wrapped application
+        minimum_size: Responses smaller than this many bytes are not compressed
+        enabled: Set to False to pass every response through
+        on_compressed: Called with the sizes of each compressed response
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, enabled: bool = True,
+                 on_compressed: Optional[CompressionCallback] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.enabled = enabled
+        self.on_compressed = on_compressed
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressingResponder(scope, send, encoding, self.minimum_size, self.on_compressed)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressingResponder:
+    """Compresses the body of one response while forwarding its ASGI messages."""
+
+    def __init__(self, scope, send: Callable[[Dict[str, Any]], Awaitable[None]], encoding: str,
+                 minimum_size: int, on_compressed: Optional[CompressionCallback]):
+        self.scope = scope
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.on_compressed = on_compressed
+        self.start: Optional[Dict[str, Any]] = None
+        self.codec = None
+        self.passthrough = False
+        self.original_size = 0
+        self.compressed_size = 0
+
+    def _eligible(self, start: Dict[str, Any]) -> bool:
+        headers = Headers(raw=start["headers"])
+        if start["status"] in (204, 206, 304) or start["status"] < 200:
+            return False
+        if "content-encoding" in headers or "content-range" in headers:
+            return False
+        if not is_compressible(headers.get("content-type", "")):
+            return False
+        try:
+            if int(headers.get("content-length", self.minimum_size)) < self.minimum_size:
+                return False
+        except ValueError:
+            pass
+        return True
+
+    async def _flush_start(self):
+        if self.start is not None:
+            start, self.start = self.start, None
+            await self._send(start)
+
+    async def _run(self, size: int, func: Callable[[], bytes]) -> bytes:
+        if size >= COMPRESSION_THREAD_THRESHOLD:
+            return await asyncio.to_thread(func)
+        return func()
+
+    def _begin(self, single_body: Optional[bytes] = None):
+        """Switch the held response start to the compressed encoding."""
+        self.start["headers"] = list(self.start["headers"])
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # The compressed bytes differ from the identity representation
+            headers["ETag"] = f"W/{etag}"
+        if single_body is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(single_body))
+
+    async def send(self, message: Dict[str, Any]):
+        kind = message["type"]
+        if kind == "http.response.start":
+            self.start = message
+            self.passthrough = not self._eligible(message)
+            return
+        if kind != "http.response.body" or self.passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        self.original_size += len(body)
+
+        if self.codec is None and not more_body:
+            # The whole body in one message: compress it at once, with a Content-Length
+            if len(body) < self.minimum_size:
+                self.passthrough = True
+                await self._flush_start()
+                await self._send(message)
+                return
+            codec = CODECS[self.encoding]()
+            compressed = await self._run(len(body), lambda: codec.compress(body) + codec.finish())
+            self._begin(compressed)
+            self.compressed_size = len(compressed)
+            await self._flush_start()
+            await self._send({"type": "http.response.body", "body": compressed, "more_body": False})
+            self._done()
+            return
+
+        if self.codec is None:
+            self.codec = CODECS[self.encoding]()
+            self._begin()
+            await self._flush_start()
+
+        codec = self.codec
+        compressed = await self._run(len(body), lambda: codec.compress(body)) if body else b""
+        if not more_body:
+            compressed += codec.finish()
+        self.compressed_size += len(compressed)
+        if compressed or not more_body:
+            await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+        if not more_body:
+            self._done()
+
+    def _done(self):
+        if self.on_compressed is not None:
+            self.on_compressed(self.scope, self.encoding, self.original_size, self.compressed_size)
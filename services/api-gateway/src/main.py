@@ -1,7 +1,8 @@
 """API Gateway - Routes requests to microservices."""
 from fastapi import FastAPI, Request, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from starlette.middleware.base import BaseHTTPMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -38,6 +39,9 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..'))
 from shared.python.redis_pool import get_redis_client
 from shared.python.circuit_breaker import CircuitBreaker, CircuitBreakerError, CircuitState
 
+from .upstream import UpstreamPool, end_to_end_headers
+from .compression import CODECS, CompressionMiddleware
+
 # Configure structured logging
 class StructuredLogger:
     """Structured logger with JSON output for distributed tracing."""
@@ -134,6 +138,13 @@ circuit_breaker_state = Gauge(
     registry=registry
 )
 
+upstream_connections = Gauge(
+    'api_gateway_upstream_connections',
+    'Pooled connections to upstream services',
+    ['service', 'state'],  # state: 'active' | 'idle' | 'http2'
+    registry=registry
+)
+
 circuit_breaker_failures = Counter(
     'api_gateway_circuit_breaker_failures_total',
     'Total circuit breaker failures',
@@ -713,6 +724,10 @@ async def lifespan(app: FastAPI):
     except (AttributeError, OSError):
         pass  # Not available on all platforms
     
+    # Pooled keep-alive clients for the upstream services
+    upstreams.open()
+    logger.info("Upstream connection pools created", services=len(SERVICES), http2=upstreams.http2)
+
     # Start background monitoring tasks
     memory_monitor_task = asyncio.create_task(monitor_memory_usage())
     cpu_monitor_task = asyncio.create_task(monitor_cpu_usage())
@@ -822,6 +837,8 @@ async def lifespan(app: FastAPI):
         )
     else:
         logger.info("All requests completed, shutting down cleanly")
+
+    await upstreams.close()
     
     logger.info("API Gateway shutdown complete")
 
@@ -1018,6 +1035,9 @@ SERVICES = {
     "integration": f"http://{SERVICE_HOST_INTEGRATION}:{os.getenv('INTEGRATION_HUB_PORT', '8099')}",
 }
 
+# One pooled keep-alive client per service, opened and closed in lifespan
+upstreams = UpstreamPool(SERVICES, REQUEST_TIMEOUT)
+
 
 async def verify_jwt_token(token: str) -> dict:
     """Verify JWT token and return payload."""
@@ -1043,24 +1063,23 @@ async def verify_jwt_token(token: str) -> dict:
             token_jti = payload.get("jti")
             if token_jti:
                 try:
-                    async with httpx.AsyncClient(timeout=2.0) as client:
-                        response = await client.get(
-                            f"http://{SERVICE_HOST_AUTH}:8085/oauth/token/status/{token_jti}"
-                        )
-                        if response.status_code == 200:
-                            token_status = response.json()
-                            if token_status.get("is_revoked"):
-                                raise HTTPException(
-                                    status_code=status.HTTP_401_UNAUTHORIZED,
-                                    detail="Token revoked"
-                                )
-                        # If auth service is down or token not found, fail closed for security
-                        elif response.status_code != 404:
-                            logger.warning(
-                                "Failed to check OAuth token status",
-                                token_jti=token_jti,
-                                status_code=response.status_code
+                    response = await upstreams.client("auth").get(
+                        f"/oauth/token/status/{token_jti}", timeout=2.0
+                    )
+                    if response.status_code == 200:
+                        token_status = response.json()
+                        if token_status.get("is_revoked"):
+                            raise HTTPException(
+                                status_code=status.HTTP_401_UNAUTHORIZED,
+                                detail="Token revoked"
                             )
+                    # If auth service is down or token not found, fail closed for security
+                    elif response.status_code != 404:
+                        logger.warning(
+                            "Failed to check OAuth token status",
+                            token_jti=token_jti,
+                            status_code=response.status_code
+                        )
                 except httpx.RequestError as e:
                     logger.warning(
                         "Error checking OAuth token revocation status",
@@ -1170,18 +1189,15 @@ async def metrics_middleware(request: Request, call_next):
 
 @app.middleware("http")
 async def network_monitoring_middleware(request: Request, call_next):
-    """Middleware to monitor network traffic (request/response sizes)."""
-    import gzip
-    from io import BytesIO
-    
+    """Middleware to monitor network traffic (request/response sizes) without buffering bodies."""
     correlation_id = getattr(request.state, "correlation_id", "unknown")
     
-    # Measure request size
-    request_body = b""
+    # Measure request size from Content-Length, so the body stays streamed to the endpoint
     if request.method in ["POST", "PUT", "PATCH"]:
-        # Read body for size measurement (will be re-read by endpoint)
-        request_body = await request.body()
-        request_size = len(request_body)
+        try:
+            request_size = int(request.headers.get("content-length", "0"))
+        except ValueError:
+            request_size = 0
         
         # Track request bytes
         network_request_bytes.labels(
@@ -1206,100 +1222,49 @@ async def network_monitoring_middleware(request: Request, call_next):
     
     # Process request
     response = await call_next(request)
+    status_code = response.status_code
     
-    # Measure response size
-    response_body = b""
-    async for chunk in response.body_iterator:
-        response_body += chunk
-    
-    response_size = len(response_body)
-    
-    # Track response bytes (before compression)
-    network_response_bytes.labels(
-        method=request.method,
-        path=request.url.path,
-        status_code=response.status_code
-    ).inc(response_size)
-    
-    # Check for large response payloads
-    if response_size > NETWORK_LARGE_PAYLOAD_THRESHOLD_BYTES:
-        network_large_payload_count.labels(payload_type="response").inc()
-        logger.warning(
-            "Large response payload detected",
-            correlation_id=correlation_id,
-            method=request.method,
-            path=request.url.path,
-            response_size_bytes=response_size,
-            response_size_mb=round(response_size / 1024 / 1024, 2),
-            threshold_mb=round(NETWORK_LARGE_PAYLOAD_THRESHOLD_BYTES / 1024 / 1024, 2)
-        )
-    
-    # Apply compression if enabled and response is large enough
-    compressed = False
-    if (NETWORK_COMPRESSION_ENABLED and 
-        response_size >= NETWORK_COMPRESSION_MIN_SIZE_BYTES and
-        "gzip" in request.headers.get("accept-encoding", "").lower()):
-        
+    async def measured(body_iterator):
+        """Pass the body through, counting its size (before compression) as it streams."""
+        response_size = 0
         try:
-            # Compress response body
-            compressed_body = gzip.compress(response_body, compresslevel=6)
-            compressed_size = len(compressed_body)
-            bandwidth_saved = response_size - compressed_size
-            
-            # Track bandwidth savings
-            network_bandwidth_saved_bytes.labels(
+            async for chunk in body_iterator:
+                response_size += len(chunk)
+                yield chunk
+        finally:
+            # Track response bytes (before compression)
+            network_response_bytes.labels(
                 method=request.method,
-                path=request.url.path
-            ).inc(bandwidth_saved)
+                path=request.url.path,
+                status_code=status_code
+            ).inc(response_size)
             
-            logger.info(
-                "Response compressed",
+            # Check for large response payloads
+            if response_size > NETWORK_LARGE_PAYLOAD_THRESHOLD_BYTES:
+                network_large_payload_count.labels(payload_type="response").inc()
+                logger.warning(
+                    "Large response payload detected",
+                    correlation_id=correlation_id,
+                    method=request.method,
+                    path=request.url.path,
+                    response_size_bytes=response_size,
+                    response_size_mb=round(response_size / 1024 / 1024, 2),
+                    threshold_mb=round(NETWORK_LARGE_PAYLOAD_THRESHOLD_BYTES / 1024 / 1024, 2)
+                )
+            
+            # Log network traffic
+            logger.debug(
+                "Network traffic",
                 correlation_id=correlation_id,
                 method=request.method,
                 path=request.url.path,
-                original_size_bytes=response_size,
-                compressed_size_bytes=compressed_size,
-                bandwidth_saved_bytes=bandwidth_saved,
-                compression_ratio=round((1 - compressed_size / response_size) * 100, 2) if response_size > 0 else 0
-            )
-            
-            # Replace body with compressed version
-            response_body = compressed_body
-            compressed = True
-        except Exception as e:
-            logger.error(
-                "Compression failed",
-                correlation_id=correlation_id,
-                error=str(e),
-                exc=e
+                request_size_bytes=request_size,
+                response_size_bytes=response_size
             )
     
-    # Log network traffic
-    logger.debug(
-        "Network traffic",
-        correlation_id=correlation_id,
-        method=request.method,
-        path=request.url.path,
-        request_size_bytes=request_size,
-        response_size_bytes=response_size,
-        compressed=compressed
-    )
-    
-    # Create new response with (possibly compressed) body
-    headers = dict(response.headers)
-    if compressed:
-        headers["content-encoding"] = "gzip"
-        headers["vary"] = "Accept-Encoding"
-    
-    # Remove content-length as it may have changed
-    headers.pop("content-length", None)
-    
-    return Response(
-        content=response_body,
-        status_code=response.status_code,
-        headers=headers,
-        media_type=response.headers.get("content-type")
-    )
+    # Compression is applied further out, by CompressionMiddleware
+    response.body_iterator = measured(response.body_iterator)
+    return response
 
 
 @app.middleware("http")
@@ -1505,8 +1470,11 @@ async def idempotency_middleware(request: Request, call_next):
         
         response = await call_next(request)
         
-        # Cache successful responses (2xx status codes)
-        if 200 <= response.status_code < 300:
+        # Cache successful JSON responses (2xx status codes); other bodies,
+        # e.g. proxied files or already-compressed ones, stream through uncached
+        if (200 <= response.status_code < 300 and
+                response.headers.get("content-type", "").startswith("application/json") and
+                "content-encoding" not in response.headers):
             # Read response body
             body = b""
             async for chunk in response.body_iterator:
@@ -1542,9 +1510,9 @@ async def idempotency_middleware(request: Request, call_next):
                 ttl=86400
             )
             
-            # Return new response with body
-            return JSONResponse(
-                content=body_json,
+            # Return the body as received (not re-encoded)
+            return Response(
+                content=body,
                 status_code=response.status_code,
                 headers={
                     **dict(response.headers),
@@ -1613,6 +1581,34 @@ async def correlation_id_middleware(request: Request, call_next):
         raise
 
 
+def record_compression(scope, encoding: str, original_size: int, compressed_size: int):
+    """Count the bandwidth saved by compressing one response."""
+    method, path = scope["method"], scope["path"]
+    bandwidth_saved = original_size - compressed_size
+    network_bandwidth_saved_bytes.labels(method=method, path=path).inc(max(bandwidth_saved, 0))
+    logger.info(
+        "Response compressed",
+        correlation_id=scope.get("state", {}).get("correlation_id", "unknown"),
+        method=method,
+        path=path,
+        encoding=encoding,
+        original_size_bytes=original_size,
+        compressed_size_bytes=compressed_size,
+        bandwidth_saved_bytes=bandwidth_saved,
+        compression_ratio=round((1 - compressed_size / original_size) * 100, 2) if original_size > 0 else 0
+    )
+
+
+# Streaming response compression (gzip, br, zstd by Accept-Encoding); added
+# last so it is the outermost middleware and sees the final response body
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=NETWORK_COMPRESSION_MIN_SIZE_BYTES,
+    enabled=NETWORK_COMPRESSION_ENABLED,
+    on_compressed=record_compression
+)
+
+
 @app.get("/health")
 @limiter.limit("1000/minute")  # IP-based rate limit
 async def health_check(request: Request):
@@ -1638,6 +1634,11 @@ async def metrics(request: Request):
             state_value = 2
         
         circuit_breaker_state.labels(service=service_name).set(state_value)
+
+    # Update upstream connection pool metrics
+    for service_name, pool_stats in upstreams.stats().items():
+        for state in ("active", "idle", "http2"):
+            upstream_connections.labels(service=service_name, state=state).set(pool_stats[state])
     
     # Generate Prometheus format metrics
     metrics_output = generate_latest(registry)
@@ -1963,6 +1964,7 @@ async def test_network_stats(request: Request):
         "correlation_id": correlation_id,
         "configuration": {
             "compression_enabled": NETWORK_COMPRESSION_ENABLED,
+            "compression_encodings": list(CODECS),
             "compression_min_size_bytes": NETWORK_COMPRESSION_MIN_SIZE_BYTES,
             "compression_min_size_kb": round(NETWORK_COMPRESSION_MIN_SIZE_BYTES / 1024, 2),
             "large_payload_threshold_bytes": NETWORK_LARGE_PAYLOAD_THRESHOLD_BYTES,
@@ -2042,7 +2044,7 @@ async def test_network_large_response(request: Request, size_mb: float = 1.0):
         "num_items": len(data),
         "is_large_payload": size_bytes > NETWORK_LARGE_PAYLOAD_THRESHOLD_BYTES,
         "compression_enabled": NETWORK_COMPRESSION_ENABLED,
-        "note": "Check response headers for Content-Encoding: gzip if compression applied",
+        "note": "Check response headers for Content-Encoding (zstd, br or gzip) if compression applied",
         "data": data,
         "timestamp": datetime.utcnow().isoformat()
     }
@@ -2677,7 +2679,14 @@ async def proxy_integrations(path: str, request: Request):
 
 
 async def proxy_request(service_name: str, path: str, request: Request):
-    """Proxy request to microservice with correlation ID and circuit breaker protection."""
+    """
+    Proxy request to microservice with correlation ID and circuit breaker protection.
+
+    The request body is streamed to the service and the response is streamed
+    back byte for byte (still encoded, e.g. gzip), with its status and
+    end-to-end headers, so ETags, conditional and range requests work
+    through the gateway and large bodies are never held in memory.
+    """
     correlation_id = getattr(request.state, "correlation_id", str(uuid.uuid4()))
     
     service_url = SERVICES.get(service_name)
@@ -2698,20 +2707,26 @@ async def proxy_request(service_name: str, path: str, request: Request):
             service=service_name
         )
     
-    # Build target URL
+    # Build target URL (raw query string, so repeated parameters survive)
     target_url = f"{service_url}/{path}"
+    if request.url.query:
+        target_url = f"{target_url}?{request.url.query}"
     
-    # Get request body
-    body = await request.body()
-    
-    # Prepare headers with correlation ID
-    headers = dict(request.headers)
-    headers["X-Correlation-ID"] = correlation_id
+    # Prepare end-to-end headers with correlation ID; httpx sets Host for the service
+    user_id = getattr(request.state, "user_id", None)
+    drop = [b"host", b"x-correlation-id"]
+    if user_id:
+        drop.append(b"x-user-id")
+    headers = end_to_end_headers(request.headers.raw, drop=drop)
+    headers.append((b"x-correlation-id", correlation_id.encode()))
     
     # Forward user_id if available
-    user_id = getattr(request.state, "user_id", None)
     if user_id:
-        headers["X-User-ID"] = str(user_id)
+        headers.append((b"x-user-id", str(user_id).encode()))
+    
+    # Stream the request body if there is one (Content-Length is forwarded, else chunked)
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    body = request.stream() if has_body else None
     
     logger.info(
         "Forwarding request to service",
@@ -2742,79 +2757,65 @@ async def proxy_request(service_name: str, path: str, request: Request):
             circuit_breaker._success_count = 0
             logger.info(f"Circuit breaker '{circuit_breaker.name}' moved to HALF_OPEN state")
     
-    # Forward request
-    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
-        try:
-            response = await client.request(
-                method=request.method,
-                url=target_url,
-                headers=headers,
-                params=dict(request.query_params),
-                content=body
-            )
-            
-            logger.info(
-                "Service response received",
-                correlation_id=correlation_id,
-                service=service_name,
-                status_code=response.status_code,
-                response_time_ms=response.elapsed.total_seconds() * 1000
-            )
-            
-            # Mark success in circuit breaker
-            if circuit_breaker:
-                circuit_breaker._on_success()
-
-            # For binary content types (images, PDFs, CSV), pass through unchanged
-            content_type = response.headers.get("content-type", "")
-            if content_type.startswith(("image/", "application/pdf", "application/octet-stream", "text/csv")):
-                return Response(
-                    content=response.content,
-                    status_code=response.status_code,
-                    headers=dict(response.headers),
-                    media_type=content_type
-                )
-            
-            # For JSON responses, return JSONResponse
-            if content_type.startswith("application/json"):
-                return JSONResponse(
-                    content=response.json(),
-                    status_code=response.status_code,
-                    headers=dict(response.headers)
-                )
-            
-            # For other text responses, wrap in JSON with data field
-            return JSONResponse(
-                content={"data": response.text},
-                status_code=response.status_code,
-                headers=dict(response.headers)
-            )
-        except httpx.ConnectError:
-            # Mark failure in circuit breaker
-            if circuit_breaker:
-                circuit_breaker._on_failure()
-            logger.error(
-                "Service connection failed",
-                correlation_id=correlation_id,
-                service=service_name,
-                target_url=target_url,
-                circuit_state=circuit_breaker.state.value if circuit_breaker else "none",
-                failure_count=circuit_breaker.failure_count if circuit_breaker else 0
-            )
-            raise HTTPException(status_code=503, detail=f"Service {service_name} unavailable")
-        except Exception as e:
-            # Mark failure in circuit breaker
-            if circuit_breaker:
-                circuit_breaker._on_failure()
-            logger.error(
-                "Proxy error",
-                correlation_id=correlation_id,
-                service=service_name,
-                error=str(e),
-                error_type=type(e).__name__,
-                circuit_state=circuit_breaker.state.value if circuit_breaker else "none"
-            )
-            raise HTTPException(status_code=500, detail=f"Proxy error: {str(e)}")
+    # Forward request over the service's pooled keep-alive client
+    client = upstreams.client(service_name)
+    start_time = time.perf_counter()
+    try:
+        upstream_request = client.build_request(
+            method=request.method,
+            url=target_url,
+            headers=headers,
+            content=body
+        )
+        response = await client.send(upstream_request, stream=True)
+        
+        logger.info(
+            "Service response received",
+            correlation_id=correlation_id,
+            service=service_name,
+            status_code=response.status_code,
+            response_time_ms=round((time.perf_counter() - start_time) * 1000, 2)
+        )
+        
+        # Mark success in circuit breaker
+        if circuit_breaker:
+            circuit_breaker._on_success()
+
+        # Pass the body through undecoded; the upstream connection goes back
+        # to the pool once the client has received it (or disconnected)
+        proxied = StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            background=BackgroundTask(response.aclose)
+        )
+        proxied.raw_headers = end_to_end_headers(response.headers.raw)
+        return proxied
+    except httpx.ConnectError:
+        # Mark failure in circuit breaker
+        if circuit_breaker:
+            circuit_breaker._on_failure()
+        logger.error(
+            "Service connection failed",
+            correlation_id=correlation_id,
+            service=service_name,
+            target_url=target_url,
+            circuit_state=circuit_breaker.state.value if circuit_breaker else "none",
+            failure_count=circuit_breaker.failure_count if circuit_breaker else 0
+        )
+        raise HTTPException(status_code=503, detail=f"Service {service_name} unavailable")
+    except Exception as e:
+        # Mark failure in circuit breaker
+        if circuit_breaker:
+            circuit_breaker._on_failure()
+        logger.error(
+            "Proxy error",
+            correlation_id=correlation_id,
+            service=service_name,
+            error=str(e),
+            error_type=type(e).__name__,
+            circuit_state=circuit_breaker.state.value if circuit_breaker else "none"
+        )
+        raise HTTPException(status_code=500, detail=f"Proxy error: {str(e)}")
 
 
 # ===============================================================================
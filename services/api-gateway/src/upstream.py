@@ -0,0 +1,131 @@
+"""Pooled HTTP clients for the services behind the gateway.
+
+Each upstream service gets one long-lived httpx.AsyncClient, created in the
+application lifespan, so proxied requests reuse keep-alive connections
+instead of paying for a TCP (and TLS) handshake per request.
+
+Pool sizing is configurable per deployment:
+
+    UPSTREAM_MAX_CONNECTIONS      connections per service (default 100)
+    UPSTREAM_MAX_KEEPALIVE        idle connections kept open per service (default 20)
+    UPSTREAM_KEEPALIVE_EXPIRY     seconds an idle connection is kept (default 30)
+    UPSTREAM_CONNECT_TIMEOUT      seconds to establish a connection (default 5)
+    UPSTREAM_HTTP2                "true" to negotiate HTTP/2 (default false)
+
+HTTP/2 is negotiated through TLS ALPN, so it only applies to https://
+upstreams that support it; plain http:// upstreams keep using HTTP/1.1
+keep-alive. It needs the h2 package (httpx[http2]).
+
+Proxied bodies are streamed in both directions. Headers are passed through
+as they are (Range, If-None-Match, ETag, Content-Encoding, Set-Cookie, ...)
+except hop-by-hop headers (RFC 9110 section 7.6.1), which belong to one
+connection and are never forwarded.
+"""
+import logging
+import os
+from typing import Dict, Iterable, List, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() in ("true", "1", "yes")
+
+HOP_BY_HOP_HEADERS = frozenset({
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"proxy-connection", b"te", b"trailer", b"transfer-encoding", b"upgrade",
+})
+
+RawHeaders = List[Tuple[bytes, bytes]]
+
+
+def end_to_end_headers(raw: Iterable[Tuple[bytes, bytes]], drop: Iterable[bytes] = ()) -> RawHeaders:
+    """
+    Headers without hop-by-hop ones, those listed in Connection, and drop.
+
+    Args:
+        raw: (name, value) pairs; names in any case, repeated names kept
+        drop: Further lower-case names to leave out
+    """
+    raw = list(raw)
+    excluded = set(HOP_BY_HOP_HEADERS) | set(drop)
+    for name, value in raw:
+        if name.lower() == b"connection":
+            excluded.update(token.strip().lower() for token in value.split(b","))
+    return [(name.lower(), value) for name, value in raw if name.lower() not in excluded]
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class UpstreamPool:
+    """One pooled AsyncClient per upstream service.
+
+    Args:
+        services: Service name -> base URL
+        timeout: Default read/write/pool timeout in seconds
+    """
+
+    def __init__(self, services: Dict[str, str], timeout: float):
+        self.services = services
+        self.timeout = timeout
+        self.http2 = UPSTREAM_HTTP2 and http2_available()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, httpx.AsyncHTTPTransport] = {}
+
+    def open(self):
+        """Create the clients (called from the lifespan startup)."""
+        if UPSTREAM_HTTP2 and not self.http2:
+            logger.warning("UPSTREAM_HTTP2 is set but the h2 package is missing; using HTTP/1.1")
+        for service in self.services:
+            self.client(service)
+
+    def client(self, service: str) -> httpx.AsyncClient:
+        """The pooled client of a service, created on first use if the lifespan did not run."""
+        client = self._clients.get(service)
+        if client is None:
+            limits = httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY
+            )
+            transport = httpx.AsyncHTTPTransport(limits=limits, http2=self.http2, retries=1)
+            client = httpx.AsyncClient(
+                base_url=self.services[service],
+                transport=transport,
+                timeout=httpx.Timeout(self.timeout, connect=UPSTREAM_CONNECT_TIMEOUT)
+            )
+            self._transports[service] = transport
+            self._clients[service] = client
+        return client
+
+    async def close(self):
+        """Close every client and its connections (called from the lifespan shutdown)."""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        self._transports.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Open connections of each service: total, active, idle and HTTP/2."""
+        stats = {}
+        for service, transport in self._transports.items():
+            pool = getattr(transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            idle = sum(1 for connection in connections if connection.is_idle())
+            stats[service] = {
+                "connections": len(connections),
+                "active": len(connections) - idle,
+                "idle": idle,
+                "http2": sum(1 for connection in connections if "HTTP/2" in connection.info()),
+            }
+        return stats
@@ -1,52 +1,75 @@
 #!/usr/bin/env python3
-"""Startup script for api-gateway with TLS support."""
+"""Startup script for api-gateway with TLS support.
+
+Set WORKERS to run several worker processes that share one listening
+socket. The supervisor restarts workers one at a time on SIGHUP (graceful
+reload); SIGTTIN / SIGTTOU add or remove a worker.
+"""
 import os
 import ssl
 import uvicorn
 from pathlib import Path
+from uvicorn.supervisors import Multiprocess
+
+# FastAPI app (imported by each worker)
+APP = "src.main:app"
+
+# Internal port should always be 8080 to match healthcheck
+PORT = 8080
+
+CERT_DIR = Path("/app/certs")
+
+
+def create_tls13_context(cert_file: str, key_file: str) -> ssl.SSLContext:
+    """Create a TLS 1.3-only server context."""
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.minimum_version = ssl.TLSVersion.TLSv1_3
+    ssl_context.maximum_version = ssl.TLSVersion.TLSv1_3
+    ssl_context.load_cert_chain(certfile=cert_file, keyfile=key_file)
+    ssl_context.options |= ssl.OP_NO_COMPRESSION
+    return ssl_context
+
+
+class TLS13Config(uvicorn.Config):
+    """uvicorn config that swaps in our TLS 1.3-only context on load.
+
+    load() runs inside each worker process, so every worker builds its own
+    SSL context instead of inheriting one from the supervisor.
+    """
+
+    def load(self) -> None:
+        super().load()
+        if self.is_ssl:
+            self.ssl = create_tls13_context(self.ssl_certfile, self.ssl_keyfile)
 
-# Import the FastAPI app
-from src.main import app
 
 if __name__ == "__main__":
-    # Internal port should always be 8080 to match healthcheck
-    port = 8080
     tls_enabled = os.getenv("TLS_ENABLED", "false").lower() in ("true", "1", "yes")
+    workers = max(1, int(os.getenv("WORKERS", "1")))
 
+    ssl_files = {}
     if tls_enabled:
-        # Configure TLS 1.3
-        cert_dir = Path("/app/certs")
-        cert_file = str(cert_dir / "server-cert.pem")
-        key_file = str(cert_dir / "server-key.pem")
-
-        print(f"Starting api-gateway with TLS 1.3 ONLY on port {port}")
-
-        # Create uvicorn config WITH ssl_keyfile/ssl_certfile
-        # This ensures is_ssl=True and triggers SSL context creation
-        config = uvicorn.Config(
-            app,
-            host="0.0.0.0",
-            port=port,
-            ssl_keyfile=key_file,
-            ssl_certfile=cert_file,
-        )
-
-        # Load the config - this creates config.ssl with default SSL context
-        config.load()
-
-        # NOW replace config.ssl with our TLS 1.3-only context
-        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        ssl_context.minimum_version = ssl.TLSVersion.TLSv1_3
-        ssl_context.maximum_version = ssl.TLSVersion.TLSv1_3
-        ssl_context.load_cert_chain(certfile=cert_file, keyfile=key_file)
-        ssl_context.options |= ssl.OP_NO_COMPRESSION
-
-        # Replace the SSL context
-        config.ssl = ssl_context
-
-        # Create and run server with our custom SSL context
-        server = uvicorn.Server(config)
-        server.run()
+        ssl_files = {
+            "ssl_certfile": str(CERT_DIR / "server-cert.pem"),
+            "ssl_keyfile": str(CERT_DIR / "server-key.pem"),
+        }
+        print(f"Starting api-gateway with TLS 1.3 ONLY on port {PORT} ({workers} worker(s))")
     else:
-        print(f"Starting api-gateway without TLS on port {port}")
-        uvicorn.run(app, host="0.0.0.0", port=port)
+        print(f"Starting api-gateway without TLS on port {PORT} ({workers} worker(s))")
+
+    config = TLS13Config(
+        APP,
+        host="0.0.0.0",
+        port=PORT,
+        workers=workers,
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30")),
+        **ssl_files,
+    )
+    server = uvicorn.Server(config)
+
+    if workers > 1:
+        # Bind once in the supervisor; every worker accepts on the same socket
+        sock = config.bind_socket()
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run()
@@ -28,6 +28,7 @@ from .saml_handler import SAMLHandler
 from .gdpr_routes import router as gdpr_router
 from .push_routes import router as push_router
 from .scim_routes import router as scim_router
+from shared.python.audit_writer import AuditLogWriter
 import redis
 import secrets
 import pyotp
@@ -240,6 +241,15 @@ class ShutdownState:
 
 shutdown_state = ShutdownState()
 
+# Audit events are queued and written in batches by a background task
+audit_writer = AuditLogWriter(
+    SessionLocal,
+    AuditLog.__table__,
+    max_queue_size=int(os.getenv("AUDIT_QUEUE_MAX_SIZE", "10000")),
+    batch_size=int(os.getenv("AUDIT_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan - startup and shutdown."""
@@ -261,6 +271,9 @@ async def lifespan(app: FastAPI):
     signal.signal(signal.SIGTERM, handle_shutdown)
     signal.signal(signal.SIGINT, handle_shutdown)
     
+    # Start background audit log writer
+    await audit_writer.start()
+    
     logger.info("Auth Service started successfully")
     
     yield
@@ -291,6 +304,9 @@ async def lifespan(app: FastAPI):
     else:
         logger.info("All requests completed, shutting down cleanly")
     
+    # Flush queued audit events before exit
+    await audit_writer.stop()
+    
     logger.info("Auth Service shutdown complete")
 
 app = FastAPI(
@@ -615,33 +631,26 @@ async def check_ip_allowlist(request: Request, call_next):
 
                         # Log to audit trail
                         try:
-                            print("DEBUG: Creating audit log entry")
                             logger.info("Writing audit log for IP block attempt")
                             db = SessionLocal()
-                            print(f"DEBUG: SessionLocal created, db={db}")
-                            audit = AuditLog(
-                                user_id=None,
-                                action="access_denied",
-                                resource_type="ip_allowlist",
-                                resource_id="blocked_access",
-                                ip_address=client_ip,
-                                user_agent=request.headers.get("user-agent"),
-                                extra_data={
-                                    "reason": "IP not in allowlist",
-                                    "path": request.url.path,
-                                    "method": request.method
-                                }
-                            )
-                            print(f"DEBUG: Audit object created: {audit}")
-                            db.add(audit)
-                            print("DEBUG: Added to session")
-                            db.commit()
-                            print("DEBUG: Committed")
-                            db.close()
-                            print("DEBUG: Closed")
+                            try:
+                                create_audit_log(
+                                    db=db,
+                                    action="access_denied",
+                                    resource_type="ip_allowlist",
+                                    resource_id="blocked_access",
+                                    ip_address=client_ip,
+                                    user_agent=request.headers.get("user-agent"),
+                                    extra_data={
+                                        "reason": "IP not in allowlist",
+                                        "path": request.url.path,
+                                        "method": request.method
+                                    }
+                                )
+                            finally:
+                                db.close()
                             logger.info("Audit log written successfully for IP block")
                         except Exception as audit_error:
-                            print(f"DEBUG: Exception in audit logging: {audit_error}")
                             logger.error("Failed to write audit log for IP block", exc=audit_error)
 
                         return JSONResponse(
@@ -1374,11 +1383,14 @@ def create_audit_log(
     ip_address: str = None,
     user_agent: str = None,
     extra_data: dict = None
-) -> AuditLog:
-    """Create an audit log entry.
+) -> None:
+    """Record an audit log entry.
+    
+    The entry is queued for the background audit writer; it is only written
+    synchronously with `db` when the writer is not running or its queue is full.
     
     Args:
-        db: Database session
+        db: Database session (used for the synchronous fallback)
         action: Action performed (e.g., 'login', 'logout', 'register')
         user_id: User ID (optional for actions like failed login)
         resource_type: Type of resource affected (optional)
@@ -1386,23 +1398,21 @@ def create_audit_log(
         ip_address: IP address of request
         user_agent: User agent string
         extra_data: Additional metadata (optional)
-        
-    Returns:
-        Created AuditLog instance
     """
-    audit_log = AuditLog(
-        user_id=user_id,
-        action=action,
-        resource_type=resource_type,
-        resource_id=resource_id,
-        ip_address=ip_address,
-        user_agent=user_agent,
-        extra_data=extra_data
-    )
-    db.add(audit_log)
+    entry = {
+        "user_id": user_id,
+        "action": action,
+        "resource_type": resource_type,
+        "resource_id": resource_id,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "extra_data": extra_data
+    }
+    if audit_writer.enqueue(entry):
+        return
+    
+    db.add(AuditLog(**entry))
     db.commit()
-    db.refresh(audit_log)
-    return audit_log
 
 
 def get_client_ip(request: Request) -> str:
@@ -4109,7 +4119,8 @@ async def admin_unlock_user(
         )
         
         # Create audit log entry
-        audit_log = AuditLog(
+        create_audit_log(
+            db=db,
             user_id=current_admin.id,
             action="admin_unlock_user",
             resource_type="user",
@@ -4122,8 +4133,6 @@ async def admin_unlock_user(
                 "unlocked_by_admin": current_admin.email
             }
         )
-        db.add(audit_log)
-        db.commit()
         
         return {
             "message": "Account unlocked successfully",
@@ -4718,7 +4727,8 @@ async def create_api_key(
         )
         
         # Create audit log
-        audit_log = AuditLog(
+        create_audit_log(
+            db=db,
             user_id=current_user.id,
             action="create_api_key",
             resource_type="api_key",
@@ -4732,8 +4742,6 @@ async def create_api_key(
                 "expires_at": expires_at.isoformat() if expires_at else None
             }
         )
-        db.add(audit_log)
-        db.commit()
         
         return ApiKeyCreatedResponse(
             id=api_key.id,
@@ -4859,7 +4867,8 @@ async def revoke_api_key(
         )
         
         # Create audit log
-        audit_log = AuditLog(
+        create_audit_log(
+            db=db,
             user_id=current_user.id,
             action="revoke_api_key",
             resource_type="api_key",
@@ -4871,8 +4880,6 @@ async def revoke_api_key(
                 "key_prefix": api_key.key_prefix
             }
         )
-        db.add(audit_log)
-        db.commit()
         
         return {
             "message": "API key revoked successfully",
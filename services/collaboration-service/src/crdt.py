@@ -0,0 +1,209 @@
+"""
+CRDT document for canvas collaboration.
+
+Each room has one document: a map of elements whose properties are
+last-writer-wins registers. An update sets properties of one element or
+deletes it:
+
+    [client_id, clock, lamport, element_id, fields, deleted]
+
+- clock counts the updates of one client (1, 2, 3, ...)
+- lamport orders writes across clients; clients send max(lamport seen) + 1
+- a register keeps the write with the highest (lamport, client_id) stamp
+- a delete leaves a tombstone that hides every older write to the element;
+  a later write re-creates it
+
+The state vector maps client_id -> highest clock applied. A replica sends
+its state vector and receives only the updates it has not applied
+(diff), so reconnecting clients download just what they missed. Updates
+travel as MessagePack lists (encode_updates / decode_updates).
+
+compact() drops updates whose writes have all been superseded and trims
+the others to the fields they still win. Replicas that lack a dropped
+update either already have the write that superseded it or receive that
+write in the same diff, so they converge to the same state.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import msgpack
+
+Stamp = Tuple[int, str]  # (lamport, client_id)
+UpdateId = Tuple[str, int]  # (client_id, clock)
+
+
+@dataclass
+class Update:
+    """A write to one element by one client."""
+    client_id: str
+    clock: int
+    lamport: int
+    element_id: str
+    fields: Dict[str, Any] = field(default_factory=dict)
+    deleted: bool = False
+
+    @property
+    def id(self) -> UpdateId:
+        return (self.client_id, self.clock)
+
+    @property
+    def stamp(self) -> Stamp:
+        return (self.lamport, self.client_id)
+
+    def to_record(self) -> list:
+        return [self.client_id, self.clock, self.lamport, self.element_id, self.fields, self.deleted]
+
+    @classmethod
+    def from_record(cls, record: list) -> "Update":
+        """
+        Raises:
+            ValueError: If the record is not an update
+        """
+        try:
+            client_id, clock, lamport, element_id, fields, deleted = record
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid CRDT update: {record!r}") from e
+        if not isinstance(clock, int) or clock < 1 or not isinstance(lamport, int) or not isinstance(fields, dict):
+            raise ValueError(f"Invalid CRDT update: {record!r}")
+        return cls(str(client_id), clock, lamport, str(element_id), fields, bool(deleted))
+
+
+def encode_updates(updates: Iterable[Update]) -> bytes:
+    return msgpack.packb([update.to_record() for update in updates], use_bin_type=True)
+
+
+def decode_updates(data: Union[bytes, bytearray, list]) -> List[Update]:
+    """Decode updates sent as MessagePack bytes or as a list of records (JSON clients).
+
+    Raises:
+        ValueError: If the payload is not a list of updates
+    """
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            data = msgpack.unpackb(data, raw=False)
+        except (msgpack.UnpackException, ValueError) as e:
+            raise ValueError(f"Invalid CRDT update payload: {e}") from e
+    if not isinstance(data, list):
+        raise ValueError("CRDT updates must be a list")
+    return [Update.from_record(record) for record in data]
+
+
+def encode_state_vector(state_vector: Dict[str, int]) -> bytes:
+    return msgpack.packb(state_vector, use_bin_type=True)
+
+
+def decode_state_vector(data: Union[bytes, bytearray, dict, None]) -> Dict[str, int]:
+    """Decode a state vector sent as MessagePack bytes or a dict; None means empty."""
+    if data is None:
+        return {}
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            data = msgpack.unpackb(data, raw=False)
+        except (msgpack.UnpackException, ValueError) as e:
+            raise ValueError(f"Invalid state vector: {e}") from e
+    if not isinstance(data, dict):
+        raise ValueError("State vector must be a map of client_id -> clock")
+    return {str(client_id): int(clock) for client_id, clock in data.items()}
+
+
+class CRDTDocument:
+    """Elements of one room as LWW registers with tombstones."""
+
+    def __init__(self):
+        self.state_vector: Dict[str, int] = {}
+        self.lamport = 0
+        # element_id -> property -> (stamp, value, update id)
+        self.registers: Dict[str, Dict[str, Tuple[Stamp, Any, UpdateId]]] = {}
+        # element_id -> (stamp, update id) of the latest delete
+        self.tombstones: Dict[str, Tuple[Stamp, UpdateId]] = {}
+        # Applied updates in arrival order, used for diffs
+        self.log: Dict[UpdateId, Update] = {}
+        self.updates_since_compaction = 0
+
+    def apply(self, update: Update) -> bool:
+        """Apply an update. Returns False if it was applied before."""
+        if update.clock <= self.state_vector.get(update.client_id, 0):
+            return False
+        self.state_vector[update.client_id] = update.clock
+        self.lamport = max(self.lamport, update.lamport)
+        self.log[update.id] = update
+        self.updates_since_compaction += 1
+
+        element_id = update.element_id
+        tombstone = self.tombstones.get(element_id)
+        if update.deleted:
+            if tombstone is None or update.stamp > tombstone[0]:
+                self.tombstones[element_id] = (update.stamp, update.id)
+                # Writes older than the delete can never become visible again
+                registers = self.registers.get(element_id, {})
+                for prop in [p for p, (stamp, _, _) in registers.items() if stamp < update.stamp]:
+                    del registers[prop]
+            return True
+
+        if tombstone is not None and update.stamp < tombstone[0]:
+            return True
+        registers = self.registers.setdefault(element_id, {})
+        for prop, value in update.fields.items():
+            current = registers.get(prop)
+            if current is None or update.stamp > current[0]:
+                registers[prop] = (update.stamp, value, update.id)
+        return True
+
+    def apply_many(self, updates: Iterable[Update]) -> List[Update]:
+        """Apply updates, returning the ones that were new."""
+        return [update for update in updates if self.apply(update)]
+
+    def diff(self, state_vector: Optional[Dict[str, int]] = None) -> List[Update]:
+        """Updates a replica with `state_vector` has not applied yet."""
+        state_vector = state_vector or {}
+        return [
+            update for update in self.log.values()
+            if update.clock > state_vector.get(update.client_id, 0)
+        ]
+
+    def elements(self) -> Dict[str, Dict[str, Any]]:
+        """Current value of every element that is not deleted."""
+        result = {}
+        for element_id, registers in self.registers.items():
+            if registers:
+                result[element_id] = {prop: value for prop, (_, value, _) in registers.items()}
+        return result
+
+    def element(self, element_id: str) -> Optional[Dict[str, Any]]:
+        """Current value of one element, or None if it is deleted or unknown."""
+        registers = self.registers.get(element_id)
+        if not registers:
+            return None
+        return {prop: value for prop, (_, value, _) in registers.items()}
+
+    def compact(self) -> int:
+        """
+        Drop superseded updates and trim the rest to the fields they still win.
+        Returns the number of updates removed.
+        """
+        winning: Dict[UpdateId, Dict[str, Any]] = {}
+        for registers in self.registers.values():
+            for prop, (_, value, update_id) in registers.items():
+                winning.setdefault(update_id, {})[prop] = value
+        deletes = {update_id for _, update_id in self.tombstones.values()}
+
+        compacted: Dict[UpdateId, Update] = {}
+        for update_id, update in self.log.items():
+            if update_id in deletes:
+                compacted[update_id] = update
+            elif update_id in winning:
+                fields = winning[update_id]
+                if len(fields) != len(update.fields):
+                    update = Update(update.client_id, update.clock, update.lamport, update.element_id, fields)
+                compacted[update_id] = update
+
+        removed = len(self.log) - len(compacted)
+        self.log = compacted
+        self.updates_since_compaction = 0
+        return removed
+
+    @classmethod
+    def from_updates(cls, updates: Iterable[Update]) -> "CRDTDocument":
+        document = cls()
+        document.apply_many(updates)
+        return document
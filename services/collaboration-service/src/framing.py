@@ -0,0 +1,141 @@
+"""
+Wire framing for collaboration traffic.
+
+JSON stays the default. A client that connects with
+auth={"protocol": "msgpack"} (or ?protocol=msgpack) receives the
+high-frequency frames (cursor_update, delta_update, operation_applied,
+presence_frame) as one
+binary MessagePack argument with short keys and timestamps as epoch
+milliseconds, and may send cursor_move, delta_update and operation payloads
+the same way. All other events stay JSON.
+
+Redis messages are written in REDIS_WIRE_FORMAT (json or msgpack). Receivers
+accept both, so a cluster can switch formats one instance at a time.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Union
+
+import msgpack
+
+PROTOCOL_JSON = "json"
+PROTOCOL_MSGPACK = "msgpack"
+PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_MSGPACK)
+
+REDIS_WIRE_FORMAT = os.getenv("REDIS_WIRE_FORMAT", PROTOCOL_JSON).lower()
+
+# Short keys used in binary frames (long -> short). Only frame fields are
+# shortened; element data inside deltas and values is passed through as is.
+FRAME_KEYS = {
+    "room": "r",
+    "user_id": "u",
+    "username": "n",
+    "color": "c",
+    "x": "x",
+    "y": "y",
+    "timestamp": "t",
+    "delta": "d",
+    "element_id": "e",
+    "operation_type": "o",
+    "old_value": "ov",
+    "new_value": "nv",
+    "resolved_by_ot": "ot",
+    "type": "k",
+    "data": "p",
+    "users": "us",
+    "tick": "tk",
+    "selected_elements": "se",
+    "pan_x": "px",
+    "pan_y": "py",
+    "zoom": "z",
+    "followers": "f",
+    "room_seq": "q",
+}
+LONG_KEYS = {short: long for long, short in FRAME_KEYS.items()}
+
+# Frame fields whose value is a frame or a list of frames (operation_applied
+# wraps one, presence_frame carries one per user)
+NESTED_FRAME_FIELDS = ("data", "users")
+
+
+def negotiate_protocol(auth: Optional[dict], query_string: str = "") -> str:
+    """Pick the frame protocol a client asked for at connect time."""
+    requested = None
+    if isinstance(auth, dict):
+        requested = auth.get("protocol")
+    if not requested and "protocol=" in query_string:
+        requested = query_string.split("protocol=")[1].split("&")[0]
+    return requested if requested in PROTOCOLS else PROTOCOL_JSON
+
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MS = timedelta(milliseconds=1)
+
+
+def _epoch_ms(timestamp: Any) -> Any:
+    """ISO timestamp (naive values are UTC) as epoch milliseconds."""
+    if not isinstance(timestamp, str):
+        return timestamp
+    parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return (parsed - EPOCH) // ONE_MS
+
+
+def _shorten(payload: Dict[str, Any]) -> Dict[str, Any]:
+    short = {}
+    for key, value in payload.items():
+        if key in NESTED_FRAME_FIELDS and isinstance(value, dict):
+            value = _shorten(value)
+        elif key in NESTED_FRAME_FIELDS and isinstance(value, list):
+            value = [_shorten(item) if isinstance(item, dict) else item for item in value]
+        elif key == "timestamp":
+            value = _epoch_ms(value)
+        short[FRAME_KEYS.get(key, key)] = value
+    return short
+
+
+def _expand(payload: Dict[str, Any]) -> Dict[str, Any]:
+    expanded = {}
+    for key, value in payload.items():
+        key = LONG_KEYS.get(key, key)
+        if key in NESTED_FRAME_FIELDS and isinstance(value, dict):
+            value = _expand(value)
+        elif key in NESTED_FRAME_FIELDS and isinstance(value, list):
+            value = [_expand(item) if isinstance(item, dict) else item for item in value]
+        expanded[key] = value
+    return expanded
+
+
+def encode_frame(payload: Dict[str, Any]) -> bytes:
+    """Encode a frame for msgpack clients."""
+    return msgpack.packb(_shorten(payload), use_bin_type=True)
+
+
+def decode_frame(data: Any) -> Any:
+    """Decode a frame sent by a client; JSON payloads are returned unchanged."""
+    if isinstance(data, (bytes, bytearray)):
+        return _expand(msgpack.unpackb(data, raw=False))
+    return data
+
+
+def encode_redis(message: Dict[str, Any]) -> Union[str, bytes]:
+    """Encode a message for Redis pub/sub in REDIS_WIRE_FORMAT."""
+    if REDIS_WIRE_FORMAT == PROTOCOL_MSGPACK:
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message)
+
+
+def decode_redis(data: Union[str, bytes]) -> Dict[str, Any]:
+    """Decode a Redis message in either format.
+
+    Raises:
+        ValueError: If the message is neither valid JSON nor MessagePack
+    """
+    if isinstance(data, str) or data[:1] == b"{":
+        return json.loads(data)
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except (msgpack.UnpackException, ValueError) as e:
+        raise ValueError(f"Invalid Redis message: {e}") from e
@@ -0,0 +1,213 @@
+"""
+Viewport interest management for collaboration rooms.
+
+On large boards people work in different areas, so fine-grained element
+changes (delta_update, element_edit, shape_created) only go to sockets
+whose viewport, grown by INTEREST_MARGIN page units, intersects the changed
+elements. Every other socket in the room receives one coarse
+`region_invalidated` event instead:
+
+    {"room": ..., "element_ids": [...], "bounds": [min_x, min_y, max_x, max_y]}
+
+and reloads those elements when it pans to them.
+
+Each room keeps the last known bounds of its elements and a uniform grid
+(INTEREST_CELL_SIZE page units per cell) of the viewports of its sockets,
+so finding the audience of a change costs one grid lookup per cell the
+change covers, not a scan of every socket. A move is sent to the viewports
+of both its old and new position. Sockets that never reported a viewport,
+and changes to elements with unknown bounds, fall back to the whole room.
+
+Clients report their viewport with viewport_update, either in page
+coordinates ("bounds": {"x", "y", "w", "h"}) or as their screen size
+("width", "height") next to the tldraw camera (pan_x, pan_y, zoom).
+"""
+import math
+import os
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+INTEREST_MARGIN = float(os.getenv("INTEREST_MARGIN", "512"))  # page units
+INTEREST_CELL_SIZE = float(os.getenv("INTEREST_CELL_SIZE", "2048"))  # page units
+# Zoomed-out viewports and huge elements span too many cells to index;
+# they are checked directly instead
+MAX_INDEXED_CELLS = 64
+
+Bounds = Tuple[float, float, float, float]  # min_x, min_y, max_x, max_y
+Cell = Tuple[int, int]
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return float(value)
+
+
+def rect_bounds(rect: Any) -> Optional[Bounds]:
+    """Bounds of {"x", "y", "w"/"width", "h"/"height"}, or None if incomplete."""
+    if not isinstance(rect, dict):
+        return None
+    x, y = _number(rect.get("x")), _number(rect.get("y"))
+    w = _number(rect.get("w", rect.get("width")))
+    h = _number(rect.get("h", rect.get("height")))
+    if None in (x, y, w, h) or w < 0 or h < 0:
+        return None
+    return (x, y, x + w, y + h)
+
+
+def camera_bounds(pan_x: Any, pan_y: Any, zoom: Any, width: Any, height: Any) -> Optional[Bounds]:
+    """Page area shown by a tldraw camera (page = screen / zoom - camera) on a width x height screen."""
+    pan_x, pan_y, zoom = _number(pan_x), _number(pan_y), _number(zoom)
+    width, height = _number(width), _number(height)
+    if None in (pan_x, pan_y, zoom, width, height) or zoom <= 0:
+        return None
+    return (-pan_x, -pan_y, -pan_x + width / zoom, -pan_y + height / zoom)
+
+
+def element_bounds(changes: Any, previous: Optional[Bounds] = None) -> Optional[Bounds]:
+    """
+    Bounds of an element after a change: explicit "bounds", or x/y and
+    props.w/props.h (tldraw records) applied over the previous bounds.
+    """
+    if not isinstance(changes, dict):
+        return previous
+    explicit = rect_bounds(changes.get("bounds"))
+    if explicit is not None:
+        return explicit
+
+    props = changes.get("props") if isinstance(changes.get("props"), dict) else {}
+    x, y = _number(changes.get("x")), _number(changes.get("y"))
+    w, h = _number(props.get("w", changes.get("w"))), _number(props.get("h", changes.get("h")))
+    if previous is not None:
+        min_x, min_y, max_x, max_y = previous
+        x = min_x if x is None else x
+        y = min_y if y is None else y
+        w = max_x - min_x if w is None else w
+        h = max_y - min_y if h is None else h
+    elif x is None or y is None:
+        return None
+    # A point until the size is known
+    w, h = max(w or 0.0, 0.0), max(h or 0.0, 0.0)
+    return (x, y, x + w, y + h)
+
+
+def union(bounds: Iterable[Bounds]) -> Optional[Bounds]:
+    bounds = list(bounds)
+    if not bounds:
+        return None
+    return (
+        min(b[0] for b in bounds), min(b[1] for b in bounds),
+        max(b[2] for b in bounds), max(b[3] for b in bounds),
+    )
+
+
+def intersects(a: Bounds, b: Bounds) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class RoomInterest:
+    """Element bounds and socket viewports of one room."""
+
+    def __init__(self, margin: float = INTEREST_MARGIN, cell_size: float = INTEREST_CELL_SIZE):
+        self.margin = margin
+        self.cell_size = cell_size
+        self.elements: Dict[str, Bounds] = {}
+        self.viewports: Dict[str, Bounds] = {}  # sid -> viewport grown by the margin
+        self.cells: Dict[Cell, Set[str]] = {}  # grid cell -> sids whose viewport covers it
+        self.wide: Set[str] = set()  # sids whose viewport spans too many cells to index
+
+    def _cell_range(self, bounds: Bounds) -> Tuple[range, range]:
+        size = self.cell_size
+        return (
+            range(math.floor(bounds[0] / size), math.floor(bounds[2] / size) + 1),
+            range(math.floor(bounds[1] / size), math.floor(bounds[3] / size) + 1),
+        )
+
+    def _cells(self, bounds: Bounds) -> Optional[Iterable[Cell]]:
+        """Grid cells covered by bounds, or None if there are too many."""
+        xs, ys = self._cell_range(bounds)
+        if len(xs) * len(ys) > MAX_INDEXED_CELLS:
+            return None
+        return [(cx, cy) for cx in xs for cy in ys]
+
+    # Viewports
+
+    def set_viewport(self, sid: str, bounds: Bounds):
+        self.remove_viewport(sid)
+        grown = (bounds[0] - self.margin, bounds[1] - self.margin, bounds[2] + self.margin, bounds[3] + self.margin)
+        self.viewports[sid] = grown
+        cells = self._cells(grown)
+        if cells is None:
+            self.wide.add(sid)
+            return
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(sid)
+
+    def remove_viewport(self, sid: str):
+        bounds = self.viewports.pop(sid, None)
+        if bounds is None:
+            return
+        if sid in self.wide:
+            self.wide.discard(sid)
+            return
+        for cell in self._cells(bounds):
+            sids = self.cells.get(cell)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self.cells[cell]
+
+    # Elements
+
+    def apply_changes(self, changes: Dict[str, Any]) -> Optional[List[Bounds]]:
+        """
+        Track element bounds from a delta (element_id -> changes, None or
+        isDeleted for deletions). Returns the old and new bounds of every
+        changed element, or None if some are unknown (deletions included).
+        """
+        areas: Optional[List[Bounds]] = []
+        for element_id, element_changes in changes.items():
+            previous = self.elements.get(element_id)
+            if element_changes is None or (isinstance(element_changes, dict) and element_changes.get("isDeleted")):
+                self.elements.pop(element_id, None)
+                areas = None
+                continue
+            bounds = element_bounds(element_changes, previous)
+            if bounds is None:
+                areas = None
+                continue
+            self.elements[element_id] = bounds
+            if areas is not None:
+                areas.extend({bounds, previous or bounds})
+        return areas
+
+    def element_areas(self, element_ids: Iterable[str]) -> Optional[List[Bounds]]:
+        """Bounds of each element, or None if any of them is unknown."""
+        areas = []
+        for element_id in element_ids:
+            bounds = self.elements.get(element_id)
+            if bounds is None:
+                return None
+            areas.append(bounds)
+        return areas
+
+    # Routing
+
+    def audience(self, areas: Iterable[Bounds]) -> Tuple[Set[str], Set[str]]:
+        """
+        Split the sockets with a viewport into (interested, not interested)
+        in a change covering `areas`. Sockets without a viewport are in
+        neither set and always get the change.
+        """
+        interested: Set[str] = set()
+        for element in areas:
+            cells = self._cells(element)
+            if cells is None:
+                candidates = set(self.viewports)
+            else:
+                candidates = set(self.wide)
+                for cell in cells:
+                    candidates.update(self.cells.get(cell, ()))
+            interested.update(
+                sid for sid in candidates - interested if intersects(self.viewports[sid], element)
+            )
+        return interested, set(self.viewports) - interested
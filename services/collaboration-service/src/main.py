@@ -1,5 +1,5 @@
 """Collaboration Service - Real-time collaboration with WebSocket."""
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Response
 from datetime import datetime, timedelta
 import os
 import json
@@ -8,11 +8,40 @@ import traceback
 from dotenv import load_dotenv
 import socketio
 import redis.asyncio as redis
-from typing import Dict, Set, Optional, List
+from typing import Dict, Set, Optional, List, Union
 import jwt
-from dataclasses import dataclass, asdict
+from prometheus_client import CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from dataclasses import dataclass, asdict, replace
 from enum import Enum
+from collections import OrderedDict
 import asyncio
+import itertools
+import uuid
+from functools import partial
+
+from .framing import (
+    PROTOCOL_JSON, PROTOCOL_MSGPACK, negotiate_protocol,
+    encode_frame, decode_frame, encode_redis, decode_redis
+)
+from .room_state import RoomStateStore
+from .operation_log import Operation, OperationLog
+from .timers import TimerScheduler
+from .write_behind import WriteBehind
+from .presence_frames import (
+    PRESENCE_TICK_HZ, PRESENCE_TICK_SECONDS, PresenceCoalescer, wants_presence_frames
+)
+from .crdt import (
+    CRDTDocument, decode_updates, encode_updates,
+    decode_state_vector, encode_state_vector
+)
+from .interest import RoomInterest, camera_bounds, rect_bounds, union
+from .send_queues import SEND_QUEUE_POLL, SendQueues
+from .sharding import INSTANCE_HEARTBEAT, ShardMap
+from .offline_queue import (
+    OfflineQueueFull, OfflineQueueStore, ReplayInProgress, element_states_from_history,
+    operation_time, rebase_operation
+)
 
 load_dotenv()
 
@@ -188,9 +217,31 @@ socket_app = app
 
 # Redis connection for pub/sub
 redis_client = None
-pubsub = None
+pubsub = None  # Room channel subscriptions, owned by redis_subscriber_task
+subscribed_rooms: Set[str] = set()  # rooms whose channel this instance subscribes to
+room_subscriptions_changed = asyncio.Event()
+
+# Cross-instance broadcast tagging (Feature #422)
+# Every published message carries this process's origin and a sequence number
+# so subscribers can drop their own echoes and duplicate deliveries. INSTANCE_ID
+# is pinned per deployment, while the sequence restarts with the process, so the
+# origin adds a boot id: peers start a new window after a restart instead of
+# dropping seq 1..N as already seen.
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{os.uname().nodename}-{uuid.uuid4().hex[:8]}"
+PUBLISH_ORIGIN = f"{INSTANCE_ID}:{uuid.uuid4().hex}"
+publish_sequence = itertools.count(1)
+broadcast_stats = {"published": 0, "delivered": 0, "echoes_dropped": 0, "duplicates_dropped": 0, "relay_skipped": 0}
+
+# Rooms are routed to an owner instance by consistent hashing (see sharding.py
+# and shard_map below). room_instances holds, for each subscribed room, the
+# other instances with sockets in it; room messages are published only while
+# it is not empty
+room_instances: Dict[str, Optional[Set[str]]] = {}  # room_id -> other instances, None if unknown
 
 # Track active rooms and users
+# room_users, activity_feeds, follow_relationships, undo/redo stacks, element_locks
+# and operation_history are this instance's cache of the shared room state in
+# Redis (see room_state.py and persist_room_state)
 active_rooms: Dict[str, Set[str]] = {}  # room_id -> set of session_ids
 room_users: Dict[str, Dict[str, UserPresence]] = {}  # room_id -> {user_id: UserPresence}
 session_user_map: Dict[str, str] = {}  # sid -> user_id
@@ -201,12 +252,21 @@ next_color_index: int = 0
 # Follow mode tracking (Feature #411)
 follow_relationships: Dict[str, Dict[str, str]] = {}  # room_id -> {follower_user_id: following_user_id}
 viewport_states: Dict[str, Dict[str, dict]] = {}  # room_id -> {user_id: {pan_x, pan_y, zoom}}
+# Element bounds and socket viewports used to route element changes (see interest.py)
+room_interest: Dict[str, RoomInterest] = {}
+interest_stats = {"fine": 0, "invalidated": 0}
 
 # Per-user undo/redo history (Feature #413)
 # Each user maintains their own undo and redo stacks
 undo_stacks: Dict[str, Dict[str, List[dict]]] = {}  # room_id -> {user_id: [actions]}
 redo_stacks: Dict[str, Dict[str, List[dict]]] = {}  # room_id -> {user_id: [actions]}
 
+# CRDT documents of rooms with local sockets (see crdt.py); loaded from Redis
+# when the first local socket joins and dropped when the last one leaves
+crdt_documents: Dict[str, CRDTDocument] = {}
+crdt_loading: Dict[str, List[list]] = {}  # room_id -> remote update records received while loading
+CRDT_COMPACT_EVERY = int(os.getenv("CRDT_COMPACT_EVERY", "500"))  # updates
+
 # Element locks (Feature #414)
 # Track which elements are locked by which users for exclusive editing
 element_locks: Dict[str, Dict[str, str]] = {}  # room_id -> {element_id: user_id}
@@ -245,7 +305,7 @@ def add_activity_event(room_id: str, user_id: str, username: str, action: str, t
         activity_feeds[room_id] = []
     
     event = ActivityEvent(
-        event_id=f"{room_id}_{len(activity_feeds[room_id])}",
+        event_id=f"{room_id}_{uuid.uuid4().hex[:12]}",
         user_id=user_id,
         username=username,
         action=action,
@@ -259,9 +319,16 @@ def add_activity_event(room_id: str, user_id: str, username: str, action: str, t
     if len(activity_feeds[room_id]) > 100:
         activity_feeds[room_id] = activity_feeds[room_id][-100:]
     
+    room_state.spawn(persist_room_state(
+        room_id, room_state.append_activity(room_id, event.to_dict()), "activity", event=event.to_dict()
+    ))
     return event
 
 
+# Presence fields too hot to write through on every change (cursor moves at 10 Hz)
+LOCAL_PRESENCE_FIELDS = {"cursor_x", "cursor_y"}
+
+
 async def update_user_presence(room_id: str, user_id: str, **updates):
     """Update user presence information."""
     if room_id in room_users and user_id in room_users[room_id]:
@@ -270,6 +337,10 @@ async def update_user_presence(room_id: str, user_id: str, **updates):
             if hasattr(presence, key):
                 setattr(presence, key, value)
         presence.last_active = datetime.utcnow()
+        if set(updates) - LOCAL_PRESENCE_FIELDS:
+            await persist_presence(room_id, presence)
+        if updates.get('status') == PresenceStatus.ONLINE:
+            arm_away_timer(room_id, user_id, presence)
         return presence
     return None
 
@@ -293,26 +364,79 @@ def check_edit_permission(room_id: str, user_id: str) -> tuple[bool, Optional[st
     return True, None
 
 
-async def check_away_users():
-    """Background task to mark users as away after 5 minutes of inactivity."""
-    while True:
-        try:
-            await asyncio.sleep(60)  # Check every minute
-            now = datetime.utcnow()
-            
-            for room_id, users in room_users.items():
-                for user_id, presence in users.items():
-                    if presence.status == PresenceStatus.ONLINE:
-                        time_inactive = (now - presence.last_active).total_seconds()
-                        if time_inactive > 300:  # 5 minutes
-                            presence.status = PresenceStatus.AWAY
-                            await sio.emit('presence_update', {
-                                'user_id': user_id,
-                                'status': PresenceStatus.AWAY,
-                                'last_active': presence.last_active.isoformat()
-                            }, room=room_id)
-        except Exception as e:
-            logger.error(f"Error in check_away_users: {e}")
+# Deadlines for away detection, lock expiry, annotation fade-out and the
+# shared presence refresh (see timers.py)
+timers = TimerScheduler()
+AWAY_AFTER_SECONDS = 300  # 5 minutes
+PRESENCE_REFRESH_SECONDS = 60
+ELEMENT_LOCK_TIMEOUT = int(os.getenv("ELEMENT_LOCK_TIMEOUT", "300"))  # seconds
+
+# Flushes CRDT edits made through this instance to diagram-service (see write_behind.py)
+write_behind = WriteBehind(timers, crdt_documents.get)
+
+
+def arm_away_timer(room_id: str, user_id: str, presence: UserPresence):
+    """Arm the away deadline of a user connected to this instance."""
+    delay = AWAY_AFTER_SECONDS - (datetime.utcnow() - presence.last_active).total_seconds()
+    timers.schedule(("away", room_id, user_id), delay, partial(check_away_user, room_id, user_id))
+
+
+async def check_away_user(room_id: str, user_id: str):
+    """Mark a user as away after 5 minutes of inactivity, or re-arm if they were active since."""
+    presence = room_users.get(room_id, {}).get(user_id)
+    if presence is None or presence.status != PresenceStatus.ONLINE:
+        return
+
+    time_inactive = (datetime.utcnow() - presence.last_active).total_seconds()
+    if time_inactive < AWAY_AFTER_SECONDS:
+        arm_away_timer(room_id, user_id, presence)
+        return
+
+    presence.status = PresenceStatus.AWAY
+    await persist_presence(room_id, presence)
+    await sio.emit('presence_update', {
+        'user_id': user_id,
+        'status': PresenceStatus.AWAY,
+        'last_active': presence.last_active.isoformat()
+    }, room=room_id)
+
+
+async def refresh_presence_periodically():
+    """Keep shared presence of local users fresh; re-arms itself every minute."""
+    timers.schedule("presence_refresh", PRESENCE_REFRESH_SECONDS, refresh_presence_periodically)
+    await refresh_shared_presence()
+
+
+async def refresh_shards():
+    """
+    Heartbeat into the instance registry and refresh which instances share
+    our rooms; hand rooms over when the live instances changed. Re-arms itself.
+    """
+    timers.schedule("shard_refresh", INSTANCE_HEARTBEAT, refresh_shards)
+    changed = await shard_map.heartbeat()
+
+    rooms = list(subscribed_rooms)
+    instances = await room_state.load_instances(rooms)
+    if instances is not None:
+        for room_id in rooms:
+            if room_id in subscribed_rooms:
+                room_instances[room_id] = instances[room_id] - {INSTANCE_ID}
+
+    if changed and shard_map.enabled:
+        for room_id in list(active_rooms):
+            owner = shard_map.owner(room_id)
+            if owner != INSTANCE_ID:
+                await hand_over_room(room_id, owner)
+
+
+async def hand_over_room(room_id: str, owner: str):
+    """Move a room's local sockets to its new owner; they reconnect through nginx."""
+    logger.info(f"Handing room {room_id} over to {owner}")
+    shard_map.stats["handovers"] += 1
+    await write_behind.flush(room_id)
+    await sio.emit('room_handover', {'room': room_id, 'owner': owner}, room=room_id)
+    for sid in list(active_rooms.get(room_id, ())):
+        await sio.disconnect(sid)
 
 
 async def get_redis():
@@ -329,23 +453,550 @@ async def get_redis():
     return redis_client
 
 
-async def publish_to_redis(channel: str, message: dict):
-    """Publish message to Redis channel for cross-instance communication."""
+# Shared room state in Redis; the room dicts above cache it locally
+room_state = RoomStateStore(get_redis)
+shard_map = ShardMap(get_redis, INSTANCE_ID)
+
+
+def presence_to_dict(presence: UserPresence) -> dict:
+    """Serialize presence for the shared room state."""
+    return {
+        **asdict(presence),
+        'status': presence.status.value,
+        'role': presence.role.value,
+        'connection_quality': presence.connection_quality.value,
+        'last_active': presence.last_active.isoformat() if presence.last_active else None,
+        'last_heartbeat': presence.last_heartbeat.isoformat() if presence.last_heartbeat else None
+    }
+
+
+def presence_from_dict(data: dict) -> UserPresence:
+    """Rebuild presence read from the shared room state."""
+    return UserPresence(**{
+        **data,
+        'status': PresenceStatus(data['status']),
+        'role': UserRole(data.get('role', UserRole.EDITOR.value)),
+        'connection_quality': ConnectionQuality(data.get('connection_quality', ConnectionQuality.GOOD.value)),
+        'last_active': datetime.fromisoformat(data['last_active']) if data.get('last_active') else None,
+        'last_heartbeat': datetime.fromisoformat(data['last_heartbeat']) if data.get('last_heartbeat') else None
+    })
+
+
+def activity_from_dict(data: dict) -> ActivityEvent:
+    return ActivityEvent(**{**data, 'timestamp': datetime.fromisoformat(data['timestamp'])})
+
+
+async def persist_room_state(room_id: str, write, kind: str, **fields):
+    """
+    Write a room state change through to Redis, then tell peer instances with
+    sockets in the room to apply it to their cache (see apply_room_state).
+    """
+    await write
+    await publish_to_redis(room_channel(room_id), {"type": "room_state", "kind": kind, **fields})
+
+
+async def persist_presence(room_id: str, presence: UserPresence):
+    data = presence_to_dict(presence)
+    await persist_room_state(
+        room_id, room_state.save_presence(room_id, presence.user_id, data),
+        "presence", user_id=presence.user_id, presence=data
+    )
+
+
+async def persist_stacks(room_id: str, user_id: str):
+    undo = undo_stacks.get(room_id, {}).get(user_id, [])
+    redo = redo_stacks.get(room_id, {}).get(user_id, [])
+    await persist_room_state(
+        room_id, room_state.save_stacks(room_id, user_id, undo, redo),
+        "stacks", user_id=user_id, undo=undo, redo=redo
+    )
+
+
+async def sequence_update(room_id: str, event: str, payload: dict) -> dict:
+    """
+    Number a document update of a room and keep it in the room's update log
+    (see catch_up). Returns the payload carrying its room_seq, or unchanged
+    if Redis is unavailable.
+    """
+    seq = await room_state.append_update(room_id, event, payload)
+    return payload if seq is None else {**payload, 'room_seq': seq}
+
+
+def apply_room_state(room_id: str, message: dict):
+    """Apply a room state change made by another instance to the local cache."""
+    kind = message.get('kind')
+    if kind == 'presence':
+        room_users.setdefault(room_id, {})[message['user_id']] = presence_from_dict(message['presence'])
+    elif kind == 'presence_removed':
+        room_users.get(room_id, {}).pop(message['user_id'], None)
+    elif kind == 'instance':
+        others = room_instances.get(room_id)
+        if others is not None:
+            if message['present']:
+                others.add(message['instance'])
+            else:
+                others.discard(message['instance'])
+    elif kind == 'lock':
+        locks = element_locks.setdefault(room_id, {})
+        if message.get('user_id'):
+            locks[message['element_id']] = message['user_id']
+        else:
+            locks.pop(message['element_id'], None)
+    elif kind == 'locks_released':
+        for element_id in message['element_ids']:
+            element_locks.get(room_id, {}).pop(element_id, None)
+    elif kind == 'operation':
+        operation_history.setdefault(room_id, OperationLog()).append(Operation.from_dict(message['operation']))
+    elif kind == 'operations':
+        operation_history.setdefault(room_id, OperationLog()).extend(
+            Operation.from_dict(operation) for operation in message['operations']
+        )
+    elif kind == 'activity':
+        feed = activity_feeds.setdefault(room_id, [])
+        feed.append(activity_from_dict(message['event']))
+        if len(feed) > 100:
+            activity_feeds[room_id] = feed[-100:]
+    elif kind == 'stacks':
+        undo_stacks.setdefault(room_id, {})[message['user_id']] = message['undo']
+        redo_stacks.setdefault(room_id, {})[message['user_id']] = message['redo']
+    elif kind == 'follow':
+        follows = follow_relationships.setdefault(room_id, {})
+        if message.get('following_id'):
+            follows[message['follower_id']] = message['following_id']
+        else:
+            follows.pop(message['follower_id'], None)
+
+
+async def load_room_state(room_id: str):
+    """Replace the local cache of a room with the shared state (first local socket joins)."""
+    state = await room_state.load_room(room_id)
+    if state is None:
+        return
+    room_users[room_id] = {user_id: presence_from_dict(data) for user_id, data in state['users'].items()}
+    element_locks[room_id] = state['locks']
+    operation_history[room_id] = OperationLog()
+    operation_history[room_id].extend(Operation.from_dict(op) for op in state['operations'])
+    activity_feeds[room_id] = [activity_from_dict(event) for event in state['activity']]
+    undo_stacks[room_id] = {user_id: stacks['undo'] for user_id, stacks in state['stacks'].items()}
+    redo_stacks[room_id] = {user_id: stacks['redo'] for user_id, stacks in state['stacks'].items()}
+    follow_relationships[room_id] = state['follows']
+
+
+async def shared_room_users(room_id: str) -> Dict[str, UserPresence]:
+    """Presence of every user in a room across all instances (local cache if Redis is down)."""
+    stored = await room_state.load_presences(room_id)
+    if stored is None:
+        return room_users.get(room_id, {})
+    return {user_id: presence_from_dict(data) for user_id, data in stored.items()}
+
+
+async def refresh_shared_presence():
+    """
+    Re-save presence of users connected here so it does not go stale, and
+    prune users left behind by instances that stopped without cleaning up.
+    """
+    local_users = {
+        (session_room_map[sid], user_id)
+        for sid, user_id in session_user_map.items()
+        if sid in session_room_map
+    }
+    for room_id, user_id in local_users:
+        presence = room_users.get(room_id, {}).get(user_id)
+        if presence:
+            await room_state.save_presence(room_id, user_id, presence_to_dict(presence))
+
+    for room_id in list(active_rooms):
+        for user_id in await room_state.prune_presences(room_id):
+            room_users.get(room_id, {}).pop(user_id, None)
+            await publish_to_redis(room_channel(room_id), {
+                "type": "room_state", "kind": "presence_removed", "user_id": user_id
+            })
+
+
+class SequenceWindow:
+    """Sequence numbers recently received from one publishing process."""
+
+    def __init__(self, size: int = 1024):
+        self.size = size
+        self.highest = 0
+        self.seen: Set[int] = set()
+
+    def accept(self, seq: int) -> bool:
+        """Return True the first time a sequence number is seen.
+
+        Publishes from one instance may use different pooled connections and
+        arrive slightly out of order, so a window of recent numbers is kept
+        instead of only the highest.
+        """
+        if seq <= self.highest - self.size or seq in self.seen:
+            return False
+        self.seen.add(seq)
+        if seq > self.highest:
+            self.highest = seq
+            if len(self.seen) > 2 * self.size:
+                floor = self.highest - self.size
+                self.seen = {s for s in self.seen if s > floor}
+        return True
+
+
+MAX_TRACKED_ORIGINS = 256
+origin_sequences: "OrderedDict[str, SequenceWindow]" = OrderedDict()  # publishing process -> recent seqs
+
+
+def accept_remote_sequence(origin: str, seq: int) -> bool:
+    """Deduplicate a message from another instance by its sequence number."""
+    window = origin_sequences.get(origin)
+    if window is None:
+        window = origin_sequences[origin] = SequenceWindow()
+        if len(origin_sequences) > MAX_TRACKED_ORIGINS:
+            origin_sequences.popitem(last=False)
+    else:
+        origin_sequences.move_to_end(origin)
+    return window.accept(seq)
+
+
+def relay_needed(room_id: str) -> bool:
+    """Whether another live instance has sockets in the room (True if unknown)."""
+    if room_id not in subscribed_rooms:
+        return True
+    others = room_instances.get(room_id)
+    return others is None or bool(others & shard_map.live)
+
+
+async def publish_to_redis(channel: str, message: dict, source_sid: Optional[str] = None, always: bool = False):
+    """
+    Publish message to Redis channel for cross-instance communication.
+
+    The message is wrapped in an envelope tagged with this process's origin
+    (PUBLISH_ORIGIN) and the next sequence number. source_sid names the socket that sent it, which
+    receiving instances skip. Room messages are dropped while no other
+    instance has sockets in the room, unless `always` is set.
+    """
+    if not always and channel.startswith("room:") and not relay_needed(channel[len("room:"):]):
+        broadcast_stats["relay_skipped"] += 1
+        return
     try:
+        envelope = {
+            "origin": PUBLISH_ORIGIN,
+            "seq": next(publish_sequence),
+            "source_sid": source_sid,
+            "message": message
+        }
         r = await get_redis()
-        await r.publish(channel, json.dumps(message))
-        logger.info(f"Published to Redis channel {channel}: {message}")
+        await r.publish(channel, encode_redis(envelope))
+        broadcast_stats["published"] += 1
+        logger.debug(f"Published to Redis channel {channel}", message_type=message.get('type'), seq=envelope["seq"])
     except Exception as e:
         logger.error(f"Failed to publish to Redis: {e}")
 
 
+def room_channel(room_id: str) -> str:
+    """Redis pub/sub channel for a room."""
+    return f"room:{room_id}"
+
+
+async def subscribe_room_channel(room_id: str) -> bool:
+    """
+    Subscribe this instance to a room's Redis channel.
+    Called when the first local socket joins the room; the subscriber task
+    re-subscribes to every room in subscribed_rooms after a reconnect.
+    Returns True if the room was not subscribed before.
+    """
+    if room_id in subscribed_rooms:
+        return False
+    subscribed_rooms.add(room_id)
+    if pubsub is not None:
+        try:
+            await pubsub.subscribe(room_channel(room_id))
+        except Exception as e:
+            logger.error(f"Failed to subscribe to Redis channel for room {room_id}: {e}")
+    room_subscriptions_changed.set()
+
+    # Tell instances already in the room to start relaying to us
+    instances = await room_state.join_instance(room_id, INSTANCE_ID)
+    room_instances[room_id] = instances - {INSTANCE_ID} if instances is not None else None
+    await publish_to_redis(room_channel(room_id), {
+        "type": "room_state", "kind": "instance", "instance": INSTANCE_ID, "present": True
+    }, always=True)
+    return True
+
+
+async def release_room_channel(room_id: str):
+    """Unsubscribe from a room's Redis channel once no local sockets remain."""
+    if room_id in active_rooms or room_id not in subscribed_rooms:
+        return
+    subscribed_rooms.discard(room_id)
+    # Without the channel this instance stops seeing the room's CRDT updates;
+    # persist what its clients changed before dropping the document
+    write_behind.flush_soon(room_id, room_state.spawn)
+    crdt_documents.pop(room_id, None)
+    room_interest.pop(room_id, None)
+    room_instances.pop(room_id, None)
+    room_state.spawn(room_state.leave_instance(room_id, INSTANCE_ID))
+    room_state.spawn(publish_to_redis(room_channel(room_id), {
+        "type": "room_state", "kind": "instance", "instance": INSTANCE_ID, "present": False
+    }, always=True))
+    if pubsub is not None:
+        try:
+            await pubsub.unsubscribe(room_channel(room_id))
+        except Exception as e:
+            logger.error(f"Failed to unsubscribe from Redis channel for room {room_id}: {e}")
+
+
+def frame_room(room_id: str, protocol: str) -> str:
+    """Socket.IO sub-room with the room's sockets that receive frames in `protocol`."""
+    return f"{room_id}#{protocol}"
+
+
+async def send_to_socket(sid: str, event: str, data):
+    await sio.emit(event, data, to=sid)
+
+
+# Bounded queues of the sockets whose transport is not keeping up
+send_queues = SendQueues(send_to_socket)
+
+
+def socket_backlogs():
+    """(sid, packets waiting in its Engine.IO queue) of every connected socket."""
+    try:
+        participants = list(sio.manager.get_participants('/', None))
+    except KeyError:
+        return  # Nobody connected yet
+    for sid, eio_sid in participants:
+        socket = sio.eio.sockets.get(eio_sid)
+        if socket is not None:
+            yield sid, socket.queue.qsize()
+
+
+async def send_queue_task():
+    """Feed the queues of sockets that are behind to their transports."""
+    while True:
+        await asyncio.sleep(SEND_QUEUE_POLL)
+        try:
+            await send_queues.pump(socket_backlogs())
+        except Exception as e:
+            logger.error(f"Failed to pump send queues: {e}")
+
+
+async def emit_to_room(event: str, data, room: str, skip_sid: Union[str, List[str], None] = None, key=None):
+    """
+    Emit a high-frequency event to a Socket.IO room. Sockets that are behind
+    get it through their send queue instead, collapsed with queued events of
+    the same `key` (see send_queues.py).
+    """
+    skip = [skip_sid] if isinstance(skip_sid, str) else list(skip_sid or [])
+    behind = [
+        sid for sid in send_queues.behind()
+        if sid not in skip and room in sio.rooms(sid)
+    ]
+    await sio.emit(event, data, room=room, skip_sid=(skip + behind) or None)
+    for sid in behind:
+        send_queues.push(sid, event, data, key)
+
+
+async def emit_to_socket(event: str, data, sid: str, key=None):
+    if sid in send_queues.queues:
+        send_queues.push(sid, event, data, key)
+    else:
+        await sio.emit(event, data, to=sid)
+
+
+async def emit_frame(event: str, payload, room_id: str, skip_sid: Union[str, List[str], None] = None,
+                     frame: Optional[dict] = None, key=None):
+    """
+    Emit a high-frequency frame to a room: JSON to JSON clients and one
+    MessagePack encoding to msgpack clients. `frame` replaces the payload
+    for msgpack clients when the JSON payload is not a frame dict.
+    """
+    await emit_to_room(event, payload, frame_room(room_id, PROTOCOL_JSON), skip_sid, key)
+
+    binary_room = frame_room(room_id, PROTOCOL_MSGPACK)
+    if next(sio.manager.get_participants('/', binary_room), None) is not None:
+        await emit_to_room(event, encode_frame(frame if frame is not None else payload), binary_room, skip_sid, key)
+
+
+async def emit_to_viewers(event: str, payload, room_id: str, areas, element_ids,
+                          skip_sid: Optional[str] = None, frame: Optional[dict] = None):
+    """
+    Emit an element change to the sockets whose viewport covers `areas`
+    (element bounds, None if unknown), and a coarse region_invalidated to
+    the rest of the room. `frame` is given for events sent with emit_frame.
+    """
+    interest = room_interest.get(room_id)
+    if areas is None or interest is None or not interest.viewports:
+        elsewhere = set()
+    else:
+        _, elsewhere = interest.audience(areas)
+        elsewhere.discard(skip_sid)
+
+    skip = [other for other in (skip_sid, *elsewhere) if other] or None
+    if frame is not None:
+        await emit_frame(event, payload, room_id, skip_sid=skip, frame=frame)
+    else:
+        await emit_to_room(event, payload, room_id, skip_sid=skip)
+    interest_stats["fine"] += 1
+
+    if elsewhere:
+        invalidation = {'room': room_id, 'element_ids': list(element_ids), 'bounds': list(union(areas))}
+        for other in elsewhere:
+            await emit_to_socket('region_invalidated', invalidation, other, key=('region_invalidated', room_id))
+        interest_stats["invalidated"] += len(elsewhere)
+
+
+def forget_viewport(room_id: Optional[str], sid: str):
+    interest = room_interest.get(room_id)
+    if interest is not None:
+        interest.remove_viewport(sid)
+
+
+def presence_room(room_id: str, protocol: str) -> str:
+    """Sub-room with the room's sockets that receive batched presence frames in `protocol`."""
+    return frame_room(room_id, f"presence-{protocol}")
+
+
+# Cursor, selection and viewport changes buffered until the next tick
+presence_coalescer = PresenceCoalescer()
+presence_buffered = asyncio.Event()
+
+
+def buffer_presence(room_id: str, user_id: str, sid: str, presence: UserPresence, **parts):
+    """Queue a cursor/selection/viewport change for the next presence tick."""
+    presence_coalescer.update(
+        room_id, user_id, sid, presence.username, presence.color,
+        datetime.utcnow().isoformat(), **parts
+    )
+    presence_buffered.set()
+
+
+async def flush_presence(room_id: str, users: dict):
+    """Send one tick of a room's presence changes."""
+    followers: Dict[str, List[str]] = {}
+    for follower_id, following_id in follow_relationships.get(room_id, {}).items():
+        followers.setdefault(following_id, []).append(follower_id)
+
+    entries = []
+    for user_id, pending in users.items():
+        entry = pending.frame_entry(user_id)
+        if pending.viewport is not None:
+            entry['followers'] = followers.get(user_id, [])
+        entries.append(entry)
+
+    # Clients that asked for presence frames get the whole tick at once
+    frame = {'room': room_id, 'tick': presence_coalescer.tick, 'users': entries}
+    batched_sids = []
+    for protocol in (PROTOCOL_JSON, PROTOCOL_MSGPACK):
+        target = presence_room(room_id, protocol)
+        sids = [sid for sid, _ in sio.manager.get_participants('/', target)]
+        if sids:
+            batched_sids.extend(sids)
+            await emit_to_room(
+                'presence_frame', frame if protocol == PROTOCOL_JSON else encode_frame(frame), target,
+                key=('presence_frame', room_id)
+            )
+
+    # Everyone else gets the per-user events, at most once per tick
+    for user_id, pending in users.items():
+        skip = [sid for sid in [pending.sid, *batched_sids] if sid] or None
+        if pending.cursor is not None:
+            await emit_frame('cursor_update', {
+                'user_id': user_id,
+                'username': pending.username,
+                'color': pending.color,
+                **pending.cursor,
+                'timestamp': pending.timestamp
+            }, room_id, skip_sid=skip, key=('cursor_update', user_id))
+        if pending.selection is not None:
+            await emit_to_room('selection_update', {
+                'user_id': user_id,
+                'username': pending.username,
+                'color': pending.color,
+                **pending.selection,
+                'timestamp': pending.timestamp
+            }, room_id, skip_sid=skip, key=('selection_update', user_id))
+        if pending.viewport is not None and followers.get(user_id):
+            await emit_to_room('viewport_changed', {
+                'user_id': user_id,
+                **pending.viewport,
+                'followers': followers[user_id],  # List of users who should follow this update
+                'timestamp': pending.timestamp
+            }, room_id, skip_sid=batched_sids, key=('viewport_changed', user_id))
+
+
+async def presence_flush_task():
+    """Flush buffered presence changes once per tick; idle while nothing is buffered."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await presence_buffered.wait()
+        started = loop.time()
+        presence_buffered.clear()
+        for room_id, users in presence_coalescer.drain().items():
+            try:
+                await flush_presence(room_id, users)
+            except Exception as e:
+                logger.error(f"Failed to flush presence for room {room_id}: {e}")
+        await asyncio.sleep(max(0.0, PRESENCE_TICK_SECONDS - (loop.time() - started)))
+
+
+async def handle_room_message(room_id: str, data: bytes):
+    """
+    Broadcast a message received from another instance to local clients in the room.
+    Our own publishes are dropped: the publishing handler already emitted them locally.
+    """
+    try:
+        envelope = decode_redis(data)
+    except ValueError:
+        logger.error(f"Failed to parse Redis message for room {room_id}")
+        return
+
+    origin = envelope.get('origin')
+    if origin == PUBLISH_ORIGIN:
+        broadcast_stats["echoes_dropped"] += 1
+        return
+    if origin is None or not isinstance(envelope.get('seq'), int):
+        logger.warning(f"Dropping untagged Redis message for room {room_id}")
+        return
+    if not accept_remote_sequence(origin, envelope['seq']):
+        broadcast_stats["duplicates_dropped"] += 1
+        return
+
+    msg_data = envelope.get('message') or {}
+    skip_sid = envelope.get('source_sid')
+
+    if msg_data.get('type') == 'room_state':
+        apply_room_state(room_id, msg_data)
+        return
+
+    if msg_data.get('type') == 'crdt_update':
+        await handle_remote_crdt_update(room_id, msg_data, skip_sid)
+        return
+
+    # Offline replays arrive under their own event, as local clients receive them
+    if msg_data.get('type') == 'operations_replayed':
+        await emit_frame('operations_replayed', msg_data, room_id, skip_sid=skip_sid)
+        broadcast_stats["delivered"] += 1
+        return
+
+    # Feature #422: Extract the 'update' payload for diagram_update messages
+    if msg_data.get('type') == 'diagram_update':
+        await sio.emit('update', msg_data.get('update', {}), room=room_id, skip_sid=skip_sid)
+    else:
+        # For other message types, broadcast as-is
+        await sio.emit('update', msg_data, room=room_id, skip_sid=skip_sid)
+    broadcast_stats["delivered"] += 1
+    logger.debug(f"Broadcasted Redis message from {origin} to local clients in room {room_id}")
+
+
 async def redis_subscriber_task():
     """
     Background task to subscribe to Redis pub/sub channels.
     Listens for messages from other service instances and broadcasts to local clients.
     Feature #397: Redis pub/sub for cross-server broadcasting
+
+    Only the channels of rooms with local sockets are subscribed (see
+    subscribe_room_channel / release_room_channel), so inbound traffic scales
+    with this instance's rooms rather than with the whole cluster.
     """
-    global redis_client
+    global pubsub
 
     logger.info("Starting Redis subscriber task...")
 
@@ -355,59 +1006,41 @@ async def redis_subscriber_task():
             redis_host = os.getenv("REDIS_HOST", "localhost")
             redis_port = int(os.getenv("REDIS_PORT", "6379"))
 
+            # Raw bytes: messages may be JSON or MessagePack (see framing.py)
             pubsub_client = await redis.Redis(
                 host=redis_host,
                 port=redis_port,
-                decode_responses=True
+                decode_responses=False
             )
 
-            # Create pub/sub instance
+            # Create pub/sub instance and restore room subscriptions
             pubsub = pubsub_client.pubsub()
-
-            # Subscribe to pattern for all room channels
-            await pubsub.psubscribe("room:*")
-            logger.info("Subscribed to Redis pattern: room:*")
+            if subscribed_rooms:
+                await pubsub.subscribe(*(room_channel(room_id) for room_id in subscribed_rooms))
+            logger.info(f"Subscribed to Redis channels for {len(subscribed_rooms)} local rooms")
 
             # Listen for messages
-            async for message in pubsub.listen():
-                try:
-                    if message['type'] == 'pmessage':
-                        channel = message['channel']
-                        data = message['data']
-
-                        # Extract room_id from channel (format: "room:{room_id}")
-                        room_id = channel.split(":", 1)[1] if ":" in channel else None
-
-                        if not room_id:
-                            continue
-
-                        # Parse message
-                        try:
-                            msg_data = json.loads(data)
-                        except json.JSONDecodeError:
-                            logger.error(f"Failed to parse Redis message: {data}")
-                            continue
-
-                        logger.info(f"Received Redis message for room {room_id}: {msg_data}")
-
-                        # Broadcast to all local WebSocket clients in this room
-                        # This allows messages from other server instances to reach clients on this server
-                        # Feature #422: Extract the 'update' payload for diagram_update messages
-                        if msg_data.get('type') == 'diagram_update':
-                            update_payload = msg_data.get('update', {})
-                            await sio.emit('update', update_payload, room=room_id)
-                            logger.info(f"Broadcasted diagram_update to local clients in room {room_id}")
-                        else:
-                            # For other message types, broadcast as-is
-                            await sio.emit('update', msg_data, room=room_id)
-                            logger.info(f"Broadcasted Redis message to local clients in room {room_id}")
+            while True:
+                room_subscriptions_changed.clear()
+                if not pubsub.subscribed:
+                    # No local rooms: nothing to read until a socket joins one
+                    await room_subscriptions_changed.wait()
+                    continue
 
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None or message['type'] != 'message':
+                    continue
+
+                # Extract room_id from channel (format: "room:{room_id}")
+                room_id = message['channel'].decode('utf-8').split(":", 1)[1]
+                try:
+                    await handle_room_message(room_id, message['data'])
                 except Exception as e:
                     logger.error(f"Error processing Redis message: {e}")
-                    continue
 
         except Exception as e:
             logger.error(f"Redis subscriber error: {e}")
+            pubsub = None
             logger.info("Reconnecting to Redis in 5 seconds...")
             await asyncio.sleep(5)
 
@@ -416,16 +1049,35 @@ async def redis_subscriber_task():
 async def startup_event():
     """Initialize Redis connection on startup."""
     logger.info("Starting collaboration service...")
+
+    # Start per-room presence frame ticks (does not need Redis)
+    presence_task = asyncio.create_task(presence_flush_task())
+    background_tasks.add(presence_task)
+    presence_task.add_done_callback(background_tasks.discard)
+    logger.info(f"Started presence frame task at {PRESENCE_TICK_HZ} Hz")
+
+    # Presence, lock and annotation deadlines (does not need Redis)
+    timer_task = asyncio.create_task(timers.run())
+    background_tasks.add(timer_task)
+    timer_task.add_done_callback(background_tasks.discard)
+
+    # Send queues of slow sockets (does not need Redis)
+    queue_task = asyncio.create_task(send_queue_task())
+    background_tasks.add(queue_task)
+    queue_task.add_done_callback(background_tasks.discard)
+
     try:
         r = await get_redis()
         await r.ping()
         logger.info("Connected to Redis successfully")
 
-        # Start background task for checking away users
-        task1 = asyncio.create_task(check_away_users())
-        background_tasks.add(task1)
-        task1.add_done_callback(background_tasks.discard)
-        logger.info("Started presence monitoring task")
+        # Refresh shared presence every minute (away detection arms per-user timers)
+        timers.schedule("presence_refresh", PRESENCE_REFRESH_SECONDS, refresh_presence_periodically)
+        logger.info("Started presence monitoring")
+
+        # Join the instance registry used for room sharding
+        await refresh_shards()
+        logger.info(f"Room sharding {'enabled' if shard_map.enabled else 'disabled'} for {INSTANCE_ID}")
 
         # Start Redis subscriber task for cross-server broadcasting (Feature #397 & #422)
         # CRITICAL: Keep reference to prevent garbage collection
@@ -434,19 +1086,21 @@ async def startup_event():
         task2.add_done_callback(background_tasks.discard)
         logger.info("Started Redis subscriber task for cross-server broadcasting")
 
-        # Start annotation cleanup task (Feature #411)
-        task3 = asyncio.create_task(cleanup_expired_annotations())
-        background_tasks.add(task3)
-        task3.add_done_callback(background_tasks.discard)
-        logger.info("Started annotation cleanup task")
     except Exception as e:
         logger.error(f"Failed to connect to Redis: {e}")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Close Redis connection on shutdown."""
+    """Persist live room documents and close Redis connection on shutdown."""
     global redis_client
+    try:
+        await write_behind.flush_all()
+        await write_behind.close()
+    except Exception as e:
+        logger.error(f"Failed to flush room documents on shutdown: {e}")
+    # Our rooms move to the next instance on the ring
+    await shard_map.leave()
     if redis_client:
         await redis_client.close()
         logger.info("Closed Redis connection")
@@ -459,9 +1113,65 @@ async def health_check():
         "status": "healthy",
         "service": "collaboration-service",
         "timestamp": datetime.utcnow().isoformat(),
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "instance_id": INSTANCE_ID,
+        "broadcast": {**broadcast_stats, "subscribed_rooms": len(subscribed_rooms)},
+        "presence_frames": {**presence_coalescer.stats, "tick_hz": PRESENCE_TICK_HZ},
+        "timers": {**timers.stats, "armed": len(timers)},
+        "write_behind": {**write_behind.stats, "dirty_rooms": len(write_behind.dirty), "retrying_rooms": len(write_behind.pending)},
+        "interest": {**interest_stats, "rooms": len(room_interest)},
+        "send_queues": send_queue_stats(),
+        "sharding": {
+            **shard_map.stats,
+            "enabled": shard_map.enabled,
+            "live_instances": sorted(shard_map.live),
+            "relayed_rooms": sum(1 for room_id in subscribed_rooms if relay_needed(room_id))
+        }
+    }
+
+
+def send_queue_stats() -> dict:
+    depth, max_depth = send_queues.depth()
+    return {**send_queues.stats, "behind": len(send_queues.queues), "depth": depth, "max_depth": max_depth}
+
+
+class SendQueueCollector:
+    """Prometheus view of the send queues of slow sockets."""
+
+    COUNTERS = {
+        "queued": "Events queued for sockets that are behind",
+        "sent": "Queued events handed to the transport",
+        "collapsed": "Queued presence events replaced by a newer one",
+        "merged": "Queued deltas merged with the next one",
+        "dropped": "Queued events dropped on overflow or resync",
+        "resyncs": "Sockets told to resync after falling too far behind",
     }
 
+    def collect(self):
+        stats = send_queue_stats()
+        yield GaugeMetricFamily(
+            'collaboration_service_send_queue_depth', 'Events waiting in send queues', value=stats["depth"]
+        )
+        yield GaugeMetricFamily(
+            'collaboration_service_send_queue_max_depth', 'Longest send queue', value=stats["max_depth"]
+        )
+        yield GaugeMetricFamily(
+            'collaboration_service_sockets_behind', 'Sockets whose transport is not keeping up', value=stats["behind"]
+        )
+        for name, documentation in self.COUNTERS.items():
+            yield CounterMetricFamily(f'collaboration_service_send_queue_{name}', documentation, value=stats[name])
+
+
+# Prometheus metrics registry
+registry = CollectorRegistry()
+registry.register(SendQueueCollector())
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
 
 @app.post("/broadcast/{room_id}")
 async def broadcast_message(room_id: str, message: dict):
@@ -471,6 +1181,7 @@ async def broadcast_message(room_id: str, message: dict):
     """
     try:
         logger.info(f"Broadcasting to room {room_id}: {message}")
+        message = await sequence_update(room_id, 'update', message)
         
         # Emit to all clients in the room
         await sio.emit('update', message, room=room_id)
@@ -491,11 +1202,25 @@ async def broadcast_message(room_id: str, message: dict):
         }
 
 
+@app.get("/rooms/{room_id}/owner")
+async def get_room_owner(room_id: str):
+    """Instance that owns a room under consistent-hash sharding (None if sharding is off)."""
+    owner = shard_map.owner(room_id)
+    return {
+        "room": room_id,
+        "owner": owner,
+        "address": shard_map.shards.get(owner) if owner else None,
+        "instance_id": INSTANCE_ID,
+        "local_sockets": len(active_rooms.get(room_id, ()))
+    }
+
+
 @app.get("/rooms/{room_id}/users")
 async def get_room_users(room_id: str):
     """Get all users currently in a room with their presence information."""
     try:
-        if room_id not in room_users:
+        users = await shared_room_users(room_id)
+        if not users:
             return {
                 "room": room_id,
                 "users": [],
@@ -503,7 +1228,7 @@ async def get_room_users(room_id: str):
             }
         
         users_list = []
-        for user_id, presence in room_users[room_id].items():
+        for user_id, presence in users.items():
             users_list.append({
                 "user_id": presence.user_id,
                 "username": presence.username,
@@ -531,14 +1256,11 @@ async def get_room_users(room_id: str):
 async def get_room_activity(room_id: str, limit: int = 50):
     """Get activity feed for a room."""
     try:
-        if room_id not in activity_feeds:
-            return {
-                "room": room_id,
-                "events": [],
-                "count": 0
-            }
-        
-        events = activity_feeds[room_id][-limit:]
+        stored = await room_state.load_activity(room_id, limit)
+        if stored is not None:
+            events = [activity_from_dict(event) for event in stored]
+        else:
+            events = activity_feeds.get(room_id, [])[-limit:]
         return {
             "room": room_id,
             "events": [event.to_dict() for event in events],
@@ -587,6 +1309,10 @@ async def connect(sid, environ, auth):
             if 'token=' in query:
                 token = query.split('token=')[1].split('&')[0]
         
+        # Frame protocol for high-frequency events (JSON unless the client asks for msgpack)
+        protocol = negotiate_protocol(auth, environ.get('QUERY_STRING', ''))
+        presence_frames = wants_presence_frames(auth, environ.get('QUERY_STRING', ''))
+
         # Verify JWT token
         if token:
             payload = verify_jwt_token(token)
@@ -600,7 +1326,9 @@ async def connect(sid, environ, auth):
                 await sio.save_session(sid, {
                     'user_id': user_id,
                     'username': username,
-                    'email': payload.get('email', '')
+                    'email': payload.get('email', ''),
+                    'protocol': protocol,
+                    'presence_frames': presence_frames
                 })
                 return True
             else:
@@ -612,7 +1340,9 @@ async def connect(sid, environ, auth):
             await sio.save_session(sid, {
                 'user_id': f'anonymous_{sid[:8]}',
                 'username': 'Anonymous',
-                'email': ''
+                'email': '',
+                'protocol': protocol,
+                'presence_frames': presence_frames
             })
             return True
             
@@ -635,11 +1365,14 @@ async def disconnect(sid):
         room_id = session_room_map.get(sid)
 
         # Remove from all rooms
+        send_queues.discard(sid)
         for room_id in list(active_rooms.keys()):
             if sid in active_rooms[room_id]:
                 active_rooms[room_id].remove(sid)
+                forget_viewport(room_id, sid)
                 if not active_rooms[room_id]:
                     del active_rooms[room_id]
+                    await release_room_channel(room_id)
 
                 # Update presence and notify
                 if room_id in room_users and user_id in room_users[room_id]:
@@ -659,8 +1392,12 @@ async def disconnect(sid):
 
                     # Mark as offline
                     presence.status = PresenceStatus.OFFLINE
+                    await persist_presence(room_id, presence)
+                    timers.cancel(("away", room_id, user_id))
 
-                    # Feature #403: Notify others about cursor removal
+                    # Feature #403: Notify others about cursor removal; drop any
+                    # buffered cursor first so the next tick cannot resurrect it
+                    presence_coalescer.discard_user(room_id, user_id)
                     await sio.emit('cursor_removed', {
                         'user_id': user_id,
                         'username': presence.username,
@@ -678,10 +1415,16 @@ async def disconnect(sid):
                         logger.info(f"Released lock on element {active_element} for disconnected user {user_id}")
 
                     # Feature #414: Release all element locks held by this user
+                    locked_elements = set(await room_state.release_user_locks(room_id, user_id))
                     if room_id in element_locks:
-                        locked_elements = [elem_id for elem_id, locked_by in element_locks[room_id].items() if locked_by == user_id]
+                        locked_elements.update(elem_id for elem_id, locked_by in element_locks[room_id].items() if locked_by == user_id)
+                    if locked_elements:
+                        await publish_to_redis(room_channel(room_id), {
+                            "type": "room_state", "kind": "locks_released", "element_ids": list(locked_elements)
+                        })
                         for elem_id in locked_elements:
-                            del element_locks[room_id][elem_id]
+                            element_locks.get(room_id, {}).pop(elem_id, None)
+                            timers.cancel(("lock", room_id, elem_id))
                             await sio.emit('element_unlocked', {
                                 'element_id': elem_id,
                                 'user_id': user_id,
@@ -704,6 +1447,14 @@ async def disconnect(sid):
                             if not room_users[room_id]:
                                 del room_users[room_id]
 
+                    # The user may have reconnected through another instance
+                    stored = (await room_state.load_presences(room_id) or {}).get(user_id)
+                    if stored and stored['status'] == PresenceStatus.OFFLINE.value:
+                        await persist_room_state(
+                            room_id, room_state.remove_presence(room_id, user_id),
+                            "presence_removed", user_id=user_id
+                        )
+
                 logger.info(f"Removed {sid} from room {room_id} with full cleanup")
 
         # Clean up mappings
@@ -724,7 +1475,8 @@ async def disconnect(sid):
 async def join_room(sid, data):
     """
     Handle client joining a room.
-    Expected data: {"room": "file:<file_id>", "user_id": "user-id", "username": "User Name", "role": "viewer|editor|admin"}
+    Expected data: {"room": "file:<file_id>", "user_id": "user-id", "username": "User Name", "role": "viewer|editor|admin",
+                    "last_seq": 42 (optional, on reconnect; see catch_up)}
     """
     try:
         # Get session data
@@ -746,13 +1498,19 @@ async def join_room(sid, data):
             logger.error(f"No room specified for {sid}")
             return {"success": False, "error": "Room ID required"}
         
-        # Join the Socket.IO room
+        # Join the Socket.IO room, and the sub-room for the client's frame protocol
         await sio.enter_room(sid, room_id)
+        await sio.enter_room(sid, frame_room(room_id, session.get('protocol', PROTOCOL_JSON)))
+        if session.get('presence_frames'):
+            await sio.enter_room(sid, presence_room(room_id, session.get('protocol', PROTOCOL_JSON)))
         
         # Track in active rooms
         if room_id not in active_rooms:
             active_rooms[room_id] = set()
         active_rooms[room_id].add(sid)
+        if await subscribe_room_channel(room_id):
+            # First local socket in the room: start from the shared state
+            await load_room_state(room_id)
         
         # Track session mappings
         session_user_map[sid] = user_id
@@ -781,6 +1539,9 @@ async def join_room(sid, data):
             presence.last_active = datetime.utcnow()
             presence.role = user_role  # Update role
         
+        await persist_presence(room_id, presence)
+        arm_away_timer(room_id, user_id, presence)
+        
         logger.info(f"Client {sid} ({username}) joined room {room_id} as {user_role.value}")
         
         # Get all current users in the room
@@ -814,15 +1575,19 @@ async def join_room(sid, data):
         event = add_activity_event(room_id, user_id, username, "joined", None)
         await sio.emit('activity', event.to_dict(), room=room_id)
         
-        return {
+        response = {
             "success": True,
             "room": room_id,
             "user_id": user_id,
             "color": presence.color,
             "role": user_role.value,
             "members": len(active_rooms[room_id]),
-            "users": current_users
+            "users": current_users,
+            "room_seq": await room_state.current_sequence(room_id)
         }
+        if data.get('last_seq') is not None:
+            response["catch_up"] = await catch_up_room(room_id, data['last_seq'])
+        return response
     except Exception as e:
         logger.error(f"Failed to join room: {e}")
         return {"success": False, "error": str(e)}
@@ -840,17 +1605,28 @@ async def leave_room(sid, data):
         if not room_id:
             return {"success": False, "error": "Room ID required"}
         
-        # Leave the Socket.IO room
+        # Leave the Socket.IO room and its frame protocol sub-rooms
         await sio.leave_room(sid, room_id)
+        await sio.leave_room(sid, frame_room(room_id, PROTOCOL_JSON))
+        await sio.leave_room(sid, frame_room(room_id, PROTOCOL_MSGPACK))
+        await sio.leave_room(sid, presence_room(room_id, PROTOCOL_JSON))
+        await sio.leave_room(sid, presence_room(room_id, PROTOCOL_MSGPACK))
         
         # Remove from active rooms
+        forget_viewport(room_id, sid)
         if room_id in active_rooms and sid in active_rooms[room_id]:
             active_rooms[room_id].remove(sid)
             if not active_rooms[room_id]:
                 del active_rooms[room_id]
+                await release_room_channel(room_id)
         
         logger.info(f"Client {sid} left room {room_id}")
         
+        # Drop the user's buffered cursor/selection/viewport so it is not flushed after they left
+        user_id = session_user_map.get(sid)
+        if user_id:
+            presence_coalescer.discard_user(room_id, user_id)
+        
         # Notify other users
         await sio.emit('user_left', {
             'timestamp': datetime.utcnow().isoformat()
@@ -862,6 +1638,46 @@ async def leave_room(sid, data):
         return {"success": False, "error": str(e)}
 
 
+async def catch_up_room(room_id: str, last_seq) -> dict:
+    """Updates of a room after last_seq, or a request to reload the whole diagram."""
+    try:
+        last_seq = int(last_seq)
+    except (TypeError, ValueError):
+        return {"success": False, "error": "last_seq must be an integer"}
+    if last_seq < 0:
+        return {"success": False, "error": "last_seq must not be negative"}
+
+    result = await room_state.updates_since(room_id, last_seq)
+    if result is None:
+        # No log to read from: the client cannot tell what it missed
+        return {"success": True, "seq": None, "updates": [], "snapshot_required": True}
+    return {"success": True, **result}
+
+
+@sio.event
+async def catch_up(sid, data):
+    """
+    Send a reconnecting client the room updates it missed.
+    Expected data: {"room": "file:<file_id>", "last_seq": 42}
+
+    Document updates ('update', 'delta_update', 'operation_applied') carry a
+    room_seq that increases by one per update in the room (delta_update only
+    in msgpack frames). The last ROOM_LOG_LENGTH updates are kept, so a
+    client that reconnects with the highest room_seq it applied receives
+    {"seq", "updates": [{"seq", "event", "payload"}]} to replay in order.
+    If part of the gap was trimmed, snapshot_required is set and the client
+    reloads the diagram instead. CRDT rooms catch up with crdt_sync.
+    """
+    try:
+        room_id = data.get('room')
+        if not room_id:
+            return {"success": False, "error": "Room ID required"}
+        return await catch_up_room(room_id, data.get('last_seq'))
+    except Exception as e:
+        logger.error(f"Failed to catch up: {e}")
+        return {"success": False, "error": str(e)}
+
+
 @sio.event
 async def diagram_update(sid, data):
     """
@@ -884,6 +1700,8 @@ async def diagram_update(sid, data):
             return {"success": False, "error": error_message, "permission_denied": True}
 
         logger.info(f"Diagram update in room {room_id} from {sid}")
+        if isinstance(update, dict):
+            update = await sequence_update(room_id, 'update', update)
 
         # Broadcast to all other clients in the room (local instance)
         await sio.emit('update', update, room=room_id, skip_sid=sid)
@@ -892,9 +1710,8 @@ async def diagram_update(sid, data):
         await publish_to_redis(f"room:{room_id}", {
             "type": "diagram_update",
             "update": update,
-            "user_id": user_id,
-            "source_sid": sid  # So we can skip the originating client
-        })
+            "user_id": user_id
+        }, source_sid=sid)  # So we can skip the originating client
 
         return {"success": True}
     except Exception as e:
@@ -909,6 +1726,7 @@ async def cursor_move(sid, data):
     Expected data: {"room": "file:<file_id>", "x": 100, "y": 200, "user_id": "user-id"}
     """
     try:
+        data = decode_frame(data)
         room_id = data.get('room')
         user_id = data.get('user_id')
         
@@ -923,15 +1741,8 @@ async def cursor_move(sid, data):
         )
         
         if presence:
-            # Broadcast cursor position with color to all other clients
-            await sio.emit('cursor_update', {
-                'user_id': user_id,
-                'username': presence.username,
-                'color': presence.color,
-                'x': data.get('x'),
-                'y': data.get('y'),
-                'timestamp': datetime.utcnow().isoformat()
-            }, room=room_id, skip_sid=sid)
+            # Broadcast cursor position with color to all other clients on the next tick
+            buffer_presence(room_id, user_id, sid, presence, cursor={'x': data.get('x'), 'y': data.get('y')})
         
         return {"success": True}
     except Exception as e:
@@ -1017,14 +1828,8 @@ async def selection_change(sid, data):
         )
         
         if presence:
-            # Broadcast selection to all other clients
-            await sio.emit('selection_update', {
-                'user_id': user_id,
-                'username': presence.username,
-                'color': presence.color,
-                'selected_elements': selected_elements,
-                'timestamp': datetime.utcnow().isoformat()
-            }, room=room_id, skip_sid=sid)
+            # Broadcast selection to all other clients on the next tick
+            buffer_presence(room_id, user_id, sid, presence, selection={'selected_elements': selected_elements})
         
         return {"success": True}
     except Exception as e:
@@ -1036,7 +1841,8 @@ async def selection_change(sid, data):
 async def element_edit(sid, data):
     """
     Handle when a user starts/stops editing an element.
-    Expected data: {"room": "file:<file_id>", "user_id": "user-id", "element_id": "id" or null}
+    Expected data: {"room": "file:<file_id>", "user_id": "user-id", "element_id": "id" or null,
+                    "bounds": {"x", "y", "w", "h"} (optional)}
     Feature #402: Collision avoidance - warn if editing same element
     Feature #417: Check edit permissions - viewers cannot edit
     """
@@ -1080,14 +1886,24 @@ async def element_edit(sid, data):
         )
 
         if presence:
-            # Broadcast active element to all other clients
-            await sio.emit('element_active', {
+            # Starting an edit goes to the clients viewing the element; stopping
+            # one goes to everybody, who may have seen it start elsewhere
+            areas = None
+            if element_id:
+                interest = room_interest.get(room_id)
+                if interest is not None:
+                    if data.get('bounds') is not None:
+                        interest.apply_changes({element_id: {'bounds': data['bounds']}})
+                    areas = interest.element_areas([element_id])
+
+            # Broadcast active element to the other clients
+            await emit_to_viewers('element_active', {
                 'user_id': user_id,
                 'username': presence.username,
                 'color': presence.color,
                 'element_id': element_id,
                 'timestamp': datetime.utcnow().isoformat()
-            }, room=room_id, skip_sid=sid)
+            }, room_id, areas, [element_id] if element_id else [], skip_sid=sid)
 
             # Add activity event if starting edit
             if element_id:
@@ -1175,7 +1991,8 @@ async def presence_update(sid, data):
 async def shape_created(sid, data):
     """
     Handle shape creation event for activity feed.
-    Expected data: {"room": "file:<file_id>", "user_id": "user-id", "shape_type": "rectangle", "shape_id": "id"}
+    Expected data: {"room": "file:<file_id>", "user_id": "user-id", "shape_type": "rectangle", "shape_id": "id",
+                    "bounds": {"x", "y", "w", "h"} (optional)}
     Feature #417: Check edit permissions - viewers cannot create shapes
     """
     try:
@@ -1198,7 +2015,13 @@ async def shape_created(sid, data):
         if room_id in room_users and user_id in room_users[room_id]:
             username = room_users[room_id][user_id].username
 
-        # Add activity event
+        # Track the new shape's bounds for viewport routing of later changes
+        if shape_id and data.get('bounds') is not None:
+            room_interest.setdefault(room_id, RoomInterest()).apply_changes(
+                {shape_id: {'bounds': data['bounds']}}
+            )
+
+        # Add activity event (the feed is room-wide, not viewport-routed)
         event = add_activity_event(room_id, user_id, username, f"created {shape_type}", shape_id)
         await sio.emit('activity', event.to_dict(), room=room_id)
 
@@ -1393,6 +2216,7 @@ async def delta_update(sid, data):
     Feature #417: Check edit permissions - viewers cannot send delta updates
     """
     try:
+        data = decode_frame(data)
         room_id = data.get('room')
         user_id = data.get('user_id') or session_user_map.get(sid)
         delta = data.get('delta', {})
@@ -1408,8 +2232,17 @@ async def delta_update(sid, data):
 
         logger.info(f"Delta update in room {room_id}: {len(delta)} elements changed")
 
-        # Broadcast delta to all other clients in the room
-        await sio.emit('delta_update', delta, room=room_id, skip_sid=sid)
+        # Broadcast delta to all other clients in the room. The JSON payload is
+        # the bare delta map, so only msgpack frames carry the room_seq
+        frame = {'user_id': user_id, 'delta': delta}
+        seq = await room_state.append_update(room_id, 'delta_update', delta)
+        if seq is not None:
+            frame['room_seq'] = seq
+        # Clients viewing elsewhere on the board only hear which region changed
+        areas = None
+        if isinstance(delta, dict):
+            areas = room_interest.setdefault(room_id, RoomInterest()).apply_changes(delta)
+        await emit_to_viewers('delta_update', delta, room_id, areas, delta, skip_sid=sid, frame=frame)
 
         return {"success": True, "elements_updated": len(delta)}
     except Exception as e:
@@ -1430,6 +2263,7 @@ async def cursor_move_throttled(sid, data):
     Feature #420: Bandwidth optimization - throttle cursor updates
     """
     try:
+        data = decode_frame(data)
         room_id = data.get('room')
         user_id = data.get('user_id')
         
@@ -1455,15 +2289,8 @@ async def cursor_move_throttled(sid, data):
         )
         
         if presence:
-            # Broadcast cursor position with color to all other clients
-            await sio.emit('cursor_update', {
-                'user_id': user_id,
-                'username': presence.username,
-                'color': presence.color,
-                'x': data.get('x'),
-                'y': data.get('y'),
-                'timestamp': datetime.utcnow().isoformat()
-            }, room=room_id, skip_sid=sid)
+            # Broadcast cursor position with color to all other clients on the next tick
+            buffer_presence(room_id, user_id, sid, presence, cursor={'x': data.get('x'), 'y': data.get('y')})
         
         return {"success": True, "throttled": False}
     except Exception as e:
@@ -1505,36 +2332,17 @@ async def get_room_connection_quality(room_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Offline queue storage (in-memory for now, could be Redis)
-offline_queues: Dict[str, List[dict]] = {}  # user_id -> list of queued operations
+# Offline operation queues, one Redis stream per user (see offline_queue.py)
+offline_queue = OfflineQueueStore(get_redis)
 
 
 # Operational Transform state tracking
 # Track the last known state of each element for OT conflict resolution
 element_states: Dict[str, Dict[str, any]] = {}  # room_id -> {element_id: state}
-operation_history: Dict[str, List[dict]] = {}  # room_id -> list of operations
+operation_history: Dict[str, OperationLog] = {}  # room_id -> last 1000 operations
 conflict_log: Dict[str, List[dict]] = {}  # room_id -> list of conflicts (Feature #408)
 
 
-@dataclass
-class Operation:
-    """Represents a single operation on an element."""
-    operation_id: str
-    user_id: str
-    element_id: str
-    operation_type: str  # 'move', 'resize', 'style', 'delete', 'create'
-    old_value: any
-    new_value: any
-    timestamp: datetime
-    transformed: bool = False
-
-    def to_dict(self):
-        return {
-            **asdict(self),
-            'timestamp': self.timestamp.isoformat()
-        }
-
-
 def can_merge_operations(op1: Operation, op2: Operation) -> bool:
     """
     Check if two operations can be intelligently merged (non-conflicting).
@@ -1757,41 +2565,24 @@ def apply_operational_transform(room_id: str, operation: Operation) -> Operation
     Returns the transformed operation that should be applied.
     """
     if room_id not in operation_history:
-        operation_history[room_id] = []
+        operation_history[room_id] = OperationLog()
+    history = operation_history[room_id]
 
     # Check for concurrent operations on the same element
-    concurrent_ops = [
-        op for op in operation_history[room_id]
-        if op['element_id'] == operation.element_id
-        and abs((datetime.fromisoformat(op['timestamp']) - operation.timestamp).total_seconds()) < 1.0
-        and op['user_id'] != operation.user_id
-        and not op.get('transformed', False)
-    ]
-
     transformed_op = operation
 
-    for concurrent_op_dict in concurrent_ops:
-        # Convert dict back to Operation
-        concurrent_op = Operation(
-            operation_id=concurrent_op_dict['operation_id'],
-            user_id=concurrent_op_dict['user_id'],
-            element_id=concurrent_op_dict['element_id'],
-            operation_type=concurrent_op_dict['operation_type'],
-            old_value=concurrent_op_dict['old_value'],
-            new_value=concurrent_op_dict['new_value'],
-            timestamp=datetime.fromisoformat(concurrent_op_dict['timestamp']),
-            transformed=concurrent_op_dict.get('transformed', False)
-        )
-
-        # Transform (pass room_id for conflict logging - Feature #408)
-        transformed_op, _ = transform_operations(transformed_op, concurrent_op, room_id)
+    for concurrent_op in history.concurrent(operation):
+        # Transform a copy so the recorded operation is not marked transformed
+        # (Feature #408: pass room_id for conflict logging)
+        transformed_op, _ = transform_operations(transformed_op, replace(concurrent_op), room_id)
 
-    # Record operation in history
-    operation_history[room_id].append(operation.to_dict())
-
-    # Keep only last 1000 operations per room
-    if len(operation_history[room_id]) > 1000:
-        operation_history[room_id] = operation_history[room_id][-1000:]
+    # Record operation in history (the log keeps the last 1000 per room)
+    history.append(operation)
+    operation_dict = operation.to_dict()
+    room_state.spawn(persist_room_state(
+        room_id, room_state.append_operation(room_id, operation_dict),
+        "operation", operation=operation_dict
+    ))
 
     return transformed_op
 
@@ -1812,6 +2603,7 @@ async def element_update_ot(sid, data):
     Feature #417: Check edit permissions - viewers cannot update elements
     """
     try:
+        data = decode_frame(data)
         room_id = data.get('room')
         user_id = data.get('user_id')
         element_id = data.get('element_id')
@@ -1889,6 +2681,7 @@ async def operation(sid, data):
     Feature #409: Intelligent merge for complex conflicts
     """
     try:
+        data = decode_frame(data)
         room_id = data.get('room')
         element_id = data.get('element_id')
         operation_type = data.get('operation_type', 'update')
@@ -1924,7 +2717,7 @@ async def operation(sid, data):
         logger.info(f"  Transformed: {transformed_op.new_value}")
 
         # Broadcast the transformed operation to all clients in the room
-        await sio.emit('operation_applied', {
+        await emit_frame('operation_applied', await sequence_update(room_id, 'operation_applied', {
             'type': 'operation_applied',
             'data': {
                 'element_id': transformed_op.element_id,
@@ -1935,7 +2728,7 @@ async def operation(sid, data):
                 'resolved_by_ot': transformed_op.transformed,
                 'timestamp': transformed_op.timestamp.isoformat()
             }
-        }, room=room_id)
+        }), room_id)
 
         # Update element state
         if room_id not in element_states:
@@ -2031,7 +2824,9 @@ async def get_operation_history(room_id: str, limit: int = 100):
     Feature #396: View OT operation history
     """
     try:
-        history = operation_history.get(room_id, [])
+        history = await room_state.load_operations(room_id)
+        if history is None:
+            history = operation_history[room_id].to_dicts() if room_id in operation_history else []
         return {
             "room": room_id,
             "operations": history[-limit:],
@@ -2060,46 +2855,233 @@ async def get_conflict_log(room_id: str, limit: int = 100):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============================================================================
+# CRDT document sync
+# ============================================================================
+
+async def get_crdt_document(room_id: str) -> CRDTDocument:
+    """The room's CRDT document, loaded from the stored update batches on first use."""
+    document = crdt_documents.get(room_id)
+    if document is not None:
+        return document
+
+    loading = room_id in crdt_loading
+    pending = crdt_loading.setdefault(room_id, [])
+    document = CRDTDocument()
+    try:
+        for batch in await room_state.load_crdt(room_id) or []:
+            document.apply_many(decode_updates(batch))
+    finally:
+        if not loading:
+            crdt_loading.pop(room_id, None)
+    # Updates published while we waited on Redis may not be stored yet
+    document.apply_many(decode_updates(pending))
+    document.updates_since_compaction = 0
+    # Another coroutine may have loaded it meanwhile
+    return crdt_documents.setdefault(room_id, document)
+
+
+def compact_crdt_batches(batches: List[bytes]) -> bytes:
+    document = CRDTDocument()
+    for batch in batches:
+        document.apply_many(decode_updates(batch))
+    document.compact()
+    return encode_updates(document.log.values())
+
+
+async def store_crdt_updates(room_id: str, batch: bytes):
+    """Persist an update batch; compact the stored batches every CRDT_COMPACT_EVERY appends."""
+    stored = await room_state.append_crdt(room_id, batch)
+    if stored and stored >= CRDT_COMPACT_EVERY:
+        room_state.spawn(room_state.compact_crdt(room_id, compact_crdt_batches))
+
+
+def maybe_compact_crdt(room_id: str, document: CRDTDocument):
+    if document.updates_since_compaction >= CRDT_COMPACT_EVERY:
+        removed = document.compact()
+        logger.info(f"CRDT: compacted room {room_id}, removed {removed} superseded updates")
+
+
+async def handle_remote_crdt_update(room_id: str, msg_data: dict, skip_sid: Optional[str]):
+    """Apply CRDT updates accepted by another instance and forward the new ones to local clients."""
+    document = crdt_documents.get(room_id)
+    if document is None:
+        if room_id in crdt_loading:
+            crdt_loading[room_id].extend(msg_data.get('updates', []))
+        # Otherwise not loaded; the stored batches include these updates
+        return
+    applied = document.apply_many(decode_updates(msg_data.get('updates', [])))
+    if applied:
+        await sio.emit('crdt_update', {
+            'room': room_id,
+            'update': encode_updates(applied)
+        }, room=room_id, skip_sid=skip_sid)
+        maybe_compact_crdt(room_id, document)
+
+
+async def apply_crdt_updates(room_id: str, updates: list, sid: Optional[str] = None) -> list:
+    """Apply client updates, broadcast the new ones, publish them to peers and persist them."""
+    document = await get_crdt_document(room_id)
+    applied = document.apply_many(updates)
+    if not applied:
+        return applied
+
+    write_behind.mark_dirty(room_id, {update.element_id for update in applied}, session_user_map.get(sid))
+
+    batch = encode_updates(applied)
+    await sio.emit('crdt_update', {'room': room_id, 'update': batch}, room=room_id, skip_sid=sid)
+    # Stored before publishing so instances loading the room see it in one of the two
+    await store_crdt_updates(room_id, batch)
+    await publish_to_redis(room_channel(room_id), {
+        "type": "crdt_update",
+        "updates": [update.to_record() for update in applied]
+    }, source_sid=sid)
+    maybe_compact_crdt(room_id, document)
+    return applied
+
+
+@sio.event
+async def crdt_sync(sid, data):
+    """
+    Incremental CRDT sync, e.g. after a reconnect.
+    Expected data: {"room": "file:<file_id>", "state_vector": <bytes|{client_id: clock}>,
+                    "update": <optional bytes|records made while offline>}
+    Returns the server's state vector and the updates the client is missing.
+    """
+    try:
+        room_id = data.get('room')
+        if not room_id:
+            return {"success": False, "error": "Room ID required"}
+        if session_room_map.get(sid) != room_id:
+            return {"success": False, "error": "Join the room before syncing"}
+
+        state_vector = decode_state_vector(data.get('state_vector'))
+        if data.get('update'):
+            user_id = session_user_map.get(sid)
+            has_permission, error_message = check_edit_permission(room_id, user_id)
+            if not has_permission:
+                return {"success": False, "error": error_message, "permission_denied": True}
+            await apply_crdt_updates(room_id, decode_updates(data['update']), sid)
+
+        document = await get_crdt_document(room_id)
+        missing = document.diff(state_vector)
+        return {
+            "success": True,
+            "state_vector": encode_state_vector(document.state_vector),
+            "update": encode_updates(missing),
+            "count": len(missing),
+            "lamport": document.lamport
+        }
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        logger.error(f"Failed to sync CRDT document: {e}")
+        return {"success": False, "error": str(e)}
+
+
+@sio.event
+async def crdt_update(sid, data):
+    """
+    Apply CRDT updates from a client and broadcast them to the room.
+    Expected data: {"room": "file:<file_id>", "update": <bytes|list of records>}
+    """
+    try:
+        room_id = data.get('room')
+        if not room_id:
+            return {"success": False, "error": "Room ID required"}
+        if session_room_map.get(sid) != room_id:
+            return {"success": False, "error": "Join the room before sending updates"}
+
+        user_id = session_user_map.get(sid)
+        has_permission, error_message = check_edit_permission(room_id, user_id)
+        if not has_permission:
+            logger.warning(f"User {user_id} denied CRDT update in room {room_id}: {error_message}")
+            return {"success": False, "error": error_message, "permission_denied": True}
+
+        applied = await apply_crdt_updates(room_id, decode_updates(data.get('update')), sid)
+        return {"success": True, "applied": len(applied)}
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        logger.error(f"Failed to apply CRDT update: {e}")
+        return {"success": False, "error": str(e)}
+
+
+@app.get("/crdt/{room_id}")
+async def get_crdt_document_state(room_id: str):
+    """Materialized elements and state vector of a room's CRDT document."""
+    try:
+        document = await get_crdt_document(room_id)
+        if room_id not in active_rooms:
+            # Not kept without local sockets: it would miss remote updates
+            crdt_documents.pop(room_id, None)
+        return {
+            "room": room_id,
+            "elements": document.elements(),
+            "state_vector": document.state_vector,
+            "lamport": document.lamport,
+            "updates": len(document.log),
+            "tombstones": len(document.tombstones)
+        }
+    except Exception as e:
+        logger.error(f"Failed to get CRDT document: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/offline/queue")
 async def queue_offline_operation(operation: dict):
     """
     Queue an operation for a user who is offline.
     Feature #424: Offline mode - queue edits when disconnected
+
+    Operations to be replayed name their "room", "element_id",
+    "operation_type", "old_value", "new_value" and optionally "timestamp"
+    (when they were made), as for /ot/apply.
     """
     try:
         user_id = operation.get('user_id')
         if not user_id:
             raise HTTPException(status_code=400, detail="user_id required")
 
-        if user_id not in offline_queues:
-            offline_queues[user_id] = []
-
         operation['queued_at'] = datetime.utcnow().isoformat()
-        offline_queues[user_id].append(operation)
+        try:
+            queued = await offline_queue.enqueue(user_id, operation)
+        except OfflineQueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        if queued is None:
+            raise HTTPException(status_code=503, detail="Offline queue unavailable")
+        length, queue_id = queued
 
         return {
             "success": True,
-            "queued": len(offline_queues[user_id]),
+            "queued": length,
+            "queue_id": queue_id,
             "message": "Operation queued for sync when online"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to queue operation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/offline/queue/{user_id}")
-async def get_offline_queue(user_id: str):
+async def get_offline_queue(user_id: str, room: Optional[str] = None):
     """
     Get queued operations for a user to sync when they come online.
     Feature #424: Offline mode - retrieve queued edits
     """
     try:
-        queue = offline_queues.get(user_id, [])
+        queue = await offline_queue.load(user_id, room)
+        if queue is None:
+            raise HTTPException(status_code=503, detail="Offline queue unavailable")
         return {
             "user_id": user_id,
             "operations": queue,
             "count": len(queue)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to get offline queue: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -2112,24 +3094,207 @@ async def clear_offline_queue(user_id: str):
     Feature #424: Offline mode - clear queue after sync
     """
     try:
-        if user_id in offline_queues:
-            count = len(offline_queues[user_id])
-            del offline_queues[user_id]
-            return {
-                "success": True,
-                "cleared": count,
-                "message": "Queue cleared"
-            }
+        count = await offline_queue.clear(user_id)
+        if count is None:
+            raise HTTPException(status_code=503, detail="Offline queue unavailable")
         return {
             "success": True,
-            "cleared": 0,
-            "message": "No queue found"
+            "cleared": count,
+            "message": "Queue cleared" if count else "No queue found"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to clear offline queue: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def log_offline_conflict(room_id: str, operation: Operation, lost: List[str], winner: Optional[Operation], current):
+    """Record fields of a replayed offline operation that lost to newer writes (Feature #408)."""
+    log = conflict_log.setdefault(room_id, [])
+    log.append({
+        "timestamp": datetime.utcnow().isoformat(),
+        "element_id": operation.element_id,
+        "operation_type": operation.operation_type,
+        "fields": lost,
+        "winner": {
+            "user_id": winner.user_id if winner else None,
+            "value": current,
+            "timestamp": winner.timestamp.isoformat() if winner else None
+        },
+        "loser": {
+            "user_id": operation.user_id,
+            "value": operation.new_value,
+            "timestamp": operation.timestamp.isoformat()
+        },
+        "resolution": "offline-replay"
+    })
+    if len(log) > 100:
+        conflict_log[room_id] = log[-100:]
+
+
+async def load_replay_base(room_id: str) -> OperationLog:
+    """
+    The room's operation history to rebase offline operations on, with
+    element_states of the room rebuilt from it.
+
+    The history is read from the shared room state: this instance's cache is
+    empty for rooms it does not host or after a restart, and element_states
+    never sees edits made through other instances. The cache is used only
+    while Redis is unavailable; elements whose writes are older than the
+    shared history keep their cached state.
+    """
+    stored = await room_state.load_operations(room_id)
+    if stored is None:
+        history = operation_history.setdefault(room_id, OperationLog())
+    else:
+        history = OperationLog()
+        history.extend(Operation.from_dict(operation) for operation in stored)
+        if room_id in active_rooms:
+            operation_history[room_id] = history
+    element_states[room_id] = {
+        **element_states.get(room_id, {}),
+        **element_states_from_history(history.operations)
+    }
+    return history
+
+
+async def replay_room_operations(room_id: str, user_id: str, entries: List[dict]) -> dict:
+    """
+    Rebase a user's queued operations for one room on the room's current
+    element state and apply them in one pass (see rebase_operation), with
+    one history write and one sequenced `operations_replayed` event.
+    """
+    history = await load_replay_base(room_id)
+    last_writes: Dict[str, Operation] = {}  # element_id -> latest operation on it
+    for recorded in history.operations:
+        latest = last_writes.get(recorded.element_id)
+        if latest is None or recorded.timestamp >= latest.timestamp:
+            last_writes[recorded.element_id] = recorded
+    states = element_states[room_id]
+
+    applied: List[Operation] = []
+    superseded: List[str] = []
+    conflicts = 0
+    for entry in entries:
+        operation = Operation(
+            operation_id=str(uuid.uuid4()),
+            user_id=user_id,
+            element_id=entry['element_id'],
+            operation_type=entry.get('operation_type', 'update'),
+            old_value=entry.get('old_value'),
+            new_value=entry.get('new_value'),
+            timestamp=operation_time(entry)
+        )
+        element_id = operation.element_id
+        current = states.get(element_id)
+        latest = last_writes.get(element_id)
+        rebased, lost = rebase_operation(operation, current, latest.timestamp if latest else None)
+        if lost:
+            conflicts += 1
+            log_offline_conflict(room_id, operation, lost, latest, current)
+            if rebased.new_value is None:
+                superseded.append(entry['queue_id'])
+                continue
+
+        if isinstance(rebased.new_value, dict) and isinstance(current, dict):
+            current.update(rebased.new_value)
+        else:
+            states[element_id] = dict(rebased.new_value) if isinstance(rebased.new_value, dict) else rebased.new_value
+        if latest is None or rebased.timestamp >= latest.timestamp:
+            last_writes[element_id] = rebased
+        history.append(rebased)
+        applied.append(rebased)
+
+    if applied:
+        operations = [op.to_dict() for op in applied]
+        room_state.spawn(persist_room_state(
+            room_id, room_state.append_operations(room_id, operations),
+            "operations", operations=operations
+        ))
+        payload = await sequence_update(room_id, 'operations_replayed', {
+            'type': 'operations_replayed',
+            'user_id': user_id,
+            'data': [
+                {
+                    'element_id': op.element_id,
+                    'operation_type': op.operation_type,
+                    'new_value': op.new_value,
+                    'old_value': op.old_value,
+                    'user_id': op.user_id,
+                    'resolved_by_ot': op.transformed,
+                    'timestamp': op.timestamp.isoformat()
+                }
+                for op in applied
+            ]
+        })
+        await emit_frame('operations_replayed', payload, room_id)
+        await publish_to_redis(room_channel(room_id), payload)
+
+    return {"applied": len(applied), "superseded": superseded, "conflicts": conflicts}
+
+
+@app.post("/offline/queue/{user_id}/replay")
+async def replay_offline_queue(user_id: str, room: Optional[str] = None):
+    """
+    Replay a user's queued operations (only those of `room` if given) in
+    one call: each room's operations are rebased on its current state in
+    one pass and applied, and are removed from the queue as soon as that
+    room has replayed, so a failure in a later room does not apply them
+    twice on retry. Operations without a room or element_id cannot be
+    applied and are dropped as rejected.
+    Feature #424: Offline mode - sync queued edits when back online
+    """
+    try:
+        try:
+            token = await offline_queue.acquire_replay(user_id)
+        except ReplayInProgress as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if token is None:
+            raise HTTPException(status_code=503, detail="Offline queue unavailable")
+
+        try:
+            queued = await offline_queue.load(user_id, room)
+            if queued is None:
+                raise HTTPException(status_code=503, detail="Offline queue unavailable")
+
+            rejected = []
+            by_room: Dict[str, List[dict]] = {}
+            for entry in queued:
+                if entry.get('room') and entry.get('element_id'):
+                    by_room.setdefault(entry['room'], []).append(entry)
+                else:
+                    rejected.append(entry['queue_id'])
+
+            acknowledged = 0
+            if rejected:
+                acknowledged += await offline_queue.acknowledge(user_id, rejected) or 0
+
+            rooms = {}
+            for room_id, entries in by_room.items():
+                rooms[room_id] = await replay_room_operations(room_id, user_id, entries)
+                removed = await offline_queue.acknowledge(user_id, [entry['queue_id'] for entry in entries])
+                if removed is None:
+                    logger.warning(f"Replayed {len(entries)} offline operations of {user_id} in {room_id} stay queued")
+                acknowledged += removed or 0
+        finally:
+            await offline_queue.release_replay(user_id, token)
+
+        return {
+            "success": True,
+            "user_id": user_id,
+            "replayed": sum(result["applied"] for result in rooms.values()),
+            "rooms": rooms,
+            "rejected": rejected,
+            "acknowledged": acknowledged
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to replay offline queue: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @sio.event
 async def follow_user(sid, data):
     """
@@ -2155,6 +3320,10 @@ async def follow_user(sid, data):
 
         # Set up follow relationship
         follow_relationships[room_id][follower_id] = following_id
+        await persist_room_state(
+            room_id, room_state.set_follow(room_id, follower_id, following_id),
+            "follow", follower_id=follower_id, following_id=following_id
+        )
 
         # Get usernames for logging
         follower_name = "Unknown"
@@ -2216,6 +3385,10 @@ async def unfollow_user(sid, data):
         if room_id in follow_relationships and follower_id in follow_relationships[room_id]:
             was_following = follow_relationships[room_id][follower_id]
             del follow_relationships[room_id][follower_id]
+        await persist_room_state(
+            room_id, room_state.set_follow(room_id, follower_id, None),
+            "follow", follower_id=follower_id, following_id=None
+        )
 
         # Get username for logging
         follower_name = "Unknown"
@@ -2250,9 +3423,13 @@ async def viewport_update(sid, data):
         "user_id": "user-id",
         "pan_x": 100,
         "pan_y": 200,
-        "zoom": 1.5
+        "zoom": 1.5,
+        "width": 1920, "height": 1080  (optional screen size, or "bounds": {"x", "y", "w", "h"} in page units)
     }
     Feature #411: Follow mode - broadcast viewport changes
+
+    With a screen size or bounds, the viewport also decides which element
+    changes the socket receives in full (see interest.py).
     """
     try:
         room_id = data.get('room')
@@ -2274,6 +3451,12 @@ async def viewport_update(sid, data):
             'zoom': zoom
         }
 
+        visible = rect_bounds(data.get('bounds')) or camera_bounds(
+            pan_x, pan_y, zoom, data.get('width'), data.get('height')
+        )
+        if visible is not None and sid in active_rooms.get(room_id, ()):
+            room_interest.setdefault(room_id, RoomInterest()).set_viewport(sid, visible)
+
         # Check if anyone is following this user
         followers = []
         if room_id in follow_relationships:
@@ -2281,19 +3464,11 @@ async def viewport_update(sid, data):
                 if following_id == user_id:
                     followers.append(follower_id)
 
-        # If there are followers, broadcast the viewport update
-        if followers:
-            logger.info(f"Viewport update: User {user_id} has {len(followers)} followers in room {room_id}")
-
-            # Broadcast to all users in room (followers will react to it)
-            await sio.emit('viewport_changed', {
-                'user_id': user_id,
-                'pan_x': pan_x,
-                'pan_y': pan_y,
-                'zoom': zoom,
-                'followers': followers,  # List of users who should follow this update
-                'timestamp': datetime.utcnow().isoformat()
-            }, room=room_id)
+        # If there are followers, broadcast the viewport update on the next tick
+        # (to all users in room; followers will react to it)
+        presence = room_users.get(room_id, {}).get(user_id)
+        if followers and presence:
+            buffer_presence(room_id, user_id, sid, presence, viewport={'pan_x': pan_x, 'pan_y': pan_y, 'zoom': zoom})
 
         return {
             "success": True,
@@ -2311,7 +3486,10 @@ async def get_follow_relationships(room_id: str):
     Feature #411: View who is following whom
     """
     try:
-        relationships = follow_relationships.get(room_id, {})
+        relationships = await room_state.load_follows(room_id)
+        if relationships is None:
+            relationships = follow_relationships.get(room_id, {})
+        users = await shared_room_users(room_id)
 
         # Format for response
         follow_list = []
@@ -2319,11 +3497,10 @@ async def get_follow_relationships(room_id: str):
             follower_name = "Unknown"
             following_name = "Unknown"
 
-            if room_id in room_users:
-                if follower_id in room_users[room_id]:
-                    follower_name = room_users[room_id][follower_id].username
-                if following_id in room_users[room_id]:
-                    following_name = room_users[room_id][following_id].username
+            if follower_id in users:
+                follower_name = users[follower_id].username
+            if following_id in users:
+                following_name = users[following_id].username
 
             follow_list.append({
                 "follower_id": follower_id,
@@ -2371,46 +3548,22 @@ class Annotation:
         }
 
 
-async def cleanup_expired_annotations():
-    """Background task to remove expired annotations."""
-    while True:
-        try:
-            await asyncio.sleep(1)  # Check every second
-            now = datetime.utcnow()
-
-            for room_id in list(annotations.keys()):
-                if room_id not in annotations:
-                    continue
+async def expire_annotation(room_id: str, annotation_id: str):
+    """Remove an annotation when its deadline passes and tell the room (auto-fade)."""
+    if room_id not in annotations:
+        return
+    annotations[room_id] = [ann for ann in annotations[room_id] if ann['annotation_id'] != annotation_id]
 
-                # Filter out expired annotations
-                active_annotations = []
-                expired_annotations = []
-
-                for ann_dict in annotations[room_id]:
-                    expires_at = datetime.fromisoformat(ann_dict['expires_at'])
-                    if expires_at > now:
-                        active_annotations.append(ann_dict)
-                    else:
-                        expired_annotations.append(ann_dict)
-
-                # Update list if any expired
-                if expired_annotations:
-                    annotations[room_id] = active_annotations
-
-                    # Notify room that annotations expired (auto-fade)
-                    for ann_dict in expired_annotations:
-                        await sio.emit('annotation_expired', {
-                            'annotation_id': ann_dict['annotation_id'],
-                            'timestamp': now.isoformat()
-                        }, room=room_id)
+    await sio.emit('annotation_expired', {
+        'annotation_id': annotation_id,
+        'timestamp': datetime.utcnow().isoformat()
+    }, room=room_id)
 
-                        logger.info(f"Annotation {ann_dict['annotation_id']} expired in room {room_id}")
+    logger.info(f"Annotation {annotation_id} expired in room {room_id}")
 
-                # Clean up empty room
-                if not annotations[room_id]:
-                    del annotations[room_id]
-        except Exception as e:
-            logger.error(f"Error in cleanup_expired_annotations: {e}")
+    # Clean up empty room
+    if not annotations[room_id]:
+        del annotations[room_id]
 
 
 @sio.event
@@ -2474,6 +3627,11 @@ async def annotation_draw(sid, data):
             annotations[room_id] = []
 
         annotations[room_id].append(annotation.to_dict())
+        timers.schedule(
+            ("annotation", room_id, annotation.annotation_id),
+            (expires_at - now).total_seconds(),
+            partial(expire_annotation, room_id, annotation.annotation_id)
+        )
 
         logger.info(f"Annotation created: {annotation_type} by {username} in room {room_id}, expires in 10s")
 
@@ -2567,6 +3725,8 @@ async def action_performed(sid, data):
         if len(undo_stacks[room_id][user_id]) > 50:
             undo_stacks[room_id][user_id] = undo_stacks[room_id][user_id][-50:]
 
+        await persist_stacks(room_id, user_id)
+
         logger.info(f"Action recorded for undo: {action.get('action_type')} by user {user_id} in room {room_id}")
         logger.info(f"  Undo stack size: {len(undo_stacks[room_id][user_id])}")
 
@@ -2626,6 +3786,8 @@ async def undo_action(sid, data):
         if len(redo_stacks[room_id][user_id]) > 50:
             redo_stacks[room_id][user_id] = redo_stacks[room_id][user_id][-50:]
 
+        await persist_stacks(room_id, user_id)
+
         logger.info(f"Undo action: {action.get('action_type')} by user {user_id} in room {room_id}")
         logger.info(f"  Undo stack size: {len(undo_stacks[room_id][user_id])}")
         logger.info(f"  Redo stack size: {len(redo_stacks[room_id][user_id])}")
@@ -2695,6 +3857,8 @@ async def redo_action(sid, data):
         if len(undo_stacks[room_id][user_id]) > 50:
             undo_stacks[room_id][user_id] = undo_stacks[room_id][user_id][-50:]
 
+        await persist_stacks(room_id, user_id)
+
         logger.info(f"Redo action: {action.get('action_type')} by user {user_id} in room {room_id}")
         logger.info(f"  Undo stack size: {len(undo_stacks[room_id][user_id])}")
         logger.info(f"  Redo stack size: {len(redo_stacks[room_id][user_id])}")
@@ -2751,6 +3915,11 @@ async def lock_element(sid, data):
         if room_id not in element_locks:
             element_locks[room_id] = {}
 
+        # Take the lock in Redis so instances cannot grant it twice
+        holder = await room_state.acquire_lock(room_id, element_id, user_id)
+        if holder is not None:
+            element_locks[room_id][element_id] = holder
+
         # Check if element is already locked by someone else
         if element_id in element_locks[room_id]:
             locked_by_user_id = element_locks[room_id][element_id]
@@ -2768,8 +3937,15 @@ async def lock_element(sid, data):
                     "locked_by_username": locked_by_username
                 }
 
-        # Lock the element
+        # Lock the element (locking again refreshes the timeout)
         element_locks[room_id][element_id] = user_id
+        timers.schedule(
+            ("lock", room_id, element_id), ELEMENT_LOCK_TIMEOUT,
+            partial(expire_element_lock, room_id, element_id, user_id)
+        )
+        await publish_to_redis(room_channel(room_id), {
+            "type": "room_state", "kind": "lock", "element_id": element_id, "user_id": user_id
+        })
 
         logger.info(f"Element {element_id} locked by user {user_id} in room {room_id}")
 
@@ -2810,6 +3986,11 @@ async def unlock_element(sid, data):
         if not room_id or not element_id or not user_id:
             return {"success": False, "error": "room, element_id, and user_id required"}
 
+        # Check the shared lock; the local cache may not have seen it yet
+        stored_locks = await room_state.load_locks(room_id)
+        if stored_locks is not None:
+            element_locks[room_id] = stored_locks
+
         # Check if element is locked
         if room_id not in element_locks or element_id not in element_locks[room_id]:
             logger.info(f"Element {element_id} not locked in room {room_id}")
@@ -2829,7 +4010,12 @@ async def unlock_element(sid, data):
             }
 
         # Unlock the element
+        await persist_room_state(
+            room_id, room_state.release_lock(room_id, element_id, user_id),
+            "lock", element_id=element_id, user_id=None
+        )
         del element_locks[room_id][element_id]
+        timers.cancel(("lock", room_id, element_id))
 
         logger.info(f"Element {element_id} unlocked by user {user_id} in room {room_id}")
 
@@ -2849,6 +4035,27 @@ async def unlock_element(sid, data):
         return {"success": False, "error": str(e)}
 
 
+async def expire_element_lock(room_id: str, element_id: str, user_id: str):
+    """Release a lock held longer than ELEMENT_LOCK_TIMEOUT."""
+    if element_locks.get(room_id, {}).get(element_id) != user_id:
+        return
+
+    await persist_room_state(
+        room_id, room_state.release_lock(room_id, element_id, user_id),
+        "lock", element_id=element_id, user_id=None
+    )
+    del element_locks[room_id][element_id]
+
+    logger.info(f"Element {element_id} lock by user {user_id} expired in room {room_id}")
+
+    await sio.emit('element_unlocked', {
+        'element_id': element_id,
+        'user_id': user_id,
+        'reason': 'expired',
+        'timestamp': datetime.utcnow().isoformat()
+    }, room=room_id)
+
+
 @app.get("/undo-redo/stacks/{room_id}/{user_id}")
 async def get_undo_redo_stacks(room_id: str, user_id: str):
     """
@@ -2859,11 +4066,16 @@ async def get_undo_redo_stacks(room_id: str, user_id: str):
         undo_size = 0
         redo_size = 0
 
-        if room_id in undo_stacks and user_id in undo_stacks[room_id]:
-            undo_size = len(undo_stacks[room_id][user_id])
+        stored = await room_state.load_stacks(room_id)
+        if stored is not None:
+            undo_size = len(stored.get(user_id, {}).get('undo', []))
+            redo_size = len(stored.get(user_id, {}).get('redo', []))
+        else:
+            if room_id in undo_stacks and user_id in undo_stacks[room_id]:
+                undo_size = len(undo_stacks[room_id][user_id])
 
-        if room_id in redo_stacks and user_id in redo_stacks[room_id]:
-            redo_size = len(redo_stacks[room_id][user_id])
+            if room_id in redo_stacks and user_id in redo_stacks[room_id]:
+                redo_size = len(redo_stacks[room_id][user_id])
 
         return {
             "room": room_id,
@@ -2886,16 +4098,17 @@ async def get_element_locks(room_id: str):
     Feature #414: View element locks
     """
     try:
-        locks = {}
-        if room_id in element_locks:
-            locks = element_locks[room_id].copy()
+        locks = await room_state.load_locks(room_id)
+        if locks is None:
+            locks = element_locks.get(room_id, {}).copy()
+        users = await shared_room_users(room_id)
 
         # Enrich with usernames if available
         enriched_locks = {}
         for element_id, user_id in locks.items():
             username = "Unknown User"
-            if room_id in room_users and user_id in room_users[room_id]:
-                username = room_users[room_id][user_id].username
+            if user_id in users:
+                username = users[user_id].username
 
             enriched_locks[element_id] = {
                 "user_id": user_id,
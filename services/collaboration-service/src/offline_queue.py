@@ -0,0 +1,251 @@
+"""
+Durable offline operation queues.
+
+Operations a client made while disconnected are queued per user in a Redis
+stream, so they survive restarts and every instance sees them:
+
+    collab:offline:{user_id}         stream  queued operations, fields
+                                             "room" and "op" (JSON)
+    collab:offline:{user_id}:replay  string  token of the replay in progress
+
+A queue holds at most OFFLINE_QUEUE_LIMIT operations (further ones are
+refused, never silently trimmed) and expires OFFLINE_QUEUE_TTL after the
+last operation was queued.
+
+A replay holds the queue's replay lock, reads the queued operations (of one
+room or all), rebases them on the current room state in one pass (see
+rebase_operation) and then deletes exactly the replayed entries with one
+XDEL, so operations queued meanwhile stay queued and no operation is
+replayed twice.
+"""
+import json
+import logging
+import os
+import uuid
+from dataclasses import replace
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from .operation_log import Operation
+
+logger = logging.getLogger(__name__)
+
+OFFLINE_QUEUE_LIMIT = int(os.getenv("OFFLINE_QUEUE_LIMIT", "1000"))  # operations per user
+OFFLINE_QUEUE_TTL = int(os.getenv("OFFLINE_QUEUE_TTL", str(7 * 86400)))  # seconds
+REPLAY_LOCK_TTL = 30  # seconds
+
+QUEUE_KEY = "collab:offline:{user_id}"
+REPLAY_LOCK_KEY = "collab:offline:{user_id}:replay"
+
+# Queue an operation unless the queue is full. Returns {length, entry id},
+# or {-1, ""} if the queue is full
+ENQUEUE_SCRIPT = """
+if redis.call('XLEN', KEYS[1]) >= tonumber(ARGV[1]) then
+    return {-1, ''}
+end
+local id = redis.call('XADD', KEYS[1], '*', 'room', ARGV[3], 'op', ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {redis.call('XLEN', KEYS[1]), id}
+"""
+
+# Release a replay lock only if it is still held with the given token
+RELEASE_REPLAY_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class OfflineQueueFull(Exception):
+    """The user's offline queue already holds OFFLINE_QUEUE_LIMIT operations."""
+
+
+class ReplayInProgress(Exception):
+    """Another replay of the user's offline queue has not finished."""
+
+
+def queue_key(user_id: str) -> str:
+    return QUEUE_KEY.format(user_id=user_id)
+
+
+def replay_lock_key(user_id: str) -> str:
+    return REPLAY_LOCK_KEY.format(user_id=user_id)
+
+
+def operation_time(operation: Dict[str, Any]) -> datetime:
+    """When a queued operation was made (its "timestamp", else when it was queued), as naive UTC."""
+    for name in ("timestamp", "queued_at"):
+        value = operation.get(name)
+        if not isinstance(value, str):
+            continue
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            continue
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        return moment
+    return datetime.utcnow()
+
+
+def element_states_from_history(operations: Iterable[Operation]) -> Dict[str, Any]:
+    """
+    Current value of each element written in an operation history, applied
+    oldest first the way live operations update element state (dict values
+    merge into the element's value, anything else replaces it).
+    """
+    states: Dict[str, Any] = {}
+    for operation in sorted(operations, key=lambda op: op.timestamp):
+        current, value = states.get(operation.element_id), operation.new_value
+        if isinstance(value, dict) and isinstance(current, dict):
+            current.update(value)
+        else:
+            states[operation.element_id] = dict(value) if isinstance(value, dict) else value
+    return states
+
+
+def rebase_operation(operation: Operation, current: Any,
+                     written_at: Optional[datetime]) -> Tuple[Operation, List[str]]:
+    """
+    Transform an operation made offline against the element's current value.
+
+    A field another user changed since the operation was made (the current
+    value differs from both its old_value and its new_value) is a conflict,
+    resolved by last-write-wins like transform_operations: the offline write
+    keeps the field only if it is newer than the element's last write
+    (written_at). Other fields apply as they are.
+
+    Returns:
+        The operation to apply, with new_value cut down to the fields it
+        still wins (None if it wins none) and old_value set to the current
+        values, and the names of the fields it lost ("*" for whole values)
+    """
+    newer = written_at is None or operation.timestamp > written_at
+    new_value, old_value = operation.new_value, operation.old_value
+
+    if not isinstance(new_value, dict) or not isinstance(current, dict):
+        conflict = current is not None and current != old_value and current != new_value
+        if conflict and not newer:
+            return replace(operation, new_value=None, old_value=current, transformed=True), ["*"]
+        return replace(operation, old_value=current, transformed=conflict), []
+
+    base = old_value if isinstance(old_value, dict) else {}
+    kept, lost = {}, []
+    for name, value in new_value.items():
+        conflict = (
+            name in current and current[name] != value
+            and (name not in base or current[name] != base[name])
+        )
+        if conflict and not newer:
+            lost.append(name)
+        else:
+            kept[name] = value
+    return replace(
+        operation,
+        new_value=kept or None,
+        old_value={name: current.get(name) for name in new_value},
+        transformed=bool(lost)
+    ), lost
+
+
+class OfflineQueueStore:
+    """Redis streams holding the offline operation queue of each user.
+
+    Args:
+        get_client: Coroutine returning the shared Redis client
+            (created with decode_responses=True)
+    """
+
+    def __init__(self, get_client: Callable[[], Awaitable[redis.Redis]]):
+        self._get_client = get_client
+
+    async def enqueue(self, user_id: str, operation: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+        """Queue an operation.
+
+        Returns:
+            (queue length, queue id of the operation), or None if Redis is unavailable
+
+        Raises:
+            OfflineQueueFull: If the queue holds OFFLINE_QUEUE_LIMIT operations
+        """
+        try:
+            client = await self._get_client()
+            length, queue_id = await client.eval(
+                ENQUEUE_SCRIPT, 1, queue_key(user_id),
+                OFFLINE_QUEUE_LIMIT, OFFLINE_QUEUE_TTL,
+                operation.get("room") or "", json.dumps(operation, default=str)
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Offline queue unavailable for {user_id}: {e}")
+            return None
+        if length < 0:
+            raise OfflineQueueFull(f"Offline queue of {user_id} is full ({OFFLINE_QUEUE_LIMIT} operations)")
+        return length, queue_id
+
+    async def load(self, user_id: str, room_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Queued operations, oldest first, each with its "queue_id"; only those of room_id if given."""
+        try:
+            client = await self._get_client()
+            entries = await client.xrange(queue_key(user_id))
+        except redis.RedisError as e:
+            logger.warning(f"Offline queue unavailable for {user_id}: {e}")
+            return None
+        return [
+            {**json.loads(fields["op"]), "queue_id": entry_id}
+            for entry_id, fields in entries
+            if room_id is None or fields.get("room") == room_id
+        ]
+
+    async def clear(self, user_id: str) -> Optional[int]:
+        """Drop the whole queue. Returns the number of operations dropped."""
+        try:
+            client = await self._get_client()
+            pipe = client.pipeline(transaction=True)
+            pipe.xlen(queue_key(user_id))
+            pipe.delete(queue_key(user_id))
+            length, _ = await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Offline queue unavailable for {user_id}: {e}")
+            return None
+        return length
+
+    async def acquire_replay(self, user_id: str) -> Optional[str]:
+        """Take the queue's replay lock.
+
+        Returns:
+            The lock token (pass it to release_replay), or None if Redis is unavailable
+
+        Raises:
+            ReplayInProgress: If another replay holds the lock
+        """
+        token = uuid.uuid4().hex
+        try:
+            client = await self._get_client()
+            acquired = await client.set(replay_lock_key(user_id), token, nx=True, ex=REPLAY_LOCK_TTL)
+        except redis.RedisError as e:
+            logger.warning(f"Offline queue unavailable for {user_id}: {e}")
+            return None
+        if not acquired:
+            raise ReplayInProgress(f"Offline queue of {user_id} is being replayed")
+        return token
+
+    async def release_replay(self, user_id: str, token: str):
+        try:
+            client = await self._get_client()
+            await client.eval(RELEASE_REPLAY_SCRIPT, 1, replay_lock_key(user_id), token)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release offline replay lock of {user_id}: {e}")
+
+    async def acknowledge(self, user_id: str, queue_ids: List[str]) -> Optional[int]:
+        """Remove replayed operations from the queue in one command. Returns the number removed."""
+        if not queue_ids:
+            return 0
+        try:
+            client = await self._get_client()
+            return await client.xdel(queue_key(user_id), *queue_ids)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to acknowledge offline operations of {user_id}: {e}")
+            return None
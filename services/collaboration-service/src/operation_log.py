@@ -0,0 +1,120 @@
+"""
+Operation log for operational transform.
+
+Each room keeps its last MAX_OPERATIONS operations as typed records in a ring
+buffer (the history served by /ot/history) plus an index of recent
+operations per element. Finding the operations concurrent with a new one
+only looks at the element's index, and the index only holds operations
+from the last few seconds, so the cost is O(operations on that element in
+the window) rather than O(history).
+"""
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+MAX_OPERATIONS = 1000
+
+# Operations on the same element less than this apart are concurrent
+CONCURRENCY_WINDOW = timedelta(seconds=1)
+
+# How long operations stay in the element index. Longer than the window so
+# operations stamped slightly out of order by another instance still match.
+INDEX_RETENTION = CONCURRENCY_WINDOW * 2
+
+
+@dataclass
+class Operation:
+    """Represents a single operation on an element."""
+    operation_id: str
+    user_id: str
+    element_id: str
+    operation_type: str  # 'move', 'resize', 'style', 'delete', 'create'
+    old_value: any
+    new_value: any
+    timestamp: datetime
+    transformed: bool = False
+
+    def to_dict(self):
+        return {
+            **asdict(self),
+            'timestamp': self.timestamp.isoformat()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Operation":
+        return cls(
+            operation_id=data['operation_id'],
+            user_id=data['user_id'],
+            element_id=data['element_id'],
+            operation_type=data['operation_type'],
+            old_value=data.get('old_value'),
+            new_value=data.get('new_value'),
+            timestamp=datetime.fromisoformat(data['timestamp']),
+            transformed=data.get('transformed', False)
+        )
+
+
+class OperationLog:
+    """Ring buffer of a room's operations with a per-element index of recent ones."""
+
+    def __init__(self, max_operations: int = MAX_OPERATIONS):
+        self.operations: Deque[Operation] = deque(maxlen=max_operations)
+        self.by_element: Dict[str, Deque[Operation]] = {}
+        self.latest: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self.operations)
+
+    def append(self, operation: Operation):
+        if len(self.operations) == self.operations.maxlen:
+            self._unindex(self.operations[0])
+        self.operations.append(operation)
+
+        if self.latest is None or operation.timestamp > self.latest:
+            self.latest = operation.timestamp
+        recent = self.by_element.get(operation.element_id)
+        if recent is None:
+            recent = self.by_element[operation.element_id] = deque()
+        recent.append(operation)
+        self._expire(operation.element_id, recent)
+
+    def extend(self, operations: Iterable[Operation]):
+        for operation in operations:
+            self.append(operation)
+
+    def concurrent(self, operation: Operation, window: timedelta = CONCURRENCY_WINDOW) -> List[Operation]:
+        """
+        Untransformed operations by other users on the same element within
+        `window` of `operation`, oldest first.
+        """
+        recent = self.by_element.get(operation.element_id)
+        if not recent:
+            return []
+        return [
+            op for op in recent
+            if op.user_id != operation.user_id
+            and not op.transformed
+            and abs(op.timestamp - operation.timestamp) < window
+        ]
+
+    def to_dicts(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """The most recent `limit` operations (all if None), oldest first."""
+        operations = self.operations
+        if limit is not None and limit < len(operations):
+            operations = list(operations)[-limit:] if limit > 0 else []
+        return [op.to_dict() for op in operations]
+
+    def _unindex(self, operation: Operation):
+        recent = self.by_element.get(operation.element_id)
+        if recent and recent[0] is operation:
+            recent.popleft()
+            if not recent:
+                del self.by_element[operation.element_id]
+
+    def _expire(self, element_id: str, recent: Deque[Operation]):
+        horizon = self.latest - INDEX_RETENTION
+        while recent and recent[0].timestamp < horizon:
+            recent.popleft()
+        if not recent:
+            del self.by_element[element_id]
@@ -0,0 +1,89 @@
+"""
+Per-room coalescing of cursor, selection and viewport updates.
+
+Handlers record the latest cursor, selection and viewport of each user
+instead of emitting them. Every tick (PRESENCE_TICK_HZ, 15-60 Hz) the
+service drains the buffer and sends one frame per dirty room, so fan-out
+grows with rooms x ticks rather than with messages x users. Moves that
+arrive within one tick collapse into the latest position.
+
+Clients that connect with auth={"presence_frames": true} (or
+?presence_frames=1) receive the whole tick as one `presence_frame` event:
+
+    {"room": ..., "tick": 42, "users": [{"user_id", "username", "color",
+      "x", "y", "selected_elements", "pan_x", "pan_y", "zoom", "followers"}]}
+
+Only the fields that changed during the tick are present, and a user's own
+entry is included (clients ignore their own user_id). Other clients keep
+receiving cursor_update / selection_update / viewport_changed events, sent
+at tick rate.
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+PRESENCE_TICK_HZ = min(max(int(os.getenv("PRESENCE_TICK_HZ", "20")), 15), 60)
+PRESENCE_TICK_SECONDS = 1.0 / PRESENCE_TICK_HZ
+
+
+def wants_presence_frames(auth: Optional[dict], query_string: str = "") -> bool:
+    """Whether a client asked for batched presence frames at connect time."""
+    if isinstance(auth, dict) and auth.get("presence_frames"):
+        return True
+    return "presence_frames=1" in query_string or "presence_frames=true" in query_string
+
+
+@dataclass
+class PendingPresence:
+    """Latest buffered presence of one user during a tick."""
+    sid: Optional[str]
+    username: str
+    color: str
+    cursor: Optional[Dict[str, Any]] = None
+    selection: Optional[Dict[str, Any]] = None
+    viewport: Optional[Dict[str, Any]] = None
+    timestamp: str = ""
+
+    def frame_entry(self, user_id: str) -> Dict[str, Any]:
+        entry = {"user_id": user_id, "username": self.username, "color": self.color}
+        for part in (self.cursor, self.selection, self.viewport):
+            if part:
+                entry.update(part)
+        entry["timestamp"] = self.timestamp
+        return entry
+
+
+@dataclass
+class PresenceCoalescer:
+    """Buffer of presence changes per room, drained once per tick."""
+    pending: Dict[str, Dict[str, PendingPresence]] = field(default_factory=dict)
+    tick: int = 0
+    stats: Dict[str, int] = field(default_factory=lambda: {"updates": 0, "coalesced": 0, "frames": 0})
+
+    def update(self, room_id: str, user_id: str, sid: Optional[str], username: str, color: str,
+               timestamp: str, **parts: Dict[str, Any]):
+        """Record the latest cursor, selection and/or viewport of a user."""
+        room = self.pending.setdefault(room_id, {})
+        entry = room.get(user_id)
+        if entry is None:
+            entry = room[user_id] = PendingPresence(sid, username, color)
+        else:
+            self.stats["coalesced"] += 1
+        for name, value in parts.items():
+            setattr(entry, name, value)
+        entry.sid = sid
+        entry.timestamp = timestamp
+        self.stats["updates"] += 1
+
+    def __bool__(self) -> bool:
+        return bool(self.pending)
+
+    def drain(self) -> Dict[str, Dict[str, PendingPresence]]:
+        """Take everything buffered since the last tick."""
+        pending, self.pending = self.pending, {}
+        self.tick += 1
+        self.stats["frames"] += len(pending)
+        return pending
+
+    def discard_user(self, room_id: str, user_id: str):
+        self.pending.get(room_id, {}).pop(user_id, None)
@@ -0,0 +1,415 @@
+"""
+Shared room state for Collaboration Service.
+
+Presence, element locks, OT history, undo/redo stacks, follow relationships
+and activity feeds are kept in Redis so that every instance sees the same room:
+
+    collab:room:{room}:users     hash    user_id -> presence JSON
+    collab:room:{room}:seen      zset    user_id -> last presence write (epoch s)
+    collab:room:{room}:locks     hash    element_id -> user_id
+    collab:room:{room}:ops       stream  OT operations (capped at MAX_OPERATIONS)
+    collab:room:{room}:activity  stream  activity events (capped at MAX_ACTIVITY)
+    collab:room:{room}:stacks    hash    user_id -> {"undo": [...], "redo": [...]}
+    collab:room:{room}:follows   hash    follower_id -> following_id
+    collab:room:{room}:crdt      list    base64 CRDT update batches (see crdt.py)
+    collab:room:{room}:seq       string  last room update sequence number
+    collab:room:{room}:updates   stream  sequenced room updates, entry id "<seq>-0"
+                                         (capped at ROOM_LOG_LENGTH)
+    collab:room:{room}:instances set     instances with sockets in the room
+
+The module-level dicts in main.py stay as a local write-through cache (see
+persist_room_state there). Every write refreshes the room's keys to expire
+ROOM_STATE_TTL after the last activity, and presence entries that have not
+been written for PRESENCE_STALE_AFTER are pruned, so rooms abandoned by a
+crashed instance clean themselves up.
+
+Redis errors are logged and reported as None / False so callers can fall
+back to their local cache instead of failing the socket event.
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+ROOM_STATE_TTL = int(os.getenv("ROOM_STATE_TTL", "86400"))  # seconds
+PRESENCE_STALE_AFTER = int(os.getenv("PRESENCE_STALE_AFTER", "600"))  # seconds
+MAX_OPERATIONS = 1000
+MAX_ACTIVITY = 100
+ROOM_LOG_LENGTH = int(os.getenv("ROOM_LOG_LENGTH", "1000"))
+
+ROOM_KEY = "collab:room:{room_id}:{part}"
+ROOM_PARTS = ("users", "seen", "locks", "ops", "activity", "stacks", "follows", "crdt", "seq", "updates", "instances")
+
+# Delete a lock only if it is still held by the given user
+RELEASE_LOCK_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# Delete every lock held by the given user, returning the element ids
+RELEASE_USER_LOCKS_SCRIPT = """
+local released = {}
+local locks = redis.call('HGETALL', KEYS[1])
+for i = 1, #locks, 2 do
+    if locks[i + 1] == ARGV[1] then
+        redis.call('HDEL', KEYS[1], locks[i])
+        table.insert(released, locks[i])
+    end
+end
+return released
+"""
+
+# Number the next room update and append it to the room's update log. If the
+# counter was lost while the log survived, continue after the log's last entry
+APPEND_UPDATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local last = redis.call('XREVRANGE', KEYS[2], '+', '-', 'COUNT', 1)
+    if #last > 0 then
+        redis.call('SET', KEYS[1], string.match(last[1][1], '^%d+'))
+    end
+end
+local seq = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], seq .. '-0', 'event', ARGV[2], 'payload', ARGV[3])
+return seq
+"""
+
+
+def room_key(room_id: str, part: str) -> str:
+    return ROOM_KEY.format(room_id=room_id, part=part)
+
+
+class RoomStateStore:
+    """Redis structures holding the shared state of collaboration rooms.
+
+    Args:
+        get_client: Coroutine returning the shared Redis client
+            (created with decode_responses=True)
+    """
+
+    def __init__(self, get_client: Callable[[], Awaitable[redis.Redis]]):
+        self._get_client = get_client
+        self._pending: Set[asyncio.Task] = set()
+
+    def spawn(self, coro: Awaitable) -> None:
+        """Run a write from synchronous code without losing the task reference."""
+        task = asyncio.ensure_future(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _execute(self, room_id: str, build: Callable[[Any], None], touch: bool = True) -> Optional[list]:
+        """Run commands in one pipeline, refreshing the room's TTL after writes."""
+        try:
+            client = await self._get_client()
+            pipe = client.pipeline(transaction=False)
+            build(pipe)
+            if touch:
+                for part in ROOM_PARTS:
+                    pipe.expire(room_key(room_id, part), ROOM_STATE_TTL)
+            return await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Room state unavailable for {room_id}: {e}")
+            return None
+
+    # Presence
+
+    async def save_presence(self, room_id: str, user_id: str, presence: Dict[str, Any]) -> bool:
+        def build(pipe):
+            pipe.hset(room_key(room_id, "users"), user_id, json.dumps(presence))
+            pipe.zadd(room_key(room_id, "seen"), {user_id: time.time()})
+        return await self._execute(room_id, build) is not None
+
+    async def remove_presence(self, room_id: str, user_id: str) -> bool:
+        def build(pipe):
+            pipe.hdel(room_key(room_id, "users"), user_id)
+            pipe.zrem(room_key(room_id, "seen"), user_id)
+        return await self._execute(room_id, build, touch=False) is not None
+
+    async def load_presences(self, room_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        result = await self._execute(
+            room_id, lambda pipe: pipe.hgetall(room_key(room_id, "users")), touch=False
+        )
+        if result is None:
+            return None
+        return {user_id: json.loads(raw) for user_id, raw in result[0].items()}
+
+    async def prune_presences(self, room_id: str, max_age: int = PRESENCE_STALE_AFTER) -> List[str]:
+        """Remove presence entries not written for max_age seconds. Returns their user ids."""
+        result = await self._execute(
+            room_id,
+            lambda pipe: pipe.zrangebyscore(room_key(room_id, "seen"), "-inf", time.time() - max_age),
+            touch=False
+        )
+        stale = result[0] if result else []
+        if stale:
+            def build(pipe):
+                pipe.hdel(room_key(room_id, "users"), *stale)
+                pipe.zrem(room_key(room_id, "seen"), *stale)
+            await self._execute(room_id, build, touch=False)
+        return stale
+
+    # Element locks
+
+    async def acquire_lock(self, room_id: str, element_id: str, user_id: str) -> Optional[str]:
+        """Take a lock unless another user holds it.
+
+        Returns:
+            The user holding the lock afterwards (user_id if acquired), or
+            None if Redis is unavailable
+        """
+        key = room_key(room_id, "locks")
+
+        def build(pipe):
+            pipe.hsetnx(key, element_id, user_id)
+            pipe.hget(key, element_id)
+        result = await self._execute(room_id, build)
+        return result[1] if result else None
+
+    async def release_lock(self, room_id: str, element_id: str, user_id: str) -> bool:
+        """Release a lock held by user_id. Returns True if it was released."""
+        result = await self._execute(
+            room_id,
+            lambda pipe: pipe.eval(RELEASE_LOCK_SCRIPT, 1, room_key(room_id, "locks"), element_id, user_id),
+            touch=False
+        )
+        return bool(result and result[0])
+
+    async def release_user_locks(self, room_id: str, user_id: str) -> List[str]:
+        """Release every lock a user holds in a room. Returns the element ids."""
+        result = await self._execute(
+            room_id,
+            lambda pipe: pipe.eval(RELEASE_USER_LOCKS_SCRIPT, 1, room_key(room_id, "locks"), user_id),
+            touch=False
+        )
+        return list(result[0]) if result else []
+
+    async def load_locks(self, room_id: str) -> Optional[Dict[str, str]]:
+        result = await self._execute(
+            room_id, lambda pipe: pipe.hgetall(room_key(room_id, "locks")), touch=False
+        )
+        return result[0] if result is not None else None
+
+    # OT history and activity feed
+
+    async def append_operation(self, room_id: str, operation: Dict[str, Any]) -> bool:
+        return await self._execute(room_id, lambda pipe: pipe.xadd(
+            room_key(room_id, "ops"), {"op": json.dumps(operation)},
+            maxlen=MAX_OPERATIONS, approximate=True
+        )) is not None
+
+    async def append_operations(self, room_id: str, operations: List[Dict[str, Any]]) -> bool:
+        """Append several operations in one round trip."""
+        def build(pipe):
+            for operation in operations:
+                pipe.xadd(
+                    room_key(room_id, "ops"), {"op": json.dumps(operation)},
+                    maxlen=MAX_OPERATIONS, approximate=True
+                )
+        return await self._execute(room_id, build) is not None
+
+    async def load_operations(self, room_id: str, limit: int = MAX_OPERATIONS) -> Optional[List[Dict[str, Any]]]:
+        """Most recent operations, oldest first."""
+        result = await self._execute(
+            room_id, lambda pipe: pipe.xrevrange(room_key(room_id, "ops"), count=limit), touch=False
+        )
+        if result is None:
+            return None
+        return [json.loads(fields["op"]) for _, fields in reversed(result[0])]
+
+    async def append_activity(self, room_id: str, event: Dict[str, Any]) -> bool:
+        return await self._execute(room_id, lambda pipe: pipe.xadd(
+            room_key(room_id, "activity"), {"event": json.dumps(event)},
+            maxlen=MAX_ACTIVITY, approximate=True
+        )) is not None
+
+    async def load_activity(self, room_id: str, limit: int = MAX_ACTIVITY) -> Optional[List[Dict[str, Any]]]:
+        """Most recent activity events, oldest first."""
+        result = await self._execute(
+            room_id, lambda pipe: pipe.xrevrange(room_key(room_id, "activity"), count=limit), touch=False
+        )
+        if result is None:
+            return None
+        return [json.loads(fields["event"]) for _, fields in reversed(result[0])]
+
+    # Undo/redo stacks
+
+    async def save_stacks(self, room_id: str, user_id: str, undo: List[dict], redo: List[dict]) -> bool:
+        return await self._execute(room_id, lambda pipe: pipe.hset(
+            room_key(room_id, "stacks"), user_id, json.dumps({"undo": undo, "redo": redo})
+        )) is not None
+
+    async def load_stacks(self, room_id: str) -> Optional[Dict[str, Dict[str, List[dict]]]]:
+        result = await self._execute(
+            room_id, lambda pipe: pipe.hgetall(room_key(room_id, "stacks")), touch=False
+        )
+        if result is None:
+            return None
+        return {user_id: json.loads(raw) for user_id, raw in result[0].items()}
+
+    # Follow mode
+
+    async def set_follow(self, room_id: str, follower_id: str, following_id: Optional[str]) -> bool:
+        key = room_key(room_id, "follows")
+        if following_id is None:
+            return await self._execute(room_id, lambda pipe: pipe.hdel(key, follower_id)) is not None
+        return await self._execute(room_id, lambda pipe: pipe.hset(key, follower_id, following_id)) is not None
+
+    async def load_follows(self, room_id: str) -> Optional[Dict[str, str]]:
+        result = await self._execute(
+            room_id, lambda pipe: pipe.hgetall(room_key(room_id, "follows")), touch=False
+        )
+        return result[0] if result is not None else None
+
+    # CRDT document
+
+    async def append_crdt(self, room_id: str, batch: bytes) -> Optional[int]:
+        """Append an encoded update batch. Returns the number of stored batches."""
+        result = await self._execute(room_id, lambda pipe: pipe.rpush(
+            room_key(room_id, "crdt"), base64.b64encode(batch).decode("ascii")
+        ))
+        return result[0] if result else None
+
+    async def load_crdt(self, room_id: str) -> Optional[List[bytes]]:
+        result = await self._execute(
+            room_id, lambda pipe: pipe.lrange(room_key(room_id, "crdt"), 0, -1), touch=False
+        )
+        if result is None:
+            return None
+        return [base64.b64decode(batch) for batch in result[0]]
+
+    async def compact_crdt(self, room_id: str, compact: Callable[[List[bytes]], bytes], retries: int = 3) -> bool:
+        """
+        Replace the stored batches with compact(batches). The list is watched,
+        so batches appended by other instances meanwhile are never lost.
+        """
+        key = room_key(room_id, "crdt")
+        try:
+            client = await self._get_client()
+            for _ in range(retries):
+                async with client.pipeline(transaction=True) as pipe:
+                    try:
+                        await pipe.watch(key)
+                        batches = [base64.b64decode(batch) for batch in await pipe.lrange(key, 0, -1)]
+                        if len(batches) < 2:
+                            return True
+                        snapshot = compact(batches)
+                        pipe.multi()
+                        pipe.delete(key)
+                        pipe.rpush(key, base64.b64encode(snapshot).decode("ascii"))
+                        pipe.expire(key, ROOM_STATE_TTL)
+                        await pipe.execute()
+                        return True
+                    except redis.WatchError:
+                        continue
+        except redis.RedisError as e:
+            logger.warning(f"CRDT compaction failed for {room_id}: {e}")
+        return False
+
+    # Sequenced update log
+
+    async def append_update(self, room_id: str, event: str, payload: Any) -> Optional[int]:
+        """Number a room update and log it. Returns its sequence number."""
+        result = await self._execute(room_id, lambda pipe: pipe.eval(
+            APPEND_UPDATE_SCRIPT, 2, room_key(room_id, "seq"), room_key(room_id, "updates"),
+            ROOM_LOG_LENGTH, event, json.dumps(payload, default=str)
+        ))
+        return result[0] if result else None
+
+    async def updates_since(self, room_id: str, last_seq: int) -> Optional[Dict[str, Any]]:
+        """
+        Room updates after last_seq, oldest first.
+
+        Returns:
+            {"seq": latest sequence number, "updates": [{"seq", "event", "payload"}],
+             "snapshot_required": bool}, where snapshot_required means some
+            updates after last_seq were trimmed from the log (or the log was
+            reset), so the client must reload the whole diagram instead. None
+            if Redis is unavailable.
+        """
+        def build(pipe):
+            pipe.get(room_key(room_id, "seq"))
+            pipe.xrange(room_key(room_id, "updates"), min=str(last_seq + 1))
+        result = await self._execute(room_id, build, touch=False)
+        if result is None:
+            return None
+
+        raw_seq, entries = result
+        updates = [
+            {"seq": int(entry_id.split("-")[0]), "event": fields["event"], "payload": json.loads(fields["payload"])}
+            for entry_id, fields in entries
+        ]
+        current = max(int(raw_seq or 0), updates[-1]["seq"] if updates else 0)
+        if last_seq > current:
+            # The log expired and started over: the client's position is meaningless
+            return {"seq": current, "updates": [], "snapshot_required": True}
+        missing = current > last_seq and (not updates or updates[0]["seq"] != last_seq + 1)
+        return {"seq": current, "updates": [] if missing else updates, "snapshot_required": missing}
+
+    async def current_sequence(self, room_id: str) -> Optional[int]:
+        result = await self._execute(
+            room_id, lambda pipe: pipe.get(room_key(room_id, "seq")), touch=False
+        )
+        return int(result[0] or 0) if result is not None else None
+
+    # Instances with sockets in the room
+
+    async def join_instance(self, room_id: str, instance_id: str) -> Optional[Set[str]]:
+        """Register an instance in a room. Returns every instance registered there."""
+        def build(pipe):
+            pipe.sadd(room_key(room_id, "instances"), instance_id)
+            pipe.smembers(room_key(room_id, "instances"))
+        result = await self._execute(room_id, build)
+        return set(result[1]) if result else None
+
+    async def leave_instance(self, room_id: str, instance_id: str) -> bool:
+        return await self._execute(
+            room_id, lambda pipe: pipe.srem(room_key(room_id, "instances"), instance_id), touch=False
+        ) is not None
+
+    async def load_instances(self, room_ids: List[str]) -> Optional[Dict[str, Set[str]]]:
+        """Instances registered in each room, in one round trip."""
+        if not room_ids:
+            return {}
+        try:
+            client = await self._get_client()
+            pipe = client.pipeline(transaction=False)
+            for room_id in room_ids:
+                pipe.smembers(room_key(room_id, "instances"))
+            result = await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Room instances unavailable: {e}")
+            return None
+        return {room_id: set(members) for room_id, members in zip(room_ids, result)}
+
+    # Whole room
+
+    async def load_room(self, room_id: str) -> Optional[Dict[str, Any]]:
+        """Everything stored for a room, in one round trip."""
+        def build(pipe):
+            pipe.hgetall(room_key(room_id, "users"))
+            pipe.hgetall(room_key(room_id, "locks"))
+            pipe.xrevrange(room_key(room_id, "ops"), count=MAX_OPERATIONS)
+            pipe.xrevrange(room_key(room_id, "activity"), count=MAX_ACTIVITY)
+            pipe.hgetall(room_key(room_id, "stacks"))
+            pipe.hgetall(room_key(room_id, "follows"))
+        result = await self._execute(room_id, build, touch=False)
+        if result is None:
+            return None
+
+        users, locks, ops, activity, stacks, follows = result
+        return {
+            "users": {user_id: json.loads(raw) for user_id, raw in users.items()},
+            "locks": locks,
+            "operations": [json.loads(fields["op"]) for _, fields in reversed(ops)],
+            "activity": [json.loads(fields["event"]) for _, fields in reversed(activity)],
+            "stacks": {user_id: json.loads(raw) for user_id, raw in stacks.items()},
+            "follows": follows,
+        }
@@ -0,0 +1,211 @@
+"""
+Bounded per-socket send queues for slow clients.
+
+Socket.IO emits are fire-and-forget: every packet for a socket waits in
+its Engine.IO queue until the transport takes it, so one client on a bad
+connection can make the server buffer without limit. Instead, sockets
+whose Engine.IO queue holds more than SEND_HIGH_WATER packets are marked
+behind, and high-frequency events (presence, cursors, deltas, OT results)
+for them go to a bounded queue of their own rather than to the transport:
+
+- presence events are keyed per user (cursor_update, selection_update,
+  viewport_changed) or per room (presence_frame, region_invalidated); a
+  newer event replaces or merges into the queued one with the same key
+- consecutive delta_update frames merge into one
+- past SEND_QUEUE_LIMIT entries, queued presence is dropped; if that is
+  not enough, or its queue has not emptied for SLOW_CONSUMER_TIMEOUT,
+  the queue is cleared and replaced by one `resync_required` event
+  ({"reason": "slow_consumer", "snapshot_required": true}) after which the
+  client reloads the diagram
+
+The pump (send_queue_task in main.py) runs every SEND_QUEUE_POLL seconds,
+feeds each queue to its transport as far as SEND_HIGH_WATER allows, and
+returns sockets to direct emits once their queue is empty and the
+transport is below SEND_LOW_WATER. Other events keep going straight to the
+transport; a socket that is behind may see them ahead of queued frames.
+"""
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from .framing import decode_frame, encode_frame
+
+SEND_QUEUE_LIMIT = int(os.getenv("SEND_QUEUE_LIMIT", "256"))  # queued events per socket
+SEND_HIGH_WATER = int(os.getenv("SEND_HIGH_WATER", "64"))  # Engine.IO packets waiting
+SEND_LOW_WATER = int(os.getenv("SEND_LOW_WATER", "8"))
+SLOW_CONSUMER_TIMEOUT = float(os.getenv("SLOW_CONSUMER_TIMEOUT", "30"))  # seconds
+SEND_QUEUE_POLL = 0.1  # seconds
+
+RESYNC_EVENT = "resync_required"
+
+# (sid, event, data) -> emitted to that socket only
+Sender = Callable[[str, str, Any], Awaitable[Any]]
+Merger = Callable[[Any, Any], Any]
+
+
+def _merge_changes(older: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-element union of two deltas; nested dicts (props) are merged one level deep."""
+    merged = dict(older)
+    for element_id, changes in newer.items():
+        previous = merged.get(element_id)
+        if isinstance(previous, dict) and isinstance(changes, dict):
+            combined = dict(previous)
+            for name, value in changes.items():
+                if isinstance(value, dict) and isinstance(combined.get(name), dict):
+                    value = {**combined[name], **value}
+                combined[name] = value
+            changes = combined
+        merged[element_id] = changes
+    return merged
+
+
+def merge_deltas(older: Any, newer: Any) -> Any:
+    """Merge two queued delta_update payloads (JSON delta maps or msgpack frames)."""
+    if isinstance(newer, (bytes, bytearray)):
+        older_frame, newer_frame = decode_frame(older), decode_frame(newer)
+        return encode_frame({
+            **newer_frame,
+            "delta": _merge_changes(older_frame.get("delta") or {}, newer_frame.get("delta") or {})
+        })
+    return _merge_changes(older, newer)
+
+
+def merge_presence_frames(older: Any, newer: Any) -> Any:
+    """Merge two queued presence_frame payloads, keeping each user's latest fields."""
+    binary = isinstance(newer, (bytes, bytearray))
+    older_frame, newer_frame = decode_frame(older), decode_frame(newer)
+    users: Dict[Any, Dict[str, Any]] = {}
+    for entry in (*older_frame.get("users", []), *newer_frame.get("users", [])):
+        users.setdefault(entry.get("user_id"), {}).update(entry)
+    frame = {**newer_frame, "users": list(users.values())}
+    return encode_frame(frame) if binary else frame
+
+
+def merge_invalidations(older: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge two queued region_invalidated payloads into one covering both."""
+    element_ids = list(dict.fromkeys([*older["element_ids"], *newer["element_ids"]]))
+    a, b = older["bounds"], newer["bounds"]
+    bounds = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+    return {**newer, "element_ids": element_ids, "bounds": bounds}
+
+
+MERGERS: Dict[str, Merger] = {
+    "delta_update": merge_deltas,
+    "presence_frame": merge_presence_frames,
+    "region_invalidated": merge_invalidations,
+}
+
+
+@dataclass
+class Outbound:
+    event: str
+    data: Any
+    key: Optional[Hashable] = None
+
+
+@dataclass
+class SocketQueue:
+    """Events waiting for one socket that is behind."""
+    since: float
+    entries: Deque[Outbound] = field(default_factory=deque)
+    keyed: Dict[Hashable, Outbound] = field(default_factory=dict)
+
+
+class SendQueues:
+    """Send queues of the sockets that are behind.
+
+    Args:
+        send: Emits one event to one socket
+    """
+
+    def __init__(self, send: Sender):
+        self._send = send
+        self.queues: Dict[str, SocketQueue] = {}
+        self.stats = {"queued": 0, "sent": 0, "collapsed": 0, "merged": 0, "dropped": 0, "resyncs": 0}
+
+    def behind(self) -> Set[str]:
+        return set(self.queues)
+
+    def depth(self) -> Tuple[int, int]:
+        """(total, largest) number of queued events."""
+        depths = [len(queue.entries) for queue in self.queues.values()]
+        return sum(depths), max(depths, default=0)
+
+    def push(self, sid: str, event: str, data: Any, key: Optional[Hashable] = None):
+        """Queue an event for a socket that is behind."""
+        queue = self.queues[sid]
+        self.stats["queued"] += 1
+        merge = MERGERS.get(event)
+
+        if key is not None and key in queue.keyed:
+            entry = queue.keyed[key]
+            entry.data = merge(entry.data, data) if merge else data
+            self.stats["collapsed"] += 1
+            return
+        if key is None and merge and queue.entries and queue.entries[-1].event == event:
+            entry = queue.entries[-1]
+            entry.data = merge(entry.data, data)
+            self.stats["merged"] += 1
+            return
+
+        entry = Outbound(event, data, key)
+        queue.entries.append(entry)
+        if key is not None:
+            queue.keyed[key] = entry
+        if len(queue.entries) > SEND_QUEUE_LIMIT:
+            self._shed(queue)
+
+    def _shed(self, queue: SocketQueue):
+        """Drop queued presence; if the queue is still full, ask for a resync."""
+        if queue.keyed:
+            kept = deque(entry for entry in queue.entries if entry.key is None)
+            self.stats["dropped"] += len(queue.entries) - len(kept)
+            queue.entries = kept
+            queue.keyed.clear()
+        if len(queue.entries) > SEND_QUEUE_LIMIT:
+            self._resync(queue)
+
+    def _resync(self, queue: SocketQueue):
+        self.stats["dropped"] += len(queue.entries)
+        self.stats["resyncs"] += 1
+        queue.entries.clear()
+        queue.keyed.clear()
+        queue.entries.append(Outbound(RESYNC_EVENT, {"reason": "slow_consumer", "snapshot_required": True}))
+        queue.since = time.monotonic()
+
+    def discard(self, sid: str):
+        self.queues.pop(sid, None)
+
+    async def pump(self, backlogs: Iterable[Tuple[str, int]]):
+        """
+        Given the Engine.IO backlog of every socket: mark sockets behind,
+        feed queued events to transports with room for them, and release
+        sockets that caught up.
+        """
+        now = time.monotonic()
+        for sid, backlog in backlogs:
+            queue = self.queues.get(sid)
+            if queue is None:
+                if backlog > SEND_HIGH_WATER:
+                    self.queues[sid] = SocketQueue(since=now)
+                continue
+
+            if now - queue.since > SLOW_CONSUMER_TIMEOUT and queue.entries and queue.entries[0].event != RESYNC_EVENT:
+                self._resync(queue)
+
+            budget = SEND_HIGH_WATER - backlog
+            while queue.entries and budget > 0:
+                entry = queue.entries.popleft()
+                if entry.key is not None and queue.keyed.get(entry.key) is entry:
+                    del queue.keyed[entry.key]
+                await self._send(sid, entry.event, entry.data)
+                self.stats["sent"] += 1
+                budget -= 1
+
+            if not queue.entries:
+                if backlog <= SEND_LOW_WATER:
+                    del self.queues[sid]
+                else:
+                    queue.since = now  # Keeping up, if barely
@@ -0,0 +1,158 @@
+"""
+Consistent-hash ownership of collaboration rooms.
+
+nginx routes every Socket.IO request by the room the client names in its
+connection URL (?room=file:<id>) with `hash $collab_room consistent` (see
+nginx/nginx.conf), so all sockets of a room reach the same instance and
+its updates are relayed locally, without a Redis round trip. HashRing
+rebuilds nginx's ketama ring (160 crc32 points per upstream server) over
+the same upstream addresses, so instances agree with nginx on the owner of
+a room. COLLAB_SHARDS lists them exactly as the nginx upstream does:
+
+    COLLAB_SHARDS=collab-1=collaboration-service-1:8083,collab-2=collaboration-service-2:8083
+
+Instances heartbeat into collab:instances (zset of INSTANCE_ID -> last
+heartbeat). nginx skips a server that is down by walking to the next
+points of the ring, which is the same as building the ring from the live
+instances only. When the live set changes, rooms that now belong to
+another instance are handed over: their dirty records are flushed, their
+sockets receive `room_handover` and are disconnected, and they reconnect
+through nginx to the new owner. Until the last of them has moved, both
+instances have sockets in the room and relay through Redis as before (see
+relay_needed in main.py). Without COLLAB_SHARDS (one instance, or no
+nginx in front) nothing is handed over.
+"""
+import bisect
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from urllib.parse import quote
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+INSTANCES_KEY = "collab:instances"
+INSTANCE_HEARTBEAT = 5.0  # seconds
+INSTANCE_TTL = 15.0  # seconds without a heartbeat before an instance counts as gone
+POINTS_PER_SERVER = 160  # nginx: weight * 160
+
+
+def parse_shards(value: str) -> Dict[str, str]:
+    """Parse "instance=host:port,..." into {instance_id: "host:port"}."""
+    shards = {}
+    for item in value.split(","):
+        instance_id, _, address = item.strip().partition("=")
+        if instance_id and address:
+            shards[instance_id.strip()] = address.strip()
+    return shards
+
+
+COLLAB_SHARDS = parse_shards(os.getenv("COLLAB_SHARDS", ""))
+
+
+def shard_key(room_id: str) -> str:
+    """The room as nginx sees it in $arg_room (URL-encoded by Socket.IO clients)."""
+    return quote(room_id, safe="-_.~")
+
+
+class HashRing:
+    """nginx-compatible consistent hash ring.
+
+    Args:
+        servers: instance_id -> upstream address ("host:port") as written in nginx.conf
+    """
+
+    def __init__(self, servers: Dict[str, str]):
+        points = []
+        for instance_id, address in servers.items():
+            host, port = address, ""
+            head, _, tail = address.rpartition(":")
+            if head and tail.isdigit():
+                host, port = head, tail
+            base = host.encode() + b"\0" + port.encode()
+            previous = 0
+            for _ in range(POINTS_PER_SERVER):
+                previous = zlib.crc32(base + struct.pack("<I", previous))
+                points.append((previous, instance_id))
+        points.sort(key=lambda point: point[0])
+
+        self._hashes: List[int] = []
+        self._owners: List[str] = []
+        for point_hash, instance_id in points:
+            if not self._hashes or self._hashes[-1] != point_hash:
+                self._hashes.append(point_hash)
+                self._owners.append(instance_id)
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect_left(self._hashes, zlib.crc32(key.encode()))
+        return self._owners[index % len(self._hashes)]
+
+
+class ShardMap:
+    """Live collaboration instances and the owner of each room.
+
+    Args:
+        get_client: Coroutine returning the shared Redis client
+        instance_id: This instance's INSTANCE_ID
+        shards: Instances routed by nginx (COLLAB_SHARDS)
+    """
+
+    def __init__(self, get_client: Callable[[], Awaitable[redis.Redis]], instance_id: str,
+                 shards: Dict[str, str] = COLLAB_SHARDS):
+        self._get_client = get_client
+        self.instance_id = instance_id
+        self.shards = shards
+        self.enabled = instance_id in shards
+        # Like nginx, consider every configured instance up until told otherwise
+        self.live: Set[str] = set(shards) | {instance_id}
+        self.ring = HashRing(self._live_shards())
+        self.stats = {"rebalances": 0, "handovers": 0}
+
+    def _live_shards(self) -> Dict[str, str]:
+        return {instance_id: address for instance_id, address in self.shards.items() if instance_id in self.live}
+
+    def owner(self, room_id: str) -> Optional[str]:
+        """Instance nginx routes the room to, or None if sharding is off."""
+        if not self.enabled:
+            return None
+        return self.ring.owner(shard_key(room_id))
+
+    def owns(self, room_id: str) -> bool:
+        owner = self.owner(room_id)
+        return owner is None or owner == self.instance_id
+
+    async def heartbeat(self) -> bool:
+        """Record this instance as live and refresh the others. Returns True if the live set changed."""
+        now = time.time()
+        try:
+            client = await self._get_client()
+            pipe = client.pipeline(transaction=False)
+            pipe.zadd(INSTANCES_KEY, {self.instance_id: now})
+            pipe.zremrangebyscore(INSTANCES_KEY, "-inf", now - INSTANCE_TTL)
+            pipe.zrange(INSTANCES_KEY, 0, -1)
+            _, _, members = await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Instance heartbeat failed: {e}")
+            return False
+
+        live = set(members) | {self.instance_id}
+        if live == self.live:
+            return False
+        logger.info(f"Live collaboration instances changed: {sorted(self.live)} -> {sorted(live)}")
+        self.live = live
+        self.ring = HashRing(self._live_shards())
+        self.stats["rebalances"] += 1
+        return True
+
+    async def leave(self):
+        try:
+            client = await self._get_client()
+            await client.zrem(INSTANCES_KEY, self.instance_id)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to deregister instance: {e}")
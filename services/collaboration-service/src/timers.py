@@ -0,0 +1,100 @@
+"""
+Deadline scheduler for collaboration-service.
+
+Away detection, element lock expiry, annotation fade-out and the periodic
+presence refresh each arm one deadline per user, lock or annotation
+instead of sweeping every room. Deadlines live in a heap, and the run loop
+sleeps until the earliest one, so an idle service does no work no matter
+how many users are connected.
+
+Timers are keyed (e.g. ("away", room_id, user_id)); scheduling a key again
+replaces its deadline and cancel() disarms it. Replaced and cancelled
+entries stay in the heap until they surface and are skipped, which keeps
+re-arming O(log n) without searching the heap. Callbacks that see activity
+since they were armed simply re-arm themselves for the new deadline.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TimerCallback = Callable[[], Awaitable[Any]]
+
+
+class TimerScheduler:
+    """Heap of keyed deadlines on the event loop clock."""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._timers: Dict[Hashable, Tuple[float, int, TimerCallback]] = {}
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self.stats = {"scheduled": 0, "fired": 0, "cancelled": 0}
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    @staticmethod
+    def now() -> float:
+        return asyncio.get_running_loop().time()
+
+    def schedule(self, key: Hashable, delay: float, callback: TimerCallback):
+        """Run `callback()` in `delay` seconds, replacing any timer with the same key."""
+        deadline = self.now() + max(delay, 0.0)
+        sequence = next(self._sequence)
+        self._timers[key] = (deadline, sequence, callback)
+        heapq.heappush(self._heap, (deadline, sequence, key))
+        if len(self._heap) > 2 * len(self._timers) + 64:
+            # Mostly re-armed or cancelled entries: rebuild from the live timers
+            self._heap = [(deadline, sequence, key) for key, (deadline, sequence, _) in self._timers.items()]
+            heapq.heapify(self._heap)
+        self.stats["scheduled"] += 1
+        if self._heap[0][1] == sequence:
+            # New earliest deadline: the run loop must sleep less
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> bool:
+        if self._timers.pop(key, None) is None:
+            return False
+        self.stats["cancelled"] += 1
+        return True
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        timer = self._timers.get(key)
+        return timer[0] if timer else None
+
+    def _pop_due(self, now: float) -> List[TimerCallback]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, sequence, key = heapq.heappop(self._heap)
+            timer = self._timers.get(key)
+            if timer is None or timer[1] != sequence:
+                continue  # Cancelled or re-armed
+            del self._timers[key]
+            due.append(timer[2])
+        return due
+
+    async def run(self):
+        """Fire timers as they come due. Runs until cancelled."""
+        while True:
+            self._wakeup.clear()
+            for callback in self._pop_due(self.now()):
+                self.stats["fired"] += 1
+                try:
+                    await callback()
+                except Exception as e:
+                    logger.error(f"Timer callback failed: {e}")
+
+            # Drop stale entries at the top so they do not cause early wakeups
+            while self._heap and self._timers.get(self._heap[0][2], (None, None))[1] != self._heap[0][1]:
+                heapq.heappop(self._heap)
+
+            timeout = self._heap[0][0] - self.now() if self._heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
@@ -0,0 +1,168 @@
+"""
+Write-behind persistence of live room documents to diagram-service.
+
+While a room is active the CRDT document in collaboration-service is the
+live copy of the canvas. Elements changed by clients connected to this
+instance are marked dirty, and at most every WRITE_BEHIND_INTERVAL seconds
+per room the dirty records are sent to diagram-service as one merged
+patch:
+
+    PUT {DIAGRAM_SERVICE_URL}/{diagram_id}
+    {"canvas_patch": {"store": {record_id: fields or null}}}
+
+A record carries only the fields written through the CRDT document, so
+diagram-service merges it into the stored record field by field (see its
+canvas_patch.py), versions the canvas as usual, and skips broadcasting
+it back (X-Collaboration-Write-Behind). Rooms are also flushed when their
+last local socket leaves and on shutdown. Failed flushes keep the records they sent and retry them with
+backoff (with newer values if the room's document is still loaded), so
+edits survive the document being unloaded when the last user leaves.
+"""
+import logging
+import os
+from functools import partial
+from typing import Any, Callable, Dict, Optional, Set
+
+import httpx
+
+from .timers import TimerScheduler
+
+logger = logging.getLogger(__name__)
+
+DIAGRAM_SERVICE_URL = os.getenv("DIAGRAM_SERVICE_URL", "http://localhost:8082")
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "3"))  # seconds
+MAX_RETRY_DELAY = 60.0  # seconds
+
+# Returns a room's CRDT document (see crdt.py), or None if it is not loaded
+DocumentLookup = Callable[[str], Optional[Any]]
+
+
+def diagram_id_for_room(room_id: str) -> Optional[str]:
+    """Diagram persisted for a room ("file:<diagram_id>"), if any."""
+    if room_id.startswith("file:"):
+        return room_id[len("file:"):] or None
+    return None
+
+
+def is_final_rejection(response: httpx.Response) -> bool:
+    """Whether diagram-service refused a patch for good, so its records are dropped."""
+    status = response.status_code
+    if status == 404:
+        # Only diagram-service's own answer for a missing or deleted diagram
+        try:
+            body = response.json()
+        except ValueError:
+            return False
+        return isinstance(body, dict) and body.get("detail") == "Diagram not found"
+    return 400 <= status < 500 and status not in (408, 409, 429)
+
+
+class WriteBehind:
+    """Per-room dirty sets flushed to diagram-service on a timer.
+
+    Args:
+        timers: Scheduler used for the per-room flush deadlines
+        get_document: Lookup of a room's loaded CRDT document
+    """
+
+    def __init__(self, timers: TimerScheduler, get_document: DocumentLookup):
+        self._timers = timers
+        self._get_document = get_document
+        self._client: Optional[httpx.AsyncClient] = None
+        self.dirty: Dict[str, Set[str]] = {}
+        self.pending: Dict[str, Dict[str, Any]] = {}  # room_id -> records of failed sends
+        self.editors: Dict[str, str] = {}  # room_id -> user whose edit is flushed
+        self.failures: Dict[str, int] = {}
+        self.stats = {"flushes": 0, "records": 0, "failures": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=DIAGRAM_SERVICE_URL, timeout=10.0)
+        return self._client
+
+    def mark_dirty(self, room_id: str, element_ids, user_id: Optional[str]):
+        """Record elements changed by a local client; arms the room's flush if needed."""
+        if diagram_id_for_room(room_id) is None or not user_id:
+            return
+        self.dirty.setdefault(room_id, set()).update(element_ids)
+        self.editors[room_id] = user_id
+        if self._timers.deadline(("persist", room_id)) is None:
+            self._timers.schedule(("persist", room_id), WRITE_BEHIND_INTERVAL, partial(self.flush, room_id))
+
+    def _take_patch(self, room_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Records to send (taken synchronously): those kept from failed sends,
+        updated with the current value of the room's dirty records.
+        """
+        self._timers.cancel(("persist", room_id))
+        store = self.pending.pop(room_id, {})
+        element_ids = self.dirty.pop(room_id, set())
+        if element_ids:
+            document = self._get_document(room_id)
+            if document is not None:
+                store.update({element_id: document.element(element_id) for element_id in element_ids})
+            else:
+                lost = element_ids - store.keys()
+                if lost:
+                    logger.warning(f"Dropping {len(lost)} unflushed records of unloaded room {room_id}")
+        if not store:
+            return None
+        return {"store": store}
+
+    async def flush(self, room_id: str) -> bool:
+        """Send the room's dirty records now. Returns False if they were kept for a retry."""
+        patch = self._take_patch(room_id)
+        if patch is None:
+            return True
+        return await self._send(room_id, patch)
+
+    def flush_soon(self, room_id: str, spawn: Callable):
+        """Snapshot the dirty records before the document is dropped, and send them in the background."""
+        patch = self._take_patch(room_id)
+        if patch is not None:
+            spawn(self._send(room_id, patch))
+
+    async def flush_all(self):
+        for room_id in list(self.dirty.keys() | self.pending.keys()):
+            await self.flush(room_id)
+
+    async def _send(self, room_id: str, patch: Dict[str, Any]) -> bool:
+        diagram_id = diagram_id_for_room(room_id)
+        user_id = self.editors.get(room_id, "")
+        try:
+            response = await self._get_client().put(
+                f"/{diagram_id}",
+                json={"canvas_patch": patch},
+                headers={"X-User-ID": user_id, "X-Collaboration-Write-Behind": "1"}
+            )
+            if is_final_rejection(response):
+                # Retrying cannot succeed (deleted diagram, lost permission)
+                logger.warning(f"diagram-service rejected write-behind for {room_id}: {response.status_code}")
+                self.failures.pop(room_id, None)
+                return True
+            # Anything else, including a 404 that did not come from update_diagram
+            # (a proxy or a DIAGRAM_SERVICE_URL that misses PUT /{id}), is retried
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            self.stats["failures"] += 1
+            attempts = self.failures[room_id] = self.failures.get(room_id, 0) + 1
+            delay = min(WRITE_BEHIND_INTERVAL * 2 ** attempts, MAX_RETRY_DELAY)
+            logger.warning(f"Write-behind for {room_id} failed ({e}); retrying in {delay:.0f}s")
+            # Keep the records for the retry; while the document is loaded they
+            # are also marked dirty, so the retry sends their newest values
+            pending = self.pending.setdefault(room_id, {})
+            for element_id, record in patch["store"].items():
+                pending.setdefault(element_id, record)
+            self.dirty.setdefault(room_id, set()).update(patch["store"])
+            self._timers.schedule(("persist", room_id), delay, partial(self.flush, room_id))
+            return False
+
+        self.failures.pop(room_id, None)
+        self.stats["flushes"] += 1
+        self.stats["records"] += len(patch["store"])
+        return True
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,20 @@
+-- Offload oversized canvas snapshots to object storage (MinIO)
+ALTER TABLE canvas_snapshots ALTER COLUMN canvas_data DROP NOT NULL;
+ALTER TABLE canvas_snapshots ADD COLUMN IF NOT EXISTS storage_key VARCHAR(512);
+ALTER TABLE canvas_snapshots ADD COLUMN IF NOT EXISTS summary JSON;
+
+-- Add comments
+COMMENT ON COLUMN canvas_snapshots.canvas_data IS 'Canvas JSON, NULL when offloaded to object storage';
+COMMENT ON COLUMN canvas_snapshots.storage_key IS 'MinIO object key of the gzipped canvas (offloaded snapshots only)';
+COMMENT ON COLUMN canvas_snapshots.summary IS 'Element count and top-level keys of offloaded canvases';
+
+-- Backfill size_bytes for rows written before size tracking, so listings
+-- never have to load a deferred canvas to measure it
+UPDATE files
+SET size_bytes = COALESCE(
+        octet_length(canvas_data::text),
+        (SELECT s.size_bytes FROM canvas_snapshots s WHERE s.content_hash = files.canvas_snapshot_hash),
+        0
+    ) + COALESCE(octet_length(note_content), 0)
+WHERE COALESCE(size_bytes, 0) = 0
+  AND (canvas_data IS NOT NULL OR canvas_snapshot_hash IS NOT NULL OR note_content IS NOT NULL);
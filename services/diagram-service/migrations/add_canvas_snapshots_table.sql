@@ -0,0 +1,29 @@
+-- Content-addressed canvas snapshot store shared by files, versions and templates
+CREATE TABLE IF NOT EXISTS canvas_snapshots (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    canvas_data JSONB NOT NULL,
+    size_bytes BIGINT DEFAULT 0,
+    ref_count INTEGER DEFAULT 0 NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_canvas_snapshots_ref_count ON canvas_snapshots(ref_count);
+
+-- Snapshot references (canvas_data stays as the inline copy until shared)
+ALTER TABLE files ADD COLUMN IF NOT EXISTS canvas_snapshot_hash VARCHAR(64)
+    REFERENCES canvas_snapshots(content_hash) ON DELETE RESTRICT;
+ALTER TABLE versions ADD COLUMN IF NOT EXISTS canvas_snapshot_hash VARCHAR(64)
+    REFERENCES canvas_snapshots(content_hash) ON DELETE RESTRICT;
+ALTER TABLE templates ADD COLUMN IF NOT EXISTS canvas_snapshot_hash VARCHAR(64)
+    REFERENCES canvas_snapshots(content_hash) ON DELETE RESTRICT;
+
+CREATE INDEX IF NOT EXISTS ix_files_canvas_snapshot_hash ON files(canvas_snapshot_hash);
+CREATE INDEX IF NOT EXISTS ix_versions_canvas_snapshot_hash ON versions(canvas_snapshot_hash);
+CREATE INDEX IF NOT EXISTS ix_templates_canvas_snapshot_hash ON templates(canvas_snapshot_hash);
+
+-- Add comments
+COMMENT ON TABLE canvas_snapshots IS 'Canvas snapshots stored once, keyed by SHA-256 of canonical JSON';
+COMMENT ON COLUMN canvas_snapshots.ref_count IS 'Number of files, versions and templates referencing this snapshot';
+COMMENT ON COLUMN files.canvas_snapshot_hash IS 'Shared canvas snapshot (used when canvas_data is NULL)';
+COMMENT ON COLUMN versions.canvas_snapshot_hash IS 'Shared canvas snapshot (used when canvas_data is NULL)';
+COMMENT ON COLUMN templates.canvas_snapshot_hash IS 'Shared canvas snapshot (used when canvas_data is NULL)';
@@ -0,0 +1,23 @@
+-- Persistent queue for email and web push notifications
+CREATE TABLE IF NOT EXISTS notification_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    user_id VARCHAR(36) NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    channel VARCHAR(20) NOT NULL,
+    kind VARCHAR(50) NOT NULL DEFAULT 'mention',
+    payload JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    claimed_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    sent_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_jobs_status_available ON notification_jobs(status, available_at);
+CREATE INDEX IF NOT EXISTS idx_notification_jobs_user_channel ON notification_jobs(user_id, channel, status);
+
+-- Add comments
+COMMENT ON TABLE notification_jobs IS 'Notifications queued by request handlers and delivered by the notification dispatcher';
+COMMENT ON COLUMN notification_jobs.available_at IS 'Earliest delivery time (digest window or retry backoff)';
+COMMENT ON COLUMN notification_jobs.claimed_at IS 'When a dispatcher claimed the job; stale claims are retried';
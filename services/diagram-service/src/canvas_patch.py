@@ -0,0 +1,51 @@
+"""
+Merging of collaboration-service write-behind patches into stored canvases.
+
+collaboration-service sends the records changed in a live room as
+
+    {"store": {record_id: fields or null}}
+
+where the fields are only those clients have written through the room's
+CRDT document (e.g. {"x": 120, "y": 40} for a moved shape), not whole
+tldraw records. They are therefore merged into the stored record field by
+field, and the nested `props` and `meta` objects one level deeper; null
+removes the record.
+"""
+
+from typing import Any, Dict
+
+# Record fields holding objects that are merged key by key
+NESTED_RECORD_FIELDS = ("props", "meta")
+
+
+def merge_record(stored: Any, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """A stored record updated with the fields of a patch."""
+    record = dict(stored) if isinstance(stored, dict) else {}
+    for key, value in fields.items():
+        current = record.get(key)
+        if key in NESTED_RECORD_FIELDS and isinstance(current, dict) and isinstance(value, dict):
+            record[key] = {**current, **value}
+        else:
+            record[key] = value
+    return record
+
+
+def apply_canvas_patch(canvas: Any, patch: Dict[str, Any]) -> Dict[str, Any]:
+    """A copy of the canvas with a write-behind store patch merged in.
+
+    Args:
+        canvas: Current canvas data (tldraw snapshot with a `store` object)
+        patch: {"store": {record_id: fields or None}}
+
+    Returns:
+        The merged canvas; the input is not modified
+    """
+    merged = dict(canvas) if isinstance(canvas, dict) else {}
+    store = dict(merged.get('store') or {})
+    for record_id, fields in (patch.get('store') or {}).items():
+        if fields is None:
+            store.pop(record_id, None)
+        else:
+            store[record_id] = merge_record(store.get(record_id), fields)
+    merged['store'] = store
+    return merged
@@ -0,0 +1,154 @@
+"""
+Object storage for oversized canvas snapshots.
+
+Canvas snapshots larger than CANVAS_OFFLOAD_THRESHOLD_BYTES are written to
+MinIO as gzipped JSON under `canvas-snapshots/<hash>.json.gz`; Postgres keeps
+only the pointer and summary metadata (see CanvasSnapshot). Content is
+streamed back on demand and, since snapshots are content-addressed and
+immutable, kept in a small in-process LRU cache bounded by total bytes.
+"""
+
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CANVAS_OFFLOAD_THRESHOLD_BYTES = int(os.getenv("CANVAS_OFFLOAD_THRESHOLD_BYTES", str(1024 * 1024)))  # 1 MB
+CANVAS_STORAGE_BUCKET = os.getenv("CANVAS_STORAGE_BUCKET", "diagrams")
+CANVAS_STORAGE_PREFIX = "canvas-snapshots"
+CANVAS_CACHE_MAX_BYTES = int(os.getenv("CANVAS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 64 MB
+
+_minio_client = None
+_minio_lock = threading.Lock()
+
+
+def get_minio_client():
+    """Get the shared MinIO client, creating it on first use."""
+    global _minio_client
+    if _minio_client is None:
+        with _minio_lock:
+            if _minio_client is None:
+                from minio import Minio
+                _minio_client = Minio(
+                    os.getenv("MINIO_ENDPOINT", "minio:9000"),
+                    access_key=os.getenv("MINIO_ACCESS_KEY", "minioadmin"),
+                    secret_key=os.getenv("MINIO_SECRET_KEY", "minioadmin"),
+                    secure=False
+                )
+    return _minio_client
+
+
+def should_offload(size_bytes: int) -> bool:
+    """Whether a canvas of this encoded size belongs in object storage."""
+    return size_bytes > CANVAS_OFFLOAD_THRESHOLD_BYTES
+
+
+def canvas_summary(canvas: Any) -> Dict[str, Any]:
+    """Small metadata summary kept in Postgres for offloaded canvases."""
+    summary: Dict[str, Any] = {"element_count": 0, "keys": []}
+    if isinstance(canvas, dict):
+        summary["keys"] = sorted(canvas.keys())[:20]
+        for key in ("shapes", "elements", "objects"):
+            if isinstance(canvas.get(key), list):
+                summary["element_count"] = len(canvas[key])
+                break
+    return summary
+
+
+class CanvasContentCache:
+    """LRU cache of loaded canvases keyed by storage key, bounded by bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, canvas: Any, size_bytes: int) -> None:
+        if size_bytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (canvas, size_bytes)
+            self.current_bytes += size_bytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.current_bytes -= entry[1]
+
+
+_content_cache = CanvasContentCache(CANVAS_CACHE_MAX_BYTES)
+
+
+def offload_canvas(content_hash: str, payload: bytes) -> str:
+    """Upload an encoded canvas to object storage.
+
+    Args:
+        content_hash: Snapshot content hash
+        payload: Canonical JSON encoding of the canvas
+
+    Returns:
+        Storage key of the uploaded object
+    """
+    storage_key = f"{CANVAS_STORAGE_PREFIX}/{content_hash}.json.gz"
+    compressed = gzip.compress(payload, compresslevel=6)
+
+    get_minio_client().put_object(
+        CANVAS_STORAGE_BUCKET,
+        storage_key,
+        io.BytesIO(compressed),
+        len(compressed),
+        content_type="application/json",
+        metadata={"Content-Encoding": "gzip", "X-Original-Size": str(len(payload))}
+    )
+
+    logger.info(
+        f"Offloaded canvas snapshot {content_hash[:12]} to object storage "
+        f"({len(payload)} bytes, {len(compressed)} compressed)"
+    )
+    return storage_key
+
+
+def load_offloaded_canvas(storage_key: str) -> Any:
+    """Stream and decode an offloaded canvas from object storage."""
+    cached = _content_cache.get(storage_key)
+    if cached is not None:
+        return cached
+
+    response = get_minio_client().get_object(CANVAS_STORAGE_BUCKET, storage_key)
+    try:
+        with gzip.GzipFile(fileobj=response) as stream:
+            payload = stream.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+    canvas = json.loads(payload)
+    _content_cache.put(storage_key, canvas, len(payload))
+    return canvas
+
+
+def delete_offloaded_canvas(storage_key: str) -> None:
+    """Delete an offloaded canvas (used by snapshot garbage collection)."""
+    _content_cache.discard(storage_key)
+    get_minio_client().remove_object(CANVAS_STORAGE_BUCKET, storage_key)
@@ -1,9 +1,11 @@
 """Email notification service for diagram comments and mentions."""
 import os
+import html
 import logging
+from contextlib import asynccontextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, AsyncIterator
 import aiosmtplib
 
 logger = logging.getLogger(__name__)
@@ -33,7 +35,8 @@ class EmailService:
         comment_content: str,
         diagram_id: str,
         diagram_name: str,
-        comment_id: str
+        comment_id: str,
+        smtp: Optional[aiosmtplib.SMTP] = None
     ) -> bool:
         """
         Send email notification when a user is mentioned in a comment.
@@ -46,6 +49,7 @@ class EmailService:
             diagram_id: ID of the diagram
             diagram_name: Name of the diagram
             comment_id: ID of the comment
+            smtp: Open connection from smtp_connection() to reuse (optional)
 
         Returns:
             True if email sent successfully, False otherwise
@@ -84,9 +88,95 @@ AutoGraph - Collaborative Diagramming
             to_email=to_email,
             subject=subject,
             text_body=text_body,
-            html_body=html_body
+            html_body=html_body,
+            smtp=smtp
         )
 
+    async def send_mention_digest(
+        self,
+        to_email: str,
+        to_name: str,
+        mentions: List[Dict[str, Any]],
+        smtp: Optional[aiosmtplib.SMTP] = None
+    ) -> bool:
+        """
+        Send one email summarizing several mentions of the same user.
+
+        Args:
+            to_email: Recipient email address
+            to_name: Recipient's name
+            mentions: Mention payloads (commenter_name, comment_content,
+                diagram_id, diagram_name, comment_id)
+            smtp: Open connection from smtp_connection() to reuse (optional)
+
+        Returns:
+            True if email sent successfully, False otherwise
+        """
+        if not self.enabled:
+            logger.info(f"Email disabled, skipping mention digest to {to_email}")
+            return True
+
+        subject = f"You were mentioned in {len(mentions)} comments"
+
+        text_lines = [f"Hi {to_name},", "", f"You were mentioned in {len(mentions)} comments:", ""]
+        html_items = []
+        for mention in mentions:
+            comment_url = f"{self.app_url}/canvas/{mention['diagram_id']}#comment-{mention['comment_id']}"
+            text_lines.append(f"- {mention['commenter_name']} on \"{mention['diagram_name']}\":")
+            text_lines.append(f"  \"{mention['comment_content']}\"")
+            text_lines.append(f"  {comment_url}")
+            text_lines.append("")
+            html_items.append(
+                f"<li><strong>{html.escape(mention['commenter_name'])}</strong> on "
+                f"<em>{html.escape(mention['diagram_name'])}</em>:"
+                f"<blockquote>{html.escape(mention['comment_content'])}</blockquote>"
+                f"<a href=\"{comment_url}\">View Comment</a></li>"
+            )
+        text_lines.extend(["---", "AutoGraph - Collaborative Diagramming"])
+
+        html_body = (
+            f"<!DOCTYPE html><html><body>"
+            f"<p>Hi {html.escape(to_name)},</p>"
+            f"<p>You were mentioned in {len(mentions)} comments:</p>"
+            f"<ul>{''.join(html_items)}</ul>"
+            f"<p>AutoGraph - Collaborative Diagramming</p>"
+            f"</body></html>"
+        )
+
+        return await self._send_email(
+            to_email=to_email,
+            subject=subject,
+            text_body="\n".join(text_lines),
+            html_body=html_body,
+            smtp=smtp
+        )
+
+    @asynccontextmanager
+    async def smtp_connection(self) -> AsyncIterator[Optional[aiosmtplib.SMTP]]:
+        """Open an SMTP connection that several sends can reuse.
+
+        Yields None when email is disabled.
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        smtp = aiosmtplib.SMTP(
+            hostname=self.smtp_host,
+            port=self.smtp_port,
+            use_tls=self.smtp_use_tls
+        )
+        await smtp.connect()
+        try:
+            if self.smtp_user:
+                await smtp.login(self.smtp_user, self.smtp_password)
+            yield smtp
+        finally:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
     def _create_mention_email_html(
         self,
         to_name: str,
@@ -229,7 +319,8 @@ AutoGraph - Collaborative Diagramming
         to_email: str,
         subject: str,
         text_body: str,
-        html_body: Optional[str] = None
+        html_body: Optional[str] = None,
+        smtp: Optional[aiosmtplib.SMTP] = None
     ) -> bool:
         """
         Send an email via SMTP.
@@ -239,6 +330,7 @@ AutoGraph - Collaborative Diagramming
             subject: Email subject
             text_body: Plain text email body
             html_body: Optional HTML email body
+            smtp: Open connection to reuse; a new connection is made if None
 
         Returns:
             True if sent successfully, False otherwise
@@ -260,14 +352,17 @@ AutoGraph - Collaborative Diagramming
                 message.attach(html_part)
 
             # Send email
-            await aiosmtplib.send(
-                message,
-                hostname=self.smtp_host,
-                port=self.smtp_port,
-                username=self.smtp_user if self.smtp_user else None,
-                password=self.smtp_password if self.smtp_password else None,
-                use_tls=self.smtp_use_tls
-            )
+            if smtp is not None:
+                await smtp.send_message(message)
+            else:
+                await aiosmtplib.send(
+                    message,
+                    hostname=self.smtp_host,
+                    port=self.smtp_port,
+                    username=self.smtp_user if self.smtp_user else None,
+                    password=self.smtp_password if self.smtp_password else None,
+                    use_tls=self.smtp_use_tls
+                )
 
             logger.info(f"Email sent successfully to {to_email}: {subject}")
             return True
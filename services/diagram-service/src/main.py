@@ -25,9 +25,14 @@ import base64
 from prometheus_client import Counter, Histogram, Gauge, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
 
 # Import database and models
-from .database import get_db
+from .database import get_db, SessionLocal
 from .models import File as FileModel, User, Version, Folder, FolderPermission, Share, Template, Comment, Mention, CommentReaction, CommentRead, CommentHistory, CommentAttachment, ExportHistory, Team, Icon, IconCategory, UserRecentIcon, UserFavoriteIcon, CommentFlag, AuditLog
-from .email_service import get_email_service
+from .notification_dispatcher import NotificationDispatcher, enqueue_mention_notifications
+from shared.python.audit_writer import AuditLogWriter
+from .version_diff import get_version_diff_cache, diff_element_properties, iter_diff_records
+from .snapshot_store import share_canvas, attach_canvas_snapshot, store_canvas_snapshot, set_canvas, canvas_size_bytes, canvas_text_matches, collect_snapshot_garbage
+from .canvas_patch import apply_canvas_patch
+from .share_cache import get_share_cache, serialize_payload, merge_payload, preview_field, record_expires_at, LIVE_FIELD, VERSION_FIELD
 
 load_dotenv()
 
@@ -237,14 +242,15 @@ def compress_version(version: Version, db: Session) -> dict:
     total_original_size = 0
     total_compressed_size = 0
     
-    # Compress canvas_data if present
-    if version.canvas_data:
-        compressed_canvas, canvas_orig, canvas_comp = compress_data(version.canvas_data)
+    # Compress inline canvas_data if present (snapshot-backed canvases are
+    # already deduplicated in canvas_snapshots and are left as references)
+    if version.inline_canvas_data:
+        compressed_canvas, canvas_orig, canvas_comp = compress_data(version.inline_canvas_data)
         version.compressed_canvas_data = compressed_canvas
         total_original_size += canvas_orig
         total_compressed_size += canvas_comp
         # Clear original data to save space
-        version.canvas_data = None
+        version.inline_canvas_data = None
     
     # Compress note_content if present
     if version.note_content:
@@ -286,7 +292,7 @@ def get_version_content(version: Version) -> tuple[Any, Optional[str]]:
     """
     if version.is_compressed:
         # Decompress data
-        canvas_data = decompress_data(version.compressed_canvas_data) if version.compressed_canvas_data else None
+        canvas_data = decompress_data(version.compressed_canvas_data) if version.compressed_canvas_data else version.canvas_data
         note_content = decompress_data(version.compressed_note_content) if version.compressed_note_content else None
     else:
         # Use original data
@@ -296,11 +302,27 @@ def get_version_content(version: Version) -> tuple[Any, Optional[str]]:
     return canvas_data, note_content
 
 
-def calculate_version_size(version: Version) -> int:
+def version_snapshot_hash(db: Session, version: Version, canvas_data: Any) -> Optional[str]:
+    """Get the canvas snapshot hash for a version, storing its canvas if needed.
+    
+    Args:
+        version: Version object
+        canvas_data: The version's (decompressed) canvas data
+        
+    Returns:
+        Content hash of the version's canvas, or None if it has no canvas
+    """
+    if version.canvas_snapshot_hash:
+        return version.canvas_snapshot_hash
+    return store_canvas_snapshot(db, canvas_data)
+
+
+def calculate_version_size(version: Version, db: Session) -> int:
     """Calculate the size of a version in bytes.
     
     Args:
         version: Version object
+        db: Database session
         
     Returns:
         Size in bytes
@@ -309,6 +331,11 @@ def calculate_version_size(version: Version) -> int:
         # For compressed versions, use the stored original_size
         return version.original_size
     
+    if version.canvas_snapshot_hash:
+        # Snapshot-backed versions: use the recorded size, never load the payload
+        note_size = len(version.note_content.encode('utf-8')) if version.note_content else 0
+        return canvas_size_bytes(db, version) + note_size
+    
     # Get the actual content
     canvas_data, note_content = get_version_content(version)
     
@@ -351,6 +378,40 @@ def format_size_human_readable(size_bytes: int) -> dict:
 
 shutdown_state = ShutdownState()
 
+# Audit events are queued and written in batches by a background task
+audit_writer = AuditLogWriter(
+    SessionLocal,
+    AuditLog.__table__,
+    max_queue_size=int(os.getenv("AUDIT_QUEUE_MAX_SIZE", "10000")),
+    batch_size=int(os.getenv("AUDIT_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+)
+
+# Mention emails and push notifications are queued and delivered in the background
+notification_dispatcher = NotificationDispatcher(SessionLocal)
+
+# Public share views are counted in Redis and written to the database in batches
+SHARE_VIEW_FLUSH_INTERVAL = float(os.getenv("SHARE_VIEW_FLUSH_INTERVAL", "30"))
+
+
+def flush_share_views() -> int:
+    """Write buffered share view counts to the database."""
+    db = SessionLocal()
+    try:
+        return get_share_cache().flush_views(db)
+    finally:
+        db.close()
+
+
+async def share_view_flush_loop():
+    """Periodically flush buffered share view counts."""
+    while True:
+        await asyncio.sleep(SHARE_VIEW_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(flush_share_views)
+        except Exception as e:
+            logger.warning("Failed to flush share view counts", error=str(e))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan - startup and shutdown."""
@@ -372,6 +433,15 @@ async def lifespan(app: FastAPI):
     signal.signal(signal.SIGTERM, handle_shutdown)
     signal.signal(signal.SIGINT, handle_shutdown)
     
+    # Start background audit log writer
+    await audit_writer.start()
+    
+    # Start share view count flusher
+    share_view_task = asyncio.create_task(share_view_flush_loop())
+    
+    # Start notification dispatcher
+    await notification_dispatcher.start()
+    
     logger.info("Diagram Service started successfully")
     
     yield
@@ -402,6 +472,15 @@ async def lifespan(app: FastAPI):
     else:
         logger.info("All requests completed, shutting down cleanly")
     
+    # Drain queued audit events and share view counts before exiting
+    await notification_dispatcher.stop()
+    await audit_writer.stop()
+    share_view_task.cancel()
+    try:
+        await asyncio.to_thread(flush_share_views)
+    except Exception as e:
+        logger.warning("Failed to flush share view counts on shutdown", error=str(e))
+    
     logger.info("Diagram Service shutdown complete")
 
 app = FastAPI(
@@ -591,12 +670,32 @@ def format_size_display(size_bytes: int) -> str:
         return f"{size_gb:.2f} GB"
 
 
-def enrich_diagram_response(diagram: File) -> Dict[str, Any]:
-    """Enrich diagram with calculated fields like size."""
-    diagram_dict = DiagramResponse.model_validate(diagram).model_dump()
-    size_bytes = calculate_diagram_size(diagram)
+def update_diagram_size(db: Session, diagram: File) -> None:
+    """Record the diagram's size so listings never need to load its canvas."""
+    note_size = len(diagram.note_content.encode('utf-8')) if diagram.note_content else 0
+    diagram.size_bytes = canvas_size_bytes(db, diagram) + note_size
+
+
+def enrich_diagram_response(diagram: File, include_content: bool = True) -> Dict[str, Any]:
+    """Enrich diagram with calculated fields like size.
+    
+    Listings pass include_content=False: canvas_data is omitted and the
+    stored size_bytes is used, so the (possibly offloaded) canvas is not
+    loaded; rows without a stored size report None rather than loading it.
+    """
+    if include_content:
+        diagram_dict = DiagramResponse.model_validate(diagram).model_dump()
+        size_bytes = calculate_diagram_size(diagram)
+    else:
+        diagram_dict = DiagramResponse.model_validate({
+            field: getattr(diagram, field)
+            for field in DiagramResponse.model_fields
+            if field not in ("canvas_data", "size_bytes", "size_display")
+        }).model_dump()
+        # Backfilled by add_canvas_snapshot_offload.sql; never measured here (one query per row)
+        size_bytes = diagram.size_bytes
     diagram_dict['size_bytes'] = size_bytes
-    diagram_dict['size_display'] = format_size_display(size_bytes)
+    diagram_dict['size_display'] = format_size_display(size_bytes) if size_bytes is not None else None
     return diagram_dict
 
 
@@ -609,11 +708,14 @@ def create_audit_log(
     ip_address: str = None,
     user_agent: str = None,
     extra_data: dict = None
-) -> AuditLog:
-    """Create an audit log entry.
+) -> None:
+    """Record an audit log entry.
+
+    The entry is queued for the background audit writer; it is only written
+    synchronously with `db` when the writer is not running or its queue is full.
 
     Args:
-        db: Database session
+        db: Database session (used for the synchronous fallback)
         action: Action performed (e.g., 'create_diagram', 'update_diagram', 'delete_diagram')
         user_id: User ID (optional for actions like failed login)
         resource_type: Type of resource affected (optional)
@@ -621,23 +723,21 @@ def create_audit_log(
         ip_address: IP address of request
         user_agent: User agent string
         extra_data: Additional metadata (optional)
-
-    Returns:
-        Created AuditLog instance
     """
-    audit_log = AuditLog(
-        user_id=user_id,
-        action=action,
-        resource_type=resource_type,
-        resource_id=resource_id,
-        ip_address=ip_address,
-        user_agent=user_agent,
-        extra_data=extra_data
-    )
-    db.add(audit_log)
+    entry = {
+        "user_id": user_id,
+        "action": action,
+        "resource_type": resource_type,
+        "resource_id": resource_id,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "extra_data": extra_data
+    }
+    if audit_writer.enqueue(entry):
+        return
+
+    db.add(AuditLog(**entry))
     db.commit()
-    db.refresh(audit_log)
-    return audit_log
 
 
 @app.get("/")
@@ -762,7 +862,7 @@ async def list_diagrams(
                     # Exact case-insensitive matches (backward compatibility)
                     File.title.ilike(search_pattern),
                     File.note_content.ilike(search_pattern),
-                    cast(File.canvas_data, String).ilike(search_pattern),
+                    canvas_text_matches(FileModel, search_pattern),
                     # Fuzzy matches for typo tolerance (new)
                     # Use COALESCE to handle NULL values (similarity returns NULL if input is NULL)
                     func.coalesce(func.similarity(File.title, search_terms), 0) > 0.3,
@@ -838,7 +938,7 @@ async def list_diagrams(
     )
     
     return {
-        "diagrams": [enrich_diagram_response(d) for d in diagrams],
+        "diagrams": [enrich_diagram_response(d, include_content=False) for d in diagrams],
         "total": total,
         "page": page,
         "page_size": page_size,
@@ -896,7 +996,7 @@ async def list_recent_diagrams(
     )
     
     return {
-        "diagrams": [enrich_diagram_response(d) for d in diagrams],
+        "diagrams": [enrich_diagram_response(d, include_content=False) for d in diagrams],
         "total": len(diagrams),
         "limit": limit
     }
@@ -943,7 +1043,7 @@ async def list_starred_diagrams(
     )
     
     return {
-        "diagrams": [enrich_diagram_response(d) for d in diagrams],
+        "diagrams": [enrich_diagram_response(d, include_content=False) for d in diagrams],
         "total": len(diagrams)
     }
 
@@ -988,7 +1088,7 @@ async def list_trash_diagrams(
     )
     
     return {
-        "diagrams": [enrich_diagram_response(d) for d in diagrams],
+        "diagrams": [enrich_diagram_response(d, include_content=False) for d in diagrams],
         "total": len(diagrams)
     }
 
@@ -1040,7 +1140,7 @@ async def list_shared_with_me(
         # Get owner info
         owner = db.query(User).filter(User.id == diagram.owner_id).first()
         
-        diagram_data = enrich_diagram_response(diagram)
+        diagram_data = enrich_diagram_response(diagram, include_content=False)
         diagram_data['permission'] = share.permission if share else 'view'
         diagram_data['owner_email'] = owner.email if owner else 'Unknown'
         diagram_data['shared_at'] = share.created_at.isoformat() if share else None
@@ -1115,7 +1215,7 @@ async def list_team_files(
         # Get owner info
         owner = db.query(User).filter(User.id == diagram.owner_id).first()
         
-        diagram_data = enrich_diagram_response(diagram)
+        diagram_data = enrich_diagram_response(diagram, include_content=False)
         diagram_data['owner_email'] = owner.email if owner else 'Unknown'
         
         # Get team name
@@ -1212,6 +1312,9 @@ class UpdateDiagramRequest(BaseModel):
     description: Optional[str] = None  # Version description
     expected_version: Optional[int] = None  # For optimistic locking
     tags: Optional[list[str]] = None
+    # Records to merge into canvas_data["store"] (None deletes a record); sent
+    # by collaboration-service instead of the whole canvas
+    canvas_patch: Optional[Dict[str, Any]] = None
     
     @validator('title')
     def validate_title(cls, v):
@@ -1305,11 +1408,11 @@ def create_version_snapshot(db: Session, file: File, description: Optional[str]
     ).order_by(Version.version_number.desc()).first()
     next_version_number = (latest_version.version_number + 1) if latest_version else 1
     
-    # Create new version
+    # Create new version (shares the file's canvas snapshot)
     new_version = Version(
         file_id=file.id,
         version_number=next_version_number,
-        canvas_data=file.canvas_data,
+        canvas_snapshot_hash=share_canvas(db, file),
         note_content=file.note_content,
         description=description,
         created_by=created_by
@@ -1433,12 +1536,14 @@ async def create_diagram(
         title=diagram.title,
         owner_id=user_id,
         file_type=diagram.file_type,
-        canvas_data=diagram.canvas_data,
         note_content=diagram.note_content,
         folder_id=diagram.folder_id,
         tags=diagram.tags or [],
         last_activity=datetime.utcnow()  # Set initial last_activity
     )
+    # Oversized canvases are offloaded to object storage
+    set_canvas(db, new_diagram, diagram.canvas_data)
+    update_diagram_size(db, new_diagram)
     
     db.add(new_diagram)
     db.flush()  # Get the diagram ID without committing yet
@@ -1535,13 +1640,13 @@ async def create_template(
             description=template.description,
             owner_id=user_id,
             file_type=template.file_type,
-            canvas_data=template.canvas_data,
             note_content=template.note_content,
             category=template.category,
             tags=template.tags or [],
             is_public=template.is_public,
             usage_count=0
         )
+        set_canvas(db, new_template, template.canvas_data)
         
         db.add(new_template)
         db.commit()
@@ -1720,17 +1825,21 @@ async def create_diagram_from_template(
         if template.owner_id != user_id and not template.is_public:
             raise HTTPException(status_code=403, detail="You do not have access to this template")
         
+        # Diagram and initial version reference the template's canvas snapshot
+        template_snapshot_hash = share_canvas(db, template)
+        
         # Create new diagram from template
         new_diagram = FileModel(
             id=str(uuid.uuid4()),
             title=f"{template.name} (from template)",
             owner_id=user_id,
             file_type=template.file_type,
-            canvas_data=template.canvas_data,
+            canvas_snapshot_hash=template_snapshot_hash,
             note_content=template.note_content,
             current_version=1,
             last_activity=datetime.utcnow()  # Set initial last_activity
         )
+        update_diagram_size(db, new_diagram)
         
         db.add(new_diagram)
         
@@ -1742,7 +1851,7 @@ async def create_diagram_from_template(
             id=str(uuid.uuid4()),
             file_id=new_diagram.id,
             version_number=1,
-            canvas_data=template.canvas_data,
+            canvas_snapshot_hash=template_snapshot_hash,
             note_content=template.note_content,
             description="Created from template",
             created_by=user_id
@@ -3210,11 +3319,16 @@ async def update_diagram(
         user_id=user_id
     )
     
-    # Query diagram (exclude deleted)
-    diagram = db.query(FileModel).filter(
+    # Query diagram (exclude deleted). A canvas_patch is merged into the
+    # stored canvas, so lock the row until commit: concurrent write-behind
+    # flushes (or a flush and a PUT) must not merge against the same snapshot
+    diagram_query = db.query(FileModel).filter(
         FileModel.id == diagram_id,
         FileModel.is_deleted == False
-    ).first()
+    )
+    if update_data.canvas_patch is not None:
+        diagram_query = diagram_query.with_for_update()
+    diagram = diagram_query.first()
     
     if not diagram:
         logger.warning(
@@ -3325,6 +3439,10 @@ async def update_diagram(
                 detail=f"Diagram was modified by another user. Expected version {update_data.expected_version}, but current version is {diagram.current_version}. Please refresh and try again."
             )
     
+    # Merge a store patch from collaboration-service write-behind into the current canvas
+    if update_data.canvas_patch is not None and update_data.canvas_data is None:
+        update_data.canvas_data = apply_canvas_patch(diagram.canvas_data, update_data.canvas_patch)
+
     # Major edit detection: Check if 10+ elements were deleted
     # IMPORTANT: Must check BEFORE updating diagram.canvas_data
     is_major_edit = False
@@ -3366,9 +3484,11 @@ async def update_diagram(
     if update_data.title is not None:
         diagram.title = update_data.title
     if update_data.canvas_data is not None:
-        diagram.canvas_data = update_data.canvas_data
+        set_canvas(db, diagram, update_data.canvas_data)
     if update_data.note_content is not None:
         diagram.note_content = update_data.note_content
+    if update_data.canvas_data is not None or update_data.note_content is not None:
+        update_diagram_size(db, diagram)
     if update_data.tags is not None:
         diagram.tags = update_data.tags
     
@@ -3419,7 +3539,7 @@ async def update_diagram(
             id=str(uuid.uuid4()),
             file_id=diagram_id,
             version_number=next_version_number,
-            canvas_data=diagram.canvas_data if update_data.canvas_data is not None else None,
+            canvas_snapshot_hash=share_canvas(db, diagram) if update_data.canvas_data is not None else None,
             note_content=diagram.note_content if update_data.note_content is not None else None,
             description=version_description,
             created_by=user_id
@@ -3435,6 +3555,10 @@ async def update_diagram(
         # Commit first so the version exists before generating thumbnail
         db.commit()
         
+        # Precompute diff against the previous version for the timeline scrubber
+        if new_version.canvas_data is not None:
+            prime_version_diff(db, new_version, new_version.canvas_data)
+        
         # Generate thumbnail for the version (async call)
         if diagram.canvas_data:
             try:
@@ -3498,60 +3622,68 @@ async def update_diagram(
     # Update metrics
     diagrams_updated.inc()
 
-    print(f"DEBUG: About to send WebSocket notification for diagram {diagram_id}")
+    # Writes from collaboration-service already reached every client in the room
+    if request.headers.get("X-Collaboration-Write-Behind"):
+        logger.info(
+            "Skipping WebSocket notification for collaboration write-behind",
+            correlation_id=correlation_id,
+            diagram_id=diagram_id
+        )
+    else:
+        print(f"DEBUG: About to send WebSocket notification for diagram {diagram_id}")
     
-    # Send WebSocket notification to collaborators
-    collaboration_service_url = os.getenv("COLLABORATION_SERVICE_URL", "http://localhost:8083")
-    room_id = f"file:{diagram_id}"
+        # Send WebSocket notification to collaborators
+        collaboration_service_url = os.getenv("COLLABORATION_SERVICE_URL", "http://localhost:8083")
+        room_id = f"file:{diagram_id}"
     
-    logger.info(
-        "Attempting to send WebSocket notification",
-        correlation_id=correlation_id,
-        diagram_id=diagram_id,
-        room_id=room_id,
-        collaboration_service_url=collaboration_service_url
-    )
+        logger.info(
+            "Attempting to send WebSocket notification",
+            correlation_id=correlation_id,
+            diagram_id=diagram_id,
+            room_id=room_id,
+            collaboration_service_url=collaboration_service_url
+        )
     
-    try:
-        async with httpx.AsyncClient(timeout=2.0) as client:
-            response = await client.post(
-                f"{collaboration_service_url}/broadcast/{room_id}",
-                json={
-                    "type": "diagram_updated",
-                    "diagram_id": diagram_id,
-                    "user_id": user_id,
-                    "version": diagram.current_version,
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "changes": {
-                        "title": update_data.title is not None,
-                        "canvas_data": update_data.canvas_data is not None,
-                        "note_content": update_data.note_content is not None
+        try:
+            async with httpx.AsyncClient(timeout=2.0) as client:
+                response = await client.post(
+                    f"{collaboration_service_url}/broadcast/{room_id}",
+                    json={
+                        "type": "diagram_updated",
+                        "diagram_id": diagram_id,
+                        "user_id": user_id,
+                        "version": diagram.current_version,
+                        "timestamp": datetime.utcnow().isoformat(),
+                        "changes": {
+                            "title": update_data.title is not None,
+                            "canvas_data": update_data.canvas_data is not None,
+                            "note_content": update_data.note_content is not None
+                        }
                     }
-                }
-            )
+                )
             
-            logger.info(
-                "WebSocket notification sent",
+                logger.info(
+                    "WebSocket notification sent",
+                    correlation_id=correlation_id,
+                    diagram_id=diagram_id,
+                    room_id=room_id,
+                    status_code=response.status_code
+                )
+        except Exception as e:
+            # Don't fail the update if WebSocket notification fails
+            logger.warning(
+                "Failed to send WebSocket notification",
                 correlation_id=correlation_id,
                 diagram_id=diagram_id,
-                room_id=room_id,
-                status_code=response.status_code
+                error=str(e),
+                error_type=type(e).__name__
+            )
+            import traceback
+            logger.warning(
+                "WebSocket notification traceback",
+                correlation_id=correlation_id,
+                traceback=traceback.format_exc()
             )
-    except Exception as e:
-        # Don't fail the update if WebSocket notification fails
-        logger.warning(
-            "Failed to send WebSocket notification",
-            correlation_id=correlation_id,
-            diagram_id=diagram_id,
-            error=str(e),
-            error_type=type(e).__name__
-        )
-        import traceback
-        logger.warning(
-            "WebSocket notification traceback",
-            correlation_id=correlation_id,
-            traceback=traceback.format_exc()
-        )
     
     logger.info(
         "Diagram updated successfully",
@@ -3920,12 +4052,15 @@ async def duplicate_diagram(
     if not duplicate_title.endswith(" (Copy)"):
         duplicate_title = f"{duplicate_title} (Copy)"
     
+    # Duplicate and its initial version reference the original's canvas snapshot
+    snapshot_hash = share_canvas(db, original)
+    
     # Create new diagram
     duplicate = FileModel(
         id=duplicate_id,
         title=duplicate_title,
         file_type=original.file_type,
-        canvas_data=original.canvas_data,  # Copy canvas data exactly
+        canvas_snapshot_hash=snapshot_hash,  # Same canvas, no copy
         note_content=original.note_content,  # Copy note content exactly
         owner_id=user_id,
         team_id=original.team_id,
@@ -3936,6 +4071,7 @@ async def duplicate_diagram(
         updated_at=datetime.utcnow()
     )
     
+    update_diagram_size(db, duplicate)
     db.add(duplicate)
     
     # Create initial version for duplicate
@@ -3943,7 +4079,7 @@ async def duplicate_diagram(
         id=str(uuid.uuid4()),
         file_id=duplicate_id,
         version_number=1,
-        canvas_data=original.canvas_data,
+        canvas_snapshot_hash=snapshot_hash,
         note_content=original.note_content,
         created_by=user_id,
         created_at=datetime.utcnow()
@@ -4258,7 +4394,7 @@ async def get_versions(
             or_(
                 Version.description.ilike(search_term),
                 Version.label.ilike(search_term),
-                cast(Version.canvas_data, String).ilike(search_term),
+                canvas_text_matches(Version, search_term),
                 Version.note_content.ilike(search_term)
             )
         )
@@ -4318,7 +4454,7 @@ async def get_versions(
     enriched_versions = []
     for v in versions:
         # Calculate version size
-        version_size_bytes = calculate_version_size(v)
+        version_size_bytes = calculate_version_size(v, db)
         size_info = format_size_human_readable(version_size_bytes)
         
         enriched_versions.append({
@@ -4550,79 +4686,156 @@ async def get_shared_diagram(
         token=token[:10] + "..."
     )
     
-    # Find share by token
-    share = db.query(Share).filter(Share.token == token).first()
+    # Find share by token (cached record, database on miss)
+    record = load_share_record(db, token)
     
-    if not share:
+    if not record:
         logger.warning(
             "Share not found",
             token=token[:10] + "..."
         )
         raise HTTPException(status_code=404, detail="Share link not found")
     
-    # Get current time for timezone-aware operations
-    from datetime import timezone
-    now_utc = datetime.now(timezone.utc)
-    
     # Check if expired
-    if share.expires_at:
-        if share.expires_at < now_utc:
-            logger.warning("Share link expired", token=token[:10] + "...")
-            raise HTTPException(status_code=410, detail="Share link has expired")
+    expires_at = record_expires_at(record)
+    if expires_at and expires_at < datetime.now(timezone.utc):
+        logger.warning("Share link expired", token=token[:10] + "...")
+        raise HTTPException(status_code=410, detail="Share link has expired")
     
     # Check password if required
-    if share.password_hash:
+    if record["password_hash"]:
         if not password:
             raise HTTPException(status_code=401, detail="Password required")
         
         import bcrypt
-        if not bcrypt.checkpw(password.encode('utf-8'), share.password_hash.encode('utf-8')):
+        if not bcrypt.checkpw(password.encode('utf-8'), record["password_hash"].encode('utf-8')):
             logger.warning(
                 "Invalid password for shared diagram",
                 token=token[:10] + "..."
             )
             raise HTTPException(status_code=401, detail="Invalid password")
     
-    # Get diagram
-    diagram = db.query(FileModel).filter(
-        File.id == share.file_id,
-        File.is_deleted == False
-    ).first()
+    # Get pre-serialized diagram snapshot
+    snapshot = get_share_cache().load_snapshot(
+        record["file_id"],
+        LIVE_FIELD,
+        lambda: build_shared_diagram_snapshot(db, record["file_id"])
+    )
     
-    if not diagram:
+    if snapshot is None:
         logger.warning(
             "Shared diagram not found or deleted",
             token=token[:10] + "...",
-            file_id=share.file_id
+            file_id=record["file_id"]
         )
         raise HTTPException(status_code=404, detail="Diagram not found or has been deleted")
     
     # Update view count and last accessed
+    view_count, last_accessed_at = count_share_view(db, record)
+    
+    logger.info(
+        "Shared diagram accessed successfully",
+        token=token[:10] + "...",
+        diagram_id=record["file_id"],
+        view_count=view_count
+    )
+    
+    return Response(
+        content=merge_payload(snapshot, {
+            "permission": record["permission"],
+            "is_public": record["is_public"],
+            "view_count": view_count,
+            "last_accessed_at": last_accessed_at
+        }),
+        media_type="application/json"
+    )
+
+
+@app.get("/shared/{token}/preview.png")
+async def get_shared_diagram_preview(
+    token: str,
+    password: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Rendered PNG preview of a shared diagram (same access rules as /shared/{token})."""
+    record = load_share_record(db, token)
+    if not record:
+        raise HTTPException(status_code=404, detail="Share link not found")
+    
+    expires_at = record_expires_at(record)
+    if expires_at and expires_at < datetime.now(timezone.utc):
+        raise HTTPException(status_code=410, detail="Share link has expired")
+    
+    if record["password_hash"]:
+        import bcrypt
+        if not password or not bcrypt.checkpw(password.encode('utf-8'), record["password_hash"].encode('utf-8')):
+            raise HTTPException(status_code=401, detail="Password required")
+    
+    snapshot = get_share_cache().load_snapshot(
+        record["file_id"],
+        LIVE_FIELD,
+        lambda: build_shared_diagram_snapshot(db, record["file_id"])
+    )
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Diagram not found or has been deleted")
+    
+    return await shared_preview_response(record["file_id"], snapshot)
+
+
+def load_share_record(db: Session, token: str) -> Optional[Dict[str, Any]]:
+    """Get the cached share record for a token, loading it on a cache miss."""
+    share_cache = get_share_cache()
+    record = share_cache.get_record(token)
+    if record is None:
+        share = db.query(Share).filter(Share.token == token).first()
+        if not share:
+            return None
+        record = share_cache.put_record(share)
+    return record
+
+
+def count_share_view(db: Session, record: Dict[str, Any]) -> tuple:
+    """Count a share view.
+    
+    Views are buffered in Redis and flushed in batches; without Redis the
+    share row is updated directly.
+    
+    Returns:
+        (view_count, last_accessed_at ISO string)
+    """
+    now_utc = datetime.now(timezone.utc)
+    pending = get_share_cache().record_view(record["token"])
+    if pending is not None:
+        return record["view_count"] + pending, now_utc.isoformat()
+    
+    share = db.query(Share).filter(Share.id == record["id"]).first()
+    if not share:
+        return record["view_count"], now_utc.isoformat()
     share.view_count = (share.view_count or 0) + 1
     share.last_accessed_at = now_utc
     db.commit()
-    db.refresh(share)  # Refresh to get the latest data
+    return share.view_count, now_utc.isoformat()
+
+
+def build_shared_diagram_snapshot(db: Session, file_id: str) -> Optional[bytes]:
+    """Serialize the share-independent part of a shared diagram response."""
+    diagram = db.query(FileModel).filter(
+        FileModel.id == file_id,
+        FileModel.is_deleted == False
+    ).first()
+    
+    if not diagram:
+        return None
     
     # Get owner info
     owner = db.query(User).filter(User.id == diagram.owner_id).first()
     
-    logger.info(
-        "Shared diagram accessed successfully",
-        token=token[:10] + "...",
-        diagram_id=diagram.id,
-        view_count=share.view_count
-    )
-    
-    return {
+    return serialize_payload({
         "id": diagram.id,
         "title": diagram.title,
         "type": diagram.file_type,
         "canvas_data": diagram.canvas_data,
         "note_content": diagram.note_content,
-        "permission": share.permission,
-        "is_public": share.is_public,
-        "view_count": share.view_count,
-        "last_accessed_at": share.last_accessed_at.isoformat() if share.last_accessed_at else None,
         "owner": {
             "id": owner.id if owner else None,
             "full_name": owner.full_name if owner else "Unknown",
@@ -4630,7 +4843,76 @@ async def get_shared_diagram(
         },
         "created_at": diagram.created_at.isoformat(),
         "updated_at": diagram.updated_at.isoformat()
-    }
+    })
+
+
+def build_shared_version_snapshot(db: Session, file_id: str, version_id: str) -> Optional[bytes]:
+    """Serialize a shared version response."""
+    version = db.query(Version).filter(
+        Version.id == version_id
+    ).first()
+    
+    if not version:
+        logger.warning("Shared version access failed - version not found", version_id=version_id)
+        return None
+    
+    # Get diagram info
+    diagram = db.query(FileModel).filter(FileModel.id == file_id).first()
+    
+    if not diagram:
+        logger.warning("Shared version access failed - diagram not found", diagram_id=file_id)
+        return None
+    
+    canvas_data, note_content = get_version_content(version)
+    
+    # Return version data (read-only)
+    return serialize_payload({
+        "id": diagram.id,
+        "title": diagram.title,
+        "type": diagram.file_type,
+        "version_number": version.version_number,
+        "version_label": version.label,
+        "version_description": version.description,
+        "canvas_data": canvas_data,
+        "note_content": note_content,
+        "created_at": version.created_at.isoformat(),
+        "permission": "view",
+        "is_read_only": True  # Versions are always read-only
+    })
+
+
+async def shared_preview_response(file_id: str, snapshot: bytes) -> Response:
+    """PNG preview of a snapshot, rendered by the export service on a cache miss."""
+    share_cache = get_share_cache()
+    field = preview_field(snapshot)
+    png = share_cache.get_snapshot(file_id, field)
+    
+    if png is None:
+        payload = json.loads(snapshot)
+        export_service_url = os.getenv("EXPORT_SERVICE_URL", "http://export-service:8097")
+        try:
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                response = await client.post(
+                    f"{export_service_url}/thumbnail",
+                    json={
+                        "diagram_id": payload["id"],
+                        "canvas_data": payload.get("canvas_data") or {},
+                        "width": 512,
+                        "height": 512
+                    }
+                )
+            response.raise_for_status()
+            png = base64.b64decode(response.json()["thumbnail_base64"])
+        except Exception as e:
+            logger.error("Failed to render shared preview", diagram_id=file_id, error=str(e))
+            raise HTTPException(status_code=502, detail="Preview rendering failed")
+        share_cache.put_snapshot(file_id, field, png)
+    
+    return Response(
+        content=png,
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=60"}
+    )
 
 
 @app.delete("/{diagram_id}/share/{share_id}")
@@ -5057,62 +5339,29 @@ async def create_comment(
             db.add(mention)
             mentioned_users_list.append(mentioned_user)
 
-    db.commit()
-    db.refresh(new_comment)
-
     # Get user info for response
     user = db.query(User).filter(User.id == user_id).first()
 
-    # Send email notifications for mentions (async, non-blocking)
+    # Queue mention notifications in the same transaction as the comment
     if mentioned_users_list:
-        from .push_notification_service import get_push_notification_service
-
-        email_service = get_email_service()
-        push_service = get_push_notification_service()
-        commenter_name = user.full_name if user and user.full_name else user.email if user else "Someone"
-        diagram_name = diagram.title if diagram and diagram.title else "Untitled Diagram"
+        enqueue_mention_notifications(
+            db,
+            mentioned_users_list,
+            commenter_name=user.full_name if user and user.full_name else user.email if user else "Someone",
+            comment_content=comment_data.content,
+            diagram_id=diagram_id,
+            diagram_name=diagram.title if diagram.title else "Untitled Diagram",
+            comment_id=new_comment.id,
+            position={"x": comment_data.position_x, "y": comment_data.position_y}
+            if comment_data.position_x is not None else None
+        )
 
-        for mentioned_user in mentioned_users_list:
-            # Send email notification
-            try:
-                await email_service.send_mention_notification(
-                    to_email=mentioned_user.email,
-                    to_name=mentioned_user.full_name if mentioned_user.full_name else mentioned_user.email.split('@')[0],
-                    commenter_name=commenter_name,
-                    comment_content=comment_data.content,
-                    diagram_id=diagram_id,
-                    diagram_name=diagram_name,
-                    comment_id=new_comment.id
-                )
-            except Exception as e:
-                # Log error but don't fail the comment creation
-                logger.error(
-                    "Failed to send mention email notification",
-                    correlation_id=correlation_id,
-                    mentioned_user=mentioned_user.email,
-                    error=str(e)
-                )
+    db.commit()
+    db.refresh(new_comment)
 
-            # Send push notification
-            try:
-                await push_service.send_mention_notification(
-                    db=db,
-                    user_id=mentioned_user.id,
-                    commenter_name=commenter_name,
-                    comment_content=comment_data.content,
-                    diagram_id=diagram_id,
-                    diagram_name=diagram_name,
-                    comment_id=new_comment.id,
-                    position=comment_data.position
-                )
-            except Exception as e:
-                # Log error but don't fail the comment creation
-                logger.error(
-                    "Failed to send push notification",
-                    correlation_id=correlation_id,
-                    mentioned_user=mentioned_user.email,
-                    error=str(e)
-                )
+    # Mention emails and push notifications are delivered by the dispatcher
+    if mentioned_users_list:
+        notification_dispatcher.notify()
     
     logger.info(
         "Comment created successfully",
@@ -6320,7 +6569,7 @@ async def create_version(
         id=str(uuid.uuid4()),
         file_id=diagram_id,
         version_number=next_version_number,
-        canvas_data=diagram.canvas_data,
+        canvas_snapshot_hash=share_canvas(db, diagram),
         note_content=diagram.note_content,
         description=version_data.description,
         label=version_data.label,
@@ -6331,6 +6580,9 @@ async def create_version(
     db.commit()
     db.refresh(new_version)
     
+    # Precompute diff against the previous version for the timeline scrubber
+    prime_version_diff(db, new_version, diagram.canvas_data)
+    
     # Generate thumbnail for the version (async call)
     if diagram.canvas_data:
         try:
@@ -6426,7 +6678,7 @@ async def get_versions(
             or_(
                 Version.description.ilike(search_term),
                 Version.label.ilike(search_term),
-                cast(Version.canvas_data, String).ilike(search_term),
+                canvas_text_matches(Version, search_term),
                 Version.note_content.ilike(search_term)
             )
         )
@@ -6484,7 +6736,7 @@ async def get_versions(
         user = db.query(User).filter(User.id == version.created_by).first()
         
         # Calculate version size
-        version_size_bytes = calculate_version_size(version)
+        version_size_bytes = calculate_version_size(version, db)
         size_info = format_size_human_readable(version_size_bytes)
         
         version_dict = {
@@ -6528,14 +6780,21 @@ async def compare_versions(
     v1: int,
     v2: int,
     request: Request,
+    include_content: bool = False,
+    format: str = "json",
     db: Session = Depends(get_db)
 ):
     """Compare two versions and return differences.
     
+    Only changed elements are returned; modifications carry property-level
+    changes. Diffs are cached per version pair (see version_diff.py).
+    
     Args:
         diagram_id: The diagram ID
         v1: First version number
         v2: Second version number
+        include_content: Also return both full canvases (legacy behaviour)
+        format: "json" (default) or "ndjson" to stream one change per line
     
     Returns:
         Comparison data with additions, deletions, and modifications
@@ -6546,6 +6805,9 @@ async def compare_versions(
     if not user_id:
         raise HTTPException(status_code=401, detail="Authentication required")
     
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    
     logger.info(
         "Comparing versions",
         correlation_id=correlation_id,
@@ -6569,125 +6831,89 @@ async def compare_versions(
     if not version1 or not version2:
         raise HTTPException(status_code=404, detail="One or both versions not found")
     
-    # Get canvas data (decompress if necessary)
-    canvas1, _ = get_version_content(version1)
-    canvas2, _ = get_version_content(version2)
-    
-    canvas1 = canvas1 or {}
-    canvas2 = canvas2 or {}
-    
-    # Extract elements from canvas data
-    # Try different common keys for elements (shapes, elements, objects, etc.)
-    elements1 = {}
-    elements2 = {}
-    
-    # Get elements from canvas1
-    if isinstance(canvas1, dict):
-        if 'shapes' in canvas1:
-            elements1 = {str(s.get('id', i)): s for i, s in enumerate(canvas1.get('shapes', []))}
-        elif 'elements' in canvas1:
-            elements1 = {str(e.get('id', i)): e for i, e in enumerate(canvas1.get('elements', []))}
-        elif 'objects' in canvas1:
-            elements1 = {str(o.get('id', i)): o for i, o in enumerate(canvas1.get('objects', []))}
-    
-    # Get elements from canvas2
-    if isinstance(canvas2, dict):
-        if 'shapes' in canvas2:
-            elements2 = {str(s.get('id', i)): s for i, s in enumerate(canvas2.get('shapes', []))}
-        elif 'elements' in canvas2:
-            elements2 = {str(e.get('id', i)): e for i, e in enumerate(canvas2.get('elements', []))}
-        elif 'objects' in canvas2:
-            elements2 = {str(o.get('id', i)): o for i, o in enumerate(canvas2.get('objects', []))}
-    
-    # Calculate differences
-    ids1 = set(elements1.keys())
-    ids2 = set(elements2.keys())
-    
-    # Additions: in v2 but not in v1
-    added_ids = ids2 - ids1
-    additions = [elements2[id] for id in added_ids]
-    
-    # Deletions: in v1 but not in v2
-    deleted_ids = ids1 - ids2
-    deletions = [elements1[id] for id in deleted_ids]
-    
-    # Modifications: in both but different
-    common_ids = ids1 & ids2
-    modifications = []
-    for id in common_ids:
-        elem1 = elements1[id]
-        elem2 = elements2[id]
-        # Simple comparison - consider different if not equal
-        if elem1 != elem2:
-            modifications.append({
-                "id": id,
-                "before": elem1,
-                "after": elem2,
-                "changes": _detect_element_changes(elem1, elem2)
-            })
+    # Element-hash diff, cached per version pair. Version content is only
+    # decompressed when the element index for that version is not cached.
+    diff_cache = get_version_diff_cache()
+    diff = diff_cache.get_diff(
+        version1.id,
+        version2.id,
+        lambda: get_version_content(version1)[0],
+        lambda: get_version_content(version2)[0]
+    )
     
     # Compare note content
     note1 = version1.note_content or ""
     note2 = version2.note_content or ""
     note_changed = note1 != note2
     
-    # Get user info for both versions
-    user1 = db.query(User).filter(User.id == version1.created_by).first()
-    user2 = db.query(User).filter(User.id == version2.created_by).first()
-    
     logger.info(
         "Version comparison completed",
         correlation_id=correlation_id,
         diagram_id=diagram_id,
-        additions=len(additions),
-        deletions=len(deletions),
-        modifications=len(modifications),
+        additions=diff["summary"]["added_count"],
+        deletions=diff["summary"]["deleted_count"],
+        modifications=diff["summary"]["modified_count"],
         note_changed=note_changed
     )
     
-    return {
-        "diagram_id": diagram_id,
-        "version1": {
-            "id": version1.id,
-            "version_number": version1.version_number,
-            "description": version1.description,
-            "label": version1.label,
-            "thumbnail_url": version1.thumbnail_url,
-            "created_by": version1.created_by,
-            "created_at": version1.created_at.isoformat(),
-            "user": {
-                "id": user1.id if user1 else None,
-                "full_name": user1.full_name if user1 else "Unknown"
-            },
-            "canvas_data": canvas1,
-            "note_content": note1
+    if format == "ndjson":
+        def stream_diff():
+            yield json.dumps({
+                "type": "header",
+                "diagram_id": diagram_id,
+                "version1": {"id": version1.id, "version_number": version1.version_number},
+                "version2": {"id": version2.id, "version_number": version2.version_number},
+                "note_changed": note_changed
+            }) + "\n"
+            for record in iter_diff_records(diff):
+                yield json.dumps(record, default=str) + "\n"
+        
+        return StreamingResponse(stream_diff(), media_type="application/x-ndjson")
+    
+    # Get user info for both versions
+    user1 = db.query(User).filter(User.id == version1.created_by).first()
+    user2 = db.query(User).filter(User.id == version2.created_by).first()
+    
+    version1_info = {
+        "id": version1.id,
+        "version_number": version1.version_number,
+        "description": version1.description,
+        "label": version1.label,
+        "thumbnail_url": version1.thumbnail_url,
+        "created_by": version1.created_by,
+        "created_at": version1.created_at.isoformat(),
+        "user": {
+            "id": user1.id if user1 else None,
+            "full_name": user1.full_name if user1 else "Unknown"
         },
-        "version2": {
-            "id": version2.id,
-            "version_number": version2.version_number,
-            "description": version2.description,
-            "label": version2.label,
-            "thumbnail_url": version2.thumbnail_url,
-            "created_by": version2.created_by,
-            "created_at": version2.created_at.isoformat(),
-            "user": {
-                "id": user2.id if user2 else None,
-                "full_name": user2.full_name if user2 else "Unknown"
-            },
-            "canvas_data": canvas2,
-            "note_content": note2
+        "note_content": note1
+    }
+    version2_info = {
+        "id": version2.id,
+        "version_number": version2.version_number,
+        "description": version2.description,
+        "label": version2.label,
+        "thumbnail_url": version2.thumbnail_url,
+        "created_by": version2.created_by,
+        "created_at": version2.created_at.isoformat(),
+        "user": {
+            "id": user2.id if user2 else None,
+            "full_name": user2.full_name if user2 else "Unknown"
         },
+        "note_content": note2
+    }
+    
+    if include_content:
+        version1_info["canvas_data"] = get_version_content(version1)[0] or {}
+        version2_info["canvas_data"] = get_version_content(version2)[0] or {}
+    
+    return {
+        "diagram_id": diagram_id,
+        "version1": version1_info,
+        "version2": version2_info,
         "differences": {
-            "additions": additions,
-            "deletions": deletions,
-            "modifications": modifications,
-            "note_changed": note_changed,
-            "summary": {
-                "total_changes": len(additions) + len(deletions) + len(modifications),
-                "added_count": len(additions),
-                "deleted_count": len(deletions),
-                "modified_count": len(modifications)
-            }
+            **diff,
+            "note_changed": note_changed
         }
     }
 
@@ -6697,35 +6923,36 @@ def _detect_element_changes(elem1: dict, elem2: dict) -> list:
     
     Returns list of change descriptions.
     """
-    changes = []
-    
-    # Compare common properties
-    for key in set(elem1.keys()) | set(elem2.keys()):
-        val1 = elem1.get(key)
-        val2 = elem2.get(key)
-        
-        if val1 != val2:
-            if key not in elem1:
-                changes.append(f"Added {key}: {val2}")
-            elif key not in elem2:
-                changes.append(f"Removed {key}: {val1}")
-            else:
-                # Property changed
-                if key == "x" or key == "y":
-                    changes.append(f"Moved")
-                elif key == "width" or key == "height":
-                    changes.append(f"Resized")
-                elif key == "rotation":
-                    changes.append(f"Rotated")
-                elif key == "color" or key == "fill" or key == "stroke":
-                    changes.append(f"Color changed")
-                elif key == "text" or key == "label":
-                    changes.append(f"Text changed")
-                else:
-                    changes.append(f"Changed {key}")
-    
-    # Deduplicate changes
-    return list(set(changes))
+    return sorted({p["description"] for p in diff_element_properties(elem1, elem2)})
+
+
+def prime_version_diff(db: Session, new_version: Version, canvas_data: Any) -> None:
+    """Precompute the diff between a new version and its predecessor.
+    
+    Keeps timeline scrubbing (adjacent version comparisons) on the cache.
+    Failures are logged and never affect version creation.
+    """
+    try:
+        previous_version = db.query(Version).filter(
+            Version.file_id == new_version.file_id,
+            Version.version_number < new_version.version_number
+        ).order_by(Version.version_number.desc()).first()
+        
+        if not previous_version:
+            return
+        
+        get_version_diff_cache().prime_adjacent(
+            previous_version.id,
+            lambda: get_version_content(previous_version)[0],
+            new_version.id,
+            canvas_data
+        )
+    except Exception as e:
+        logger.warning(
+            "Failed to precompute adjacent version diff",
+            version_id=new_version.id,
+            error=str(e)
+        )
 
 
 @app.get("/{diagram_id}/versions/{version_id}")
@@ -6783,7 +7010,7 @@ async def get_version(
     user = db.query(User).filter(User.id == version.created_by).first()
     
     # Calculate version size
-    version_size_bytes = calculate_version_size(version)
+    version_size_bytes = calculate_version_size(version, db)
     size_info = format_size_human_readable(version_size_bytes)
     
     response_data = {
@@ -7202,66 +7429,67 @@ async def get_shared_version(
     """
     logger.info("Accessing shared version", token=token[:10] + "...")
     
-    # Find share by token
-    share = db.query(Share).filter(
-        Share.token == token,
-        Share.version_id.isnot(None)  # Must be a version share
-    ).first()
+    # Find share by token (cached record, database on miss)
+    record = load_share_record(db, token)
     
-    if not share:
+    # Must be a version share
+    if not record or not record["version_id"]:
         logger.warning("Shared version access failed - invalid token", token=token[:10] + "...")
         raise HTTPException(status_code=404, detail="Invalid or expired share link")
     
     # Check expiration
-    if share.expires_at:
-        if datetime.now(timezone.utc) > share.expires_at:
-            logger.warning("Shared version access failed - link expired", token=token[:10] + "...")
-            raise HTTPException(status_code=403, detail="This share link has expired")
+    expires_at = record_expires_at(record)
+    if expires_at and datetime.now(timezone.utc) > expires_at:
+        logger.warning("Shared version access failed - link expired", token=token[:10] + "...")
+        raise HTTPException(status_code=403, detail="This share link has expired")
     
-    # Get version
-    version = db.query(Version).filter(
-        Version.id == share.version_id
-    ).first()
+    # Get pre-serialized version snapshot
+    snapshot = get_share_cache().load_snapshot(
+        record["file_id"],
+        VERSION_FIELD.format(version_id=record["version_id"]),
+        lambda: build_shared_version_snapshot(db, record["file_id"], record["version_id"])
+    )
     
-    if not version:
-        logger.warning("Shared version access failed - version not found", version_id=share.version_id)
+    if snapshot is None:
         raise HTTPException(status_code=404, detail="Version not found")
     
-    # Get diagram info
-    diagram = db.query(FileModel).filter(FileModel.id == share.file_id).first()
-    
-    if not diagram:
-        logger.warning("Shared version access failed - diagram not found", diagram_id=share.file_id)
-        raise HTTPException(status_code=404, detail="Diagram not found")
-    
     # Update analytics
-    share.view_count += 1
-    share.last_accessed_at = datetime.now(timezone.utc)
-    db.commit()
+    view_count, _ = count_share_view(db, record)
     
     logger.info(
         "Shared version accessed successfully",
         token=token[:10] + "...",
-        diagram_id=diagram.id,
-        version_id=version.id,
-        version_number=version.version_number,
-        view_count=share.view_count
+        diagram_id=record["file_id"],
+        version_id=record["version_id"],
+        view_count=view_count
     )
     
-    # Return version data (read-only)
-    return {
-        "id": diagram.id,
-        "title": diagram.title,
-        "type": diagram.file_type,
-        "version_number": version.version_number,
-        "version_label": version.label,
-        "version_description": version.description,
-        "canvas_data": version.canvas_data,
-        "note_content": version.note_content,
-        "created_at": version.created_at.isoformat(),
-        "permission": "view",
-        "is_read_only": True  # Versions are always read-only
-    }
+    return Response(content=snapshot, media_type="application/json")
+
+
+@app.get("/version-shared/{token}/preview.png")
+async def get_shared_version_preview(
+    token: str,
+    db: Session = Depends(get_db)
+):
+    """Rendered PNG preview of a shared version."""
+    record = load_share_record(db, token)
+    if not record or not record["version_id"]:
+        raise HTTPException(status_code=404, detail="Invalid or expired share link")
+    
+    expires_at = record_expires_at(record)
+    if expires_at and datetime.now(timezone.utc) > expires_at:
+        raise HTTPException(status_code=403, detail="This share link has expired")
+    
+    snapshot = get_share_cache().load_snapshot(
+        record["file_id"],
+        VERSION_FIELD.format(version_id=record["version_id"]),
+        lambda: build_shared_version_snapshot(db, record["file_id"], record["version_id"])
+    )
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    
+    return await shared_preview_response(record["file_id"], snapshot)
 
 @app.post("/{diagram_id}/versions/{version_id}/restore")
 async def restore_version(
@@ -7310,7 +7538,7 @@ async def restore_version(
         id=str(uuid.uuid4()),
         file_id=diagram_id,
         version_number=next_version_number,
-        canvas_data=diagram.canvas_data,
+        canvas_snapshot_hash=share_canvas(db, diagram),
         note_content=diagram.note_content,
         description=f"Auto-backup before restore to v{version.version_number}",
         created_by=user_id
@@ -7318,9 +7546,11 @@ async def restore_version(
     
     db.add(backup_version)
     
-    # Restore the version content to diagram
-    diagram.canvas_data = version.canvas_data
-    diagram.note_content = version.note_content
+    # Restore the version content to diagram (references the version's snapshot)
+    restored_canvas, restored_note = get_version_content(version)
+    attach_canvas_snapshot(diagram, version_snapshot_hash(db, version, restored_canvas))
+    diagram.note_content = restored_note
+    update_diagram_size(db, diagram)
     diagram.updated_at = datetime.utcnow()
     diagram.last_activity = datetime.utcnow()
     
@@ -7405,17 +7635,22 @@ async def fork_version(
     if not original_diagram:
         raise HTTPException(status_code=404, detail="Original diagram not found")
     
+    # Forked diagram and its initial version reference the version's snapshot
+    forked_canvas, forked_note = get_version_content(version)
+    snapshot_hash = version_snapshot_hash(db, version, forked_canvas)
+    
     # Create new diagram from version
     new_diagram = FileModel(
         id=str(uuid.uuid4()),
         title=f"{original_diagram.title} (Fork from v{version.version_number})",
         file_type=original_diagram.file_type,
-        canvas_data=version.canvas_data,
-        note_content=version.note_content,
+        canvas_snapshot_hash=snapshot_hash,
+        note_content=forked_note,
         owner_id=user_id,
         team_id=original_diagram.team_id,
         folder_id=original_diagram.folder_id
     )
+    update_diagram_size(db, new_diagram)
     
     db.add(new_diagram)
     db.commit()
@@ -7426,8 +7661,8 @@ async def fork_version(
         id=str(uuid.uuid4()),
         file_id=new_diagram.id,
         version_number=1,
-        canvas_data=version.canvas_data,
-        note_content=version.note_content,
+        canvas_snapshot_hash=snapshot_hash,
+        note_content=forked_note,
         description=f"Forked from {original_diagram.title} v{version.version_number}",
         created_by=user_id
     )
@@ -8869,7 +9104,7 @@ async def get_analytics_overview(
         # For production, you'd want to track actual file sizes
         storage_query = db.query(
             func.sum(
-                func.coalesce(func.pg_column_size(File.canvas_data), 0) + func.coalesce(func.pg_column_size(File.note_content), 0)
+                FileModel.canvas_storage_size() + func.coalesce(func.pg_column_size(File.note_content), 0)
             )
         )
         if team_id:
@@ -8900,7 +9135,7 @@ async def get_analytics_overview(
                 Team.name,
                 func.count(File.id).label('diagram_count'),
                 func.sum(
-                    func.coalesce(func.pg_column_size(File.canvas_data), 0) + func.coalesce(func.pg_column_size(File.note_content), 0)
+                    FileModel.canvas_storage_size() + func.coalesce(func.pg_column_size(File.note_content), 0)
                 ).label('storage_bytes')
             ).join(
                 File, File.team_id == Team.id, isouter=True
@@ -9099,7 +9334,7 @@ async def get_storage_used_analytics(
         # Total storage query
         storage_query = db.query(
             func.sum(
-                func.coalesce(func.pg_column_size(File.canvas_data), 0) + func.coalesce(func.pg_column_size(File.note_content), 0)
+                FileModel.canvas_storage_size() + func.coalesce(func.pg_column_size(File.note_content), 0)
             )
         )
         if team_id:
@@ -9112,7 +9347,7 @@ async def get_storage_used_analytics(
             File.file_type,
             func.count(File.id).label('diagram_count'),
             func.sum(
-                func.coalesce(func.pg_column_size(File.canvas_data), 0) + func.coalesce(func.pg_column_size(File.note_content), 0)
+                FileModel.canvas_storage_size() + func.coalesce(func.pg_column_size(File.note_content), 0)
             ).label('storage_bytes')
         ).group_by(File.file_type)
         
@@ -9134,12 +9369,12 @@ async def get_storage_used_analytics(
             User.email,
             func.count(File.id).label('diagram_count'),
             func.sum(
-                func.coalesce(func.pg_column_size(File.canvas_data), 0) + func.coalesce(func.pg_column_size(File.note_content), 0)
+                FileModel.canvas_storage_size() + func.coalesce(func.pg_column_size(File.note_content), 0)
             ).label('storage_bytes')
         ).join(User, User.id == File.owner_id).group_by(
             File.owner_id, User.email
         ).order_by(
-            func.sum(func.coalesce(func.pg_column_size(File.canvas_data), 0) + func.coalesce(func.pg_column_size(File.note_content), 0)).desc()
+            func.sum(FileModel.canvas_storage_size() + func.coalesce(func.pg_column_size(File.note_content), 0)).desc()
         ).limit(10)
         
         if team_id:
@@ -9193,7 +9428,7 @@ async def get_cost_allocation_analytics(
             func.count(func.distinct(File.owner_id)).label('user_count'),
             func.count(File.id).label('diagram_count'),
             func.sum(
-                func.coalesce(func.pg_column_size(File.canvas_data), 0) + func.coalesce(func.pg_column_size(File.note_content), 0)
+                FileModel.canvas_storage_size() + func.coalesce(func.pg_column_size(File.note_content), 0)
             ).label('storage_bytes'),
             func.count(Version.id).label('version_count')
         ).outerjoin(
@@ -9332,6 +9567,9 @@ def cleanup_old_data(
         
         db.commit()
         
+        # Bulk deletes bypass snapshot reference tracking; recount and collect
+        snapshot_gc = collect_snapshot_garbage(db)
+        
         logger.info(
             "Data retention cleanup completed",
             correlation_id=correlation_id,
@@ -9347,7 +9585,8 @@ def cleanup_old_data(
             "cleanup_results": {
                 "old_diagrams_moved_to_trash": old_diagrams_count,
                 "deleted_from_trash": deleted_from_trash,
-                "old_versions_deleted": deleted_versions
+                "old_versions_deleted": deleted_versions,
+                "orphaned_snapshots_deleted": snapshot_gc["snapshots_deleted"]
             },
             "cutoff_dates": {
                 "diagram_cutoff": diagram_cutoff.isoformat(),
@@ -9365,6 +9604,36 @@ def cleanup_old_data(
         raise HTTPException(status_code=500, detail="Failed to cleanup old data")
 
 
+@app.post("/admin/snapshots/gc")
+def collect_canvas_snapshots(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Garbage-collect canvas snapshots no longer referenced by any file, version or template.
+    
+    This is a system-level endpoint for background maintenance jobs.
+    """
+    correlation_id = request.headers.get("X-Correlation-ID")
+    
+    try:
+        result = collect_snapshot_garbage(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(
+            f"Error during canvas snapshot garbage collection: {str(e)}",
+            correlation_id=correlation_id
+        )
+        raise HTTPException(status_code=500, detail="Failed to collect canvas snapshots")
+    
+    logger.info(
+        "Canvas snapshot garbage collection completed",
+        correlation_id=correlation_id,
+        **result
+    )
+    
+    return result
+
+
 # ========================================
 # ICON LIBRARY API ENDPOINTS
 # ========================================
@@ -1,10 +1,11 @@
 """SQLAlchemy models for all 12 database tables."""
 from sqlalchemy import (
     Column, String, Integer, DateTime, Boolean, Text, 
-    ForeignKey, JSON, BigInteger, Float, Index
+    ForeignKey, JSON, BigInteger, Float, Index, select
 )
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import relationship, declared_attr, deferred, object_session
 from sqlalchemy.sql import func
 from datetime import datetime
 import uuid
@@ -192,7 +193,92 @@ class FolderPermission(Base):
     )
 
 
-class File(Base):
+class CanvasSnapshot(Base):
+    """Content-addressed canvas snapshot shared by files, versions and templates."""
+    __tablename__ = "canvas_snapshots"
+
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 of canonical canvas JSON
+    canvas_data = deferred(Column(JSONB))  # NULL when offloaded to object storage
+    size_bytes = Column(BigInteger, default=0)
+
+    # Object storage offload for oversized canvases (see canvas_storage.py)
+    storage_key = Column(String(512))  # MinIO object key, NULL when stored inline
+    summary = Column(JSON)  # Element count and top-level keys of offloaded canvases
+    ref_count = Column(Integer, default=0, nullable=False)  # files + versions + templates referencing it
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('idx_canvas_snapshots_ref_count', 'ref_count'),
+    )
+
+    def load_canvas(self):
+        """Canvas data, streamed from object storage when offloaded."""
+        if self.storage_key is None:
+            return self.canvas_data
+        from .canvas_storage import load_offloaded_canvas
+        return load_offloaded_canvas(self.storage_key)
+
+
+class SnapshotCanvasMixin:
+    """Canvas content stored inline or as a reference to a shared CanvasSnapshot.
+
+    `canvas_data` reads the inline column first and falls back to the
+    referenced snapshot. Assigning `canvas_data` writes inline and detaches
+    the snapshot (copy-on-write).
+    """
+
+    @declared_attr
+    def inline_canvas_data(cls):
+        # Deferred so listings and metadata queries never load canvas payloads
+        return deferred(Column("canvas_data", JSONB))
+
+    @declared_attr
+    def canvas_snapshot_hash(cls):
+        return Column(
+            String(64),
+            ForeignKey("canvas_snapshots.content_hash", ondelete="RESTRICT"),
+            index=True
+        )
+
+    @hybrid_property
+    def canvas_data(self):
+        if self.inline_canvas_data is not None:
+            return self.inline_canvas_data
+        if self.canvas_snapshot_hash is None:
+            return None
+        session = object_session(self)
+        if session is None:
+            return None
+        snapshot = session.get(CanvasSnapshot, self.canvas_snapshot_hash)
+        return snapshot.load_canvas() if snapshot else None
+
+    @canvas_data.setter
+    def canvas_data(self, value):
+        self.inline_canvas_data = value
+        self.canvas_snapshot_hash = None
+
+    @canvas_data.expression
+    def canvas_data(cls):
+        # Inline canvas, else the referenced snapshot's (NULL if that is offloaded)
+        snapshot_canvas = select(CanvasSnapshot.canvas_data).where(
+            CanvasSnapshot.content_hash == cls.canvas_snapshot_hash
+        ).scalar_subquery()
+        return func.coalesce(cls.inline_canvas_data, snapshot_canvas)
+
+    @classmethod
+    def canvas_storage_size(cls):
+        """SQL expression: bytes the canvas takes, inline or in its snapshot (size_bytes if offloaded)."""
+        snapshot_size = select(
+            func.coalesce(func.pg_column_size(CanvasSnapshot.canvas_data), CanvasSnapshot.size_bytes)
+        ).where(
+            CanvasSnapshot.content_hash == cls.canvas_snapshot_hash
+        ).scalar_subquery()
+        return func.coalesce(func.pg_column_size(cls.inline_canvas_data), snapshot_size, 0)
+
+
+class File(SnapshotCanvasMixin, Base):
     """Diagram/file table."""
     __tablename__ = "files"
 
@@ -204,7 +290,7 @@ class File(Base):
     
     # File type and content
     file_type = Column(String(50), default="canvas", nullable=False)  # canvas, note, mixed
-    canvas_data = Column(JSONB)  # TLDraw canvas state (JSONB for better performance)
+    # canvas_data: TLDraw canvas state, see SnapshotCanvasMixin
     note_content = Column(Text)  # Markdown content
     
     # Metadata
@@ -255,7 +341,7 @@ class File(Base):
     )
 
 
-class Version(Base):
+class Version(SnapshotCanvasMixin, Base):
     """Version history table."""
     __tablename__ = "versions"
 
@@ -263,8 +349,7 @@ class Version(Base):
     file_id = Column(String(36), ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
     version_number = Column(Integer, nullable=False)
     
-    # Version content
-    canvas_data = Column(JSONB)  # JSONB for better performance
+    # Version content (canvas_data: see SnapshotCanvasMixin)
     note_content = Column(Text)
     
     # Compression fields
@@ -645,7 +730,7 @@ class UsageMetric(Base):
     )
 
 
-class Template(Base):
+class Template(SnapshotCanvasMixin, Base):
     """Diagram template table for reusable patterns."""
     __tablename__ = "templates"
 
@@ -656,7 +741,7 @@ class Template(Base):
     
     # Template content (same as diagram)
     file_type = Column(String(50), default="canvas", nullable=False)  # canvas, note, mixed
-    canvas_data = Column(JSONB)  # TLDraw canvas state
+    # canvas_data: TLDraw canvas state, see SnapshotCanvasMixin
     note_content = Column(Text)  # Markdown content
     
     # Template metadata
@@ -901,3 +986,32 @@ class CommentFlag(Base):
         Index('idx_comment_flags_status', 'status'),
         Index('idx_comment_flags_created', 'created_at'),
     )
+
+
+class NotificationJob(Base):
+    """Queued email / web push notification (see notification_dispatcher.py)."""
+    __tablename__ = "notification_jobs"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    # Delivery
+    channel = Column(String(20), nullable=False)  # email, push
+    kind = Column(String(50), nullable=False, default="mention")
+    payload = Column(JSONB, nullable=False)
+
+    # Queue state
+    status = Column(String(20), nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    claimed_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    sent_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index('idx_notification_jobs_status_available', 'status', 'available_at'),
+        Index('idx_notification_jobs_user_channel', 'user_id', 'channel', 'status'),
+    )
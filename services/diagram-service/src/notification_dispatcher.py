@@ -0,0 +1,370 @@
+"""
+Notification dispatcher for Diagram Service.
+
+Request handlers queue notifications as `notification_jobs` rows in the same
+transaction as the comment that caused them, and return without touching
+SMTP or the push services. A background dispatcher claims due jobs with
+SELECT ... FOR UPDATE SKIP LOCKED (so several service instances can share
+the queue) and delivers them with bounded concurrency:
+
+- Email jobs wait NOTIFICATION_DIGEST_WINDOW seconds so that mentions of the
+  same user arriving close together go out as one digest. Each worker sends
+  its share of a batch over a single SMTP connection.
+- Push jobs are due immediately; pywebpush is synchronous, so sends run in
+  worker threads.
+
+Failed jobs are retried with exponential backoff and marked failed after
+NOTIFICATION_MAX_ATTEMPTS. Jobs claimed by a dispatcher that died are
+reclaimed after NOTIFICATION_CLAIM_TIMEOUT.
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from .email_service import get_email_service
+from .models import NotificationJob, User
+from .push_notification_service import get_push_notification_service
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "4"))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "100"))
+NOTIFICATION_POLL_INTERVAL = float(os.getenv("NOTIFICATION_POLL_INTERVAL", "5"))  # seconds
+NOTIFICATION_DIGEST_WINDOW = int(os.getenv("NOTIFICATION_DIGEST_WINDOW", "60"))  # seconds
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+NOTIFICATION_CLAIM_TIMEOUT = int(os.getenv("NOTIFICATION_CLAIM_TIMEOUT", "300"))  # seconds
+NOTIFICATION_RETRY_DELAY = int(os.getenv("NOTIFICATION_RETRY_DELAY", "30"))  # seconds, doubled per attempt
+
+
+def enqueue_mention_notifications(
+    db: Session,
+    recipients: List[User],
+    commenter_name: str,
+    comment_content: str,
+    diagram_id: str,
+    diagram_name: str,
+    comment_id: str,
+    position: Optional[Dict[str, Any]] = None
+) -> int:
+    """Queue email and push notifications for mentioned users.
+
+    The jobs are added to `db` and become visible to the dispatcher when the
+    caller commits.
+
+    Returns:
+        Number of jobs queued
+    """
+    now = datetime.now(timezone.utc)
+    mention = {
+        "commenter_name": commenter_name,
+        "comment_content": comment_content,
+        "diagram_id": diagram_id,
+        "diagram_name": diagram_name,
+        "comment_id": comment_id
+    }
+
+    queued = 0
+    for user in recipients:
+        if get_email_service().enabled and user.email:
+            db.add(NotificationJob(
+                user_id=user.id,
+                channel="email",
+                kind="mention",
+                payload={
+                    **mention,
+                    "to_email": user.email,
+                    "to_name": user.full_name or user.email.split('@')[0]
+                },
+                available_at=now + timedelta(seconds=NOTIFICATION_DIGEST_WINDOW)
+            ))
+            queued += 1
+        if get_push_notification_service().configured:
+            db.add(NotificationJob(
+                user_id=user.id,
+                channel="push",
+                kind="mention",
+                payload={**mention, "position": position},
+                available_at=now
+            ))
+            queued += 1
+    return queued
+
+
+class NotificationDispatcher:
+    """Background delivery of queued notification jobs.
+
+    Args:
+        session_factory: Callable returning a new SQLAlchemy session
+        workers: Maximum concurrent deliveries
+        batch_size: Maximum jobs claimed per cycle
+        poll_interval: Seconds between queue polls when idle
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        workers: int = NOTIFICATION_WORKERS,
+        batch_size: int = NOTIFICATION_BATCH_SIZE,
+        poll_interval: float = NOTIFICATION_POLL_INTERVAL
+    ):
+        self.session_factory = session_factory
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Statistics
+        self.jobs_sent = 0
+        self.jobs_retried = 0
+        self.jobs_failed = 0
+        self.digests_sent = 0
+
+    def notify(self) -> None:
+        """Wake the dispatcher after new jobs were committed."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # Queue access (runs in worker threads)
+
+    def _claim_jobs(self) -> List[Dict[str, Any]]:
+        """Claim due jobs, plus every pending email job of the users they mention."""
+        now = datetime.now(timezone.utc)
+        stale = now - timedelta(seconds=NOTIFICATION_CLAIM_TIMEOUT)
+
+        db = self.session_factory()
+        try:
+            jobs = db.query(NotificationJob).filter(
+                or_(
+                    and_(NotificationJob.status == "pending", NotificationJob.available_at <= now),
+                    and_(NotificationJob.status == "sending", NotificationJob.claimed_at < stale)
+                )
+            ).order_by(
+                NotificationJob.available_at
+            ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+            # Pull mentions still inside their digest window into this digest
+            email_users = {job.user_id for job in jobs if job.channel == "email"}
+            if email_users:
+                jobs += db.query(NotificationJob).filter(
+                    NotificationJob.status == "pending",
+                    NotificationJob.channel == "email",
+                    NotificationJob.user_id.in_(email_users),
+                    NotificationJob.id.notin_([job.id for job in jobs])
+                ).with_for_update(skip_locked=True).all()
+
+            claimed = []
+            for job in jobs:
+                job.status = "sending"
+                job.claimed_at = now
+                claimed.append({
+                    "id": job.id,
+                    "user_id": job.user_id,
+                    "channel": job.channel,
+                    "payload": job.payload,
+                    "attempts": job.attempts
+                })
+            db.commit()
+            return claimed
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _complete_jobs(self, sent: List[str], failed: Dict[str, str]) -> None:
+        """Mark delivered jobs sent and reschedule or fail the others."""
+        now = datetime.now(timezone.utc)
+        db = self.session_factory()
+        try:
+            if sent:
+                db.query(NotificationJob).filter(NotificationJob.id.in_(sent)).update(
+                    {"status": "sent", "sent_at": now, "last_error": None},
+                    synchronize_session=False
+                )
+            if failed:
+                for job in db.query(NotificationJob).filter(NotificationJob.id.in_(list(failed))):
+                    job.attempts += 1
+                    job.last_error = failed[job.id]
+                    if job.attempts >= NOTIFICATION_MAX_ATTEMPTS:
+                        job.status = "failed"
+                        self.jobs_failed += 1
+                    else:
+                        job.status = "pending"
+                        job.available_at = now + timedelta(
+                            seconds=NOTIFICATION_RETRY_DELAY * 2 ** (job.attempts - 1)
+                        )
+                        self.jobs_retried += 1
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _load_push_subscriptions(self, user_id: str) -> List[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            return get_push_notification_service().get_active_subscriptions(db, user_id)
+        finally:
+            db.close()
+
+    def _deactivate_push_subscriptions(self, subscription_ids: List[str]) -> None:
+        db = self.session_factory()
+        try:
+            get_push_notification_service().deactivate_subscriptions(db, subscription_ids)
+        finally:
+            db.close()
+
+    # Delivery
+
+    async def _send_email_digests(self, digests: List[List[Dict[str, Any]]], results: Dict[str, Optional[str]]) -> None:
+        """Send a worker's share of email digests over one SMTP connection."""
+        try:
+            async with get_email_service().smtp_connection() as smtp:
+                for jobs in digests:
+                    first = jobs[0]["payload"]
+                    if len(jobs) == 1:
+                        ok = await get_email_service().send_mention_notification(
+                            to_email=first["to_email"],
+                            to_name=first["to_name"],
+                            commenter_name=first["commenter_name"],
+                            comment_content=first["comment_content"],
+                            diagram_id=first["diagram_id"],
+                            diagram_name=first["diagram_name"],
+                            comment_id=first["comment_id"],
+                            smtp=smtp
+                        )
+                    else:
+                        ok = await get_email_service().send_mention_digest(
+                            to_email=first["to_email"],
+                            to_name=first["to_name"],
+                            mentions=[job["payload"] for job in jobs],
+                            smtp=smtp
+                        )
+                        if ok:
+                            self.digests_sent += 1
+                    for job in jobs:
+                        results[job["id"]] = None if ok else "SMTP send failed"
+        except Exception as e:
+            logger.error(f"SMTP connection failed: {e}")
+            for jobs in digests:
+                for job in jobs:
+                    results.setdefault(job["id"], f"SMTP connection failed: {e}")
+
+    async def _send_push(self, job: Dict[str, Any], semaphore: asyncio.Semaphore, results: Dict[str, Optional[str]]) -> None:
+        async with semaphore:
+            try:
+                subscriptions = await asyncio.to_thread(self._load_push_subscriptions, job["user_id"])
+                if not subscriptions:
+                    results[job["id"]] = None
+                    return
+
+                sent, gone = await get_push_notification_service().send_to_subscriptions(
+                    subscriptions,
+                    get_push_notification_service().build_mention_payload(**job["payload"])
+                )
+                if gone:
+                    await asyncio.to_thread(self._deactivate_push_subscriptions, gone)
+                # Succeeded if delivered anywhere, or every subscription is gone
+                results[job["id"]] = None if sent or len(gone) == len(subscriptions) else "Push send failed"
+            except Exception as e:
+                logger.error(f"Push notification job {job['id']} failed: {e}")
+                results[job["id"]] = str(e)
+
+    async def dispatch_once(self) -> int:
+        """Claim and deliver one batch of due jobs. Returns jobs processed."""
+        jobs = await asyncio.to_thread(self._claim_jobs)
+        if not jobs:
+            return 0
+
+        digests: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        push_jobs = []
+        for job in jobs:
+            if job["channel"] == "email":
+                digests[job["user_id"]].append(job)
+            else:
+                push_jobs.append(job)
+
+        results: Dict[str, Optional[str]] = {}
+        semaphore = asyncio.Semaphore(self.workers)
+        email_batches = [list(digests.values())[i::self.workers] for i in range(self.workers)]
+        await asyncio.gather(
+            *(self._send_email_digests(batch, results) for batch in email_batches if batch),
+            *(self._send_push(job, semaphore, results) for job in push_jobs)
+        )
+
+        sent = [job_id for job_id, error in results.items() if error is None]
+        failed = {job_id: error for job_id, error in results.items() if error is not None}
+        await asyncio.to_thread(self._complete_jobs, sent, failed)
+        self.jobs_sent += len(sent)
+
+        logger.info(
+            f"Notification batch delivered: {len(sent)} sent, {len(failed)} failed "
+            f"({len(digests)} email recipients, {len(push_jobs)} push)"
+        )
+        return len(jobs)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                processed = await self.dispatch_once()
+            except Exception as e:
+                logger.error(f"Notification dispatch failed: {e}")
+                processed = 0
+
+            # Keep draining while batches come back full
+            if processed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def start(self) -> None:
+        """Start the background dispatcher (call from lifespan startup)."""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Notification dispatcher started: workers={self.workers}, "
+            f"batch_size={self.batch_size}, digest_window={NOTIFICATION_DIGEST_WINDOW}s"
+        )
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Stop after the in-flight batch (call from lifespan shutdown).
+
+        Undelivered jobs stay in the queue for the next start.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+        logger.info(f"Notification dispatcher stopped: {self.jobs_sent} jobs sent")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get dispatcher statistics."""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "workers": self.workers,
+            "jobs_sent": self.jobs_sent,
+            "jobs_retried": self.jobs_retried,
+            "jobs_failed": self.jobs_failed,
+            "digests_sent": self.digests_sent
+        }
@@ -2,8 +2,9 @@
 
 import os
 import json
+import asyncio
 import logging
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from pywebpush import webpush, WebPushException
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
@@ -23,6 +24,10 @@ class PushNotificationService:
         if not self.vapid_private_key or not self.vapid_public_key:
             logger.warning("VAPID keys not configured - push notifications will not work")
 
+    @property
+    def configured(self) -> bool:
+        return bool(self.vapid_private_key and self.vapid_public_key)
+
     async def send_mention_notification(
         self,
         db: Session,
@@ -50,27 +55,44 @@ class PushNotificationService:
         Returns:
             Number of successful notifications sent
         """
-        if not self.vapid_private_key or not self.vapid_public_key:
+        if not self.configured:
             logger.warning("Push notifications not configured")
             return 0
 
-        # Import here to avoid circular dependencies
-        from .models import PushSubscription
-
-        # Get all active push subscriptions for the user
-        subscriptions = db.query(PushSubscription).filter(
-            and_(
-                PushSubscription.user_id == user_id,
-                PushSubscription.is_active == True
-            )
-        ).all()
-
+        subscriptions = self.get_active_subscriptions(db, user_id)
         if not subscriptions:
             logger.info(f"No active push subscriptions for user {user_id}")
             return 0
 
-        # Prepare notification payload
-        notification_data = {
+        notification_data = self.build_mention_payload(
+            commenter_name=commenter_name,
+            comment_content=comment_content,
+            diagram_id=diagram_id,
+            diagram_name=diagram_name,
+            comment_id=comment_id,
+            position=position
+        )
+
+        sent_count, failed_subscriptions = await self.send_to_subscriptions(
+            subscriptions, notification_data
+        )
+
+        # Deactivate failed subscriptions
+        self.deactivate_subscriptions(db, failed_subscriptions)
+
+        return sent_count
+
+    @staticmethod
+    def build_mention_payload(
+        commenter_name: str,
+        comment_content: str,
+        diagram_id: str,
+        diagram_name: str,
+        comment_id: str,
+        position: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Build the push payload for a mention notification."""
+        return {
             "title": f"{commenter_name} mentioned you",
             "body": comment_content[:100] + ("..." if len(comment_content) > 100 else ""),
             "icon": "/icons/icon-192x192.png",
@@ -97,75 +119,121 @@ class PushNotificationService:
             ]
         }
 
-        sent_count = 0
-        failed_subscriptions = []
-
-        # Send to all subscriptions
-        for subscription in subscriptions:
-            try:
-                # Prepare subscription info for pywebpush
-                subscription_info = {
-                    "endpoint": subscription.endpoint,
-                    "keys": {
-                        "p256dh": subscription.p256dh,
-                        "auth": subscription.auth
-                    }
+    def get_active_subscriptions(self, db: Session, user_id: str) -> List[Dict[str, Any]]:
+        """Get a user's active push subscriptions as plain dicts."""
+        # Import here to avoid circular dependencies
+        from .models import PushSubscription
+
+        subscriptions = db.query(PushSubscription).filter(
+            and_(
+                PushSubscription.user_id == user_id,
+                PushSubscription.is_active == True
+            )
+        ).all()
+
+        return [
+            {
+                "id": subscription.id,
+                "user_id": subscription.user_id,
+                "endpoint": subscription.endpoint,
+                "keys": {
+                    "p256dh": subscription.p256dh,
+                    "auth": subscription.auth
                 }
+            }
+            for subscription in subscriptions
+        ]
 
-                # Send the push notification
-                webpush(
-                    subscription_info=subscription_info,
-                    data=json.dumps(notification_data),
-                    vapid_private_key=self.vapid_private_key,
-                    vapid_claims={
-                        "sub": self.vapid_subject
-                    }
-                )
-
-                sent_count += 1
-                logger.info(
-                    f"Push notification sent successfully",
-                    extra={
-                        "user_id": user_id,
-                        "subscription_id": subscription.id,
-                        "comment_id": comment_id
-                    }
-                )
-
-            except WebPushException as e:
-                logger.error(
-                    f"Failed to send push notification",
-                    extra={
-                        "user_id": user_id,
-                        "subscription_id": subscription.id,
-                        "error": str(e),
-                        "status_code": e.response.status_code if e.response else None
-                    }
-                )
-
-                # If subscription is invalid (410 Gone or 404 Not Found), mark it as inactive
-                if e.response and e.response.status_code in [410, 404]:
-                    failed_subscriptions.append(subscription.id)
-
-            except Exception as e:
-                logger.error(
-                    f"Unexpected error sending push notification",
-                    extra={
-                        "user_id": user_id,
-                        "subscription_id": subscription.id,
-                        "error": str(e)
-                    }
-                )
+    def deactivate_subscriptions(self, db: Session, subscription_ids: List[str]) -> None:
+        """Mark subscriptions rejected by the push service as inactive."""
+        if not subscription_ids:
+            return
 
-        # Deactivate failed subscriptions
-        if failed_subscriptions:
-            db.query(PushSubscription).filter(
-                PushSubscription.id.in_(failed_subscriptions)
-            ).update({"is_active": False}, synchronize_session=False)
-            db.commit()
-            logger.info(f"Deactivated {len(failed_subscriptions)} invalid push subscriptions")
+        from .models import PushSubscription
 
-        return sent_count
+        db.query(PushSubscription).filter(
+            PushSubscription.id.in_(subscription_ids)
+        ).update({"is_active": False}, synchronize_session=False)
+        db.commit()
+        logger.info(f"Deactivated {len(subscription_ids)} invalid push subscriptions")
+
+    async def send_to_subscriptions(
+        self,
+        subscriptions: List[Dict[str, Any]],
+        notification_data: Dict[str, Any]
+    ) -> Tuple[int, List[str]]:
+        """
+        Send a payload to several subscriptions concurrently.
+
+        pywebpush is synchronous, so each send runs in a worker thread.
+
+        Returns:
+            (number sent, IDs of subscriptions that are gone and should be deactivated)
+        """
+        data = json.dumps(notification_data)
+        results = await asyncio.gather(*(
+            asyncio.to_thread(self._send_webpush, subscription, data)
+            for subscription in subscriptions
+        ))
+
+        sent_count = sum(1 for result in results if result == "sent")
+        failed_subscriptions = [
+            subscription["id"]
+            for subscription, result in zip(subscriptions, results)
+            if result == "gone"
+        ]
+        return sent_count, failed_subscriptions
+
+    def _send_webpush(self, subscription: Dict[str, Any], data: str) -> str:
+        """Send one push message (blocking). Returns "sent", "gone" or "error"."""
+        try:
+            webpush(
+                subscription_info={
+                    "endpoint": subscription["endpoint"],
+                    "keys": subscription["keys"]
+                },
+                data=data,
+                vapid_private_key=self.vapid_private_key,
+                vapid_claims={
+                    "sub": self.vapid_subject
+                }
+            )
+
+            logger.info(
+                f"Push notification sent successfully",
+                extra={
+                    "user_id": subscription["user_id"],
+                    "subscription_id": subscription["id"]
+                }
+            )
+            return "sent"
+
+        except WebPushException as e:
+            logger.error(
+                f"Failed to send push notification",
+                extra={
+                    "user_id": subscription["user_id"],
+                    "subscription_id": subscription["id"],
+                    "error": str(e),
+                    "status_code": e.response.status_code if e.response else None
+                }
+            )
+
+            # If subscription is invalid (410 Gone or 404 Not Found), mark it as inactive
+            if e.response and e.response.status_code in [410, 404]:
+                return "gone"
+            return "error"
+
+        except Exception as e:
+            logger.error(
+                f"Unexpected error sending push notification",
+                extra={
+                    "user_id": subscription["user_id"],
+                    "subscription_id": subscription["id"],
+                    "error": str(e)
+                }
+            )
+            return "error"
 
 
 # Singleton instance
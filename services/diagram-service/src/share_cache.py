@@ -0,0 +1,337 @@
+"""
+Cache for public share links (/shared/{token}, /version-shared/{token}).
+
+Public share hits are served from Redis so that a widely posted link does
+not load the primary database:
+
+- Share records: the few Share columns needed to enforce revocation, expiry
+  and passwords, keyed by token. Revoking a share drops its record.
+- Snapshots: the pre-serialized diagram or version payload and its rendered
+  PNG preview, stored as fields of one Redis hash per diagram so a change to
+  the diagram (or its deletion) invalidates everything with a single DEL.
+  Previews are keyed by a digest of the snapshot they were rendered from,
+  so a preview can never outlive its snapshot.
+- View counts: accumulated in Redis and flushed to `shares` in batches.
+
+Invalidation follows ORM commits (see the session listeners at the bottom).
+Bulk query-level updates bypass the ORM, so every entry also carries a TTL.
+When Redis is unavailable every lookup is a miss and callers fall back to
+the database.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+import redis
+from sqlalchemy import event, func, inspect, update
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import File, Share, Version
+
+logger = logging.getLogger(__name__)
+
+SHARE_RECORD_TTL = int(os.getenv("SHARE_RECORD_TTL", "60"))  # seconds
+SHARE_SNAPSHOT_TTL = int(os.getenv("SHARE_SNAPSHOT_TTL", "300"))  # seconds
+
+RECORD_KEY = "share:record:{token}"
+SNAPSHOT_KEY = "share:snapshot:{file_id}"
+VIEWS_KEY = "share:views:{token}"
+LAST_ACCESS_KEY = "share:last-access:{token}"
+DIRTY_VIEWS_KEY = "share:views:dirty"
+
+# Snapshot hash fields
+LIVE_FIELD = "live"
+VERSION_FIELD = "version:{version_id}"
+PREVIEW_FIELD = "preview:{digest}"
+
+# Attributes that appear in a shared payload; other changes (view counts,
+# stars, ...) leave cached snapshots valid
+FILE_SNAPSHOT_ATTRS = (
+    "title", "file_type", "inline_canvas_data", "canvas_snapshot_hash", "note_content",
+    "owner_id", "is_deleted", "updated_at", "created_at"
+)
+VERSION_SNAPSHOT_ATTRS = (
+    "label", "description", "inline_canvas_data", "canvas_snapshot_hash", "note_content",
+    "compressed_canvas_data", "compressed_note_content", "is_compressed"
+)
+
+
+def serialize_payload(payload: Dict[str, Any]) -> bytes:
+    """Serialize a snapshot payload once for reuse on every hit."""
+    return json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def preview_field(snapshot: bytes) -> str:
+    """Snapshot hash field holding the preview rendered from `snapshot`."""
+    return PREVIEW_FIELD.format(digest=hashlib.sha1(snapshot).hexdigest())
+
+
+def merge_payload(snapshot: bytes, fields: Dict[str, Any]) -> bytes:
+    """Add per-hit fields to a pre-serialized JSON object without re-encoding it."""
+    if not fields:
+        return snapshot
+    extra = serialize_payload(fields)
+    if not snapshot[1:-1].strip():
+        return extra  # Empty object: nothing to splice after the new fields
+    return extra[:-1] + b"," + snapshot[1:]
+
+
+def share_record(share: Share) -> Dict[str, Any]:
+    """Cacheable subset of a Share row."""
+    return {
+        "id": share.id,
+        "token": share.token,
+        "file_id": share.file_id,
+        "version_id": share.version_id,
+        "permission": share.permission,
+        "is_public": share.is_public,
+        "password_hash": share.password_hash,
+        "expires_at": share.expires_at.isoformat() if share.expires_at else None,
+        "view_count": share.view_count or 0,
+        "last_accessed_at": share.last_accessed_at.isoformat() if share.last_accessed_at else None
+    }
+
+
+def record_expires_at(record: Dict[str, Any]) -> Optional[datetime]:
+    """Expiry of a cached share record as an aware datetime."""
+    if not record.get("expires_at"):
+        return None
+    expires_at = datetime.fromisoformat(record["expires_at"])
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at
+
+
+class ShareCache:
+    """Redis-backed cache of share records, snapshots and view counters."""
+
+    def __init__(self):
+        self._client: Optional[redis.Redis] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis(
+                host=os.getenv("REDIS_HOST", "localhost"),
+                port=int(os.getenv("REDIS_PORT", "6379")),
+                db=int(os.getenv("REDIS_DB", "0")),
+                socket_timeout=1,
+                socket_connect_timeout=1
+            )
+        return self._client
+
+    def _count(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    # Share records
+
+    def get_record(self, token: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = self.client.get(RECORD_KEY.format(token=token))
+        except redis.RedisError as e:
+            logger.warning(f"Share cache unavailable: {e}")
+            return None
+        return self._count(json.loads(raw) if raw else None)
+
+    def put_record(self, share: Share) -> Dict[str, Any]:
+        record = share_record(share)
+        try:
+            self.client.set(RECORD_KEY.format(token=share.token), json.dumps(record), ex=SHARE_RECORD_TTL)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to cache share record: {e}")
+        return record
+
+    # Snapshots
+
+    def get_snapshot(self, file_id: str, field: str) -> Optional[bytes]:
+        try:
+            return self._count(self.client.hget(SNAPSHOT_KEY.format(file_id=file_id), field))
+        except redis.RedisError as e:
+            logger.warning(f"Share cache unavailable: {e}")
+            return None
+
+    def put_snapshot(self, file_id: str, field: str, payload: bytes) -> None:
+        key = SNAPSHOT_KEY.format(file_id=file_id)
+        try:
+            pipe = self.client.pipeline()
+            pipe.hset(key, field, payload)
+            pipe.expire(key, SHARE_SNAPSHOT_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to cache share snapshot: {e}")
+
+    def load_snapshot(
+        self,
+        file_id: str,
+        field: str,
+        loader: Callable[[], Optional[bytes]]
+    ) -> Optional[bytes]:
+        """Get a snapshot, building it with loader() on a miss.
+
+        The snapshot key is WATCHed while loading, so a snapshot built from
+        rows that were changed (and invalidated) concurrently is returned
+        but not cached.
+        """
+        cached = self.get_snapshot(file_id, field)
+        if cached is not None:
+            return cached
+
+        key = SNAPSHOT_KEY.format(file_id=file_id)
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.watch(key)
+                payload = loader()
+                if payload is not None:
+                    pipe.multi()
+                    pipe.hset(key, field, payload)
+                    pipe.expire(key, SHARE_SNAPSHOT_TTL)
+                    try:
+                        pipe.execute()
+                    except redis.WatchError:
+                        logger.info(f"Share snapshot for {file_id} changed while loading; not cached")
+                return payload
+        except redis.RedisError as e:
+            logger.warning(f"Share cache unavailable: {e}")
+            return loader()
+
+    # View counts
+
+    def record_view(self, token: str) -> Optional[int]:
+        """Count a view in Redis.
+
+        Returns:
+            Views not yet flushed to the database (including this one), or
+            None if Redis is unavailable and the caller must write through
+        """
+        try:
+            pipe = self.client.pipeline()
+            pipe.incr(VIEWS_KEY.format(token=token))
+            pipe.set(LAST_ACCESS_KEY.format(token=token), datetime.now(timezone.utc).isoformat())
+            pipe.sadd(DIRTY_VIEWS_KEY, token)
+            pending, _, _ = pipe.execute()
+            return int(pending)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to count share view in cache: {e}")
+            return None
+
+    def flush_views(self, db: Session, batch_size: int = 500) -> int:
+        """Apply pending view counts to the shares table.
+
+        Returns:
+            Number of shares updated
+        """
+        tokens = [t.decode("utf-8") for t in (self.client.spop(DIRTY_VIEWS_KEY, batch_size) or [])]
+        if not tokens:
+            return 0
+
+        pipe = self.client.pipeline()
+        for token in tokens:
+            pipe.getdel(VIEWS_KEY.format(token=token))
+            pipe.getdel(LAST_ACCESS_KEY.format(token=token))
+        results = pipe.execute()
+        pending = [
+            (token, int(views), last_access.decode("utf-8") if last_access else None)
+            for token, views, last_access in zip(tokens, results[::2], results[1::2])
+            if views
+        ]
+
+        try:
+            for token, views, last_access in pending:
+                values = {"view_count": func.coalesce(Share.view_count, 0) + views}
+                if last_access:
+                    values["last_accessed_at"] = datetime.fromisoformat(last_access)
+                db.execute(update(Share).where(Share.token == token).values(**values))
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put the counts back so the next flush retries them
+            pipe = self.client.pipeline()
+            for token, views, _ in pending:
+                pipe.incrby(VIEWS_KEY.format(token=token), views)
+                pipe.sadd(DIRTY_VIEWS_KEY, token)
+            pipe.execute()
+            raise
+
+        # Cached records carry the old count; reload them on next hit
+        self.client.delete(*(RECORD_KEY.format(token=token) for token in tokens))
+        return len(pending)
+
+    # Invalidation
+
+    def invalidate(self, file_ids=(), version_fields=(), tokens=()) -> None:
+        try:
+            pipe = self.client.pipeline()
+            for file_id in file_ids:
+                pipe.delete(SNAPSHOT_KEY.format(file_id=file_id))
+            for file_id, field in version_fields:
+                pipe.hdel(SNAPSHOT_KEY.format(file_id=file_id), field)
+            for token in tokens:
+                pipe.delete(RECORD_KEY.format(token=token))
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to invalidate share cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "record_ttl_seconds": SHARE_RECORD_TTL,
+            "snapshot_ttl_seconds": SHARE_SNAPSHOT_TTL
+        }
+
+
+# Global share cache instance
+_share_cache = ShareCache()
+
+
+def get_share_cache() -> ShareCache:
+    """Get global share cache instance."""
+    return _share_cache
+
+
+def _changed(obj, attrs) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in attrs)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_share_invalidations(session: Session, flush_context) -> None:
+    """Record cache entries made stale by this flush, applied after commit."""
+    pending = session.info.setdefault("share_cache_invalidations", {
+        "file_ids": set(), "version_fields": set(), "tokens": set()
+    })
+
+    for obj in list(session.dirty) + list(session.deleted):
+        deleted = obj in session.deleted
+        if isinstance(obj, File) and (deleted or _changed(obj, FILE_SNAPSHOT_ATTRS)):
+            pending["file_ids"].add(obj.id)
+        elif isinstance(obj, Version) and (deleted or _changed(obj, VERSION_SNAPSHOT_ATTRS)):
+            pending["version_fields"].add((obj.file_id, VERSION_FIELD.format(version_id=obj.id)))
+        elif isinstance(obj, Share) and obj.token:
+            pending["tokens"].add(obj.token)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_share_invalidations(session: Session) -> None:
+    pending = session.info.pop("share_cache_invalidations", None)
+    if pending and any(pending.values()):
+        _share_cache.invalidate(**pending)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_share_invalidations(session: Session) -> None:
+    session.info.pop("share_cache_invalidations", None)
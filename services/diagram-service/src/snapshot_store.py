@@ -0,0 +1,228 @@
+"""
+Content-addressed canvas snapshot store for Diagram Service.
+
+Canvas snapshots are stored once in `canvas_snapshots`, keyed by the SHA-256
+of their canonical JSON, and referenced from files, versions and templates
+via `canvas_snapshot_hash` (see SnapshotCanvasMixin). Duplicating a diagram,
+forking or restoring a version, or instantiating a template copies only the
+hash.
+
+Reference counts are maintained on flush from attribute history. Bulk
+deletes and database-level cascades bypass the ORM, so garbage collection
+recounts references before removing unreferenced snapshots.
+
+Snapshots above the offload threshold keep only a pointer and summary in
+Postgres; their content lives in object storage (see canvas_storage.py).
+"""
+
+import hashlib
+import json
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import String, cast, event, inspect, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .canvas_storage import canvas_summary, delete_offloaded_canvas, offload_canvas, should_offload
+from .database import SessionLocal
+from .models import CanvasSnapshot, SnapshotCanvasMixin
+
+logger = logging.getLogger(__name__)
+
+# Unreferenced snapshots younger than this are kept, so a snapshot inserted
+# by a transaction that has not committed its referencing row yet survives GC.
+GC_GRACE_PERIOD = timedelta(hours=1)
+
+
+def canonical_canvas_json(canvas: Any) -> str:
+    """Canonical JSON encoding used for hashing and size accounting."""
+    return json.dumps(canvas, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def canvas_hash(canvas: Any) -> str:
+    """SHA-256 content hash of a canvas."""
+    return hashlib.sha256(canonical_canvas_json(canvas).encode('utf-8')).hexdigest()
+
+
+def store_canvas_snapshot(db: Session, canvas: Any) -> Optional[str]:
+    """Store a canvas snapshot if not already present and return its hash.
+
+    Args:
+        db: Database session
+        canvas: Canvas data (None stores nothing)
+
+    Returns:
+        Content hash, or None if canvas is None
+    """
+    if canvas is None:
+        return None
+
+    payload = canonical_canvas_json(canvas).encode('utf-8')
+    content_hash = hashlib.sha256(payload).hexdigest()
+
+    values = {
+        "content_hash": content_hash,
+        "size_bytes": len(payload),
+        "ref_count": 0
+    }
+
+    if should_offload(len(payload)):
+        # Skip the upload entirely when this content is already stored
+        exists = db.query(CanvasSnapshot.content_hash).filter(
+            CanvasSnapshot.content_hash == content_hash
+        ).first()
+        if exists:
+            return content_hash
+        values["storage_key"] = offload_canvas(content_hash, payload)
+        values["summary"] = canvas_summary(canvas)
+    else:
+        values["canvas_data"] = canvas
+
+    db.execute(
+        insert(CanvasSnapshot)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=["content_hash"])
+    )
+    return content_hash
+
+
+def set_canvas(db: Session, owner: SnapshotCanvasMixin, canvas: Any) -> None:
+    """Assign a new canvas to an owner.
+
+    Oversized canvases go straight to the snapshot store (and so to object
+    storage) instead of the owner's inline JSONB column.
+    """
+    if canvas is not None and should_offload(len(canonical_canvas_json(canvas).encode('utf-8'))):
+        attach_canvas_snapshot(owner, store_canvas_snapshot(db, canvas))
+    else:
+        owner.canvas_data = canvas
+
+
+def canvas_size_bytes(db: Session, owner: SnapshotCanvasMixin) -> int:
+    """Encoded canvas size without loading offloaded or snapshot payloads."""
+    if owner.canvas_snapshot_hash:
+        size = db.query(CanvasSnapshot.size_bytes).filter(
+            CanvasSnapshot.content_hash == owner.canvas_snapshot_hash
+        ).scalar()
+        return size or 0
+    if owner.inline_canvas_data is not None:
+        return len(canonical_canvas_json(owner.inline_canvas_data).encode('utf-8'))
+    return 0
+
+
+def share_canvas(db: Session, owner: SnapshotCanvasMixin) -> Optional[str]:
+    """Return a snapshot hash holding the owner's current canvas.
+
+    An inline canvas is moved into the snapshot store and the owner is
+    switched to reference it, so the owner and every new referrer share one
+    copy until the owner is next edited.
+    """
+    if owner.inline_canvas_data is None:
+        return owner.canvas_snapshot_hash
+
+    content_hash = store_canvas_snapshot(db, owner.inline_canvas_data)
+    attach_canvas_snapshot(owner, content_hash)
+    return content_hash
+
+
+def attach_canvas_snapshot(owner: SnapshotCanvasMixin, content_hash: Optional[str]) -> None:
+    """Point an owner at a shared snapshot, dropping any inline canvas."""
+    owner.inline_canvas_data = None
+    owner.canvas_snapshot_hash = content_hash
+
+
+def canvas_text_matches(model, pattern: str):
+    """SQL clause matching `pattern` (ILIKE) in inline or snapshot canvas text."""
+    return or_(
+        cast(model.inline_canvas_data, String).ilike(pattern),
+        model.canvas_snapshot_hash.in_(
+            select(CanvasSnapshot.content_hash).where(
+                cast(CanvasSnapshot.canvas_data, String).ilike(pattern)
+            )
+        )
+    )
+
+
+def _snapshot_hash_history(obj) -> tuple[list, list]:
+    """Added and removed snapshot hashes for a pending object."""
+    history = inspect(obj).attrs.canvas_snapshot_hash.history
+    return [h for h in history.added if h], [h for h in history.deleted if h]
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _track_snapshot_references(session: Session, flush_context, instances) -> None:
+    """Apply reference count deltas for snapshot references changed in this flush."""
+    deltas: Counter = Counter()
+
+    for obj in session.new:
+        if isinstance(obj, SnapshotCanvasMixin) and obj.canvas_snapshot_hash:
+            deltas[obj.canvas_snapshot_hash] += 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, SnapshotCanvasMixin):
+            continue
+        added, removed = _snapshot_hash_history(obj)
+        for content_hash in added:
+            deltas[content_hash] += 1
+        for content_hash in removed:
+            deltas[content_hash] -= 1
+
+    for obj in session.deleted:
+        if not isinstance(obj, SnapshotCanvasMixin):
+            continue
+        history = inspect(obj).attrs.canvas_snapshot_hash.history
+        previous = (history.deleted or history.unchanged or [None])[0]
+        if previous:
+            deltas[previous] -= 1
+
+    for content_hash, delta in deltas.items():
+        if delta:
+            session.execute(
+                update(CanvasSnapshot)
+                .where(CanvasSnapshot.content_hash == content_hash)
+                .values(ref_count=CanvasSnapshot.ref_count + delta)
+            )
+
+
+def collect_snapshot_garbage(db: Session) -> Dict[str, Any]:
+    """Recount snapshot references and delete unreferenced snapshots.
+
+    Returns:
+        Dict with deleted snapshot count and bytes reclaimed
+    """
+    db.execute(text("""
+        UPDATE canvas_snapshots s SET ref_count =
+            (SELECT COUNT(*) FROM files f WHERE f.canvas_snapshot_hash = s.content_hash)
+          + (SELECT COUNT(*) FROM versions v WHERE v.canvas_snapshot_hash = s.content_hash)
+          + (SELECT COUNT(*) FROM templates t WHERE t.canvas_snapshot_hash = s.content_hash)
+    """))
+
+    cutoff = datetime.now(timezone.utc) - GC_GRACE_PERIOD
+    deleted = db.execute(
+        CanvasSnapshot.__table__.delete()
+        .where(CanvasSnapshot.ref_count <= 0, CanvasSnapshot.created_at < cutoff)
+        .returning(CanvasSnapshot.size_bytes, CanvasSnapshot.storage_key)
+    ).fetchall()
+    db.commit()
+
+    # Remove offloaded content only after the rows are gone
+    objects_deleted = 0
+    for _, storage_key in deleted:
+        if not storage_key:
+            continue
+        try:
+            delete_offloaded_canvas(storage_key)
+            objects_deleted += 1
+        except Exception as e:
+            logger.warning(f"Failed to delete offloaded canvas {storage_key}: {e}")
+
+    result = {
+        "snapshots_deleted": len(deleted),
+        "objects_deleted": objects_deleted,
+        "bytes_reclaimed": sum(row[0] or 0 for row in deleted)
+    }
+    logger.info(f"Canvas snapshot GC completed: {result}")
+    return result
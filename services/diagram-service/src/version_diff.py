@@ -0,0 +1,293 @@
+"""
+Structural version diff engine for Diagram Service.
+
+Versions are compared element-by-element using a content hash per element,
+so unchanged elements are skipped without a deep comparison and only changed
+elements (with their property-level changes) are returned.
+
+Versions are immutable, so both the per-version element index and the
+per-pair diff are cached without invalidation. Adjacent diffs are primed
+when a version is created so timeline scrubbing hits the cache.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Keys under which canvas payloads keep their element lists
+ELEMENT_COLLECTION_KEYS = ("shapes", "elements", "objects")
+
+# element_id -> (content_hash, element)
+ElementIndex = Dict[str, Tuple[str, dict]]
+
+
+def extract_elements(canvas: Any) -> Dict[str, dict]:
+    """Map element ID to element for a canvas payload.
+
+    Args:
+        canvas: Canvas data (dict with a shapes/elements/objects list)
+
+    Returns:
+        Dict of element ID (as string) to element dict
+    """
+    if not isinstance(canvas, dict):
+        return {}
+
+    for key in ELEMENT_COLLECTION_KEYS:
+        if key in canvas:
+            items = canvas.get(key) or []
+            return {
+                str(item.get('id', i)): item
+                for i, item in enumerate(items)
+                if isinstance(item, dict)
+            }
+
+    return {}
+
+
+def element_hash(element: dict) -> str:
+    """Stable content hash of a single element."""
+    payload = json.dumps(element, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def build_element_index(canvas: Any) -> ElementIndex:
+    """Build an element index (ID -> (hash, element)) for a canvas."""
+    return {
+        element_id: (element_hash(element), element)
+        for element_id, element in extract_elements(canvas).items()
+    }
+
+
+def describe_property_change(key: str, in_before: bool, in_after: bool, before: Any, after: Any) -> str:
+    """Human-readable description of a single property change."""
+    if not in_before:
+        return f"Added {key}: {after}"
+    if not in_after:
+        return f"Removed {key}: {before}"
+    if key in ("x", "y"):
+        return "Moved"
+    if key in ("width", "height"):
+        return "Resized"
+    if key == "rotation":
+        return "Rotated"
+    if key in ("color", "fill", "stroke"):
+        return "Color changed"
+    if key in ("text", "label"):
+        return "Text changed"
+    return f"Changed {key}"
+
+
+def diff_element_properties(before: dict, after: dict) -> List[Dict[str, Any]]:
+    """Property-level changes between two versions of the same element.
+
+    Returns:
+        List of {"property", "change", "before", "after"} dicts, where
+        change is one of "added", "removed" or "changed"
+    """
+    changes = []
+    for key in sorted(set(before.keys()) | set(after.keys())):
+        in_before = key in before
+        in_after = key in after
+        old_value = before.get(key)
+        new_value = after.get(key)
+
+        if in_before and in_after and old_value == new_value:
+            continue
+
+        if not in_before:
+            change = "added"
+        elif not in_after:
+            change = "removed"
+        else:
+            change = "changed"
+
+        changes.append({
+            "property": key,
+            "change": change,
+            "before": old_value,
+            "after": new_value,
+            "description": describe_property_change(key, in_before, in_after, old_value, new_value)
+        })
+
+    return changes
+
+
+def diff_indexes(index1: ElementIndex, index2: ElementIndex) -> Dict[str, Any]:
+    """Diff two element indexes, returning only changed elements.
+
+    Elements whose hashes match are skipped without comparing properties.
+    Modifications carry only the changed properties in before/after.
+    """
+    ids1 = set(index1.keys())
+    ids2 = set(index2.keys())
+
+    additions = [index2[element_id][1] for element_id in sorted(ids2 - ids1)]
+    deletions = [index1[element_id][1] for element_id in sorted(ids1 - ids2)]
+
+    modifications = []
+    for element_id in sorted(ids1 & ids2):
+        hash1, elem1 = index1[element_id]
+        hash2, elem2 = index2[element_id]
+        if hash1 == hash2:
+            continue
+
+        properties = diff_element_properties(elem1, elem2)
+        if not properties:
+            continue
+
+        modifications.append({
+            "id": element_id,
+            "before": {p["property"]: p["before"] for p in properties if p["change"] != "added"},
+            "after": {p["property"]: p["after"] for p in properties if p["change"] != "removed"},
+            "properties": properties,
+            "changes": sorted({p["description"] for p in properties})
+        })
+
+    return {
+        "additions": additions,
+        "deletions": deletions,
+        "modifications": modifications,
+        "summary": {
+            "total_changes": len(additions) + len(deletions) + len(modifications),
+            "added_count": len(additions),
+            "deleted_count": len(deletions),
+            "modified_count": len(modifications)
+        }
+    }
+
+
+def iter_diff_records(diff: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yield a diff as a flat sequence of records for streaming (NDJSON).
+
+    Records are emitted in the order additions, deletions, modifications,
+    followed by a single summary record.
+    """
+    for element in diff["additions"]:
+        yield {"type": "added", "id": str(element.get("id", "")), "element": element}
+    for element in diff["deletions"]:
+        yield {"type": "deleted", "id": str(element.get("id", "")), "element": element}
+    for modification in diff["modifications"]:
+        yield {"type": "modified", **modification}
+    yield {"type": "summary", **diff["summary"]}
+
+
+class VersionDiffCache:
+    """
+    LRU caches for version element indexes and version-pair diffs.
+
+    Keys are version IDs; versions are immutable so cached entries never
+    need invalidation, only eviction.
+    """
+
+    def __init__(self, max_indexes: int = 256, max_diffs: int = 1024):
+        """
+        Initialize version diff cache.
+
+        Args:
+            max_indexes: Maximum number of cached per-version element indexes
+            max_diffs: Maximum number of cached version-pair diffs
+        """
+        self.max_indexes = max_indexes
+        self.max_diffs = max_diffs
+        self._indexes: "OrderedDict[str, ElementIndex]" = OrderedDict()
+        self._diffs: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_lru(self, store: OrderedDict, key):
+        with self._lock:
+            value = store.get(key)
+            if value is not None:
+                store.move_to_end(key)
+            return value
+
+    def _put_lru(self, store: OrderedDict, key, value, max_size: int):
+        with self._lock:
+            store[key] = value
+            store.move_to_end(key)
+            while len(store) > max_size:
+                store.popitem(last=False)
+
+    def get_index(self, version_id: str, load_canvas: Callable[[], Any]) -> ElementIndex:
+        """Get the element index for a version, building it on first use."""
+        index = self._get_lru(self._indexes, version_id)
+        if index is None:
+            index = build_element_index(load_canvas())
+            self._put_lru(self._indexes, version_id, index, self.max_indexes)
+        return index
+
+    def get_cached_diff(self, version1_id: str, version2_id: str) -> Optional[Dict[str, Any]]:
+        """Return a cached diff for a version pair, if present."""
+        diff = self._get_lru(self._diffs, (version1_id, version2_id))
+        with self._lock:
+            if diff is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return diff
+
+    def get_diff(
+        self,
+        version1_id: str,
+        version2_id: str,
+        load_canvas1: Callable[[], Any],
+        load_canvas2: Callable[[], Any]
+    ) -> Dict[str, Any]:
+        """Get the diff between two versions, computing and caching on miss.
+
+        Loaders are only called when the corresponding element index is not
+        cached, so a cache hit never decompresses version content.
+        """
+        diff = self.get_cached_diff(version1_id, version2_id)
+        if diff is not None:
+            return diff
+
+        index1 = self.get_index(version1_id, load_canvas1)
+        index2 = self.get_index(version2_id, load_canvas2)
+        diff = diff_indexes(index1, index2)
+        self._put_lru(self._diffs, (version1_id, version2_id), diff, self.max_diffs)
+        return diff
+
+    def prime_adjacent(
+        self,
+        previous_version_id: str,
+        previous_canvas: Callable[[], Any],
+        new_version_id: str,
+        new_canvas: Any
+    ) -> Dict[str, Any]:
+        """Precompute the diff between a new version and its predecessor."""
+        return self.get_diff(
+            previous_version_id,
+            new_version_id,
+            previous_canvas,
+            lambda: new_canvas
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        total = self.hits + self.misses
+        return {
+            "indexes": len(self._indexes),
+            "max_indexes": self.max_indexes,
+            "diffs": len(self._diffs),
+            "max_diffs": self.max_diffs,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0
+        }
+
+
+# Global diff cache instance
+_version_diff_cache = VersionDiffCache()
+
+
+def get_version_diff_cache() -> VersionDiffCache:
+    """Get global version diff cache instance."""
+    return _version_diff_cache
@@ -0,0 +1,238 @@
+"""Asynchronous batched audit-log writer.
+
+Request handlers enqueue audit events instead of inserting and committing an
+AuditLog row inline. A background task drains the bounded queue and writes
+events in batches with a single multi-row INSERT, off the event loop thread.
+
+Usage:
+    audit_writer = AuditLogWriter(SessionLocal, AuditLog.__table__)
+
+    # lifespan startup / shutdown
+    await audit_writer.start()
+    ...
+    await audit_writer.stop()   # drains pending events
+
+    # request path
+    if not audit_writer.enqueue({...}):
+        ...  # queue full or writer stopped: write synchronously
+"""
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import Table
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """Bounded in-process queue of audit events flushed by a background task.
+
+    Args:
+        session_factory: Callable returning a new SQLAlchemy session
+        table: Audit log table (e.g. AuditLog.__table__)
+        max_queue_size: Maximum pending events before enqueue() reports backpressure
+        batch_size: Maximum rows per INSERT
+        flush_interval: Seconds between flushes when the queue is not full enough
+        max_batch_retries: Failed attempts before a batch is written row by row
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any],
+        table: Table,
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_batch_retries: int = 3
+    ):
+        self.session_factory = session_factory
+        self.table = table
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_batch_retries = max_batch_retries
+        self._consecutive_failures = 0
+
+        # deque + lock so handlers running in the threadpool can enqueue too
+        self._queue: deque = deque()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Statistics
+        self.events_enqueued = 0
+        self.events_written = 0
+        self.events_rejected = 0
+        self.batches_written = 0
+        self.write_failures = 0
+        self.events_dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._stopping
+
+    def enqueue(self, event: Dict[str, Any]) -> bool:
+        """Queue an audit event for the background writer.
+
+        Args:
+            event: Column values for one audit row; created_at defaults to now
+
+        Returns:
+            False if the writer is not running or the queue is full, in which
+            case the caller should write the event synchronously.
+        """
+        if not self.running:
+            return False
+
+        event.setdefault("created_at", datetime.now(timezone.utc))
+
+        with self._lock:
+            if len(self._queue) >= self.max_queue_size:
+                self.events_rejected += 1
+                return False
+            self._queue.append(event)
+            self.events_enqueued += 1
+            should_wake = len(self._queue) >= self.batch_size
+
+        if should_wake:
+            self._wake()
+        return True
+
+    def _wake(self) -> None:
+        """Wake the flusher, from the event loop thread or any other thread."""
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            count = min(self.batch_size, len(self._queue))
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _requeue(self, batch: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._queue.extendleft(reversed(batch))
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """Write a batch with one multi-row INSERT (runs in a worker thread)."""
+        # Multi-row VALUES needs the same keys in every row
+        columns = set().union(*(event.keys() for event in batch))
+        rows = [{column: event.get(column) for column in columns} for event in batch]
+
+        db = self.session_factory()
+        try:
+            db.execute(self.table.insert().values(rows))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_rows_individually(self, batch: List[Dict[str, Any]]) -> int:
+        """Write a batch row by row, skipping rows that fail. Returns rows written."""
+        written = 0
+        for event in batch:
+            try:
+                self._write_batch([event])
+                written += 1
+            except Exception as e:
+                self.events_dropped += 1
+                logger.error(f"Dropping audit event that cannot be written: {event.get('action')}: {e}")
+        return written
+
+    async def _flush(self) -> bool:
+        """Write everything currently queued. Returns False if a write failed."""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return True
+            if self._consecutive_failures >= self.max_batch_retries:
+                # Isolate bad rows so one event cannot block the queue
+                self.events_written += await asyncio.to_thread(self._write_rows_individually, batch)
+                self._consecutive_failures = 0
+                continue
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+                self.events_written += len(batch)
+                self.batches_written += 1
+                self._consecutive_failures = 0
+            except Exception as e:
+                self.write_failures += 1
+                self._consecutive_failures += 1
+                self._requeue(batch)
+                logger.error(f"Failed to write {len(batch)} audit events, will retry: {e}")
+                return False
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not await self._flush():
+                await asyncio.sleep(self.flush_interval)
+
+    async def start(self) -> None:
+        """Start the background flusher (call from lifespan startup)."""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Audit log writer started: batch_size={self.batch_size}, "
+            f"flush_interval={self.flush_interval}s, max_queue_size={self.max_queue_size}"
+        )
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Stop accepting events and drain the queue (call from lifespan shutdown)."""
+        if self._task is None:
+            return
+
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+
+        # Final drain; retry briefly so events survive a transient DB error
+        deadline = self._loop.time() + timeout
+        while self._queue and self._loop.time() < deadline:
+            if not await self._flush():
+                await asyncio.sleep(min(self.flush_interval, 1.0))
+
+        if self._queue:
+            logger.error(f"Audit log writer stopped with {len(self._queue)} unwritten events")
+        else:
+            logger.info(f"Audit log writer drained: {self.events_written} events written")
+        self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get writer statistics."""
+        return {
+            "running": self.running,
+            "queue_depth": len(self._queue),
+            "max_queue_size": self.max_queue_size,
+            "events_enqueued": self.events_enqueued,
+            "events_written": self.events_written,
+            "events_rejected": self.events_rejected,
+            "batches_written": self.batches_written,
+            "write_failures": self.write_failures,
+            "events_dropped": self.events_dropped
+        }